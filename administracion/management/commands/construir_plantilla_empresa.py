@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from core.services.plantilla_empresa import PlantillaEmpresa
+
+
+class Command(BaseCommand):
+    help = (
+        'Construye la BD plantilla de empresas (migraciones y catálogos) para la versión de esquema '
+        'actual. Ejecutar después de agregar migraciones; crear_empresa_* la construye si falta.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--forzar', action='store_true', help='Reconstruir aunque ya exista')
+        parser.add_argument('--limpiar', action='store_true', help='Eliminar plantillas de versiones anteriores')
+        parser.add_argument('--info', action='store_true', help='Solo mostrar la versión actual y las plantillas')
+
+    def handle(self, *args, **options):
+        if options['info']:
+            version = PlantillaEmpresa.version_esquema()
+            estado = 'construida' if PlantillaEmpresa.existe(version) else 'sin construir'
+            self.stdout.write(f'Versión de esquema: {version} ({estado})')
+            for nombre in PlantillaEmpresa.plantillas():
+                self.stdout.write(f'  {nombre}')
+            return
+
+        resultado = PlantillaEmpresa.construir(forzar=options['forzar'])
+        if resultado['construida']:
+            self.stdout.write(self.style.SUCCESS(
+                f'Plantilla {resultado["version"]} construida en {resultado["segundos"]:.1f}s: {resultado["nombre"]}'
+            ))
+        else:
+            self.stdout.write(f'La plantilla {resultado["version"]} ya existe (usa --forzar para reconstruirla)')
+
+        if options['limpiar']:
+            for nombre in PlantillaEmpresa.limpiar():
+                self.stdout.write(f'Eliminada: {nombre}')
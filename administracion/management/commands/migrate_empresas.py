@@ -0,0 +1,126 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from core.services.migracion_empresas import MigracionEmpresas
+from core.services.plantilla_empresa import PlantillaEmpresa
+
+
+class Command(BaseCommand):
+    help = (
+        'Aplica las migraciones a las BD de todas las empresas activas, varias a la vez en un pool '
+        'de procesos, con reporte por empresa, simulación y reanudación'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('app_label', nargs='?', help='Solo esta app (como en migrate)')
+        parser.add_argument('migration_name', nargs='?', help='Hasta esta migración (como en migrate)')
+        parser.add_argument(
+            '--procesos',
+            type=int,
+            default=None,
+            help='BD migrándose a la vez (por defecto settings.MIGRATE_EMPRESAS_PROCESOS)',
+        )
+        parser.add_argument('--rfc', action='append', help='Solo la empresa con este RFC; se puede repetir')
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='No migrar: solo mostrar las migraciones pendientes de cada empresa',
+        )
+        parser.add_argument(
+            '--reanudar',
+            action='store_true',
+            help='Omitir las empresas que ya quedaron migradas a esta versión en la corrida anterior',
+        )
+        parser.add_argument('--estado', help='Archivo de estado (por defecto settings.MIGRATE_EMPRESAS_ESTADO)')
+
+    def handle(self, *args, **options):
+        empresas = MigracionEmpresas.empresas(options['rfc'])
+        if not empresas:
+            raise CommandError('No hay empresas activas que migrar')
+
+        version = PlantillaEmpresa.version_esquema()
+        objetivo = ' '.join(filter(None, [options['app_label'], options['migration_name']])) or 'todas'
+        ruta_estado = options['estado'] or MigracionEmpresas.ruta_estado()
+        estado = MigracionEmpresas.leer_estado(ruta_estado)
+
+        pendientes = empresas
+        if options['reanudar']:
+            pendientes = [
+                empresa for empresa in empresas
+                if not self._al_dia(estado.get(empresa['db_name']), version, objetivo)
+            ]
+            omitidas = len(empresas) - len(pendientes)
+            if omitidas:
+                self.stdout.write(f'Reanudando: {omitidas} empresas ya migradas a la versión {version}')
+
+        procesos = options['procesos'] or getattr(settings, 'MIGRATE_EMPRESAS_PROCESOS', None) or os.cpu_count() or 1
+        accion = 'Revisando' if options['dry_run'] else 'Migrando'
+        self.stdout.write(f'{accion} {len(pendientes)} empresas con {min(procesos, len(pendientes) or 1)} procesos...')
+
+        rfc_por_bd = {empresa['db_name']: empresa['rfc'] for empresa in empresas}
+
+        def al_terminar(resultado):
+            rfc = rfc_por_bd.get(resultado['db_name'], '')
+            pendientes_bd = resultado['pendientes']
+            if resultado['exito']:
+                detalle = f'{len(pendientes_bd)} pendientes' if options['dry_run'] else f'{len(pendientes_bd)} aplicadas'
+                self.stdout.write(self.style.SUCCESS(
+                    f"  {rfc:<13} {resultado['db_name']}: {detalle} ({resultado['segundos']:.1f}s)"
+                ))
+                if options['dry_run'] and options['verbosity'] > 1:
+                    for nombre in pendientes_bd:
+                        self.stdout.write(f'      {nombre}')
+            else:
+                self.stdout.write(self.style.ERROR(
+                    f"  {rfc:<13} {resultado['db_name']}: {resultado['error']} ({resultado['segundos']:.1f}s)"
+                ))
+
+            if not options['dry_run']:
+                estado[resultado['db_name']] = {
+                    'rfc': rfc,
+                    'exito': resultado['exito'],
+                    'version': version,
+                    'objetivo': objetivo,
+                    'aplicadas': len(pendientes_bd) if resultado['exito'] else 0,
+                    'segundos': round(resultado['segundos'], 3),
+                    'error': resultado['error'],
+                    'fecha': timezone.now().isoformat(),
+                }
+                MigracionEmpresas.guardar_estado(ruta_estado, estado)
+
+        inicio = time.perf_counter()
+        resultados = MigracionEmpresas.ejecutar(
+            [empresa['db_name'] for empresa in pendientes],
+            procesos,
+            simular=options['dry_run'],
+            app_label=options['app_label'],
+            migration_name=options['migration_name'],
+            al_terminar=al_terminar,
+        )
+
+        fallidas = [resultado for resultado in resultados if not resultado['exito']]
+        self.stdout.write(
+            f'{len(resultados) - len(fallidas)} correctas, {len(fallidas)} con error en '
+            f'{time.perf_counter() - inicio:.1f}s'
+        )
+        mas_lentas = sorted(resultados, key=lambda resultado: resultado['segundos'], reverse=True)[:3]
+        if mas_lentas:
+            self.stdout.write('Más lentas: ' + ', '.join(
+                f"{resultado['db_name']} {resultado['segundos']:.1f}s" for resultado in mas_lentas
+            ))
+        if not options['dry_run']:
+            self.stdout.write(f'Estado guardado en {ruta_estado}')
+        if fallidas and options['dry_run']:
+            raise CommandError(f'{len(fallidas)} empresas no se pudieron revisar')
+        if fallidas:
+            raise CommandError(
+                f'{len(fallidas)} empresas no se migraron; corrige y vuelve a ejecutar con --reanudar'
+            )
+
+    @staticmethod
+    def _al_dia(anterior, version, objetivo) -> bool:
+        return bool(anterior) and anterior['exito'] and anterior['version'] == version and anterior['objetivo'] == objetivo
@@ -5,6 +5,8 @@ from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from .models import Empresa, UsuarioAdministracion
 from .forms import EmpresaForm
+from core.decorators import no_atomica
+from core.services.conexiones_empresa import ConexionesEmpresa
 
 
 def configuracion_view(request):
@@ -51,32 +53,42 @@ def empresas_view(request):
     })
 
 
+@no_atomica
 def empresa_create_view(request):
-    """Crear nueva empresa"""
+    """
+    Crear nueva empresa (fuera de ATOMIC_REQUESTS: clonar la plantilla en PostgreSQL no admite transacción)
+
+    Primero se crea la base de datos y solo si queda lista se registra la empresa; si el registro
+    falla se elimina la base creada, para no dejar empresas sin BD ni BD sin empresa.
+    """
     if request.method == 'POST':
         form = EmpresaForm(request.POST)
         if form.is_valid():
+            from core.services.plantilla_empresa import PlantillaEmpresa
+
             empresa = form.save(commit=False)
-            empresa.save(using='administracion')
-            
-            # Crear la base de datos de la empresa
             try:
-                from django.core.management import call_command
                 # Extraer el RFC del nombre de la base de datos (Directiva_RFC -> RFC)
-                rfc_from_db_name = empresa.db_name.replace('Directiva_', '')
-                call_command('crear_empresa_simple', 
-                           empresa.db_name,
-                           razon_social=empresa.nombre,
-                           rfc=rfc_from_db_name,
-                           direccion=request.POST.get('direccion', ''),
-                           telefono=request.POST.get('telefono', ''),
-                           ciclo_actual=request.POST.get('ciclo_actual', ''))
-                
-                messages.success(request, f'Empresa "{empresa.nombre}" creada exitosamente con base de datos inicializada.')
+                PlantillaEmpresa.crear_empresa(
+                    empresa.db_name,
+                    razon_social=empresa.nombre,
+                    rfc=empresa.db_name.replace('Directiva_', ''),
+                    direccion=request.POST.get('direccion', ''),
+                    telefono=request.POST.get('telefono', ''),
+                    ciclo_actual=request.POST.get('ciclo_actual', ''),
+                )
+            except FileExistsError:
+                messages.error(request, f'La base de datos "{empresa.db_name}" ya existe; la empresa no se registró.')
             except Exception as e:
-                messages.warning(request, f'Empresa "{empresa.nombre}" creada, pero hubo un error al inicializar la base de datos: {str(e)}')
-            
-            return redirect('administracion:empresas')
+                messages.error(request, f'No se pudo crear la base de datos de la empresa: {str(e)}')
+            else:
+                try:
+                    empresa.save(using='administracion')
+                except Exception:
+                    PlantillaEmpresa.eliminar_empresa(empresa.db_name)
+                    raise
+                messages.success(request, f'Empresa "{empresa.nombre}" creada exitosamente con base de datos inicializada.')
+                return redirect('administracion:empresas')
     else:
         form = EmpresaForm()
     
@@ -102,6 +114,7 @@ def empresa_edit_view(request, empresa_id):
         form = EmpresaForm(request.POST, instance=empresa)
         if form.is_valid():
             form.save(using='administracion')
+            ConexionesEmpresa.olvidar_empresa(empresa.rfc)
             messages.success(request, f'Empresa "{empresa.nombre}" actualizada exitosamente.')
             return redirect('administracion:empresas')
     else:
@@ -120,6 +133,8 @@ def empresa_toggle_suspend(request, empresa_id):
     empresa = get_object_or_404(Empresa, pk=empresa_id)
     empresa.suspendido = not empresa.suspendido
     empresa.save(using='administracion')
+    # Los demás workers lo ven al vencer su caché (EMPRESAS_CACHE_SEGUNDOS)
+    ConexionesEmpresa.olvidar_empresa(empresa.rfc)
     
     action = 'suspendida' if empresa.suspendido else 'activada'
     messages.success(request, f'Empresa "{empresa.nombre}" {action} exitosamente.')
@@ -8,6 +8,7 @@ from django.contrib.auth.decorators import login_required
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from .services.sat_catalog_service import SATCatalogService
+from .services.indice_catalogo_sat import CATALOGOS_AUTOCOMPLETAR, IndiceCatalogoSAT
 from .models import AutorizoGasto
 
 
@@ -41,6 +42,45 @@ def obtener_usos_cfdi_ajax(request):
         }, status=500)
 
 
+@login_required
+def buscar_claves_sat_ajax(request):
+    """Vista AJAX para autocompletar ClaveProdServ y ClaveUnidad desde el índice en memoria"""
+    if request.method != 'GET':
+        return JsonResponse({'error': 'Método no permitido'}, status=405)
+
+    catalogo = request.GET.get('catalogo', 'productos-servicios')
+    if catalogo not in CATALOGOS_AUTOCOMPLETAR:
+        return JsonResponse({
+            'success': False,
+            'error': f'Catálogo no válido. Opciones: {", ".join(CATALOGOS_AUTOCOMPLETAR)}'
+        }, status=400)
+
+    try:
+        limite = min(max(int(request.GET.get('limite', IndiceCatalogoSAT.LIMITE_DEFAULT)), 1), 50)
+    except ValueError:
+        limite = IndiceCatalogoSAT.LIMITE_DEFAULT
+
+    try:
+        resultados = IndiceCatalogoSAT.buscar(catalogo, request.GET.get('q', ''), limite)
+        if resultados is None:
+            return JsonResponse({
+                'success': False,
+                'error': 'El catálogo no está cargado (ejecuta cargar_catalogos_sat)'
+            }, status=503)
+
+        return JsonResponse({
+            'success': True,
+            'resultados': resultados,
+            'total': len(resultados)
+        })
+
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'error': f'Error interno del servidor: {str(e)}'
+        }, status=500)
+
+
 @login_required
 def obtener_autorizo_gastos_ajax(request):
     """Vista AJAX para obtener la lista de personas que autorizan gastos"""
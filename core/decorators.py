@@ -1,60 +1,24 @@
 from functools import wraps
-from django.conf import settings
-from django.db import connections
 from django.contrib.auth.decorators import login_required
 
 
 def with_empresa_db(view_func):
     """
     Decorador que asegura que la vista use la base de datos correcta de la empresa
+    (lo mismo que hace EmpresaDbMiddleware, para vistas servidas sin el middleware)
     """
     @wraps(view_func)
     def wrapper(request, *args, **kwargs):
-        # Solo aplicar si el usuario está autenticado
-        if hasattr(request, 'user') and request.user.is_authenticated:
-            empresa_db = request.session.get('empresa_db')
-            if empresa_db and empresa_db != 'default':
-                try:
-                    empresa_db_path = f'{empresa_db}.sqlite3'
-                    
-                    # Crear configuración completa de la base de datos
-                    empresa_db_config = {
-                        'ENGINE': 'django.db.backends.sqlite3',
-                        'NAME': empresa_db_path,
-                        'ATOMIC_REQUESTS': True,
-                        'AUTOCOMMIT': True,
-                        'CONN_HEALTH_CHECKS': False,
-                        'CONN_MAX_AGE': 0,
-                        'HOST': '',
-                        'OPTIONS': {},
-                        'PASSWORD': '',
-                        'PORT': '',
-                        'TEST': {
-                            'CHARSET': None,
-                            'COLLATION': None,
-                            'MIGRATE': True,
-                            'MIRROR': None,
-                            'NAME': None
-                        },
-                        'TIME_ZONE': None,
-                        'USER': ''
-                    }
-                    
-                    # Solo actualizar si la configuración es diferente
-                    current_config = settings.DATABASES.get('default', {})
-                    if current_config.get('NAME') != empresa_db_path:
-                        # Actualizar la configuración de la base de datos
-                        settings.DATABASES['default'] = empresa_db_config
-                        
-                        # Registrar la conexión en el sistema de conexiones de Django
-                        connections.databases['default'] = empresa_db_config
-                        
-                except Exception as e:
-                    # Si hay error, limpiar la sesión y usar base por defecto
-                    request.session.pop('empresa_db', None)
-                    pass
-        
-        return view_func(request, *args, **kwargs)
+        from directiva_agricola.db_router import get_current_company_db, set_current_company_db
+        from .middleware import EmpresaDbMiddleware
+
+        anterior = get_current_company_db()
+        if anterior is None:
+            set_current_company_db(EmpresaDbMiddleware.alias_sesion(request))
+        try:
+            return view_func(request, *args, **kwargs)
+        finally:
+            set_current_company_db(anterior)
     
     return wrapper
 
@@ -64,3 +28,32 @@ def login_required_with_empresa_db(view_func):
     Decorador que combina login_required con with_empresa_db
     """
     return login_required(with_empresa_db(view_func))
+
+
+class _TodasLasBD(set):
+    """Alias excluidos de ATOMIC_REQUESTS que contiene a todos, también a las BD de empresas
+    que se registran después de decorar la vista"""
+
+    def __contains__(self, alias):
+        return True
+
+
+def no_atomica(view_func):
+    """
+    Decorador que excluye la vista de ATOMIC_REQUESTS en todas las BD
+
+    transaction.non_atomic_requests solo excluye un alias ('default'); EmpresaDbMiddleware
+    abriría la transacción de la BD de la empresa y la vista seguiría dentro de ella.
+    """
+    view_func._non_atomic_requests = _TodasLasBD()
+    return view_func
+
+
+def solo_lectura(view_func):
+    """
+    Decorador para vistas que solo leen: sin transacción por petición (ATOMIC_REQUESTS) y, en
+    GET/HEAD, con la conexión en solo lectura (SoloLecturaMiddleware)
+    """
+    view_func = no_atomica(view_func)
+    view_func.solo_lectura = True
+    return view_func
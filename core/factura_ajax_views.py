@@ -5,10 +5,13 @@ Vistas AJAX adicionales para facturación
 import json
 from datetime import datetime
 from decimal import Decimal
+from django.conf import settings
 from django.shortcuts import get_object_or_404
 from django.http import JsonResponse
+from django.urls import reverse
 from django.contrib.auth.decorators import login_required
-from .models import Emisor, Cliente, ProductoServicio, Factura, FacturaDetalle
+from .decorators import no_atomica, solo_lectura
+from .models import Emisor, Cliente, ProductoServicio, Factura, FacturaDetalle, TrabajoTimbrado
 
 
 @login_required
@@ -308,7 +311,7 @@ def guardar_factura_ajax(request):
 
 @login_required
 def timbrar_factura_ajax(request, folio):
-    """Vista AJAX para timbrar una factura"""
+    """Vista AJAX para timbrar una factura (encola el timbrado si TIMBRADO_ASINCRONO está activo)"""
     # Permitir a usuarios autenticados timbrar
     
     if request.method != 'POST':
@@ -316,10 +319,23 @@ def timbrar_factura_ajax(request, folio):
     
     try:
         from .services.facturacion_service import FacturacionService
+        from .services.cola_timbrado_service import ColaTimbradoService
         
         # Obtener la factura por folio
         factura = get_object_or_404(Factura, folio=folio)
         
+        if getattr(settings, 'TIMBRADO_ASINCRONO', False):
+            # El worker timbra fuera de la petición (y elimina la factura si falla);
+            # la interfaz consulta el estado en estado_url
+            trabajo = ColaTimbradoService.encolar(factura, eliminar_factura_si_falla=True)
+            respuesta = ColaTimbradoService.estado(trabajo)
+            respuesta.update({
+                'success': True,
+                'encolado': True,
+                'estado_url': reverse('core:estado_timbrado_ajax', args=[trabajo.pk])
+            })
+            return JsonResponse(respuesta, status=202)
+        
         # Intentar timbrar la factura
         resultado = FacturacionService.timbrar_factura(factura)
         
@@ -354,6 +370,123 @@ def timbrar_factura_ajax(request, folio):
             'error': f'Error interno del servidor: {str(e)}'
         }, status=500)
 
+
+@login_required
+@no_atomica
+def timbrar_lote_ajax(request):
+    """
+    Vista AJAX para timbrar varias facturas: recibe {"folios": [...], "paralelismo": n}
+    
+    Con TIMBRADO_ASINCRONO las facturas se encolan para el worker de timbrado y se responde
+    con el estado_url de cada trabajo. Si no, se timbran aquí sin ATOMIC_REQUESTS: las llamadas
+    al PAC no mantienen una transacción abierta y cada resultado se guarda al recibirse.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Método no permitido'}, status=405)
+    
+    try:
+        from .services.timbrado_lote_service import TimbradoLoteService
+        from .services.cola_timbrado_service import ColaTimbradoService
+        
+        data = json.loads(request.body or '{}')
+        folios = [int(folio) for folio in data.get('folios', [])]
+        paralelismo = int(data['paralelismo']) if data.get('paralelismo') else None
+    except (ValueError, TypeError, AttributeError):
+        return JsonResponse({'success': False, 'error': 'Datos inválidos'}, status=400)
+    
+    if not folios:
+        return JsonResponse({'success': False, 'error': 'No se indicaron folios'}, status=400)
+    
+    maximo = getattr(settings, 'TIMBRADO_LOTE_MAX_FOLIOS', 500)
+    if len(folios) > maximo:
+        return JsonResponse({
+            'success': False,
+            'error': f'Se pueden timbrar máximo {maximo} facturas por lote'
+        }, status=400)
+    
+    try:
+        if getattr(settings, 'TIMBRADO_ASINCRONO', False):
+            lote = ColaTimbradoService.encolar_lote(folios)
+            trabajos = []
+            for folio, trabajo in lote['trabajos'].items():
+                estado = ColaTimbradoService.estado(trabajo)
+                estado.update({
+                    'folio': folio,
+                    'estado_url': reverse('core:estado_timbrado_ajax', args=[trabajo.pk])
+                })
+                trabajos.append(estado)
+            return JsonResponse({
+                'success': True,
+                'encolado': True,
+                'trabajos': trabajos,
+                'no_encontrados': lote['no_encontrados'],
+            }, status=202)
+        
+        resumen = TimbradoLoteService.timbrar_lote(folios, paralelismo)
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'error': f'Error interno del servidor: {str(e)}'
+        }, status=500)
+    
+    resumen['success'] = True
+    return JsonResponse(resumen)
+
+
+@login_required
+@solo_lectura
+def pdf_lote_ajax(request):
+    """
+    Vista AJAX para descargar en un ZIP los PDF de varias facturas: recibe {"folios": [...]}
+    
+    Las facturas se renderizan en paralelo en el pool de PDF (settings.PDF_POOL); las timbradas
+    salen de la caché de PDF. El ZIP se envía conforme se genera y el renderizado se detiene a los
+    PDF_LOTE_SEGUNDOS; las que fallen o no alcancen se listan en errores.txt dentro del ZIP.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Método no permitido'}, status=405)
+    if not request.user.is_staff:
+        return JsonResponse({'error': 'No tienes permisos para realizar esta acción'}, status=403)
+    
+    try:
+        data = json.loads(request.body or '{}')
+        folios = list(dict.fromkeys(int(folio) for folio in data.get('folios', [])))
+    except (ValueError, TypeError, AttributeError):
+        return JsonResponse({'success': False, 'error': 'Datos inválidos'}, status=400)
+    
+    if not folios:
+        return JsonResponse({'success': False, 'error': 'No se indicaron folios'}, status=400)
+    
+    maximo = getattr(settings, 'PDF_LOTE_MAX_FOLIOS', 200)
+    if len(folios) > maximo:
+        return JsonResponse({
+            'success': False,
+            'error': f'Se pueden descargar máximo {maximo} PDF por lote'
+        }, status=400)
+    
+    from django.http import StreamingHttpResponse
+    from .services.exportacion_cfdi import ExportacionCFDIService
+    from .services.pdf_service import WEASYPRINT_AVAILABLE
+    
+    if not WEASYPRINT_AVAILABLE:
+        return JsonResponse({'success': False, 'error': 'WeasyPrint no está disponible'}, status=500)
+    
+    response = StreamingHttpResponse(
+        ExportacionCFDIService.generar_zip_pdf(folios, getattr(settings, 'PDF_LOTE_SEGUNDOS', 8)),
+        content_type='application/zip'
+    )
+    response['Content-Disposition'] = 'attachment; filename="facturas_pdf.zip"'
+    return response
+
+
+@login_required
+def estado_timbrado_ajax(request, trabajo_id):
+    """Vista AJAX para consultar el estado de un trabajo de timbrado encolado"""
+    from .services.cola_timbrado_service import ColaTimbradoService
+    
+    trabajo = get_object_or_404(TrabajoTimbrado, pk=trabajo_id)
+    return JsonResponse(ColaTimbradoService.estado(trabajo))
+
 @login_required
 def probar_conexion_pac_ajax(request, emisor_id):
     """Vista AJAX para probar la conexión con el PAC"""
@@ -3,6 +3,72 @@ from decimal import Decimal
 from .models import Emisor, Cliente, ProductoServicio, Usuario
 
 
+# Columnas pesadas de la factura que viven en FacturaDocumento
+CAMPOS_DOCUMENTO = (
+    'xml_original', 'xml_timbrado', 'codigo_qr', 'sello', 'sello_sat',
+    'certificado', 'cadena_original_sat', 'acuse_cancelacion',
+)
+
+# Columnas que muestran los listados y estados de cuenta
+CAMPOS_LISTADO = (
+    'folio', 'serie', 'fecha_emision', 'emisor', 'receptor', 'metodo_pago', 'forma_pago', 'moneda',
+    'subtotal', 'impuesto', 'total', 'uuid', 'fecha_timbrado', 'estado_timbrado', 'cancelada',
+)
+
+
+def _campo_documento(nombre):
+    """Propiedad de Factura que lee y escribe un campo de su FacturaDocumento"""
+    
+    def obtener(factura):
+        return getattr(factura.obtener_documento(), nombre)
+    
+    def asignar(factura, valor):
+        setattr(factura.obtener_documento(), nombre, valor)
+        factura._documento_modificado = True
+    
+    return property(obtener, asignar)
+
+
+class FacturaQuerySet(models.QuerySet):
+    """QuerySet de facturas con proyecciones para listados"""
+    
+    def para_listado(self):
+        """Solo las columnas de CAMPOS_LISTADO, con emisor y receptor en la misma consulta"""
+        return self.select_related('emisor', 'receptor').only(*CAMPOS_LISTADO)
+    
+    def con_documento(self):
+        """Carga el FacturaDocumento (XML, sellos, QR) en la misma consulta"""
+        return self.select_related('documento')
+    
+    def con_saldo(self):
+        """
+        Anota `total_pagado` (solo pagos timbrados), `saldo` y `estado_pago`
+        
+        Equivalentes a obtener_total_pagado, obtener_saldo_pendiente y obtener_estado_pago,
+        calculados en la base de datos con una subconsulta por factura.
+        """
+        from .models import PagoFactura
+        from .utils.query_utils import suma_subconsulta
+        
+        cero = models.Value(Decimal('0.00'))
+        return self.annotate(
+            total_pagado=suma_subconsulta(PagoFactura.objects.filter(uuid__isnull=False), 'factura', 'monto_pago'),
+        ).annotate(
+            saldo=models.Case(
+                models.When(metodo_pago='PPD', then=models.F('total') - models.F('total_pagado')),
+                default=cero,
+                output_field=models.DecimalField(max_digits=18, decimal_places=4),
+            ),
+            estado_pago=models.Case(
+                models.When(~models.Q(metodo_pago='PPD'), then=models.Value('No aplica')),
+                models.When(saldo__lte=0, then=models.Value('Pagada')),
+                models.When(total_pagado__gt=0, then=models.Value('Pago parcial')),
+                default=models.Value('Pendiente'),
+                output_field=models.CharField(),
+            ),
+        )
+
+
 class Factura(models.Model):
     """Modelo para gestión de facturas CFDI 4.0 según Anexo 20 RMF 2022"""
     
@@ -306,35 +372,7 @@ class Factura(models.Model):
         help_text="Número de serie del certificado SAT (20 posiciones)"
     )
     
-    sello_sat = models.TextField(
-        blank=True,
-        null=True,
-        verbose_name="SelloSAT",
-        help_text="Sello digital del SAT en Base64"
-    )
-    
-    codigo_qr = models.TextField(
-        blank=True,
-        null=True,
-        verbose_name="Código QR",
-        help_text="Código QR de la factura en Base64 (proporcionado por el PAC)"
-    )
-    
-    cadena_original_sat = models.TextField(
-        blank=True,
-        null=True,
-        verbose_name="Cadena Original complemento SAT",
-        help_text="Cadena original del complemento SAT (SelloCFD del timbre fiscal)"
-    )
-    
     # Campos de sello digital del emisor (CFDI 4.0)
-    sello = models.TextField(
-        blank=True,
-        null=True,
-        verbose_name="Sello",
-        help_text="Sello digital del comprobante en Base64"
-    )
-    
     no_certificado = models.CharField(
         max_length=20,
         blank=True,
@@ -343,13 +381,6 @@ class Factura(models.Model):
         help_text="Número de serie del certificado del emisor"
     )
     
-    certificado = models.TextField(
-        blank=True,
-        null=True,
-        verbose_name="Certificado",
-        help_text="Certificado del emisor en Base64"
-    )
-    
     ESTADO_TIMBRADO_CHOICES = [
         ('PENDIENTE', 'Pendiente'),
         ('TIMBRADO', 'Timbrado'),
@@ -411,20 +442,8 @@ class Factura(models.Model):
         help_text="Año del período de la información global"
     )
     
-    # Archivos XML
-    xml_original = models.TextField(
-        blank=True,
-        null=True,
-        verbose_name="XML Original",
-        help_text="XML original antes del timbrado"
-    )
-    
-    xml_timbrado = models.TextField(
-        blank=True,
-        null=True,
-        verbose_name="XML Timbrado",
-        help_text="XML timbrado por el PAC"
-    )
+    # Los XML, sellos, certificado, código QR y acuse de cancelación se guardan en
+    # FacturaDocumento (ver CAMPOS_DOCUMENTO); aquí son propiedades que lo cargan al usarse
     
     # Datos de cancelación
     fecha_cancelacion = models.DateTimeField(
@@ -442,13 +461,6 @@ class Factura(models.Model):
         help_text="Motivo de la cancelación"
     )
     
-    acuse_cancelacion = models.TextField(
-        blank=True,
-        null=True,
-        verbose_name="Acuse de Cancelación",
-        help_text="Acuse de cancelación del SAT"
-    )
-    
     # Datos de validación
     errores_validacion = models.TextField(
         blank=True,
@@ -490,6 +502,21 @@ class Factura(models.Model):
             models.Index(fields=['exportacion']),
         ]
     
+    objects = FacturaQuerySet.as_manager()
+    
+    CAMPOS_DOCUMENTO = CAMPOS_DOCUMENTO
+    
+    xml_original = _campo_documento('xml_original')
+    xml_timbrado = _campo_documento('xml_timbrado')
+    codigo_qr = _campo_documento('codigo_qr')
+    sello = _campo_documento('sello')
+    sello_sat = _campo_documento('sello_sat')
+    certificado = _campo_documento('certificado')
+    cadena_original_sat = _campo_documento('cadena_original_sat')
+    acuse_cancelacion = _campo_documento('acuse_cancelacion')
+    
+    _documento_modificado = False
+    
     def __str__(self):
         if self.serie and self.folio:
             return f"{self.serie}-{self.folio}"
@@ -513,8 +540,29 @@ class Factura(models.Model):
             from core.utils.timezone_utils import obtener_fecha_actual_mexico
             self.fecha_emision = obtener_fecha_actual_mexico(self.lugar_expedicion)
         
+        # Los campos del documento se guardan en su propia tabla
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = [campo for campo in update_fields if campo not in CAMPOS_DOCUMENTO]
+        
         self.full_clean()
         super().save(*args, **kwargs)
+        
+        if self._documento_modificado:
+            self.obtener_documento().save(using=kwargs.get('using') or self._state.db)
+            self._documento_modificado = False
+    
+    def obtener_documento(self):
+        """
+        FacturaDocumento de la factura
+        
+        Se consulta la primera vez que se usa uno de sus campos (o viene de con_documento());
+        si la factura aún no tiene documento se crea en memoria y se guarda con la factura.
+        """
+        try:
+            return self.documento
+        except FacturaDocumento.DoesNotExist:
+            return FacturaDocumento(factura=self)
     
     @classmethod
     def obtener_siguiente_folio_por_serie(cls, serie=None):
@@ -571,6 +619,101 @@ class Factura(models.Model):
             return 'Pendiente'
 
 
+class FacturaDocumento(models.Model):
+    """XML, sellos, certificado, código QR y acuse de una factura, fuera de la tabla de facturas"""
+    
+    factura = models.OneToOneField(
+        Factura,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='documento',
+        verbose_name="Factura",
+        help_text="Factura a la que pertenece el documento"
+    )
+    
+    xml_original = models.TextField(
+        blank=True,
+        null=True,
+        verbose_name="XML Original",
+        help_text="XML original antes del timbrado"
+    )
+    
+    xml_timbrado = models.TextField(
+        blank=True,
+        null=True,
+        verbose_name="XML Timbrado",
+        help_text="XML timbrado por el PAC"
+    )
+    
+    codigo_qr = models.TextField(
+        blank=True,
+        null=True,
+        verbose_name="Código QR",
+        help_text="Código QR de la factura en Base64 (proporcionado por el PAC)"
+    )
+    
+    sello = models.TextField(
+        blank=True,
+        null=True,
+        verbose_name="Sello",
+        help_text="Sello digital del comprobante en Base64"
+    )
+    
+    sello_sat = models.TextField(
+        blank=True,
+        null=True,
+        verbose_name="SelloSAT",
+        help_text="Sello digital del SAT en Base64"
+    )
+    
+    certificado = models.TextField(
+        blank=True,
+        null=True,
+        verbose_name="Certificado",
+        help_text="Certificado del emisor en Base64"
+    )
+    
+    cadena_original_sat = models.TextField(
+        blank=True,
+        null=True,
+        verbose_name="Cadena Original complemento SAT",
+        help_text="Cadena original del complemento SAT (SelloCFD del timbre fiscal)"
+    )
+    
+    acuse_cancelacion = models.TextField(
+        blank=True,
+        null=True,
+        verbose_name="Acuse de Cancelación",
+        help_text="Acuse de cancelación del SAT"
+    )
+    
+    class Meta:
+        verbose_name = "Documento de Factura"
+        verbose_name_plural = "Documentos de Factura"
+        db_table = 'facturas_documentos'
+    
+    def __str__(self):
+        return f"Documento de factura {self.factura_id}"
+    
+    @classmethod
+    def guardar_de_facturas(cls, facturas, campos=CAMPOS_DOCUMENTO):
+        """
+        Guarda en bloque (insertando o actualizando) los documentos modificados de varias facturas
+        
+        Args:
+            facturas: Facturas ya guardadas
+            campos: Campos del documento a escribir
+        """
+        documentos = [factura.obtener_documento() for factura in facturas if factura._documento_modificado]
+        if documentos:
+            cls.objects.bulk_create(
+                documentos, batch_size=200,
+                update_conflicts=True, unique_fields=['factura'], update_fields=list(campos)
+            )
+        for factura in facturas:
+            factura._documento_modificado = False
+
+
 class FacturaDetalle(models.Model):
     """Modelo para detalle de facturas CFDI 4.0 según Anexo 20 RMF 2022"""
     
@@ -725,3 +868,115 @@ class FacturaDetalle(models.Model):
         
         self.full_clean()
         super().save(*args, **kwargs)
+
+
+class TrabajoTimbrado(models.Model):
+    """Trabajo de la cola de timbrado asíncrono (el worker procesar_cola_timbrado lo atiende)"""
+    
+    ESTADO_CHOICES = [
+        ('PENDIENTE', 'Pendiente'),
+        ('EN_PROCESO', 'En proceso'),
+        ('COMPLETADO', 'Completado'),
+        ('ERROR', 'Error'),
+    ]
+    
+    factura = models.ForeignKey(
+        Factura,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='trabajos_timbrado',
+        verbose_name="Factura"
+    )
+    
+    factura_folio = models.IntegerField(
+        verbose_name="Folio de la factura",
+        help_text="Folio de la factura (se conserva aunque la factura se elimine)"
+    )
+    
+    estado = models.CharField(
+        max_length=20,
+        choices=ESTADO_CHOICES,
+        default='PENDIENTE',
+        verbose_name="Estado"
+    )
+    
+    eliminar_factura_si_falla = models.BooleanField(
+        default=False,
+        verbose_name="Eliminar factura si falla",
+        help_text="Eliminar la factura si el timbrado no se completa (captura desde facturación)"
+    )
+    
+    intentos = models.PositiveIntegerField(
+        default=0,
+        verbose_name="Intentos"
+    )
+    
+    uuid = models.CharField(
+        max_length=36,
+        blank=True,
+        null=True,
+        verbose_name="UUID",
+        help_text="UUID asignado por el PAC al completar el timbrado"
+    )
+    
+    fecha_timbrado = models.CharField(
+        max_length=30,
+        blank=True,
+        null=True,
+        verbose_name="Fecha de timbrado",
+        help_text="Fecha de timbrado devuelta por el PAC"
+    )
+    
+    error = models.TextField(
+        blank=True,
+        null=True,
+        verbose_name="Error"
+    )
+    
+    codigo_error = models.CharField(
+        max_length=50,
+        blank=True,
+        null=True,
+        verbose_name="Código de error"
+    )
+    
+    detalles_error = models.TextField(
+        blank=True,
+        null=True,
+        verbose_name="Detalles del error",
+        help_text="Detalles de validación separados por salto de línea"
+    )
+    
+    fecha_creacion = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name="Fecha de creación"
+    )
+    
+    fecha_inicio = models.DateTimeField(
+        blank=True,
+        null=True,
+        verbose_name="Fecha de inicio"
+    )
+    
+    fecha_fin = models.DateTimeField(
+        blank=True,
+        null=True,
+        verbose_name="Fecha de fin"
+    )
+    
+    class Meta:
+        verbose_name = "Trabajo de Timbrado"
+        verbose_name_plural = "Trabajos de Timbrado"
+        db_table = 'trabajos_timbrado'
+        ordering = ['fecha_creacion', 'id']
+        indexes = [
+            models.Index(fields=['estado', 'fecha_creacion']),
+        ]
+    
+    def __str__(self):
+        return f"Timbrado factura {self.factura_folio} - {self.get_estado_display()}"
+    
+    @property
+    def terminado(self):
+        return self.estado in ('COMPLETADO', 'ERROR')
@@ -5,12 +5,13 @@ Vistas para facturación electrónica CFDI 4.0
 import json
 from datetime import datetime
 from django.shortcuts import get_object_or_404, render
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
 from django.contrib.auth.decorators import login_required
 from django.views.generic import TemplateView, ListView, DetailView
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.db.models import Q
 from django.utils import timezone
+from .decorators import solo_lectura
 from .models import Emisor, Cliente, ProductoServicio, Factura, FacturaDetalle
 from .services.pdf_service import PDFService
 
@@ -45,7 +46,7 @@ class ListadoFacturasView(LoginRequiredMixin, ListView):
     paginate_by = 20
     
     def get_queryset(self):
-        queryset = Factura.objects.select_related('emisor', 'receptor').order_by('-fecha_emision', 'serie', 'folio')
+        queryset = Factura.objects.para_listado().order_by('-fecha_emision', 'serie', 'folio')
         
         # Filtros de búsqueda
         search = self.request.GET.get('search', '')
@@ -110,6 +111,9 @@ class FacturaDetailView(LoginRequiredMixin, DetailView):
     context_object_name = 'factura'
     pk_url_kwarg = 'folio'
     
+    def get_queryset(self):
+        return Factura.objects.select_related('emisor', 'receptor').con_documento()
+    
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['title'] = f'Factura: {self.object.serie} - {self.object.folio:06d}'
@@ -127,7 +131,7 @@ def generar_pdf_factura(request, folio):
     
     try:
         factura = get_object_or_404(Factura, folio=folio)
-        return PDFService.generar_pdf_factura(factura)
+        return PDFService.generar_pdf_factura(factura, request)
     except Exception as e:
         return HttpResponse(f'Error generando PDF: {str(e)}', status=500)
 
@@ -153,7 +157,7 @@ def descargar_xml_factura(request, folio):
         return HttpResponse('No tienes permisos para acceder a esta sección', status=403)
     
     try:
-        factura = get_object_or_404(Factura, folio=folio)
+        factura = get_object_or_404(Factura.objects.con_documento(), folio=folio)
         
         # Verificar que la factura esté timbrada
         if not factura.xml_timbrado:
@@ -176,6 +180,44 @@ def descargar_xml_factura(request, folio):
         return HttpResponse(f'Error descargando XML: {str(e)}', status=500)
 
 
+@login_required
+@solo_lectura
+def exportar_cfdi_zip(request):
+    """
+    Vista para descargar en un ZIP los XML timbrados y PDF de las facturas filtradas
+    
+    Acepta los filtros del listado (estado, emisor_id, receptor_id, fecha_desde, fecha_hasta)
+    y pdf=0 para exportar solo los XML. El ZIP se envía conforme se genera y solo incluye los PDF
+    que ya están en la caché; los demás se listan en errores.txt (el comando exportar_cfdi los renderiza).
+    """
+    if not request.user.is_staff:
+        return HttpResponse('No tienes permisos para acceder a esta sección', status=403)
+    
+    from .services.exportacion_cfdi import ExportacionCFDIService
+    
+    try:
+        fecha_desde = request.GET.get('fecha_desde', '')
+        fecha_hasta = request.GET.get('fecha_hasta', '')
+        facturas = ExportacionCFDIService.filtrar(
+            fecha_desde=datetime.strptime(fecha_desde, '%Y-%m-%d').date() if fecha_desde else None,
+            fecha_hasta=datetime.strptime(fecha_hasta, '%Y-%m-%d').date() if fecha_hasta else None,
+            emisor=request.GET.get('emisor_id', ''),
+            receptor=request.GET.get('receptor_id', ''),
+            estado=request.GET.get('estado', ''),
+        )
+    except ValueError:
+        return HttpResponse('Fecha inválida, use el formato AAAA-MM-DD', status=400)
+    
+    response = StreamingHttpResponse(
+        ExportacionCFDIService.generar_zip(
+            facturas, incluir_pdf=request.GET.get('pdf', '1') != '0', renderizar_faltantes=False
+        ),
+        content_type='application/zip'
+    )
+    response['Content-Disposition'] = f'attachment; filename="cfdi_{timezone.now():%Y%m%d_%H%M}.zip"'
+    return response
+
+
 # Vistas AJAX existentes
 
 
@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+
+from core.services.cadena_original import CadenaOriginal
+from core.services.xml_builder import XMLCFDIBuilder
+from core.utils.cfdi_prueba import CERTIFICADO_PRUEBA, factura_en_memoria, medir
+
+
+class Command(BaseCommand):
+    help = 'Mide el costo por documento de la cadena original con 1, 50 y 500 conceptos (sin base de datos)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--conceptos',
+            type=int,
+            nargs='+',
+            default=[1, 50, 500],
+            help='Número de conceptos por factura de cada escenario',
+        )
+        parser.add_argument('--repeticiones', type=int, default=200, help='Documentos por escenario')
+
+    def handle(self, *args, **options):
+        repeticiones = options['repeticiones']
+
+        self.stdout.write(f"{'Conceptos':>10} {'Desde modelos':>16} {'Desde XML':>14} {'Árbol + cadena':>16}")
+        for num_conceptos in options['conceptos']:
+            factura, detalles = factura_en_memoria(num_conceptos)
+            arbol = XMLCFDIBuilder.construir_arbol_cfdi(factura, detalles, CERTIFICADO_PRUEBA)
+            xml_cfdi = XMLCFDIBuilder.serializar_xml(arbol)
+
+            desde_modelos = CadenaOriginal.generar(arbol)
+            if desde_modelos != CadenaOriginal.desde_xml(xml_cfdi):
+                self.stdout.write(self.style.ERROR(f'{num_conceptos} conceptos: la cadena difiere entre árbol y XML'))
+
+            solo_arbol = medir(lambda: CadenaOriginal.generar(arbol), repeticiones)
+            solo_xml = medir(lambda: CadenaOriginal.desde_xml(xml_cfdi), repeticiones)
+            completo = medir(
+                lambda: CadenaOriginal.generar(XMLCFDIBuilder.construir_arbol_cfdi(factura, detalles, CERTIFICADO_PRUEBA)),
+                repeticiones,
+            )
+
+            self.stdout.write(
+                f'{num_conceptos:>10} {solo_arbol * 1000:>13.3f} ms {solo_xml * 1000:>11.3f} ms '
+                f'{completo * 1000:>13.3f} ms'
+            )
+
+        self.stdout.write(
+            f'Longitud de la última cadena: {len(desde_modelos)} caracteres. '
+            f'"Desde modelos" recorre el árbol ya construido; "Desde XML" incluye el parseo.'
+        )
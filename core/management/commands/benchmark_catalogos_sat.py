@@ -0,0 +1,93 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.services.catalogo_sat_local import CatalogoSATLocal
+from core.services.indice_catalogo_sat import CATALOGOS_AUTOCOMPLETAR, IndiceCatalogoSAT
+
+# Lo que típicamente se escribe en el formulario de productos (parcial, sin acentos, con códigos)
+CONSULTAS = {
+    'productos-servicios': [
+        '5', '50', '5011', '10171', 'tom', 'tomate', 'jitomate', 'chile', 'aguacate', 'fertiliz', 'fertilizante',
+        'semilla maiz', 'sem ma', 'plaguic', 'diesel', 'gasolina', 'flete', 'transporte carga', 'servicio',
+        'caja carton', 'cajas de carton', 'riego', 'tuberia pvc', 'mano de obra', 'renta', 'arrendamiento',
+        'agroquimico', 'fungicida', 'herbicida', 'insecticida', 'abono organico', 'empaque', 'refaccion',
+        'llanta', 'aceite motor', 'electricidad', 'honorarios', 'asesoria', 'papeleria', 'limon', 'pepino',
+    ],
+    'claves-unidad': [
+        'H', 'H8', 'KG', 'k', 'kilo', 'kilogramo', 'pieza', 'pz', 'caja', 'tonelada', 'litro', 'lt', 'metro',
+        'metro cubico', 'servicio', 'actividad', 'hora', 'dia', 'paquete', 'unidad', 'bulto', 'saco', 'rollo',
+    ],
+}
+
+
+def percentil(tiempos, porcentaje: float) -> float:
+    ordenados = sorted(tiempos)
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * porcentaje / 100))]
+
+
+class Command(BaseCommand):
+    help = (
+        'Mide la latencia (p50/p99) del autocompletado de ClaveProdServ y ClaveUnidad con el índice en '
+        'memoria y la compara con la búsqueda directa en el almacén local'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeticiones', type=int, default=200, help='Rondas sobre la lista de consultas')
+        parser.add_argument('--limite', type=int, default=20, help='Resultados por consulta')
+        parser.add_argument(
+            '--consulta',
+            action='append',
+            help='Medir esta consulta en lugar de la lista predefinida; se puede repetir',
+        )
+
+    def handle(self, *args, **options):
+        if not CatalogoSATLocal.disponible():
+            raise CommandError('No hay catálogos SAT cargados (ejecuta cargar_catalogos_sat)')
+
+        inicio = time.perf_counter()
+        cargados = IndiceCatalogoSAT.precargar()
+        self.stdout.write(f'Índices construidos en {(time.perf_counter() - inicio) * 1000:.0f} ms')
+        for catalogo, registros in cargados.items():
+            self.stdout.write(f'  {catalogo}: {registros} registros')
+
+        self.stdout.write(
+            f"{'Catálogo':>20} {'Consultas':>10} {'Índice p50':>12} {'Índice p99':>12} "
+            f"{'SQLite p50':>12} {'SQLite p99':>12}"
+        )
+        for nombre, catalogo in CATALOGOS_AUTOCOMPLETAR.items():
+            if catalogo not in cargados:
+                self.stdout.write(self.style.WARNING(f'{nombre}: catálogo {catalogo} no cargado'))
+                continue
+            consultas = options['consulta'] or CONSULTAS[nombre]
+            indice = self._medir(
+                lambda texto: IndiceCatalogoSAT.buscar(nombre, texto, options['limite']), consultas,
+                options['repeticiones'],
+            )
+            sqlite = self._medir(
+                lambda texto: CatalogoSATLocal.buscar(catalogo, texto, options['limite']), consultas,
+                max(1, options['repeticiones'] // 10),
+            )
+            self.stdout.write(
+                f'{nombre:>20} {len(indice):>10} {percentil(indice, 50) * 1000:>9.3f} ms '
+                f'{percentil(indice, 99) * 1000:>9.3f} ms {percentil(sqlite, 50) * 1000:>9.3f} ms '
+                f'{percentil(sqlite, 99) * 1000:>9.3f} ms'
+            )
+
+        self.stdout.write(
+            'La primera ronda se descarta (calentamiento) y el índice reutiliza los prefijos ya consultados. '
+            'SQLite busca solo por prefijo de la descripción completa; el índice, por prefijo de cada palabra.'
+        )
+
+    @staticmethod
+    def _medir(funcion, consultas, repeticiones: int):
+        """Segundos por consulta de cada llamada (con una ronda previa de calentamiento)"""
+        for texto in consultas:
+            funcion(texto)
+        tiempos = []
+        for _ in range(repeticiones):
+            for texto in consultas:
+                inicio = time.perf_counter()
+                funcion(texto)
+                tiempos.append(time.perf_counter() - inicio)
+        return tiempos
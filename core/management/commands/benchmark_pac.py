@@ -0,0 +1,66 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.core.management.base import BaseCommand
+
+from core.services.pac_client import PACProdigiaClient
+from core.services.pac_sesiones import PoolSesionesPAC
+from core.utils.pac_falso import ServidorPACFalso
+
+XML_PRUEBA = (
+    '<cfdi:Comprobante xmlns:cfdi="http://www.sat.gob.mx/cfd/4" Version="4.0" Serie="A" Folio="1" '
+    'SubTotal="100.00" Moneda="MXN" Total="116.00" TipoDeComprobante="I" Exportacion="01" '
+    'LugarExpedicion="12345"><cfdi:Emisor Rfc="EKU9003173C9" Nombre="EMISOR" RegimenFiscal="601"/>'
+    '<cfdi:Receptor Rfc="XAXX010101000" Nombre="PUBLICO EN GENERAL" UsoCFDI="S01"/>'
+    '</cfdi:Comprobante>'
+)
+
+
+class Command(BaseCommand):
+    help = 'Mide el timbrado contra un PAC falso local: conexión nueva por petición vs sesiones compartidas'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--solicitudes', type=int, default=200, help='Timbrados por escenario')
+        parser.add_argument('--hilos', type=int, default=8, help='Peticiones concurrentes')
+        parser.add_argument('--latencia', type=float, default=0.01, help='Segundos de respuesta del PAC falso')
+
+    def handle(self, *args, **options):
+        solicitudes = options['solicitudes']
+        hilos = options['hilos']
+
+        with ServidorPACFalso(latencia=options['latencia']) as pac:
+            configuracion = {
+                'url': pac.url,
+                'credenciales': {'usuario': 'prueba', 'password': 'prueba', 'contrato': 'prueba'},
+            }
+            cliente = PACProdigiaClient(configuracion)
+            endpoint = f'{pac.url}/wsTimbradoCFDI'
+
+            def sin_pool(_):
+                respuesta = requests.post(endpoint, data=XML_PRUEBA, timeout=30)
+                return cliente._procesar_respuesta_timbrado(respuesta.text)
+
+            def con_pool(_):
+                return cliente.timbrar_cfdi(XML_PRUEBA)
+
+            PoolSesionesPAC.reiniciar()
+            for nombre, funcion in (('Conexión por petición', sin_pool), ('Sesión compartida', con_pool)):
+                conexiones_previas = pac.conexiones
+                inicio = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=hilos) as ejecutor:
+                    resultados = list(ejecutor.map(funcion, range(solicitudes)))
+                duracion = time.perf_counter() - inicio
+                exitos = sum(1 for r in resultados if r.get('exito'))
+
+                self.stdout.write(
+                    f'{nombre}: {exitos}/{solicitudes} timbrados en {duracion:.2f}s '
+                    f'({solicitudes / duracion:.1f}/s), conexiones TCP: {pac.conexiones - conexiones_previas}'
+                )
+
+            for endpoint_pac, metricas in PoolSesionesPAC.metricas().items():
+                self.stdout.write(
+                    f"{endpoint_pac}: {metricas['solicitudes']} solicitudes, {metricas['errores']} errores, "
+                    f"latencia promedio {metricas['latencia_promedio'] * 1000:.1f} ms, "
+                    f"máxima {metricas['latencia_maxima'] * 1000:.1f} ms"
+                )
@@ -0,0 +1,80 @@
+from cryptography.hazmat.primitives.asymmetric import rsa
+from django.core.management.base import BaseCommand
+
+from core.services.cadena_original import CadenaOriginal
+from core.services.certificado_service import CertificadoService
+from core.services.documento_cfdi import DocumentoCFDI
+from core.services.facturacion_service import FacturacionService
+from core.services.timbrado_service import TimbradoService
+from core.services.xml_builder import XMLCFDIBuilder
+from core.utils.cfdi_prueba import CERTIFICADO_PRUEBA, factura_en_memoria, medir
+from core.utils.pac_falso import timbrar_xml
+
+
+class Command(BaseCommand):
+    help = (
+        'Compara el ciclo XML de un timbrado (construir, sellar, re-sellar y leer la respuesta) '
+        'entre el motor etree con minidom y el motor lxml de un solo paso'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--conceptos',
+            type=int,
+            nargs='+',
+            default=[1, 50, 500],
+            help='Número de conceptos por factura de cada escenario',
+        )
+        parser.add_argument('--repeticiones', type=int, default=100, help='Documentos por escenario')
+
+    def handle(self, *args, **options):
+        repeticiones = options['repeticiones']
+        llave = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        # Solo se usan los métodos de parseo; no se conecta a ningún PAC
+        servicio = TimbradoService.__new__(TimbradoService)
+
+        def ciclo_etree(factura, detalles):
+            # Ruta anterior: árbol -> minidom -> parseo para re-sellar -> regex -> parseos de la respuesta
+            arbol = XMLCFDIBuilder.construir_arbol_cfdi(factura, detalles, CERTIFICADO_PRUEBA, motor='etree')
+            sello = CertificadoService.generar_sello_digital(CadenaOriginal.generar(arbol), llave)
+            arbol.set('Sello', sello)
+            xml_cfdi = XMLCFDIBuilder.serializar_xml(arbol)
+
+            sello = CertificadoService.generar_sello_digital(XMLCFDIBuilder.generar_cadena_original(xml_cfdi), llave)
+            xml_cfdi = XMLCFDIBuilder.actualizar_sello_y_certificado(
+                xml_cfdi, sello, CERTIFICADO_PRUEBA['no_certificado'], CERTIFICADO_PRUEBA['certificado_base64']
+            )
+
+            xml_timbrado, _ = timbrar_xml(xml_cfdi)
+            XMLCFDIBuilder.extraer_timbre_fiscal(xml_timbrado)
+            servicio._extraer_cadena_original_sat(xml_timbrado)
+            FacturacionService._extraer_cadena_original_sat(xml_timbrado)
+            return xml_cfdi
+
+        def ciclo_lxml(factura, detalles):
+            # Motor lxml: un árbol sellado en memoria, una serialización y un parseo de la respuesta
+            documento = DocumentoCFDI.construir(factura, detalles, CERTIFICADO_PRUEBA)
+            documento.sellar(CertificadoService.generar_sello_digital(documento.cadena_original(), llave))
+            xml_cfdi = documento.xml
+
+            xml_timbrado, _ = timbrar_xml(xml_cfdi)
+            documento_timbrado = DocumentoCFDI.desde_xml(xml_timbrado)
+            documento_timbrado.timbre()
+            servicio._extraer_cadena_original_sat(documento_timbrado.raiz)
+            FacturacionService._extraer_cadena_original_sat(documento_timbrado.raiz)
+            return xml_cfdi
+
+        self.stdout.write(
+            f"{'Conceptos':>10} {'Motor':>6} {'Bytes XML':>11} {'ms/doc':>9} {'docs/s':>9}"
+        )
+        for num_conceptos in options['conceptos']:
+            factura, detalles = factura_en_memoria(num_conceptos)
+            tiempos = {}
+            for motor, ciclo in (('etree', ciclo_etree), ('lxml', ciclo_lxml)):
+                tamano = len(ciclo(factura, detalles).encode('utf-8'))
+                tiempos[motor] = medir(lambda: ciclo(factura, detalles), repeticiones)
+                self.stdout.write(
+                    f'{num_conceptos:>10} {motor:>6} {tamano:>11} {tiempos[motor] * 1000:>9.3f} '
+                    f'{1 / tiempos[motor]:>9.0f}'
+                )
+            self.stdout.write(f"{'':>10} lxml {tiempos['etree'] / tiempos['lxml']:.1f}x más rápido")
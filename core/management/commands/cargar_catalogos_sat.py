@@ -0,0 +1,74 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.services.catalogo_sat_local import CatalogoSATLocal
+
+
+class Command(BaseCommand):
+    help = (
+        'Carga los catálogos SAT desde archivos locales (CSV, XML/XSD, XLSX o XLS) al almacén '
+        'local de catálogos (settings.SAT_CATALOGOS_DB)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'origen',
+            nargs='?',
+            help='Archivo o directorio con los catálogos (por defecto settings.SAT_CATALOGOS_ORIGEN)',
+        )
+        parser.add_argument('--etiqueta', help='Etiqueta de la versión (por defecto, hash de los archivos)')
+        parser.add_argument(
+            '--catalogo',
+            action='append',
+            help='Cargar solo este catálogo (nombre SAT, p. ej. c_UsoCFDI); se puede repetir',
+        )
+        parser.add_argument('--forzar', action='store_true', help='Cargar aunque la versión ya esté cargada')
+        parser.add_argument('--info', action='store_true', help='Solo mostrar la versión cargada y sus catálogos')
+
+    def handle(self, *args, **options):
+        if options['info']:
+            self._mostrar_info()
+            return
+
+        origen = options['origen'] or getattr(settings, 'SAT_CATALOGOS_ORIGEN', None)
+        if not origen:
+            raise CommandError('Indica el archivo o directorio de catálogos (o settings.SAT_CATALOGOS_ORIGEN)')
+        try:
+            archivos = CatalogoSATLocal.archivos_origen(str(origen))
+        except FileNotFoundError:
+            raise CommandError(f'No existe {origen}')
+        if not archivos:
+            raise CommandError(f'No hay archivos de catálogos en {origen}')
+
+        version = options['etiqueta'] or CatalogoSATLocal.huella(archivos)
+        actual = CatalogoSATLocal.metadatos()
+        if actual['disponible'] and actual['version'] == version and not options['forzar']:
+            self.stdout.write(self.style.WARNING(f'La versión {version} ya está cargada (usa --forzar para recargar)'))
+            return
+
+        self.stdout.write(f'Cargando {len(archivos)} archivos como versión {version}...')
+        inicio = time.perf_counter()
+        try:
+            resultado = CatalogoSATLocal.cargar(archivos, version=version, catalogos=options['catalogo'])
+        except (ValueError, ImportError) as e:
+            raise CommandError(str(e))
+
+        for catalogo, registros in sorted(resultado['catalogos'].items()):
+            self.stdout.write(f'  {catalogo}: {registros} registros')
+        self.stdout.write(self.style.SUCCESS(
+            f'Catálogos SAT versión {resultado["version"]} cargados en {CatalogoSATLocal.ruta()} '
+            f'({time.perf_counter() - inicio:.1f}s)'
+        ))
+
+    def _mostrar_info(self):
+        info = CatalogoSATLocal.metadatos()
+        if not info['disponible']:
+            self.stdout.write(self.style.WARNING(f'No hay catálogos cargados ({info["ruta"]})'))
+            return
+        self.stdout.write(f'Archivo: {info["ruta"]}')
+        self.stdout.write(f'Versión: {info["version"]} (cargada {info["fecha_carga"]})')
+        self.stdout.write(f'Origen: {info["origen"]}')
+        for catalogo, registros in info['catalogos'].items():
+            self.stdout.write(f'  {catalogo}: {registros} registros')
@@ -0,0 +1,57 @@
+import os
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from core.services.exportacion_cfdi import ExportacionCFDIService
+from core.services.pdf_pool import PoolPDF
+from directiva_agricola.db_router import set_current_company_db
+
+
+class Command(BaseCommand):
+    help = 'Exporta en un ZIP los XML timbrados y PDF de las facturas de un periodo, emisor, receptor o estado'
+
+    def add_arguments(self, parser):
+        parser.add_argument('salida', help='Ruta del archivo ZIP a escribir')
+        parser.add_argument('--desde', type=date.fromisoformat, help='Fecha de emisión inicial (AAAA-MM-DD)')
+        parser.add_argument('--hasta', type=date.fromisoformat, help='Fecha de emisión final (AAAA-MM-DD)')
+        parser.add_argument('--emisor', help='Código del emisor')
+        parser.add_argument('--receptor', help='Código del receptor')
+        parser.add_argument('--estado', help='Estado de timbrado (TIMBRADO, CANCELADO, ...)')
+        parser.add_argument('--sin-pdf', action='store_true', help='Exportar solo los XML')
+        parser.add_argument(
+            '--procesos',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='Procesos del pool de PDF para los que no están en caché (por defecto todos los núcleos)',
+        )
+        parser.add_argument(
+            '--database',
+            default=DEFAULT_DB_ALIAS,
+            help='Alias de la base de datos de la empresa (por defecto "default")',
+        )
+
+    def handle(self, *args, **options):
+        set_current_company_db(options['database'])
+
+        facturas = ExportacionCFDIService.filtrar(
+            fecha_desde=options['desde'],
+            fecha_hasta=options['hasta'],
+            emisor=options['emisor'],
+            receptor=options['receptor'],
+            estado=options['estado'],
+        )
+        total = facturas.count()
+        if not total:
+            raise CommandError('No hay facturas timbradas con esos filtros')
+
+        self.stdout.write(f'Exportando {total} facturas a {options["salida"]}...')
+        PoolPDF.usar_procesos(options['procesos'])
+        tamano = 0
+        with open(options['salida'], 'wb') as archivo:
+            for parte in ExportacionCFDIService.generar_zip(facturas, incluir_pdf=not options['sin_pdf']):
+                archivo.write(parte)
+                tamano += len(parte)
+
+        self.stdout.write(self.style.SUCCESS(f'ZIP generado: {options["salida"]} ({tamano / 1024:.0f} KB)'))
@@ -0,0 +1,76 @@
+from datetime import timedelta
+from itertools import chain
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+from django.utils import timezone
+
+from core.models import Factura, PagoFactura
+from core.services.pdf_cache import CachePDF
+from core.services.pdf_service import WEASYPRINT_AVAILABLE, PDFService
+from directiva_agricola.db_router import set_current_company_db
+
+
+class Command(BaseCommand):
+    help = 'Renderiza y guarda en la caché de PDF los comprobantes timbrados recientemente'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--horas',
+            type=int,
+            default=24,
+            help='Comprobantes timbrados en las últimas N horas (por defecto 24)',
+        )
+        parser.add_argument('--todos', action='store_true', help='Todos los comprobantes timbrados')
+        parser.add_argument(
+            '--database',
+            default=DEFAULT_DB_ALIAS,
+            help='Alias de la base de datos de la empresa (por defecto "default")',
+        )
+
+    def handle(self, *args, **options):
+        if not WEASYPRINT_AVAILABLE:
+            raise CommandError('WeasyPrint no está disponible: no se pueden renderizar PDF')
+        if not CachePDF.activo():
+            raise CommandError('La caché de PDF está desactivada (PDF_CACHE_ACTIVO = False)')
+
+        set_current_company_db(options['database'])
+
+        facturas = Factura.objects.filter(estado_timbrado='TIMBRADO', uuid__isnull=False).select_related(
+            'emisor', 'receptor'
+        )
+        pagos = PagoFactura.objects.filter(uuid__isnull=False).exclude(uuid='').select_related(
+            'factura__emisor', 'factura__receptor'
+        )
+        if not options['todos']:
+            desde = timezone.now() - timedelta(hours=options['horas'])
+            facturas = facturas.filter(fecha_timbrado__gte=desde)
+            pagos = pagos.filter(fecha_creacion__gte=desde)
+
+        renderizados = existentes = errores = 0
+        trabajos = chain(
+            (('factura', PDFService.PLANTILLA_FACTURA, factura.uuid, PDFService.renderizar_pdf_factura, factura)
+             for factura in facturas.iterator()),
+            (('complemento_pago', PDFService.PLANTILLA_COMPLEMENTO_PAGO, pago.uuid,
+              PDFService.renderizar_pdf_complemento_pago, pago)
+             for pago in pagos.iterator()),
+        )
+
+        versiones = {
+            plantilla: CachePDF.version(plantilla)
+            for plantilla in (PDFService.PLANTILLA_FACTURA, PDFService.PLANTILLA_COMPLEMENTO_PAGO)
+        }
+        for tipo, plantilla, uuid, renderizar, documento in trabajos:
+            if CachePDF.existe(tipo, uuid, plantilla, versiones[plantilla]):
+                existentes += 1
+                continue
+            try:
+                CachePDF.obtener(tipo, uuid, plantilla, lambda: renderizar(documento), versiones[plantilla])
+                renderizados += 1
+            except Exception as e:
+                errores += 1
+                self.stdout.write(self.style.ERROR(f'{tipo} {uuid}: {e}'))
+
+        self.stdout.write(self.style.SUCCESS(
+            f'PDF renderizados: {renderizados}, ya en caché: {existentes}, con error: {errores}'
+        ))
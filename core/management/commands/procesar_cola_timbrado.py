@@ -0,0 +1,151 @@
+import logging
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, close_old_connections
+
+from core.services.cola_timbrado_service import ColaTimbradoService
+from core.services.conexiones_empresa import ConexionesEmpresa
+from directiva_agricola.db_router import set_current_company_db
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Worker de la cola de timbrado: timbra con el PAC los trabajos encolados por la interfaz'
+
+    def add_arguments(self, parser):
+        destino = parser.add_mutually_exclusive_group()
+        destino.add_argument(
+            '--database',
+            default=DEFAULT_DB_ALIAS,
+            help='Alias o db_name de la empresa cuya cola se atiende (por defecto "default")',
+        )
+        destino.add_argument(
+            '--todas',
+            action='store_true',
+            help='Atender las colas de todas las empresas activas y no suspendidas, por turnos',
+        )
+        parser.add_argument(
+            '--intervalo',
+            type=float,
+            default=2.0,
+            help='Segundos de espera cuando la cola está vacía',
+        )
+        parser.add_argument(
+            '--una-vez',
+            action='store_true',
+            help='Procesar los trabajos pendientes y terminar',
+        )
+        parser.add_argument(
+            '--max-trabajos',
+            type=int,
+            default=0,
+            help='Terminar después de procesar este número de trabajos (0 = sin límite)',
+        )
+        parser.add_argument(
+            '--liberar-minutos',
+            type=int,
+            default=10,
+            help='Minutos tras los cuales un trabajo en proceso se considera interrumpido',
+        )
+
+    def handle(self, *args, **options):
+        self.liberar_minutos = options['liberar_minutos']
+        self.iniciadas = set()
+        intervalo = options['intervalo']
+        max_trabajos = options['max_trabajos']
+
+        if options['todas']:
+            self.stdout.write(self.style.SUCCESS('Worker de timbrado iniciado para todas las empresas activas'))
+        else:
+            using = self._alias(options['database'])
+            self.stdout.write(self.style.SUCCESS(f"Worker de timbrado iniciado en '{using}'"))
+
+        procesados = 0
+        try:
+            while True:
+                close_old_connections()
+                # Una vuelta: un trabajo por empresa, para que una cola larga no acapare el worker
+                aliases = self._aliases_activos() if options['todas'] else [using]
+                atendidos = 0
+                for alias in aliases:
+                    if self._atender_uno(alias):
+                        atendidos += 1
+                        procesados += 1
+                        if max_trabajos and procesados >= max_trabajos:
+                            break
+
+                if max_trabajos and procesados >= max_trabajos:
+                    break
+                if not atendidos:
+                    if options['una_vez']:
+                        break
+                    time.sleep(intervalo)
+        except KeyboardInterrupt:
+            self.stdout.write('Worker detenido')
+        finally:
+            set_current_company_db(None)
+
+        self.stdout.write(f'Trabajos procesados: {procesados}')
+
+    def _alias(self, database):
+        """Registra la BD de la empresa en connections.databases (como EmpresaDbMiddleware)"""
+        try:
+            return ConexionesEmpresa.registrar(database)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+    def _aliases_activos(self):
+        """Alias de las empresas activas y no suspendidas; se relee en cada vuelta"""
+        from administracion.models import Empresa
+
+        db_names = Empresa.objects.using('administracion').filter(
+            activo=True, suspendido=False
+        ).values_list('db_name', flat=True)
+        aliases = []
+        for db_name in db_names:
+            try:
+                aliases.append(ConexionesEmpresa.registrar(db_name))
+            except ValueError as e:
+                logger.error(str(e))
+        return aliases
+
+    def _atender_uno(self, alias):
+        """Toma y procesa el siguiente trabajo de la cola de la empresa; False si no había"""
+        # Todas las consultas de core se enrutan a la base de datos de la empresa
+        set_current_company_db(alias)
+        try:
+            if alias not in self.iniciadas:
+                interrumpidos = ColaTimbradoService.liberar_trabajos_interrumpidos(self.liberar_minutos)
+                if interrumpidos:
+                    self.stdout.write(self.style.WARNING(
+                        f"Trabajos interrumpidos en '{alias}' marcados con error: {interrumpidos}"
+                    ))
+                self.iniciadas.add(alias)
+            trabajo = ColaTimbradoService.tomar_siguiente()
+        except DatabaseError as e:
+            logger.error(f"No se pudo leer la cola de timbrado de '{alias}': {e}")
+            return False
+
+        if trabajo is None:
+            return False
+
+        inicio = time.monotonic()
+        try:
+            resultado = ColaTimbradoService.procesar(trabajo)
+        except Exception as e:
+            logger.exception(f'Error procesando trabajo de timbrado {trabajo.pk} en {alias}')
+            resultado = {'exito': False, 'error': str(e), 'codigo_error': 'WORKER_ERROR'}
+            ColaTimbradoService.registrar_resultado(trabajo, resultado)
+
+        duracion = time.monotonic() - inicio
+        if resultado.get('exito'):
+            self.stdout.write(self.style.SUCCESS(
+                f"[{alias}] Factura {trabajo.factura_folio}: timbrada {resultado.get('uuid', '')} ({duracion:.1f}s)"
+            ))
+        else:
+            self.stdout.write(self.style.ERROR(
+                f"[{alias}] Factura {trabajo.factura_folio}: {resultado.get('error', 'Error desconocido')} ({duracion:.1f}s)"
+            ))
+        return True
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+from core.models import Existencia
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye la tabla materializada de existencias a partir del kardex'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--database',
+            default=DEFAULT_DB_ALIAS,
+            help='Alias de la base de datos a reconstruir (por defecto "default")',
+        )
+
+    def handle(self, *args, **options):
+        using = options['database']
+
+        self.stdout.write(f"Reconstruyendo existencias en '{using}'...")
+        total = Existencia.reconstruir(using=using)
+        logger.info(f"Existencias reconstruidas en {using}: {total}")
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Existencias reconstruidas: {total}')
+        )
@@ -0,0 +1,66 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from core.models import Factura
+from core.services.conexiones_empresa import ConexionesEmpresa
+from core.services.timbrado_lote_service import TimbradoLoteService
+from directiva_agricola.db_router import set_current_company_db
+
+
+class Command(BaseCommand):
+    help = 'Timbra varias facturas: genera todos los XML y los envía al PAC con concurrencia limitada'
+
+    def add_arguments(self, parser):
+        parser.add_argument('folios', nargs='*', type=int, help='Folios de las facturas a timbrar')
+        parser.add_argument(
+            '--pendientes',
+            action='store_true',
+            help='Timbrar todas las facturas con estado de timbrado PENDIENTE',
+        )
+        parser.add_argument('--emisor', type=int, help='Con --pendientes, solo las de este emisor')
+        parser.add_argument(
+            '--paralelismo',
+            type=int,
+            default=None,
+            help='Peticiones simultáneas al PAC (por defecto settings.TIMBRADO_LOTE_PARALELISMO)',
+        )
+        parser.add_argument(
+            '--database',
+            default=DEFAULT_DB_ALIAS,
+            help='Alias o db_name de la empresa (por defecto "default")',
+        )
+
+    def handle(self, *args, **options):
+        # Registrar la BD de la empresa como lo hace EmpresaDbMiddleware
+        try:
+            set_current_company_db(ConexionesEmpresa.registrar(options['database']))
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        folios = list(options['folios'])
+        if options['pendientes']:
+            pendientes = Factura.objects.filter(estado_timbrado='PENDIENTE')
+            if options['emisor']:
+                pendientes = pendientes.filter(emisor_id=options['emisor'])
+            folios += list(pendientes.order_by('folio').values_list('folio', flat=True))
+
+        if not folios:
+            raise CommandError('Indique los folios a timbrar o use --pendientes')
+
+        self.stdout.write(f'Timbrando {len(folios)} facturas...')
+
+        def progreso(resultado):
+            if resultado['exito']:
+                self.stdout.write(self.style.SUCCESS(f"Factura {resultado['folio']}: timbrada {resultado['uuid']}"))
+            else:
+                self.stdout.write(self.style.ERROR(
+                    f"Factura {resultado['folio']} ({resultado['etapa']}): {resultado['error']}"
+                ))
+
+        resumen = TimbradoLoteService.timbrar_lote(folios, options['paralelismo'], progreso=progreso)
+
+        self.stdout.write(
+            f"Timbradas: {resumen['exitosos']}, con error: {resumen['fallidos']}, "
+            f"{resumen['duracion']:.1f}s ({resumen['facturas_por_segundo']:.1f} facturas/s, "
+            f"paralelismo {resumen['paralelismo']})"
+        )
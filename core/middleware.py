@@ -1,5 +1,6 @@
 from django.utils import timezone
 from django.conf import settings
+from django.http import FileResponse
 
 class TimezoneMiddleware:
     def __init__(self, get_response):
@@ -36,3 +37,170 @@ class StaticFilesNoCacheMiddleware:
             response['Pragma'] = 'no-cache'
             response['Expires'] = '0'
         return response
+
+
+class EmpresaDbMiddleware:
+    """
+    Dirige las consultas de la petición a la BD de la empresa de la sesión
+
+    La empresa se guarda en la sesión al iniciar sesión (`empresa_rfc`) y se resuelve contra
+    administracion.Empresa; el alias queda registrado en el worker (ConexionesEmpresa).
+    Si la empresa se suspende o se da de baja, la sesión se cierra.
+
+    Los alias de empresas se registran sin ATOMIC_REQUESTS (Django abriría una transacción en
+    cada BD registrada en el worker); con ATOMIC_REQUESTS en 'default', la vista se envuelve
+    aquí en transaction.atomic(using=alias) solo para la BD de la empresa de la petición,
+    respetando transaction.non_atomic_requests y core.decorators.no_atomica. Los métodos que
+    escriben (POST, PUT, PATCH, DELETE) usan atomic_escritura: la vista valida leyendo antes de
+    escribir y, con BEGIN diferido, SQLite no esperaría el bloqueo al primer UPDATE.
+    """
+
+    METODOS_SEGUROS = ('GET', 'HEAD', 'OPTIONS')
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        from directiva_agricola.db_router import set_current_company_db
+        from .services.conexiones_empresa import ConexionesEmpresa
+
+        alias = self.alias_sesion(request)
+        set_current_company_db(alias)
+        try:
+            response = self.get_response(request)
+        except BaseException as e:
+            self._terminar_transaccion(request, e)
+            raise
+        else:
+            self._terminar_transaccion(request)
+        finally:
+            set_current_company_db(None)
+            ConexionesEmpresa.liberar()
+
+        # Las respuestas en streaming consultan la BD mientras se envían
+        if alias and response.streaming and not response.is_async and not isinstance(response, FileResponse):
+            response.streaming_content = self._con_empresa(alias, response.streaming_content)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        from django.db import connections, transaction
+        from directiva_agricola.db_router import get_current_company_db
+        from directiva_agricola.transacciones import atomic_escritura
+
+        alias = get_current_company_db()
+        if (
+            alias
+            and connections.databases['default'].get('ATOMIC_REQUESTS')
+            and alias not in getattr(view_func, '_non_atomic_requests', set())
+        ):
+            if request.method in self.METODOS_SEGUROS:
+                request._transaccion_empresa = transaction.atomic(using=alias)
+            else:
+                request._transaccion_empresa = atomic_escritura(using=alias)
+            request._transaccion_empresa.__enter__()
+        return None
+
+    def process_exception(self, request, exception):
+        # Igual que ATOMIC_REQUESTS: un error en la vista revierte la transacción
+        self._terminar_transaccion(request, exception)
+        return None
+
+    @staticmethod
+    def _terminar_transaccion(request, error=None):
+        transaccion = request.__dict__.pop('_transaccion_empresa', None)
+        if transaccion is not None:
+            if error is None:
+                transaccion.__exit__(None, None, None)
+            else:
+                transaccion.__exit__(type(error), error, error.__traceback__)
+
+    @staticmethod
+    def alias_sesion(request):
+        """Alias de la BD de la empresa de la sesión (None para la BD por defecto)"""
+        from .services.conexiones_empresa import ConexionesEmpresa
+
+        rfc = request.session.get('empresa_rfc')
+        if rfc:
+            alias = ConexionesEmpresa.alias_para_rfc(rfc)
+            if alias is None:
+                request.session.flush()
+            return alias
+
+        # Sesiones anteriores guardaban directamente el nombre de la BD
+        db_name = request.session.get('empresa_db')
+        if db_name and db_name != 'default':
+            try:
+                return ConexionesEmpresa.registrar(db_name)
+            except ValueError:
+                request.session.pop('empresa_db', None)
+        return None
+
+    @staticmethod
+    def _con_empresa(alias, contenido):
+        from directiva_agricola.db_router import set_current_company_db
+
+        set_current_company_db(alias)
+        try:
+            yield from contenido
+        finally:
+            set_current_company_db(None)
+
+
+class SoloLecturaMiddleware:
+    """
+    Pone en solo lectura la conexión de la petición para las vistas marcadas con
+    core.decorators.solo_lectura (o SoloLecturaMixin) en GET/HEAD, y la restaura al terminar
+
+    Va después de EmpresaDbMiddleware: usa la BD de la empresa de la sesión. Las vistas ya no
+    corren dentro de una transacción (ATOMIC_REQUESTS), así que en SQLite no hacen esperar a
+    las escrituras de otros workers y en PostgreSQL no mantienen un snapshot abierto.
+    """
+
+    METODOS = ('GET', 'HEAD')
+
+    # vendor -> (activar, restaurar)
+    SENTENCIAS = {
+        'sqlite': ('PRAGMA query_only = ON', 'PRAGMA query_only = OFF'),
+        'postgresql': ('SET default_transaction_read_only = on', 'SET default_transaction_read_only = off'),
+        'mysql': ('SET SESSION TRANSACTION READ ONLY', 'SET SESSION TRANSACTION READ WRITE'),
+    }
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        try:
+            return self.get_response(request)
+        finally:
+            alias = getattr(request, '_alias_solo_lectura', None)
+            if alias:
+                self._restaurar(alias)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        from django.db import connections
+        from directiva_agricola.db_router import get_current_company_db
+
+        if request.method not in self.METODOS or not getattr(view_func, 'solo_lectura', False):
+            return None
+
+        alias = get_current_company_db() or 'default'
+        conexion = connections[alias]
+        sentencias = self.SENTENCIAS.get(conexion.vendor)
+        if sentencias and not conexion.in_atomic_block:
+            with conexion.cursor() as cursor:
+                cursor.execute(sentencias[0])
+            request._alias_solo_lectura = alias
+        return None
+
+    def _restaurar(self, alias):
+        from django.db import connections
+
+        conexion = connections[alias]
+        if conexion.connection is None:
+            return
+        try:
+            with conexion.cursor() as cursor:
+                cursor.execute(self.SENTENCIAS[conexion.vendor][1])
+        except Exception:
+            # Una conexión persistente no debe quedar en solo lectura para la siguiente petición
+            conexion.close()
@@ -0,0 +1,62 @@
+# Generated by Django 5.2.5 on 2025-10-18 10:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def poblar_existencias(apps, schema_editor):
+    """Carga las existencias iniciales con el último movimiento de kardex de cada producto/almacén"""
+    Kardex = apps.get_model('core', 'Kardex')
+    Existencia = apps.get_model('core', 'Existencia')
+    using = schema_editor.connection.alias
+
+    ultimo_id = Kardex.objects.using(using).filter(
+        producto=models.OuterRef('producto'),
+        almacen=models.OuterRef('almacen')
+    ).order_by('-fecha', '-id').values('id')[:1]
+
+    ultimos_movimientos = Kardex.objects.using(using).annotate(
+        ultimo_id=models.Subquery(ultimo_id)
+    ).filter(id=models.F('ultimo_id'))
+
+    Existencia.objects.using(using).bulk_create([
+        Existencia(
+            producto_id=movimiento.producto_id,
+            almacen_id=movimiento.almacen_id,
+            existencia=movimiento.existencia_actual,
+            costo_promedio=movimiento.costo_promedio_actual,
+            fecha_ultimo_movimiento=movimiento.fecha
+        )
+        for movimiento in ultimos_movimientos.iterator()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0059_alter_productoservicio_impuesto_impuesto_and_more'),
+        ('core', '0071_otromovimiento_otromovimientodetalle'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Existencia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('existencia', models.DecimalField(decimal_places=2, default=0, help_text='Existencia actual según el último movimiento del kardex', max_digits=10, verbose_name='Existencia')),
+                ('costo_promedio', models.DecimalField(decimal_places=2, default=0, help_text='Costo promedio actual según el último movimiento del kardex', max_digits=10, verbose_name='Costo Promedio')),
+                ('fecha_ultimo_movimiento', models.DateTimeField(blank=True, null=True, verbose_name='Fecha del último movimiento')),
+                ('fecha_modificacion', models.DateTimeField(auto_now=True, verbose_name='Fecha de modificación')),
+                ('almacen', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.almacen', verbose_name='Almacén')),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.productoservicio', verbose_name='Producto/Servicio')),
+            ],
+            options={
+                'verbose_name': 'Existencia',
+                'verbose_name_plural': 'Existencias',
+                'db_table': 'existencias',
+                'ordering': ['almacen', 'producto'],
+                'unique_together': {('producto', 'almacen')},
+            },
+        ),
+        migrations.RunPython(poblar_existencias, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.5 on 2025-10-18 10:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0072_existencia'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='kardex',
+            index=models.Index(fields=['producto', 'almacen', 'fecha', 'id'], name='kardex_prod_alm_fecha_idx'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.5 on 2025-10-18 10:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0073_kardex_producto_almacen_fecha_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrabajoTimbrado',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('factura_folio', models.IntegerField(help_text='Folio de la factura (se conserva aunque la factura se elimine)', verbose_name='Folio de la factura')),
+                ('estado', models.CharField(choices=[('PENDIENTE', 'Pendiente'), ('EN_PROCESO', 'En proceso'), ('COMPLETADO', 'Completado'), ('ERROR', 'Error')], default='PENDIENTE', max_length=20, verbose_name='Estado')),
+                ('eliminar_factura_si_falla', models.BooleanField(default=False, help_text='Eliminar la factura si el timbrado no se completa (captura desde facturación)', verbose_name='Eliminar factura si falla')),
+                ('intentos', models.PositiveIntegerField(default=0, verbose_name='Intentos')),
+                ('uuid', models.CharField(blank=True, help_text='UUID asignado por el PAC al completar el timbrado', max_length=36, null=True, verbose_name='UUID')),
+                ('fecha_timbrado', models.CharField(blank=True, help_text='Fecha de timbrado devuelta por el PAC', max_length=30, null=True, verbose_name='Fecha de timbrado')),
+                ('error', models.TextField(blank=True, null=True, verbose_name='Error')),
+                ('codigo_error', models.CharField(blank=True, max_length=50, null=True, verbose_name='Código de error')),
+                ('detalles_error', models.TextField(blank=True, help_text='Detalles de validación separados por salto de línea', null=True, verbose_name='Detalles del error')),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True, verbose_name='Fecha de creación')),
+                ('fecha_inicio', models.DateTimeField(blank=True, null=True, verbose_name='Fecha de inicio')),
+                ('fecha_fin', models.DateTimeField(blank=True, null=True, verbose_name='Fecha de fin')),
+                ('factura', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='trabajos_timbrado', to='core.factura', verbose_name='Factura')),
+            ],
+            options={
+                'verbose_name': 'Trabajo de Timbrado',
+                'verbose_name_plural': 'Trabajos de Timbrado',
+                'db_table': 'trabajos_timbrado',
+                'ordering': ['fecha_creacion', 'id'],
+                'indexes': [models.Index(fields=['estado', 'fecha_creacion'], name='trabajos_ti_estado_1e0a2d_idx')],
+            },
+        ),
+    ]
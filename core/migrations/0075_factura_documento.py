@@ -0,0 +1,92 @@
+# Generated by Django 5.2.5 on 2025-10-18 11:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+CAMPOS_DOCUMENTO = (
+    'xml_original', 'xml_timbrado', 'codigo_qr', 'sello', 'sello_sat',
+    'certificado', 'cadena_original_sat', 'acuse_cancelacion',
+)
+
+
+def mover_documentos(apps, schema_editor):
+    """Copia las columnas pesadas de cada factura a facturas_documentos con un solo INSERT ... SELECT"""
+    q = schema_editor.quote_name
+    columnas = ', '.join(q(campo) for campo in CAMPOS_DOCUMENTO)
+    con_datos = ' OR '.join(f'{q(campo)} IS NOT NULL' for campo in CAMPOS_DOCUMENTO)
+    schema_editor.execute(
+        f'INSERT INTO {q("facturas_documentos")} ({q("factura_id")}, {columnas}) '
+        f'SELECT {q("folio")}, {columnas} FROM {q("facturas")} WHERE {con_datos}'
+    )
+
+
+def regresar_documentos(apps, schema_editor):
+    q = schema_editor.quote_name
+    asignaciones = ', '.join(
+        f'{q(campo)} = (SELECT d.{q(campo)} FROM {q("facturas_documentos")} d '
+        f'WHERE d.{q("factura_id")} = {q("facturas")}.{q("folio")})'
+        for campo in CAMPOS_DOCUMENTO
+    )
+    schema_editor.execute(f'UPDATE {q("facturas")} SET {asignaciones}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0074_trabajotimbrado'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FacturaDocumento',
+            fields=[
+                ('factura', models.OneToOneField(help_text='Factura a la que pertenece el documento', on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='documento', serialize=False, to='core.factura', verbose_name='Factura')),
+                ('xml_original', models.TextField(blank=True, help_text='XML original antes del timbrado', null=True, verbose_name='XML Original')),
+                ('xml_timbrado', models.TextField(blank=True, help_text='XML timbrado por el PAC', null=True, verbose_name='XML Timbrado')),
+                ('codigo_qr', models.TextField(blank=True, help_text='Código QR de la factura en Base64 (proporcionado por el PAC)', null=True, verbose_name='Código QR')),
+                ('sello', models.TextField(blank=True, help_text='Sello digital del comprobante en Base64', null=True, verbose_name='Sello')),
+                ('sello_sat', models.TextField(blank=True, help_text='Sello digital del SAT en Base64', null=True, verbose_name='SelloSAT')),
+                ('certificado', models.TextField(blank=True, help_text='Certificado del emisor en Base64', null=True, verbose_name='Certificado')),
+                ('cadena_original_sat', models.TextField(blank=True, help_text='Cadena original del complemento SAT (SelloCFD del timbre fiscal)', null=True, verbose_name='Cadena Original complemento SAT')),
+                ('acuse_cancelacion', models.TextField(blank=True, help_text='Acuse de cancelación del SAT', null=True, verbose_name='Acuse de Cancelación')),
+            ],
+            options={
+                'verbose_name': 'Documento de Factura',
+                'verbose_name_plural': 'Documentos de Factura',
+                'db_table': 'facturas_documentos',
+            },
+        ),
+        migrations.RunPython(mover_documentos, regresar_documentos),
+        migrations.RemoveField(
+            model_name='factura',
+            name='acuse_cancelacion',
+        ),
+        migrations.RemoveField(
+            model_name='factura',
+            name='cadena_original_sat',
+        ),
+        migrations.RemoveField(
+            model_name='factura',
+            name='certificado',
+        ),
+        migrations.RemoveField(
+            model_name='factura',
+            name='codigo_qr',
+        ),
+        migrations.RemoveField(
+            model_name='factura',
+            name='sello',
+        ),
+        migrations.RemoveField(
+            model_name='factura',
+            name='sello_sat',
+        ),
+        migrations.RemoveField(
+            model_name='factura',
+            name='xml_original',
+        ),
+        migrations.RemoveField(
+            model_name='factura',
+            name='xml_timbrado',
+        ),
+    ]
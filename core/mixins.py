@@ -1,55 +1,29 @@
-from django.conf import settings
-from django.db import connections
-
-
 class EmpresaDbMixin:
     """
     Mixin que asegura que la vista use la base de datos correcta de la empresa
+    (lo mismo que hace EmpresaDbMiddleware, para vistas servidas sin el middleware)
     """
     
     def dispatch(self, request, *args, **kwargs):
-        # Solo aplicar si el usuario está autenticado
-        if hasattr(request, 'user') and request.user.is_authenticated:
-            empresa_db = request.session.get('empresa_db')
-            if empresa_db and empresa_db != 'default':
-                try:
-                    empresa_db_path = f'{empresa_db}.sqlite3'
-                    
-                    # Crear configuración completa de la base de datos
-                    empresa_db_config = {
-                        'ENGINE': 'django.db.backends.sqlite3',
-                        'NAME': empresa_db_path,
-                        'ATOMIC_REQUESTS': True,
-                        'AUTOCOMMIT': True,
-                        'CONN_HEALTH_CHECKS': False,
-                        'CONN_MAX_AGE': 0,
-                        'HOST': '',
-                        'OPTIONS': {},
-                        'PASSWORD': '',
-                        'PORT': '',
-                        'TEST': {
-                            'CHARSET': None,
-                            'COLLATION': None,
-                            'MIGRATE': True,
-                            'MIRROR': None,
-                            'NAME': None
-                        },
-                        'TIME_ZONE': None,
-                        'USER': ''
-                    }
-                    
-                    # Solo actualizar si la configuración es diferente
-                    current_config = settings.DATABASES.get('default', {})
-                    if current_config.get('NAME') != empresa_db_path:
-                        # Actualizar la configuración de la base de datos
-                        settings.DATABASES['default'] = empresa_db_config
-                        
-                        # Registrar la conexión en el sistema de conexiones de Django
-                        connections.databases['default'] = empresa_db_config
-                        
-                except Exception as e:
-                    # Si hay error, limpiar la sesión y usar base por defecto
-                    request.session.pop('empresa_db', None)
-                    pass
-        
-        return super().dispatch(request, *args, **kwargs)
+        from directiva_agricola.db_router import get_current_company_db, set_current_company_db
+        from .middleware import EmpresaDbMiddleware
+
+        anterior = get_current_company_db()
+        if anterior is None:
+            set_current_company_db(EmpresaDbMiddleware.alias_sesion(request))
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            set_current_company_db(anterior)
+
+
+class SoloLecturaMixin:
+    """
+    Mixin para vistas de clase que solo leen (lo mismo que el decorador solo_lectura)
+    """
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        from .decorators import solo_lectura
+
+        return solo_lectura(super().as_view(**initkwargs))
@@ -1,11 +1,13 @@
-from django.db import models
+from django.db import models, router, transaction
 from django.contrib.auth.models import AbstractUser
 from django.contrib.auth.hashers import make_password
 from django.core.validators import RegexValidator, EmailValidator
 from django.core.exceptions import ValidationError
 from django.utils import timezone
 from django.conf import settings
+from .utils.query_utils import suma_subconsulta
 import re
+from decimal import Decimal, ROUND_HALF_EVEN
 
 # Create your models here.
 
@@ -1065,6 +1067,69 @@ class Cultivo(models.Model):
         super().save(*args, **kwargs)
 
 
+# Condiciones para considerar un detalle de remisión como preliquidado
+Q_DETALLE_CON_VALORES = (
+    models.Q(kgs_liquidados__gt=0) |
+    models.Q(kgs_merma__gt=0) |
+    models.Q(precio__gt=0) |
+    models.Q(importe_liquidado__gt=0)
+)
+Q_DETALLE_CON_AUDITORIA = models.Q(usuario_liquidacion__isnull=False, fecha_liquidacion__isnull=False)
+
+
+class RemisionQuerySet(models.QuerySet):
+    """QuerySet de remisiones con estado de liquidación y saldo calculados en la base de datos"""
+    
+    def with_liquidacion_state(self):
+        """Anota `liquidada` (equivalente a Remision.esta_liquidada) con una subconsulta EXISTS"""
+        detalles = RemisionDetalle.objects.filter(remision=models.OuterRef('pk'))
+        return self.annotate(
+            liquidada=models.Exists(detalles.filter(Q_DETALLE_CON_VALORES & Q_DETALLE_CON_AUDITORIA))
+        )
+    
+    def with_diagnostico_liquidacion(self):
+        """Anota el estado de liquidación y las banderas que explican por qué una remisión está pendiente"""
+        detalles = RemisionDetalle.objects.filter(remision=models.OuterRef('pk'))
+        return self.with_liquidacion_state().annotate(
+            tiene_detalles=models.Exists(detalles),
+            tiene_valores=models.Exists(detalles.filter(Q_DETALLE_CON_VALORES)),
+            tiene_auditoria=models.Exists(detalles.filter(Q_DETALLE_CON_AUDITORIA)),
+        )
+    
+    def with_saldo(self):
+        """Anota `importe_liquidado_total`, `total_pagado` y `saldo` (equivalente a Remision.saldo_pendiente)"""
+        return self.annotate(
+            importe_liquidado_total=suma_subconsulta(RemisionDetalle.objects.all(), 'remision', 'importe_liquidado'),
+            total_pagado=suma_subconsulta(PagoRemision.objects.filter(activo=True), 'remision', 'monto'),
+        ).annotate(
+            saldo=models.F('importe_liquidado_total') - models.F('total_pagado')
+        )
+    
+    def preliquidadas(self):
+        """Remisiones con al menos un detalle preliquidado"""
+        if 'liquidada' not in self.query.annotations:
+            return self.with_liquidacion_state().filter(liquidada=True)
+        return self.filter(liquidada=True)
+    
+    def pendientes_liquidar(self):
+        """Remisiones sin ningún detalle preliquidado"""
+        if 'liquidada' not in self.query.annotations:
+            return self.with_liquidacion_state().filter(liquidada=False)
+        return self.filter(liquidada=False)
+    
+    def con_saldo(self):
+        """Remisiones con saldo pendiente mayor a cero"""
+        if 'saldo' not in self.query.annotations:
+            return self.with_saldo().filter(saldo__gt=0)
+        return self.filter(saldo__gt=0)
+    
+    def sin_saldo(self):
+        """Remisiones completamente pagadas (saldo igual a cero)"""
+        if 'saldo' not in self.query.annotations:
+            return self.with_saldo().filter(saldo=0)
+        return self.filter(saldo=0)
+
+
 class Remision(models.Model):
     """Modelo para gestión de remisiones (master)"""
     
@@ -1248,8 +1313,14 @@ class Remision(models.Model):
             models.Index(fields=['transportista']),
         ]
     
+    objects = RemisionQuerySet.as_manager()
+    
     def esta_liquidada(self):
         """Determinar si una remisión está liquidada basándose en los campos de liquidación"""
+        # Usar la anotación de RemisionQuerySet.with_liquidacion_state() si está disponible
+        if hasattr(self, 'liquidada'):
+            return self.liquidada
+        
         detalles = self.detalles.all()
         if not detalles.exists():
             return False
@@ -1271,6 +1342,10 @@ class Remision(models.Model):
         """Calcular el saldo pendiente de la remisión (importe liquidado - pagos realizados)"""
         from django.db import models
         
+        # Usar la anotación de RemisionQuerySet.with_saldo() si está disponible
+        if hasattr(self, 'saldo'):
+            return self.saldo
+        
         # Calcular el importe total liquidado de la remisión
         importe_total = self.detalles.aggregate(
             total=models.Sum('importe_liquidado')
@@ -2414,7 +2489,7 @@ class Emisor(models.Model):
 
 
 # Importar modelos de factura
-from .factura_models import Factura, FacturaDetalle
+from .factura_models import Factura, FacturaDocumento, FacturaDetalle, TrabajoTimbrado
 
 
 class PagoFactura(models.Model):
@@ -2845,6 +2920,9 @@ class Kardex(models.Model):
         ('ajuste', 'Ajuste'),
     ]
     
+    # Movimientos leídos por lote al recalcular saldos hacia adelante
+    LOTE_RECALCULO = 2000
+    
     producto = models.ForeignKey(
         ProductoServicio,
         on_delete=models.CASCADE,
@@ -2930,47 +3008,387 @@ class Kardex(models.Model):
         db_table = 'kardex'
         ordering = ['-fecha', '-id']
         unique_together = ['producto', 'almacen', 'fecha', 'tipo_movimiento']
+        indexes = [
+            # Posición cronológica de cada movimiento dentro del kardex de un producto/almacén
+            models.Index(fields=['producto', 'almacen', 'fecha', 'id'], name='kardex_prod_alm_fecha_idx'),
+        ]
     
     def __str__(self):
         return f"{self.producto.descripcion} - {self.almacen.descripcion} - {self.get_tipo_movimiento_display()}"
     
-    def save(self, *args, **kwargs):
-        # Calcular costo total
-        self.costo_total = self.cantidad * self.precio_unitario
-        
-        # Obtener el último movimiento para calcular existencias y costo promedio
-        ultimo_movimiento = Kardex.objects.filter(
-            producto=self.producto,
-            almacen=self.almacen
-        ).exclude(id=self.id).order_by('-fecha', '-id').first()
+    @staticmethod
+    def calcular_saldos(tipo_movimiento, cantidad, precio_unitario, existencia_anterior, costo_promedio_anterior):
+        """
+        Calcula existencia y costo promedio resultantes de aplicar un movimiento (método de costo promedio)
         
-        if ultimo_movimiento:
-            self.existencia_anterior = ultimo_movimiento.existencia_actual
-            self.costo_promedio_anterior = ultimo_movimiento.costo_promedio_actual
-        else:
-            self.existencia_anterior = 0
-            self.costo_promedio_anterior = 0
+        Returns:
+            tuple: (costo_total, existencia_actual, costo_promedio_actual)
+        """
+        costo_total = cantidad * precio_unitario
         
         # Calcular existencia actual según el tipo de movimiento
-        if self.tipo_movimiento == 'entrada':
-            self.existencia_actual = self.existencia_anterior + self.cantidad
-        elif self.tipo_movimiento == 'salida':
-            self.existencia_actual = self.existencia_anterior - self.cantidad
+        if tipo_movimiento == 'entrada':
+            existencia_actual = existencia_anterior + cantidad
+        elif tipo_movimiento == 'salida':
+            existencia_actual = existencia_anterior - cantidad
         else:  # ajuste
-            self.existencia_actual = self.cantidad
+            existencia_actual = cantidad
         
         # Calcular costo promedio actual (método de costo promedio)
-        if self.tipo_movimiento == 'entrada':
-            if self.existencia_anterior > 0:
-                costo_total_anterior = self.existencia_anterior * self.costo_promedio_anterior
-                costo_total_actual = costo_total_anterior + self.costo_total
-                self.costo_promedio_actual = costo_total_actual / self.existencia_actual
+        if tipo_movimiento == 'entrada':
+            if existencia_anterior > 0:
+                costo_total_anterior = existencia_anterior * costo_promedio_anterior
+                costo_promedio_actual = (costo_total_anterior + costo_total) / existencia_actual
             else:
-                self.costo_promedio_actual = self.precio_unitario
+                costo_promedio_actual = precio_unitario
+        else:
+            costo_promedio_actual = costo_promedio_anterior
+        
+        return costo_total, existencia_actual, costo_promedio_actual
+    
+    @classmethod
+    def movimientos_posteriores(cls, producto_id, almacen_id, fecha, movimiento_id, using=None):
+        """Movimientos del producto/almacén en o después de la posición (fecha, id), en orden cronológico"""
+        return cls.objects.using(using).filter(
+            producto_id=producto_id,
+            almacen_id=almacen_id
+        ).filter(
+            models.Q(fecha__gt=fecha) | models.Q(fecha=fecha, id__gte=movimiento_id)
+        ).order_by('fecha', 'id')
+    
+    @classmethod
+    def movimiento_previo(cls, producto_id, almacen_id, fecha, movimiento_id=None, using=None):
+        """Último movimiento del producto/almacén estrictamente antes de la posición (fecha, id)"""
+        movimientos = cls.objects.using(using).filter(producto_id=producto_id, almacen_id=almacen_id)
+        if movimiento_id is None:
+            # Un movimiento nuevo queda después de los existentes con la misma fecha
+            movimientos = movimientos.filter(fecha__lte=fecha)
         else:
-            self.costo_promedio_actual = self.costo_promedio_anterior
+            movimientos = movimientos.filter(
+                models.Q(fecha__lt=fecha) | models.Q(fecha=fecha, id__lt=movimiento_id)
+            )
+        return movimientos.order_by('-fecha', '-id').only(
+            'existencia_actual', 'costo_promedio_actual'
+        ).first()
+    
+    @classmethod
+    def recalcular_desde(cls, producto_id, almacen_id, fecha, movimiento_id, using=None, saldo_inicial=None):
+        """
+        Recalcula hacia adelante la existencia y el costo promedio del producto/almacén
+        a partir de la posición (fecha, id), en una sola pasada.
+        
+        Los movimientos se leen por lotes con paginación por llave (fecha, id) sobre el índice
+        compuesto, de modo que la memoria usada no depende del tamaño del kardex.
+        
+        Args:
+            saldo_inicial: (existencia, costo_promedio) previos a la posición, si ya se conocen
+        
+        Returns:
+            int: Número de movimientos actualizados
+        """
+        using = using or router.db_for_write(cls)
+        if saldo_inicial is not None:
+            existencia, costo_promedio = saldo_inicial
+        else:
+            previo = cls.movimiento_previo(producto_id, almacen_id, fecha, movimiento_id, using=using)
+            existencia = previo.existencia_actual if previo else Decimal('0')
+            costo_promedio = previo.costo_promedio_actual if previo else Decimal('0')
+        
+        campos = ['costo_total', 'existencia_anterior', 'existencia_actual',
+                  'costo_promedio_anterior', 'costo_promedio_actual']
+        actualizados = 0
+        cursor_fecha, cursor_id = fecha, movimiento_id
+        while True:
+            lote = list(
+                cls.movimientos_posteriores(producto_id, almacen_id, cursor_fecha, cursor_id, using=using)
+                .only('fecha', 'tipo_movimiento', 'cantidad', 'precio_unitario', *campos)
+                [:cls.LOTE_RECALCULO]
+            )
+            if not lote:
+                break
+            
+            pendientes = []
+            for movimiento in lote:
+                costo_total, existencia_actual, costo_promedio_actual = cls.calcular_saldos(
+                    movimiento.tipo_movimiento, movimiento.cantidad, movimiento.precio_unitario,
+                    existencia, costo_promedio
+                )
+                # Redondear como se almacena en la base de datos para que el recálculo sea estable
+                nuevos = {
+                    'costo_total': _redondear(costo_total),
+                    'existencia_anterior': existencia,
+                    'existencia_actual': _redondear(existencia_actual),
+                    'costo_promedio_anterior': costo_promedio,
+                    'costo_promedio_actual': _redondear(costo_promedio_actual),
+                }
+                if any(getattr(movimiento, campo) != valor for campo, valor in nuevos.items()):
+                    for campo, valor in nuevos.items():
+                        setattr(movimiento, campo, valor)
+                    pendientes.append(movimiento)
+                existencia = nuevos['existencia_actual']
+                costo_promedio = nuevos['costo_promedio_actual']
+            
+            if pendientes:
+                cls.objects.using(using).bulk_update(pendientes, campos)
+                actualizados += len(pendientes)
+            
+            # Siguiente lote: estrictamente después del último movimiento procesado
+            cursor_fecha, cursor_id = lote[-1].fecha, lote[-1].id + 1
+        
+        return actualizados
+    
+    @classmethod
+    def registrar_movimientos(cls, producto_id, almacen_id, movimientos, using=None):
+        """
+        Registra en bloque varios movimientos de un mismo producto/almacén con un solo cálculo de saldos
+        
+        Args:
+            movimientos: Instancias de Kardex sin guardar, con fechas consecutivas en orden cronológico
+        
+        Returns:
+            list: Movimientos creados
+        """
+        if not movimientos:
+            return []
+        using = using or router.db_for_write(cls)
+        with transaction.atomic(using=using):
+            previo = cls.movimiento_previo(producto_id, almacen_id, movimientos[0].fecha, using=using)
+            existencia = previo.existencia_actual if previo else Decimal('0')
+            costo_promedio = previo.costo_promedio_actual if previo else Decimal('0')
+            
+            for movimiento in movimientos:
+                movimiento.producto_id = producto_id
+                movimiento.almacen_id = almacen_id
+                movimiento.existencia_anterior = existencia
+                movimiento.costo_promedio_anterior = costo_promedio
+                movimiento.costo_total, existencia_actual, costo_promedio_actual = cls.calcular_saldos(
+                    movimiento.tipo_movimiento, movimiento.cantidad, movimiento.precio_unitario,
+                    existencia, costo_promedio
+                )
+                movimiento.existencia_actual = existencia = _redondear(existencia_actual)
+                movimiento.costo_promedio_actual = costo_promedio = _redondear(costo_promedio_actual)
+            
+            creados = cls.objects.using(using).bulk_create(movimientos)
+            
+            # Propagar a movimientos posteriores (por ejemplo, con fecha futura) y actualizar la existencia
+            ultimo = creados[-1]
+            cls.recalcular_desde(
+                producto_id, almacen_id, ultimo.fecha, ultimo.pk + 1, using=using,
+                saldo_inicial=(existencia, costo_promedio)
+            )
+            Existencia.actualizar(producto_id, almacen_id, using=using)
+        return creados
+    
+    @classmethod
+    def anular_movimientos(cls, movimientos, using=None):
+        """
+        Elimina en bloque los movimientos indicados y recalcula los saldos de cada producto/almacén afectado
+        
+        Returns:
+            int: Número de movimientos eliminados
+        """
+        using = using or router.db_for_write(cls)
+        with transaction.atomic(using=using):
+            afectados = list(
+                movimientos.using(using).order_by().values('producto_id', 'almacen_id')
+                .annotate(fecha_inicio=models.Min('fecha'))
+            )
+            eliminados, _ = movimientos.using(using).delete()
+            for afectado in afectados:
+                cls.recalcular_desde(
+                    afectado['producto_id'], afectado['almacen_id'], afectado['fecha_inicio'], 0, using=using
+                )
+                Existencia.actualizar(afectado['producto_id'], afectado['almacen_id'], using=using)
+        return eliminados
+    
+    def save(self, *args, **kwargs):
+        using = kwargs.get('using') or router.db_for_write(Kardex, instance=self)
+        with transaction.atomic(using=using):
+            posicion_original = None
+            if self.pk:
+                posicion_original = Kardex.objects.using(using).filter(pk=self.pk).values(
+                    'producto_id', 'almacen_id', 'fecha'
+                ).first()
+            
+            # Saldos a partir del movimiento inmediato anterior en orden cronológico
+            previo = Kardex.movimiento_previo(
+                self.producto_id, self.almacen_id, self.fecha, self.pk, using=using
+            )
+            if previo:
+                self.existencia_anterior = previo.existencia_actual
+                self.costo_promedio_anterior = previo.costo_promedio_actual
+            else:
+                self.existencia_anterior = 0
+                self.costo_promedio_anterior = 0
+            
+            self.costo_total, self.existencia_actual, self.costo_promedio_actual = Kardex.calcular_saldos(
+                self.tipo_movimiento, self.cantidad, self.precio_unitario,
+                self.existencia_anterior, self.costo_promedio_anterior
+            )
+            
+            super().save(*args, **kwargs)
+            
+            # Movimientos con fecha anterior o editados: propagar saldos hacia adelante
+            inicio = self.fecha
+            if posicion_original:
+                mismo_kardex = (posicion_original['producto_id'] == self.producto_id and
+                                posicion_original['almacen_id'] == self.almacen_id)
+                if mismo_kardex:
+                    inicio = min(inicio, posicion_original['fecha'])
+                else:
+                    Kardex.recalcular_desde(
+                        posicion_original['producto_id'], posicion_original['almacen_id'],
+                        posicion_original['fecha'], self.pk, using=using
+                    )
+                    Existencia.actualizar(
+                        posicion_original['producto_id'], posicion_original['almacen_id'], using=using
+                    )
+            if inicio == self.fecha:
+                # Basta recalcular los movimientos posteriores a este, partiendo de sus saldos
+                Kardex.recalcular_desde(
+                    self.producto_id, self.almacen_id, self.fecha, self.pk + 1, using=using,
+                    saldo_inicial=(_redondear(self.existencia_actual), _redondear(self.costo_promedio_actual))
+                )
+            else:
+                Kardex.recalcular_desde(self.producto_id, self.almacen_id, inicio, 0, using=using)
+            
+            # Mantener la existencia materializada en la misma transacción
+            Existencia.actualizar(self.producto_id, self.almacen_id, using=using)
+    
+    def delete(self, *args, **kwargs):
+        using = kwargs.get('using') or router.db_for_write(Kardex, instance=self)
+        fecha, movimiento_id = self.fecha, self.pk
+        with transaction.atomic(using=using):
+            resultado = super().delete(*args, **kwargs)
+            Kardex.recalcular_desde(self.producto_id, self.almacen_id, fecha, movimiento_id, using=using)
+            Existencia.actualizar(self.producto_id, self.almacen_id, using=using)
+        return resultado
+
+
+def _redondear(valor):
+    """Redondea un importe a 2 decimales como lo hace DecimalField al guardarlo"""
+    return Decimal(valor).quantize(Decimal('0.01'), rounding=ROUND_HALF_EVEN)
+
+
+class Existencia(models.Model):
+    """Existencia actual materializada por producto y almacén (derivada del Kardex)"""
+    
+    producto = models.ForeignKey(
+        ProductoServicio,
+        on_delete=models.CASCADE,
+        verbose_name="Producto/Servicio"
+    )
+    
+    almacen = models.ForeignKey(
+        Almacen,
+        on_delete=models.CASCADE,
+        verbose_name="Almacén"
+    )
+    
+    existencia = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        default=0,
+        verbose_name="Existencia",
+        help_text="Existencia actual según el último movimiento del kardex"
+    )
+    
+    costo_promedio = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        default=0,
+        verbose_name="Costo Promedio",
+        help_text="Costo promedio actual según el último movimiento del kardex"
+    )
+    
+    fecha_ultimo_movimiento = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name="Fecha del último movimiento"
+    )
+    
+    fecha_modificacion = models.DateTimeField(
+        auto_now=True,
+        verbose_name="Fecha de modificación"
+    )
+    
+    class Meta:
+        verbose_name = "Existencia"
+        verbose_name_plural = "Existencias"
+        db_table = 'existencias'
+        ordering = ['almacen', 'producto']
+        unique_together = ['producto', 'almacen']
+    
+    def __str__(self):
+        return f"{self.producto_id} - {self.almacen_id}: {self.existencia}"
+    
+    @classmethod
+    def actualizar(cls, producto_id, almacen_id, using=None):
+        """Sincroniza la existencia del par producto/almacén con su último movimiento de kardex"""
+        using = using or router.db_for_write(cls)
+        ultimo_movimiento = Kardex.objects.using(using).filter(
+            producto_id=producto_id,
+            almacen_id=almacen_id
+        ).order_by('-fecha', '-id').only(
+            'fecha', 'existencia_actual', 'costo_promedio_actual'
+        ).first()
+        
+        if ultimo_movimiento is None:
+            cls.objects.using(using).filter(producto_id=producto_id, almacen_id=almacen_id).delete()
+            return None
+        
+        existencia, _ = cls.objects.using(using).update_or_create(
+            producto_id=producto_id,
+            almacen_id=almacen_id,
+            defaults={
+                'existencia': ultimo_movimiento.existencia_actual,
+                'costo_promedio': ultimo_movimiento.costo_promedio_actual,
+                'fecha_ultimo_movimiento': ultimo_movimiento.fecha,
+            }
+        )
+        return existencia
+    
+    @classmethod
+    def reconstruir(cls, using=None):
+        """Regenera todas las existencias desde el último movimiento de kardex de cada producto/almacén"""
+        using = using or router.db_for_write(cls)
+        ultimo_id = Kardex.objects.using(using).filter(
+            producto=models.OuterRef('producto'),
+            almacen=models.OuterRef('almacen')
+        ).order_by('-fecha', '-id').values('id')[:1]
+        
+        ultimos_movimientos = Kardex.objects.using(using).annotate(
+            ultimo_id=models.Subquery(ultimo_id)
+        ).filter(id=models.F('ultimo_id')).values_list(
+            'producto_id', 'almacen_id', 'existencia_actual', 'costo_promedio_actual', 'fecha'
+        )
         
-        super().save(*args, **kwargs)
+        existencias = [
+            cls(
+                producto_id=producto_id,
+                almacen_id=almacen_id,
+                existencia=existencia_actual,
+                costo_promedio=costo_promedio_actual,
+                fecha_ultimo_movimiento=fecha
+            )
+            for producto_id, almacen_id, existencia_actual, costo_promedio_actual, fecha
+            in ultimos_movimientos.iterator()
+        ]
+        
+        with transaction.atomic(using=using):
+            cls.objects.using(using).all().delete()
+            cls.objects.using(using).bulk_create(existencias, batch_size=1000)
+        
+        return len(existencias)
+    
+    @classmethod
+    def obtener_existencia(cls, producto_id, almacen_id):
+        """Existencia actual del producto en el almacén (0 si no tiene movimientos)"""
+        existencia = cls.objects.filter(
+            producto_id=producto_id,
+            almacen_id=almacen_id
+        ).values_list('existencia', flat=True).first()
+        return existencia if existencia is not None else Decimal('0')
 
 
 class TipoSalida(models.Model):
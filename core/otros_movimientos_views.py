@@ -10,7 +10,7 @@ from django.utils import timezone
 from decimal import Decimal
 import json
 
-from .models import OtroMovimiento, OtroMovimientoDetalle, ProductoServicio, Almacen, Kardex
+from .models import OtroMovimiento, OtroMovimientoDetalle, ProductoServicio, Almacen, Existencia
 from .otros_movimientos_forms import OtroMovimientoForm, OtroMovimientoDetalleForm, OtroMovimientoSearchForm
 
 
@@ -188,13 +188,8 @@ def obtener_existencia_producto_otro_movimiento(request):
         if not producto_id or not almacen_id:
             return JsonResponse({'success': False, 'error': 'Faltan parámetros'})
         
-        # Obtener último movimiento en Kardex
-        ultimo_movimiento = Kardex.objects.filter(
-            producto_id=producto_id,
-            almacen_id=almacen_id
-        ).order_by('-fecha', '-id').first()
-        
-        existencia = ultimo_movimiento.existencia_actual if ultimo_movimiento else 0
+        # Existencia actual desde la tabla materializada
+        existencia = Existencia.obtener_existencia(producto_id, almacen_id)
         
         return JsonResponse({
             'success': True,
@@ -14,12 +14,16 @@ import os
 
 logger = logging.getLogger(__name__)
 
+from .decorators import no_atomica
 from .models import Factura, Cliente, PagoFactura
 from .pago_forms import PagoFacturaForm, FiltroEstadoCuentaForm
 from .services.complemento_pago_xml_builder import ComplementoPagoXMLBuilder
+from .services.cadena_original import CadenaOriginal
 from .services.timbrado_service import TimbradoService
 from .services.configuracion_entorno import ConfiguracionEntornoService
 from .services.certificado_service import CertificadoService
+from .services.estado_cuenta_service import EstadoCuentaService
+from .services.complemento_pago_service import ComplementoPagoService
 
 
 class EstadoCuentaView(ListView):
@@ -29,43 +33,17 @@ class EstadoCuentaView(ListView):
     paginate_by = 20
     
     def get_queryset(self):
-        """Obtiene las facturas PPD del cliente"""
-        cliente_id = self.kwargs.get('cliente_id')
-        cliente = get_object_or_404(Cliente, codigo=cliente_id)
-        
-        # Obtener facturas PPD del cliente
-        facturas = Factura.objects.filter(
-            receptor=cliente,
-            metodo_pago='PPD'
-        ).order_by('-fecha_emision')
-        
-        return facturas
+        """Obtiene las facturas PPD del cliente con su saldo anotado"""
+        self.cliente = get_object_or_404(Cliente, codigo=self.kwargs.get('cliente_id'))
+        return EstadoCuentaService.facturas_cliente(self.cliente)
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        cliente_id = self.kwargs.get('cliente_id')
-        cliente = get_object_or_404(Cliente, codigo=cliente_id)
-        
-        # Calcular totales
-        facturas = self.get_queryset()
-        total_facturado = facturas.aggregate(
-            total=Sum('total')
-        )['total'] or Decimal('0.00')
-        
-        total_pagado = PagoFactura.objects.filter(
-            factura__receptor=cliente,
-            factura__metodo_pago='PPD'
-        ).aggregate(
-            total=Sum('monto_pago')
-        )['total'] or Decimal('0.00')
-        
-        saldo_pendiente = total_facturado - total_pagado
         
+        # Totales del cliente en una sola consulta agrupada
+        context.update(EstadoCuentaService.resumen_cliente(self.cliente))
         context.update({
-            'cliente': cliente,
-            'total_facturado': total_facturado,
-            'total_pagado': total_pagado,
-            'saldo_pendiente': saldo_pendiente,
+            'cliente': self.cliente,
             'fecha_actual': timezone.now().strftime('%d/%m/%Y %H:%M'),
         })
         
@@ -211,60 +189,9 @@ def listado_estados_cuenta(request):
             'error': 'No tienes permisos para acceder a esta sección'
         })
     
-    # Obtener clientes con facturas PPD
-    clientes_con_facturas = Cliente.objects.filter(
-        facturas__metodo_pago='PPD'
-    ).distinct().order_by('razon_social')
-    
-    # Calcular totales por cliente
-    clientes_data = []
-    for cliente in clientes_con_facturas:
-        facturas = Factura.objects.filter(
-            receptor=cliente,
-            metodo_pago='PPD'
-        )
-        
-        total_facturado = facturas.aggregate(
-            total=Sum('total')
-        )['total'] or Decimal('0.00')
-        
-        total_pagado = PagoFactura.objects.filter(
-            factura__receptor=cliente,
-            factura__metodo_pago='PPD'
-        ).aggregate(
-            total=Sum('monto_pago')
-        )['total'] or Decimal('0.00')
-        
-        saldo_pendiente = total_facturado - total_pagado
-        
-        # Contar facturas por estado
-        facturas_pendientes = facturas.filter(
-            pagos__isnull=True
-        ).count()
-        
-        facturas_parciales = facturas.filter(
-            pagos__isnull=False
-        ).exclude(
-            pagos__monto_pago__gte=models.F('total')
-        ).distinct().count()
-        
-        facturas_pagadas = facturas.filter(
-            pagos__monto_pago__gte=models.F('total')
-        ).distinct().count()
-        
-        clientes_data.append({
-            'cliente': cliente,
-            'total_facturado': total_facturado,
-            'total_pagado': total_pagado,
-            'saldo_pendiente': saldo_pendiente,
-            'facturas_pendientes': facturas_pendientes,
-            'facturas_parciales': facturas_parciales,
-            'facturas_pagadas': facturas_pagadas,
-            'total_facturas': facturas.count(),
-        })
-    
+    # Totales y conteos por estado de todos los clientes con facturas PPD
     context = {
-        'clientes_data': clientes_data,
+        'clientes_data': EstadoCuentaService.resumen_clientes(),
         'fecha_actual': timezone.now().strftime('%d/%m/%Y %H:%M'),
     }
     
@@ -450,8 +377,11 @@ def guardar_complemento_pago_ajax(request, factura_id):
                 logger.info(f"Datos del pago para XML (normalizados): {data}")
                 logger.info(f"Certificado data: {certificado_data}")
                 
-                # Generar cadena original primero (como en facturación)
-                cadena_original = ComplementoPagoXMLBuilder.generar_cadena_original_desde_modelos(factura, data)
+                # Construir el árbol una sola vez: la cadena original y el XML comparten Fecha y atributos
+                arbol_complemento = ComplementoPagoXMLBuilder.construir_arbol_complemento_pago(
+                    factura, data, certificado_data
+                )
+                cadena_original = CadenaOriginal.generar(arbol_complemento)
                 logger.info(f"Cadena original generada: {cadena_original[:200]}...")
                 
                 # Generar sello digital
@@ -465,10 +395,9 @@ def guardar_complemento_pago_ajax(request, factura_id):
                 
                 logger.info(f"Sello digital generado: {sello[:50]}...")
                 
-                # Generar XML del complemento de pago CON sello (como en facturación)
-                xml_complemento = ComplementoPagoXMLBuilder.construir_xml_complemento_pago(
-                    factura, data, certificado_data, sello
-                )
+                # Sellar y serializar el XML del complemento de pago
+                arbol_complemento.set('Sello', sello)
+                xml_complemento = ComplementoPagoXMLBuilder.serializar_xml(arbol_complemento)
                 
                 logger.info(f"XML final con sello generado: {xml_complemento[:500]}...")
                 
@@ -587,6 +516,52 @@ def guardar_complemento_pago_ajax(request, factura_id):
     return JsonResponse({'error': 'Método no permitido'}, status=405)
 
 
+@login_required
+@no_atomica
+def guardar_complemento_pago_multiple_ajax(request):
+    """
+    Vista AJAX para un pago aplicado a varias facturas PPD del mismo cliente
+    
+    Recibe {"documentos": [{"folio": n, "monto": m}, ...], "fecha_pago", "forma_pago", "moneda",
+    "tipo_cambio", "referencia_pago", "observaciones"} y timbra un solo complemento con un
+    DoctoRelacionado por factura. Sin ATOMIC_REQUESTS: la llamada al PAC no debe mantener
+    una transacción abierta; el servicio inserta los pagos en su propia transacción.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Método no permitido'}, status=405)
+    if not request.user.is_staff:
+        return JsonResponse({'error': 'No tienes permisos para realizar esta acción'}, status=403)
+    
+    try:
+        data = json.loads(request.body or '{}')
+        documentos = list(data.get('documentos', []))
+    except (ValueError, TypeError):
+        return JsonResponse({'success': False, 'error': 'Error al procesar los datos del complemento de pago'}, status=400)
+    
+    maximo = getattr(settings, 'COMPLEMENTO_PAGO_MAX_DOCUMENTOS', 100)
+    if len(documentos) > maximo:
+        return JsonResponse({
+            'success': False,
+            'error': f'Un complemento de pago puede relacionar máximo {maximo} facturas'
+        }, status=400)
+    
+    try:
+        resultado = ComplementoPagoService.registrar_pago(documentos, data, request.user)
+    except Exception as e:
+        logger.error(f"Error registrando complemento de pago de varias facturas: {e}")
+        return JsonResponse({
+            'success': False,
+            'error': f'Error al registrar el complemento de pago: {str(e)}'
+        })
+    
+    if resultado['success']:
+        resultado['message'] = (
+            f"Complemento de pago timbrado exitosamente para {len(resultado['pagos'])} facturas. "
+            f"UUID: {resultado['uuid']}"
+        )
+    return JsonResponse(resultado)
+
+
 @login_required
 def imprimir_estado_cuenta(request, cliente_id):
     """Vista para imprimir el estado de cuenta de un cliente"""
@@ -597,32 +572,10 @@ def imprimir_estado_cuenta(request, cliente_id):
     
     cliente = get_object_or_404(Cliente, codigo=cliente_id)
     
-    # Obtener facturas PPD del cliente
-    facturas = Factura.objects.filter(
-        receptor=cliente,
-        metodo_pago='PPD'
-    ).order_by('-fecha_emision')
-    
-    # Calcular totales
-    total_facturado = facturas.aggregate(
-        total=Sum('total')
-    )['total'] or Decimal('0.00')
-    
-    total_pagado = PagoFactura.objects.filter(
-        factura__receptor=cliente,
-        factura__metodo_pago='PPD'
-    ).aggregate(
-        total=Sum('monto_pago')
-    )['total'] or Decimal('0.00')
-    
-    saldo_pendiente = total_facturado - total_pagado
-    
     context = {
         'cliente': cliente,
-        'facturas': facturas,
-        'total_facturado': total_facturado,
-        'total_pagado': total_pagado,
-        'saldo_pendiente': saldo_pendiente,
+        'facturas': EstadoCuentaService.facturas_cliente(cliente),
+        **EstadoCuentaService.resumen_cliente(cliente),
         'fecha_actual': timezone.now().strftime('%d/%m/%Y %H:%M'),
         'title': f'Estado de Cuenta - {cliente.razon_social}'
     }
@@ -707,7 +660,12 @@ def imprimir_complemento_pago(request, pago_id):
             messages.error(request, 'El complemento de pago no está timbrado')
             return redirect('core:listado_facturas')
         
-        # Decodificar el XML timbrado
+        # PDF desde la caché (se renderiza una sola vez por UUID y versión de plantilla/marca)
+        from .services.pdf_service import PDFService, WEASYPRINT_AVAILABLE
+        if WEASYPRINT_AVAILABLE:
+            return PDFService.generar_pdf_complemento_pago(pago, request)
+        
+        # Sin WeasyPrint: página HTML para imprimir desde el navegador
         import base64
         xml_timbrado = base64.b64decode(pago.xml_timbrado).decode('utf-8')
         
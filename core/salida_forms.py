@@ -138,15 +138,10 @@ class SalidaInventarioDetalleForm(forms.ModelForm):
         
         # Validar existencia disponible
         if cantidad and producto and almacen:
-            from .models import Kardex
+            from .models import Existencia
             
             # Obtener la existencia actual del producto en el almacén
-            ultimo_movimiento = Kardex.objects.filter(
-                producto=producto,
-                almacen=almacen
-            ).order_by('-fecha', '-id').first()
-            
-            existencia_disponible = ultimo_movimiento.existencia_actual if ultimo_movimiento else 0
+            existencia_disponible = Existencia.obtener_existencia(producto.pk, almacen.pk)
             
             if cantidad > existencia_disponible:
                 raise forms.ValidationError(
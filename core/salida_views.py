@@ -11,7 +11,7 @@ from decimal import Decimal
 from .models import (
     SalidaInventario, SalidaInventarioDetalle, TipoSalida, 
     ProductoServicio, Almacen, CentroCosto, AutorizoGasto,
-    ConfiguracionSistema, Kardex
+    ConfiguracionSistema, Existencia
 )
 from .salida_forms import SalidaInventarioForm, SalidaInventarioDetalleForm, TipoSalidaForm
 
@@ -48,12 +48,7 @@ def salida_inventario_create(request):
                             cantidad_solicitada = Decimal(detalle_data['cantidad'])
                             
                             # Obtener la existencia actual del producto en el almacén
-                            ultimo_movimiento = Kardex.objects.filter(
-                                producto_id=producto_id,
-                                almacen_id=almacen_id
-                            ).order_by('-fecha', '-id').first()
-                            
-                            existencia_disponible = ultimo_movimiento.existencia_actual if ultimo_movimiento else 0
+                            existencia_disponible = Existencia.obtener_existencia(producto_id, almacen_id)
                             
                             if cantidad_solicitada > existencia_disponible:
                                 producto = ProductoServicio.objects.get(codigo=producto_id)
@@ -228,15 +223,10 @@ def obtener_existencia_producto(request):
             return JsonResponse({'success': False, 'error': 'Parámetros requeridos'})
         
         try:
-            from .models import Kardex
-            
-            # Obtener el último movimiento del producto en el almacén
-            ultimo_movimiento = Kardex.objects.filter(
-                producto_id=producto_id,
-                almacen_id=almacen_id
-            ).order_by('-fecha', '-id').first()
+            from .models import Existencia
             
-            existencia = ultimo_movimiento.existencia_actual if ultimo_movimiento else 0
+            # Existencia actual desde la tabla materializada
+            existencia = Existencia.obtener_existencia(producto_id, almacen_id)
             
             return JsonResponse({
                 'success': True,
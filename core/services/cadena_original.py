@@ -0,0 +1,235 @@
+"""
+Motor de la cadena original
+Describe el orden de campos de las XSLT del SAT (CFDI 4.0 y sus complementos), lo compila una
+vez por versión y genera la cadena en un solo recorrido de un árbol XML: el del XML recibido o
+el que construyen los builders desde los modelos
+"""
+
+import logging
+import re
+import xml.etree.ElementTree as ET
+from collections import namedtuple
+from functools import lru_cache
+from typing import Callable, List, Union
+
+logger = logging.getLogger(__name__)
+
+# Un nodo de la descripción: nombre local del elemento y su contenido en el orden de la XSLT.
+# El contenido mezcla atributos (nombre, requerido) y nodos hijos.
+Nodo = namedtuple('Nodo', ['nombre', 'contenido'])
+
+R = True   # Requerido: siempre emite "|" aunque el atributo no exista
+O = False  # Opcional: solo se emite si el atributo existe
+
+# Marca para cfdi:Complemento: cada hijo se procesa con la descripción de su complemento
+COMPLEMENTOS = object()
+
+_TRASLADO = [('Base', R), ('Impuesto', R), ('TipoFactor', R), ('TasaOCuota', O), ('Importe', O)]
+_RETENCION = [('Base', R), ('Impuesto', R), ('TipoFactor', R), ('TasaOCuota', R), ('Importe', R)]
+
+# cadenaoriginal_4_0.xslt
+CFDI_40 = [
+    ('Version', R), ('Serie', O), ('Folio', O), ('Fecha', R), ('FormaPago', O), ('NoCertificado', R),
+    ('CondicionesDePago', O), ('SubTotal', R), ('Descuento', O), ('Moneda', R), ('TipoCambio', O),
+    ('Total', R), ('TipoDeComprobante', R), ('Exportacion', R), ('MetodoPago', O),
+    ('LugarExpedicion', R), ('Confirmacion', O),
+    Nodo('InformacionGlobal', [('Periodicidad', R), ('Meses', R), ('Año', R)]),
+    Nodo('CfdiRelacionados', [('TipoRelacion', R), Nodo('CfdiRelacionado', [('UUID', R)])]),
+    Nodo('Emisor', [('Rfc', R), ('Nombre', R), ('RegimenFiscal', R), ('FacAtrAdquirente', O)]),
+    Nodo('Receptor', [
+        ('Rfc', R), ('Nombre', R), ('DomicilioFiscalReceptor', R), ('ResidenciaFiscal', O),
+        ('NumRegIdTrib', O), ('RegimenFiscalReceptor', R), ('UsoCFDI', R),
+    ]),
+    Nodo('Conceptos', [
+        Nodo('Concepto', [
+            ('ClaveProdServ', R), ('NoIdentificacion', O), ('Cantidad', R), ('ClaveUnidad', R),
+            ('Unidad', O), ('Descripcion', R), ('ValorUnitario', R), ('Importe', R), ('Descuento', O),
+            ('ObjetoImp', R),
+            Nodo('Impuestos', [
+                Nodo('Traslados', [Nodo('Traslado', _TRASLADO)]),
+                Nodo('Retenciones', [Nodo('Retencion', _RETENCION)]),
+            ]),
+            Nodo('ACuentaTerceros', [
+                ('RfcACuentaTerceros', R), ('NombreACuentaTerceros', R),
+                ('RegimenFiscalACuentaTerceros', R), ('DomicilioFiscalACuentaTerceros', R),
+            ]),
+            Nodo('InformacionAduanera', [('NumeroPedimento', R)]),
+            Nodo('CuentaPredial', [('Numero', R)]),
+            Nodo('Parte', [
+                ('ClaveProdServ', R), ('NoIdentificacion', O), ('Cantidad', R), ('Unidad', O),
+                ('Descripcion', R), ('ValorUnitario', O), ('Importe', O),
+                Nodo('InformacionAduanera', [('NumeroPedimento', R)]),
+            ]),
+        ]),
+    ]),
+    Nodo('Impuestos', [
+        Nodo('Retenciones', [Nodo('Retencion', [('Impuesto', R), ('Importe', R)])]),
+        ('TotalImpuestosRetenidos', O),
+        Nodo('Traslados', [Nodo('Traslado', _TRASLADO)]),
+        ('TotalImpuestosTrasladados', O),
+    ]),
+    Nodo('Complemento', [COMPLEMENTOS]),
+]
+
+# Pagos20.xslt
+PAGOS_20 = [
+    ('Version', R),
+    Nodo('Totales', [
+        ('TotalRetencionesIVA', O), ('TotalRetencionesISR', O), ('TotalRetencionesIEPS', O),
+        ('TotalTrasladosBaseIVA16', O), ('TotalTrasladosImpuestoIVA16', O),
+        ('TotalTrasladosBaseIVA8', O), ('TotalTrasladosImpuestoIVA8', O),
+        ('TotalTrasladosBaseIVA0', O), ('TotalTrasladosImpuestoIVA0', O),
+        ('TotalTrasladosBaseIVAExento', O), ('MontoTotalPagos', R),
+    ]),
+    Nodo('Pago', [
+        ('FechaPago', R), ('FormaDePagoP', R), ('MonedaP', R), ('TipoCambioP', O), ('Monto', R),
+        ('NumOperacion', O), ('RfcEmisorCtaOrd', O), ('NomBancoOrdExt', O), ('CtaOrdenante', O),
+        ('RfcEmisorCtaBen', O), ('CtaBeneficiario', O), ('TipoCadPago', O), ('CertPago', O),
+        ('CadPago', O), ('SelloPago', O),
+        Nodo('DoctoRelacionado', [
+            ('IdDocumento', R), ('Serie', O), ('Folio', O), ('MonedaDR', R), ('EquivalenciaDR', O),
+            ('NumParcialidad', R), ('ImpSaldoAnt', R), ('ImpPagado', R), ('ImpSaldoInsoluto', R),
+            ('ObjetoImpDR', R),
+            Nodo('ImpuestosDR', [
+                Nodo('RetencionesDR', [Nodo('RetencionDR', [
+                    ('BaseDR', R), ('ImpuestoDR', R), ('TipoFactorDR', R), ('TasaOCuotaDR', R), ('ImporteDR', R),
+                ])]),
+                Nodo('TrasladosDR', [Nodo('TrasladoDR', [
+                    ('BaseDR', R), ('ImpuestoDR', R), ('TipoFactorDR', R), ('TasaOCuotaDR', O), ('ImporteDR', O),
+                ])]),
+            ]),
+        ]),
+        Nodo('ImpuestosP', [
+            Nodo('RetencionesP', [Nodo('RetencionP', [('ImpuestoP', R), ('ImporteP', R)])]),
+            Nodo('TrasladosP', [Nodo('TrasladoP', [
+                ('BaseP', R), ('ImpuestoP', R), ('TipoFactorP', R), ('TasaOCuotaP', O), ('ImporteP', O),
+            ])]),
+        ]),
+    ]),
+]
+
+# Descripciones por versión del comprobante y por (complemento, versión)
+COMPROBANTES = {'4.0': CFDI_40}
+COMPLEMENTOS_SOPORTADOS = {('Pagos', '2.0'): PAGOS_20}
+
+_ESPACIOS = re.compile(r'[ \t\r\n]+')
+_ATRIBUTO, _HIJO, _COMPLEMENTOS = 0, 1, 2
+
+
+def _normalizar(valor: str) -> str:
+    """normalize-space() de XSLT: colapsa espacios, tabuladores y saltos de línea y recorta"""
+    if '\n' in valor or '\t' in valor or '\r' in valor or '  ' in valor or valor[:1] == ' ' or valor[-1:] == ' ':
+        return _ESPACIOS.sub(' ', valor).strip(' ')
+    return valor
+
+
+@lru_cache(maxsize=None)
+def _nombre_local(tag: str) -> str:
+    """Nombre sin espacio de nombres: '{ns}Concepto', 'cfdi:Concepto' y 'Concepto' -> 'Concepto'"""
+    if tag[:1] == '{':
+        return tag[tag.index('}') + 1:]
+    return tag[tag.find(':') + 1:]
+
+
+def _hijos_por_nombre(elemento) -> dict:
+    hijos = {}
+    for hijo in elemento:
+        if isinstance(hijo.tag, str):
+            hijos.setdefault(_nombre_local(hijo.tag), []).append(hijo)
+    return hijos
+
+
+def _compilar(contenido: list) -> Callable:
+    """Convierte la descripción en una función emitir(elemento, partes)"""
+    pasos = []
+    for item in contenido:
+        if item is COMPLEMENTOS:
+            pasos.append((_COMPLEMENTOS, None, None))
+        elif isinstance(item, Nodo):
+            pasos.append((_HIJO, item.nombre, _compilar(item.contenido)))
+        else:
+            pasos.append((_ATRIBUTO, item[0], item[1]))
+    pasos = tuple(pasos)
+    tiene_hijos = any(tipo != _ATRIBUTO for tipo, _, _ in pasos)
+
+    def emitir(elemento, partes: List[str]):
+        hijos = _hijos_por_nombre(elemento) if tiene_hijos else None
+        get = elemento.get
+        for tipo, nombre, dato in pasos:
+            if tipo == _ATRIBUTO:
+                valor = get(nombre)
+                if valor is not None:
+                    partes.append(_normalizar(valor))
+                elif dato:
+                    partes.append('')
+            elif tipo == _HIJO:
+                for hijo in hijos.get(nombre, ()):
+                    dato(hijo, partes)
+            else:
+                _emitir_complementos(elemento, partes)
+
+    return emitir
+
+
+@lru_cache(maxsize=None)
+def _compilado_comprobante(version: str) -> Callable:
+    if version not in COMPROBANTES:
+        raise ValueError(f"Versión de CFDI no soportada para la cadena original: {version}")
+    return _compilar(COMPROBANTES[version])
+
+
+@lru_cache(maxsize=None)
+def _compilado_complemento(nombre: str, version: str):
+    descripcion = COMPLEMENTOS_SOPORTADOS.get((nombre, version))
+    return _compilar(descripcion) if descripcion is not None else None
+
+
+def _emitir_complementos(complemento, partes: List[str]):
+    # Los complementos se procesan en el orden del documento, como apply-templates en la XSLT
+    for hijo in complemento:
+        if not isinstance(hijo.tag, str):
+            continue
+        nombre = _nombre_local(hijo.tag)
+        emitir = _compilado_complemento(nombre, hijo.get('Version', ''))
+        if emitir is not None:
+            emitir(hijo, partes)
+        else:
+            # Por ejemplo el TimbreFiscalDigital, que tiene su propia cadena
+            logger.debug(f"Complemento {nombre} sin descripción de cadena original; se omite")
+
+
+class CadenaOriginal:
+    """Generador de la cadena original del comprobante"""
+
+    @classmethod
+    def generar(cls, comprobante) -> str:
+        """
+        Genera la cadena original desde el elemento Comprobante
+
+        Args:
+            comprobante: Elemento raíz (ElementTree o lxml); acepta etiquetas con prefijo
+                ('cfdi:Comprobante') o con espacio de nombres ('{http://...}Comprobante')
+
+        Returns:
+            str: Cadena original ||...||
+
+        Raises:
+            ValueError: Si la versión del comprobante no está soportada
+        """
+        emitir = _compilado_comprobante(comprobante.get('Version', ''))
+        partes = []
+        emitir(comprobante, partes)
+        return '||' + '|'.join(partes) + '||'
+
+    @classmethod
+    def desde_xml(cls, xml_cfdi: Union[str, bytes]) -> str:
+        """
+        Genera la cadena original desde el XML del comprobante
+
+        Args:
+            xml_cfdi: XML del CFDI
+
+        Returns:
+            str: Cadena original
+        """
+        return cls.generar(ET.fromstring(xml_cfdi))
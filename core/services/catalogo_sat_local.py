@@ -0,0 +1,484 @@
+"""
+Almacén local de catálogos SAT
+Los catálogos (c_UsoCFDI, c_ClaveProdServ, ...) se cargan desde archivos CSV, XML/XSD o Excel
+a un archivo SQLite propio (settings.SAT_CATALOGOS_DB), común a todas las empresas. El archivo
+se reconstruye completo con el comando cargar_catalogos_sat y se reemplaza de forma atómica;
+en las peticiones solo se lee (mmap), sin red.
+"""
+
+import csv
+import hashlib
+import io
+import json
+import logging
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import unicodedata
+import xml.etree.ElementTree as ET
+from datetime import datetime
+from typing import Any, Dict, FrozenSet, Iterable, Iterator, List, Optional, Tuple
+
+from django.conf import settings
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+ESQUEMA = (
+    "CREATE TABLE metadatos (clave TEXT PRIMARY KEY, valor TEXT) WITHOUT ROWID",
+    "CREATE TABLE catalogos (catalogo TEXT PRIMARY KEY, registros INTEGER, origen TEXT) WITHOUT ROWID",
+    # busqueda: descripción en minúsculas y sin acentos, para buscar por prefijo con el índice
+    "CREATE TABLE registros ("
+    " catalogo TEXT NOT NULL, codigo TEXT NOT NULL, descripcion TEXT, busqueda TEXT,"
+    " vigencia_desde TEXT, vigencia_hasta TEXT, datos TEXT,"
+    " PRIMARY KEY (catalogo, codigo)) WITHOUT ROWID",
+    "CREATE INDEX registros_busqueda ON registros (catalogo, busqueda)",
+)
+
+EXTENSIONES = ('.csv', '.xml', '.xsd', '.xlsx', '.xls')
+
+
+def normalizar(texto: str) -> str:
+    """Minúsculas sin acentos ni espacios repetidos (para búsquedas)"""
+    sin_acentos = unicodedata.normalize('NFKD', texto or '').encode('ascii', 'ignore').decode('ascii')
+    return ' '.join(sin_acentos.lower().split())
+
+
+def _siguiente_prefijo(prefijo: str) -> str:
+    """Menor cadena mayor que todas las que empiezan con prefijo (rango para el índice)"""
+    return prefijo[:-1] + chr(ord(prefijo[-1]) + 1)
+
+
+def _fecha_iso(valor) -> str:
+    """Fechas de vigencia del SAT (dd/mm/aaaa, aaaa-mm-dd o celdas de Excel) en ISO"""
+    if not valor:
+        return ''
+    if isinstance(valor, datetime):
+        return valor.date().isoformat()
+    texto = str(valor).strip()
+    for formato in ('%d/%m/%Y', '%Y-%m-%d', '%Y-%m-%dT%H:%M:%S', '%d-%m-%Y'):
+        try:
+            return datetime.strptime(texto, formato).date().isoformat()
+        except ValueError:
+            continue
+    return texto
+
+
+class CatalogoSATLocal:
+    """Consulta y carga del archivo local de catálogos SAT"""
+
+    _local = threading.local()
+    _lock = threading.Lock()
+    # Códigos por catálogo para validar en O(1); se descartan cuando cambia la versión del archivo
+    _codigos: Dict[Tuple[Any, str], FrozenSet[str]] = {}
+
+    @classmethod
+    def ruta(cls) -> str:
+        return str(getattr(settings, 'SAT_CATALOGOS_DB', os.path.join(settings.BASE_DIR, 'catalogos_sat.sqlite3')))
+
+    # ------------------------------------------------------------------
+    # Lectura
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def _conexion(cls) -> Tuple[Optional[sqlite3.Connection], Any]:
+        """
+        Conexión de solo lectura del hilo actual y firma del archivo
+
+        Si el archivo se reemplazó (nueva versión cargada) se abre de nuevo.
+        Devuelve (None, None) si todavía no se han cargado catálogos.
+        """
+        ruta = cls.ruta()
+        try:
+            info = os.stat(ruta)
+        except FileNotFoundError:
+            return None, None
+        firma = (info.st_ino, info.st_mtime_ns)
+
+        actual = getattr(cls._local, 'actual', None)
+        if actual and actual[0] == firma:
+            return actual[1], firma
+        if actual:
+            actual[1].close()
+
+        conexion = sqlite3.connect(f'file:{ruta}?mode=ro', uri=True, check_same_thread=False)
+        conexion.execute(f'PRAGMA mmap_size={getattr(settings, "SAT_CATALOGOS_MMAP", 256 * 1024 * 1024)}')
+        conexion.execute('PRAGMA query_only=1')
+        cls._local.actual = (firma, conexion)
+        return conexion, firma
+
+    @classmethod
+    def firma(cls):
+        """Identifica la versión del archivo vigente (cambia cuando se carga otra); None si no existe"""
+        return cls._conexion()[1]
+
+    @classmethod
+    def disponible(cls, catalogo: str = None) -> bool:
+        """Si el archivo existe (y, si se indica, si contiene el catálogo)"""
+        conexion, _ = cls._conexion()
+        if conexion is None:
+            return False
+        if catalogo is None:
+            return True
+        return conexion.execute('SELECT 1 FROM catalogos WHERE catalogo = ?', (catalogo,)).fetchone() is not None
+
+    @classmethod
+    def codigos(cls, catalogo: str) -> Optional[FrozenSet[str]]:
+        """
+        Conjunto de códigos del catálogo (cargado una vez por versión del archivo)
+
+        Returns:
+            frozenset o None si el catálogo no está cargado
+        """
+        conexion, firma = cls._conexion()
+        if conexion is None:
+            return None
+        clave = (firma, catalogo)
+        codigos = cls._codigos.get(clave)
+        if codigos is None:
+            if not cls.disponible(catalogo):
+                return None
+            codigos = frozenset(
+                codigo for (codigo,) in conexion.execute('SELECT codigo FROM registros WHERE catalogo = ?', (catalogo,))
+            )
+            with cls._lock:
+                # Solo se conserva la versión vigente del archivo
+                cls._codigos = {k: v for k, v in cls._codigos.items() if k[0] == firma}
+                cls._codigos[clave] = codigos
+        return codigos
+
+    @classmethod
+    def existe(cls, catalogo: str, codigo: str) -> Optional[bool]:
+        """
+        Valida un código
+
+        Returns:
+            bool, o None si el catálogo no está cargado (el que llama decide el respaldo)
+        """
+        codigos = cls.codigos(catalogo)
+        if codigos is None:
+            return None
+        return str(codigo) in codigos
+
+    @staticmethod
+    def _registro(fila) -> Dict[str, Any]:
+        codigo, descripcion, vigencia_desde, vigencia_hasta, datos = fila
+        return {
+            'codigo': codigo,
+            'descripcion': descripcion or '',
+            'vigencia_desde': vigencia_desde or '',
+            'vigencia_hasta': vigencia_hasta or '',
+            **json.loads(datos or '{}'),
+        }
+
+    @classmethod
+    def obtener(cls, catalogo: str, codigo: str) -> Optional[Dict[str, Any]]:
+        """Registro de un código (búsqueda por llave primaria) o None"""
+        conexion, _ = cls._conexion()
+        if conexion is None:
+            return None
+        fila = conexion.execute(
+            'SELECT codigo, descripcion, vigencia_desde, vigencia_hasta, datos FROM registros '
+            'WHERE catalogo = ? AND codigo = ?', (catalogo, str(codigo))
+        ).fetchone()
+        return cls._registro(fila) if fila else None
+
+    @classmethod
+    def listar(cls, catalogo: str) -> List[Dict[str, Any]]:
+        """Todos los registros de un catálogo, ordenados por código"""
+        conexion, _ = cls._conexion()
+        if conexion is None:
+            return []
+        return [cls._registro(fila) for fila in conexion.execute(
+            'SELECT codigo, descripcion, vigencia_desde, vigencia_hasta, datos FROM registros '
+            'WHERE catalogo = ? ORDER BY codigo', (catalogo,)
+        )]
+
+    @classmethod
+    def buscar(cls, catalogo: str, texto: str, limite: int = 20) -> List[Dict[str, Any]]:
+        """
+        Registros cuyo código o descripción empiezan con el texto
+
+        Ambas búsquedas son rangos sobre un índice (no recorren el catálogo); la descripción se
+        compara sin acentos ni mayúsculas. Primero van las coincidencias por código.
+
+        Args:
+            catalogo: Nombre SAT del catálogo (c_ClaveProdServ, ...)
+            texto: Prefijo a buscar
+            limite: Máximo de resultados
+
+        Returns:
+            List[Dict]: codigo, descripcion, vigencia_desde, vigencia_hasta y columnas adicionales
+        """
+        conexion, _ = cls._conexion()
+        texto = (texto or '').strip()
+        if conexion is None or not texto:
+            return []
+
+        columnas = 'SELECT codigo, descripcion, vigencia_desde, vigencia_hasta, datos FROM registros WHERE catalogo = ? AND '
+        resultados = {}
+        for fila in conexion.execute(
+            columnas + 'codigo >= ? AND codigo < ? ORDER BY codigo LIMIT ?',
+            (catalogo, texto, _siguiente_prefijo(texto), limite)
+        ):
+            resultados[fila[0]] = cls._registro(fila)
+
+        busqueda = normalizar(texto)
+        if busqueda and len(resultados) < limite:
+            for fila in conexion.execute(
+                columnas + 'busqueda >= ? AND busqueda < ? ORDER BY busqueda LIMIT ?',
+                (catalogo, busqueda, _siguiente_prefijo(busqueda), limite)
+            ):
+                resultados.setdefault(fila[0], cls._registro(fila))
+                if len(resultados) >= limite:
+                    break
+        return list(resultados.values())
+
+    @classmethod
+    def metadatos(cls) -> Dict[str, Any]:
+        """Versión, fecha de carga y registros por catálogo del archivo vigente"""
+        conexion, _ = cls._conexion()
+        if conexion is None:
+            return {'disponible': False, 'ruta': cls.ruta(), 'catalogos': {}}
+        datos = dict(conexion.execute('SELECT clave, valor FROM metadatos'))
+        return {
+            'disponible': True,
+            'ruta': cls.ruta(),
+            'version': datos.get('version'),
+            'fecha_carga': datos.get('fecha_carga'),
+            'origen': datos.get('origen'),
+            'catalogos': {
+                catalogo: registros
+                for catalogo, registros in conexion.execute('SELECT catalogo, registros FROM catalogos ORDER BY catalogo')
+            },
+        }
+
+    # ------------------------------------------------------------------
+    # Carga
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def archivos_origen(ruta: str) -> List[str]:
+        """Archivos de catálogo en una ruta (un archivo o un directorio), en orden alfabético"""
+        if os.path.isfile(ruta):
+            return [ruta]
+        return sorted(
+            os.path.join(ruta, nombre) for nombre in os.listdir(ruta)
+            if nombre.lower().endswith(EXTENSIONES)
+        )
+
+    @staticmethod
+    def huella(archivos: Iterable[str]) -> str:
+        """Hash del contenido de los archivos de origen (versión por defecto)"""
+        digest = hashlib.sha256()
+        for archivo in archivos:
+            digest.update(os.path.basename(archivo).encode('utf-8'))
+            with open(archivo, 'rb') as origen:
+                for bloque in iter(lambda: origen.read(1024 * 1024), b''):
+                    digest.update(bloque)
+        return digest.hexdigest()[:12]
+
+    @classmethod
+    def cargar(cls, archivos: List[str], version: str = None, catalogos: Iterable[str] = None) -> Dict[str, Any]:
+        """
+        Construye un archivo nuevo con los catálogos y reemplaza al vigente
+
+        El archivo se escribe aparte y se reemplaza con os.replace: los procesos que lo están
+        leyendo siguen con la versión anterior hasta su siguiente consulta.
+
+        Args:
+            archivos: Archivos CSV, XML/XSD, XLSX o XLS
+            version: Etiqueta de la versión (por defecto, hash de los archivos)
+            catalogos: Cargar solo estos catálogos (nombres SAT, p. ej. c_UsoCFDI)
+
+        Returns:
+            Dict: version y registros por catálogo
+        """
+        version = version or cls.huella(archivos)
+        filtro = set(catalogos) if catalogos else None
+        destino = cls.ruta()
+        os.makedirs(os.path.dirname(destino) or '.', exist_ok=True)
+        descriptor, temporal = tempfile.mkstemp(dir=os.path.dirname(destino) or '.', suffix='.tmp')
+        os.close(descriptor)
+
+        conteo: Dict[str, int] = {}
+        origenes: Dict[str, str] = {}
+        try:
+            conexion = sqlite3.connect(temporal)
+            try:
+                conexion.execute('PRAGMA journal_mode=OFF')
+                conexion.execute('PRAGMA synchronous=OFF')
+                for sentencia in ESQUEMA:
+                    conexion.execute(sentencia)
+
+                for archivo in archivos:
+                    for catalogo, registros in cls._leer_archivo(archivo):
+                        if filtro and catalogo not in filtro:
+                            continue
+                        filas = list(cls._filas(catalogo, registros))
+                        # Un catálogo repetido en otro archivo reemplaza al anterior
+                        conexion.execute('DELETE FROM registros WHERE catalogo = ?', (catalogo,))
+                        conexion.executemany(
+                            'INSERT OR REPLACE INTO registros VALUES (?, ?, ?, ?, ?, ?, ?)', filas
+                        )
+                        conteo[catalogo] = conexion.execute(
+                            'SELECT COUNT(*) FROM registros WHERE catalogo = ?', (catalogo,)
+                        ).fetchone()[0]
+                        origenes[catalogo] = os.path.basename(archivo)
+
+                conexion.executemany(
+                    'INSERT INTO catalogos VALUES (?, ?, ?)',
+                    [(catalogo, total, origenes[catalogo]) for catalogo, total in conteo.items()]
+                )
+                conexion.executemany('INSERT INTO metadatos VALUES (?, ?)', [
+                    ('version', version),
+                    ('fecha_carga', timezone.now().isoformat()),
+                    ('origen', ', '.join(sorted(set(origenes.values())))),
+                ])
+                conexion.commit()
+                conexion.execute('VACUUM')
+            finally:
+                conexion.close()
+
+            if not conteo:
+                raise ValueError('Los archivos no contienen catálogos SAT reconocibles')
+            os.replace(temporal, destino)
+        except Exception:
+            if os.path.exists(temporal):
+                os.remove(temporal)
+            raise
+
+        logger.info(f"Catálogos SAT versión {version} cargados en {destino}: {conteo}")
+        return {'version': version, 'catalogos': conteo}
+
+    @staticmethod
+    def _filas(catalogo: str, registros: Iterable[Dict[str, Any]]) -> Iterator[tuple]:
+        for registro in registros:
+            codigo = str(registro.pop('codigo') or '').strip()
+            if not codigo:
+                continue
+            descripcion = str(registro.pop('descripcion', '') or '').strip()
+            vigencia_desde = _fecha_iso(registro.pop('vigencia_desde', ''))
+            vigencia_hasta = _fecha_iso(registro.pop('vigencia_hasta', ''))
+            datos = {clave: str(valor).strip() for clave, valor in registro.items() if valor not in (None, '')}
+            yield (
+                catalogo, codigo, descripcion, normalizar(descripcion), vigencia_desde, vigencia_hasta,
+                json.dumps(datos, ensure_ascii=False) if datos else None,
+            )
+
+    @classmethod
+    def _leer_archivo(cls, archivo: str) -> Iterator[Tuple[str, Iterator[Dict[str, Any]]]]:
+        """(catálogo, registros) de cada catálogo contenido en el archivo"""
+        extension = os.path.splitext(archivo)[1].lower()
+        if extension == '.csv':
+            yield from cls._leer_tablas([cls._leer_csv(archivo)], archivo)
+        elif extension in ('.xml', '.xsd'):
+            yield from cls._leer_xml(archivo)
+        elif extension == '.xlsx':
+            try:
+                import openpyxl
+            except ImportError:
+                raise ImportError(f'Se requiere openpyxl para leer {archivo}')
+            libro = openpyxl.load_workbook(archivo, read_only=True, data_only=True)
+            yield from cls._leer_tablas((hoja.iter_rows(values_only=True) for hoja in libro.worksheets), archivo)
+        elif extension == '.xls':
+            try:
+                import xlrd
+            except ImportError:
+                raise ImportError(f'Se requiere xlrd para leer {archivo}')
+            libro = xlrd.open_workbook(archivo)
+            yield from cls._leer_tablas(
+                ((hoja.row_values(i) for i in range(hoja.nrows)) for hoja in libro.sheets()), archivo
+            )
+        else:
+            logger.warning(f"Archivo de catálogo ignorado (formato no soportado): {archivo}")
+
+    @staticmethod
+    def _leer_csv(archivo: str) -> Iterator[list]:
+        with open(archivo, 'rb') as origen:
+            contenido = origen.read()
+        # Los CSV del SAT vienen en UTF-8 (a veces con BOM) o en Latin-1
+        try:
+            texto = contenido.decode('utf-8-sig')
+        except UnicodeDecodeError:
+            texto = contenido.decode('latin-1')
+        yield from csv.reader(io.StringIO(texto))
+
+    @classmethod
+    def _leer_tablas(cls, tablas: Iterable[Iterable], archivo: str) -> Iterator[Tuple[str, Iterator[Dict[str, Any]]]]:
+        """
+        Tablas con el formato del catCFDI del SAT: renglones de título, un encabezado cuya
+        primera columna es el nombre del catálogo (c_UsoCFDI, ...) y después los registros
+        """
+        for filas in tablas:
+            filas = iter(filas)
+            for fila in filas:
+                celdas = [str(celda).strip() if celda is not None else '' for celda in fila]
+                if celdas and re.match(r'^c_\w+$', celdas[0]):
+                    yield celdas[0], cls._registros_tabla(celdas, filas)
+                    break
+            else:
+                logger.warning(f"Sin encabezado de catálogo (c_...) en una tabla de {archivo}")
+
+    @staticmethod
+    def _registros_tabla(encabezado: List[str], filas: Iterator) -> Iterator[Dict[str, Any]]:
+        columnas = []
+        for indice, nombre in enumerate(encabezado):
+            llave = normalizar(nombre).replace(' ', '_')
+            if indice == 0:
+                columnas.append('codigo')
+            elif llave.startswith('descripcion') and 'descripcion' not in columnas:
+                columnas.append('descripcion')
+            elif 'inicio' in llave or llave == 'vigenciadesde':
+                columnas.append('vigencia_desde')
+            elif llave.startswith('fecha_fin') or 'fin_de_vigencia' in llave or llave == 'vigenciahasta':
+                columnas.append('vigencia_hasta')
+            else:
+                columnas.append(nombre or f'columna_{indice}')
+
+        for fila in filas:
+            valores = list(fila)
+            if not valores or valores[0] in (None, ''):
+                continue
+            codigo = valores[0]
+            # Excel guarda como número códigos como 01 o 84111506
+            if isinstance(codigo, float) and codigo.is_integer():
+                codigo = int(codigo)
+            registro = {'codigo': codigo}
+            for columna, valor in zip(columnas[1:], valores[1:]):
+                registro[columna] = valor
+            yield registro
+
+    @staticmethod
+    def _leer_xml(archivo: str) -> Iterator[Tuple[str, Iterator[Dict[str, Any]]]]:
+        """
+        XML de catálogos (elementos c_X con atributo c_X, Descripcion y vigencias) o el XSD
+        catCFDI (simpleType c_X con sus enumeraciones, solo códigos)
+        """
+        raiz = ET.parse(archivo).getroot()
+        catalogos: Dict[str, List[Dict[str, Any]]] = {}
+        xs = '{http://www.w3.org/2001/XMLSchema}'
+
+        for tipo in raiz.iter(f'{xs}simpleType'):
+            nombre = tipo.get('name', '')
+            if nombre.startswith('c_'):
+                catalogos[nombre] = [
+                    {'codigo': enumeracion.get('value')} for enumeracion in tipo.iter(f'{xs}enumeration')
+                ]
+
+        for elemento in raiz.iter():
+            nombre = elemento.tag.rsplit('}', 1)[-1]
+            if nombre.startswith('c_') and elemento.get(nombre) is not None:
+                atributos = dict(elemento.attrib)
+                catalogos.setdefault(nombre, []).append({
+                    'codigo': atributos.pop(nombre),
+                    'descripcion': atributos.pop('Descripcion', ''),
+                    'vigencia_desde': atributos.pop('VigenciaDesde', atributos.pop('FechaInicioDeVigencia', '')),
+                    'vigencia_hasta': atributos.pop('VigenciaHasta', atributos.pop('FechaFinDeVigencia', '')),
+                    **atributos,
+                })
+
+        for nombre, registros in catalogos.items():
+            yield nombre, iter(registros)
@@ -5,6 +5,7 @@ Maneja la extracción de datos del certificado, validación de vigencia y genera
 
 import os
 import base64
+import hashlib
 import logging
 from datetime import datetime, timezone
 from typing import Dict, Any, Optional, Tuple
@@ -15,12 +16,18 @@ from cryptography.hazmat.primitives.serialization import pkcs12
 from django.core.files.base import ContentFile
 from django.conf import settings
 
+from ..utils.cache_utils import CacheLRU
+
 logger = logging.getLogger(__name__)
 
 
 class CertificadoService:
     """Servicio para manejo de certificados digitales"""
     
+    # Certificados parseados y llaves cargadas por emisor (ver _obtener_de_cache)
+    _cache_certificados = CacheLRU(getattr(settings, 'CERTIFICADOS_CACHE_MAX', 64))
+    _cache_llaves = CacheLRU(getattr(settings, 'CERTIFICADOS_CACHE_MAX', 64))
+    
     @classmethod
     def extraer_datos_certificado(cls, emisor) -> Dict[str, Any]:
         """
@@ -37,69 +44,13 @@ class CertificadoService:
             if not emisor.archivo_certificado:
                 raise ValueError("No se ha cargado un archivo de certificado para este emisor")
             
-            # Validar que sea base64 válido
-            try:
-                certificado_data = base64.b64decode(emisor.archivo_certificado)
-            except Exception as e:
-                raise ValueError(f"El certificado no es un base64 válido: {str(e)}")
-            
-            # Validar que el certificado tenga el tamaño mínimo esperado
-            if len(certificado_data) < 100:
-                raise ValueError("El certificado parece estar corrupto o incompleto")
-            
-            # Intentar cargar el certificado como DER
-            try:
-                certificado = x509.load_der_x509_certificate(certificado_data)
-            except Exception as e:
-                # Si falla como DER, intentar como PEM
-                try:
-                    # Convertir DER a PEM si es necesario
-                    pem_data = base64.b64encode(certificado_data).decode('utf-8')
-                    pem_cert = f"-----BEGIN CERTIFICATE-----\n{pem_data}\n-----END CERTIFICATE-----"
-                    certificado = x509.load_pem_x509_certificate(pem_cert.encode('utf-8'))
-                except Exception as pem_error:
-                    raise ValueError(f"No se pudo cargar el certificado como DER o PEM: {str(e)} | PEM: {str(pem_error)}")
-            
-            # Extraer datos
-            numero_certificado = certificado.serial_number
-            rfc_emisor = None
-            razon_social = None
-            
-            # Extraer RFC y razón social del subject
-            for attribute in certificado.subject:
-                if attribute.oid == x509.NameOID.COUNTRY_NAME:
-                    continue
-                elif attribute.oid == x509.NameOID.STATE_OR_PROVINCE_NAME:
-                    continue
-                elif attribute.oid == x509.NameOID.LOCALITY_NAME:
-                    continue
-                elif attribute.oid == x509.NameOID.ORGANIZATION_NAME:
-                    razon_social = attribute.value
-                elif attribute.oid == x509.NameOID.COMMON_NAME:
-                    # El RFC puede estar en el CN
-                    if len(attribute.value) == 13:  # RFC de persona moral
-                        rfc_emisor = attribute.value
-                    elif len(attribute.value) == 12:  # RFC de persona física
-                        rfc_emisor = attribute.value
-            
-            # Fechas de vigencia
-            fecha_inicio = certificado.not_valid_before_utc
-            fecha_fin = certificado.not_valid_after_utc
-            
-            # Verificar si es FIEL
-            es_fiel = cls._es_certificado_fiel(certificado)
+            datos, fecha_inicio, fecha_fin = cls._obtener_de_cache(
+                cls._cache_certificados, emisor, emisor.archivo_certificado,
+                lambda: cls._parsear_certificado(emisor.archivo_certificado)
+            )
             
-            return {
-                'valido': True,
-                'no_certificado': str(numero_certificado),
-                'rfc_emisor': rfc_emisor,
-                'razon_social': razon_social,
-                'fecha_inicio': fecha_inicio.isoformat() if fecha_inicio else None,
-                'fecha_fin': fecha_fin.isoformat() if fecha_fin else None,
-                'es_fiel': es_fiel,
-                'vigente': cls._verificar_vigencia(fecha_inicio, fecha_fin),
-                'certificado_base64': base64.b64encode(certificado_data).decode('utf-8')
-            }
+            # La vigencia depende de la fecha actual: no se guarda en caché
+            return {**datos, 'vigente': cls._verificar_vigencia(fecha_inicio, fecha_fin)}
             
         except Exception as e:
             logger.error(f"Error extrayendo datos del certificado: {e}")
@@ -108,6 +59,81 @@ class CertificadoService:
                 'error': str(e)
             }
     
+    @classmethod
+    def _parsear_certificado(cls, archivo_certificado: str) -> Tuple[Dict[str, Any], datetime, datetime]:
+        """
+        Decodifica y parsea el certificado .cer en base64
+        
+        Returns:
+            Tuple: (datos del certificado, fecha de inicio, fecha de fin)
+            
+        Raises:
+            ValueError: Si el certificado no es válido
+        """
+        # Validar que sea base64 válido
+        try:
+            certificado_data = base64.b64decode(archivo_certificado)
+        except Exception as e:
+            raise ValueError(f"El certificado no es un base64 válido: {str(e)}")
+        
+        # Validar que el certificado tenga el tamaño mínimo esperado
+        if len(certificado_data) < 100:
+            raise ValueError("El certificado parece estar corrupto o incompleto")
+        
+        # Intentar cargar el certificado como DER
+        try:
+            certificado = x509.load_der_x509_certificate(certificado_data)
+        except Exception as e:
+            # Si falla como DER, intentar como PEM
+            try:
+                # Convertir DER a PEM si es necesario
+                pem_data = base64.b64encode(certificado_data).decode('utf-8')
+                pem_cert = f"-----BEGIN CERTIFICATE-----\n{pem_data}\n-----END CERTIFICATE-----"
+                certificado = x509.load_pem_x509_certificate(pem_cert.encode('utf-8'))
+            except Exception as pem_error:
+                raise ValueError(f"No se pudo cargar el certificado como DER o PEM: {str(e)} | PEM: {str(pem_error)}")
+        
+        # Extraer datos
+        numero_certificado = certificado.serial_number
+        rfc_emisor = None
+        razon_social = None
+        
+        # Extraer RFC y razón social del subject
+        for attribute in certificado.subject:
+            if attribute.oid == x509.NameOID.COUNTRY_NAME:
+                continue
+            elif attribute.oid == x509.NameOID.STATE_OR_PROVINCE_NAME:
+                continue
+            elif attribute.oid == x509.NameOID.LOCALITY_NAME:
+                continue
+            elif attribute.oid == x509.NameOID.ORGANIZATION_NAME:
+                razon_social = attribute.value
+            elif attribute.oid == x509.NameOID.COMMON_NAME:
+                # El RFC puede estar en el CN
+                if len(attribute.value) == 13:  # RFC de persona moral
+                    rfc_emisor = attribute.value
+                elif len(attribute.value) == 12:  # RFC de persona física
+                    rfc_emisor = attribute.value
+        
+        # Fechas de vigencia
+        fecha_inicio = certificado.not_valid_before_utc
+        fecha_fin = certificado.not_valid_after_utc
+        
+        # Verificar si es FIEL
+        es_fiel = cls._es_certificado_fiel(certificado)
+        
+        datos = {
+            'valido': True,
+            'no_certificado': str(numero_certificado),
+            'rfc_emisor': rfc_emisor,
+            'razon_social': razon_social,
+            'fecha_inicio': fecha_inicio.isoformat() if fecha_inicio else None,
+            'fecha_fin': fecha_fin.isoformat() if fecha_fin else None,
+            'es_fiel': es_fiel,
+            'certificado_base64': base64.b64encode(certificado_data).decode('utf-8')
+        }
+        return datos, fecha_inicio, fecha_fin
+    
     @classmethod
     def _verificar_vigencia(cls, fecha_inicio, fecha_fin) -> bool:
         """
@@ -237,27 +263,70 @@ class CertificadoService:
             if not emisor.archivo_llave:
                 raise ValueError("No se ha cargado un archivo de llave para este emisor")
             
-            llave_data = base64.b64decode(emisor.archivo_llave)
-            
-            # Intentar cargar como PEM
-            try:
-                llave_privada = serialization.load_pem_private_key(
-                    llave_data,
-                    password=emisor.password_llave.encode('utf-8') if emisor.password_llave else None
-                )
-                return llave_privada
-            except Exception:
-                # Intentar cargar como DER
-                llave_privada = serialization.load_der_private_key(
-                    llave_data,
-                    password=emisor.password_llave.encode('utf-8') if emisor.password_llave else None
-                )
-                return llave_privada
+            # La contraseña forma parte de la clave: si cambia, la llave se vuelve a cargar
+            return cls._obtener_de_cache(
+                cls._cache_llaves, emisor, f"{emisor.archivo_llave}\x00{emisor.password_llave or ''}",
+                lambda: cls._parsear_llave_privada(emisor.archivo_llave, emisor.password_llave)
+            )
                 
         except Exception as e:
             logger.error(f"Error cargando llave privada: {e}")
             return None
     
+    @classmethod
+    def _parsear_llave_privada(cls, archivo_llave: str, password_llave: Optional[str]) -> Any:
+        """Decodifica la llave en base64 y la carga como PEM o DER"""
+        llave_data = base64.b64decode(archivo_llave)
+        password = password_llave.encode('utf-8') if password_llave else None
+        
+        # Intentar cargar como PEM
+        try:
+            return serialization.load_pem_private_key(llave_data, password=password)
+        except Exception:
+            # Intentar cargar como DER
+            return serialization.load_der_private_key(llave_data, password=password)
+    
+    @classmethod
+    def _obtener_de_cache(cls, cache: CacheLRU, emisor, contenido: str, crear):
+        """
+        Valor en caché para el contenido almacenado del emisor
+        
+        La clave es (base de datos, emisor, sha256 del contenido): al cambiar el certificado,
+        la llave o la contraseña la clave cambia y se descartan las entradas anteriores del emisor.
+        """
+        emisor_clave = (emisor._state.db, emisor.pk)
+        huella = hashlib.sha256(contenido.encode('utf-8')).hexdigest()
+        
+        def crear_y_descartar_anteriores():
+            valor = crear()
+            cache.descartar(lambda clave: clave[0] == emisor_clave)
+            return valor
+        
+        return cache.obtener((emisor_clave, huella), crear_y_descartar_anteriores)
+    
+    @classmethod
+    def invalidar_cache(cls, emisor=None) -> int:
+        """
+        Descarta los certificados y llaves en caché (de un emisor o de todos)
+        
+        Returns:
+            int: Número de entradas descartadas
+        """
+        if emisor is None:
+            condicion = None
+        else:
+            emisor_clave = (emisor._state.db, emisor.pk)
+            condicion = lambda clave: clave[0] == emisor_clave
+        return cls._cache_certificados.descartar(condicion) + cls._cache_llaves.descartar(condicion)
+    
+    @classmethod
+    def estadisticas_cache(cls) -> Dict[str, Dict[str, int]]:
+        """Aciertos, fallos y descartes de las cachés de certificados y llaves"""
+        return {
+            'certificados': cls._cache_certificados.estadisticas(),
+            'llaves': cls._cache_llaves.estadisticas(),
+        }
+    
     @classmethod
     def generar_sello_digital(cls, cadena_original: str, llave_privada: Any) -> Optional[str]:
         """
@@ -0,0 +1,117 @@
+"""
+Servicio de cobranza de remisiones preliquidadas
+Filtra, agrupa por cliente y pagina en la base de datos
+"""
+
+import logging
+from typing import Dict, Any, List, Tuple
+from django.db.models import Q, Exists, OuterRef
+
+from ..models import Cliente, Remision
+
+logger = logging.getLogger(__name__)
+
+
+class CobranzaService:
+    """Servicio de consulta de cobranza agrupada por cliente"""
+
+    @staticmethod
+    def filtrar_remisiones(parametros) -> Any:
+        """
+        Obtiene las remisiones preliquidadas no canceladas que cumplen los filtros de cobranza
+
+        Args:
+            parametros: QueryDict o dict con busqueda, cliente, estado_facturacion,
+                estado_pago, fecha_desde y fecha_hasta
+
+        Returns:
+            RemisionQuerySet: Remisiones con `importe_liquidado_total`, `total_pagado` y `saldo` anotados
+        """
+        busqueda = parametros.get('busqueda', '')
+        cliente_id = parametros.get('cliente', '')
+        estado_facturacion = parametros.get('estado_facturacion', '')
+        estado_pago = parametros.get('estado_pago', '')
+        fecha_desde = parametros.get('fecha_desde', '')
+        fecha_hasta = parametros.get('fecha_hasta', '')
+
+        remisiones = Remision.objects.filter(cancelada=False)
+
+        if busqueda:
+            remisiones = remisiones.filter(
+                Q(ciclo__icontains=busqueda) |
+                Q(folio__icontains=busqueda) |
+                Q(cliente__razon_social__icontains=busqueda)
+            )
+
+        if cliente_id:
+            remisiones = remisiones.filter(cliente_id=cliente_id)
+
+        if estado_facturacion == 'pendiente':
+            remisiones = remisiones.filter(facturado=False)
+        elif estado_facturacion == 'facturado':
+            remisiones = remisiones.filter(facturado=True)
+
+        if fecha_desde:
+            remisiones = remisiones.filter(fecha__gte=fecha_desde)
+
+        if fecha_hasta:
+            remisiones = remisiones.filter(fecha__lte=fecha_hasta)
+
+        # Solo preliquidadas, con estado de pago basado en el saldo pendiente
+        remisiones = remisiones.with_liquidacion_state().with_saldo().preliquidadas()
+        if estado_pago == 'pagado':
+            # Solo remisiones con saldo cero (completamente pagadas)
+            return remisiones.sin_saldo()
+        # 'pendiente' o sin filtro: solo las no pagadas (comportamiento por defecto)
+        return remisiones.con_saldo()
+
+    @staticmethod
+    def clientes_con_remisiones(remisiones):
+        """
+        Clientes que tienen al menos una remisión en `remisiones`, ordenados por razón social
+
+        El QuerySet resultante es perezoso, por lo que el paginador aplica COUNT y LIMIT/OFFSET en SQL.
+        """
+        return Cliente.objects.filter(
+            Exists(remisiones.filter(cliente=OuterRef('pk')))
+        ).order_by('razon_social', 'codigo')
+
+    @staticmethod
+    def agrupar_por_cliente(clientes, remisiones) -> List[Tuple[Any, List[Tuple[Any, Any]], Any, Any]]:
+        """
+        Agrupa las remisiones de los clientes indicados (solo se consultan las de esos clientes)
+
+        Args:
+            clientes: Clientes a incluir (por ejemplo, los de la página actual)
+            remisiones: QuerySet devuelto por filtrar_remisiones
+
+        Returns:
+            List: Tuplas (cliente, [(remision, importe)], total_importe, saldo_cliente)
+        """
+        clientes = list(clientes)
+        remisiones_por_cliente: Dict[Any, list] = {cliente.pk: [] for cliente in clientes}
+
+        remisiones_pagina = (
+            remisiones.filter(cliente__in=[cliente.pk for cliente in clientes])
+            .select_related('cliente')
+            .order_by('cliente_id', '-fecha')
+        )
+        for remision in remisiones_pagina:
+            remisiones_por_cliente[remision.cliente_id].append(remision)
+
+        agrupadas = []
+        for cliente in clientes:
+            total_importe = 0
+            saldo_cliente = 0
+            remisiones_con_importe = []
+
+            for remision in remisiones_por_cliente[cliente.pk]:
+                # Importe total y saldo pendiente anotados por RemisionQuerySet.with_saldo()
+                importe_remision = remision.importe_liquidado_total
+                total_importe += importe_remision
+                saldo_cliente += remision.saldo_pendiente
+                remisiones_con_importe.append((remision, importe_remision))
+
+            agrupadas.append((cliente, remisiones_con_importe, total_importe, saldo_cliente))
+
+        return agrupadas
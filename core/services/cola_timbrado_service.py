@@ -0,0 +1,196 @@
+"""
+Cola persistente de timbrado asíncrono
+La petición web solo encola; el worker timbra fuera de transacción y aplica el resultado
+"""
+
+import logging
+from datetime import timedelta
+from typing import Dict, Any, Optional
+from django.db.models import F
+from django.utils import timezone
+
+from directiva_agricola.transacciones import atomic_escritura
+from ..factura_models import Factura, TrabajoTimbrado
+from .facturacion_service import FacturacionService
+
+logger = logging.getLogger(__name__)
+
+
+class ColaTimbradoService:
+    """Servicio de la cola de trabajos de timbrado"""
+
+    @staticmethod
+    def encolar(factura, eliminar_factura_si_falla: bool = False) -> TrabajoTimbrado:
+        """
+        Encola el timbrado de una factura; si ya tiene un trabajo activo lo reutiliza
+
+        Args:
+            factura: Factura a timbrar
+            eliminar_factura_si_falla: Eliminar la factura si el timbrado falla
+
+        Returns:
+            TrabajoTimbrado: Trabajo pendiente o en proceso de la factura
+        """
+        with atomic_escritura():
+            trabajo = TrabajoTimbrado.objects.filter(
+                factura=factura,
+                estado__in=['PENDIENTE', 'EN_PROCESO']
+            ).first()
+            if trabajo:
+                return trabajo
+
+            trabajo = TrabajoTimbrado.objects.create(
+                factura=factura,
+                factura_folio=factura.folio,
+                eliminar_factura_si_falla=eliminar_factura_si_falla
+            )
+        logger.info(f"Timbrado de factura {factura.folio} encolado (trabajo {trabajo.pk})")
+        return trabajo
+
+    @classmethod
+    def encolar_lote(cls, folios) -> Dict[str, Any]:
+        """
+        Encola el timbrado de varias facturas en una sola transacción
+
+        Args:
+            folios: Folios de las facturas a timbrar
+
+        Returns:
+            Dict: trabajos (folio -> TrabajoTimbrado) y no_encontrados (folios sin factura)
+        """
+        folios = list(dict.fromkeys(folios))
+        with atomic_escritura():
+            facturas = Factura.objects.in_bulk(folios)
+            trabajos = {folio: cls.encolar(facturas[folio]) for folio in folios if folio in facturas}
+        return {
+            'trabajos': trabajos,
+            'no_encontrados': [folio for folio in folios if folio not in facturas],
+        }
+
+    @staticmethod
+    def tomar_siguiente() -> Optional[TrabajoTimbrado]:
+        """
+        Reserva el trabajo pendiente más antiguo
+
+        La reserva es un UPDATE condicionado al estado PENDIENTE, por lo que dos workers
+        nunca toman el mismo trabajo (no requiere SELECT FOR UPDATE).
+
+        Returns:
+            TrabajoTimbrado reservado o None si la cola está vacía
+        """
+        while True:
+            trabajo_id = TrabajoTimbrado.objects.filter(estado='PENDIENTE').order_by(
+                'fecha_creacion', 'id'
+            ).values_list('id', flat=True).first()
+            if trabajo_id is None:
+                return None
+
+            reservado = TrabajoTimbrado.objects.filter(pk=trabajo_id, estado='PENDIENTE').update(
+                estado='EN_PROCESO',
+                fecha_inicio=timezone.now(),
+                intentos=F('intentos') + 1
+            )
+            if reservado:
+                return TrabajoTimbrado.objects.select_related('factura').get(pk=trabajo_id)
+
+    @classmethod
+    def procesar(cls, trabajo: TrabajoTimbrado) -> Dict[str, Any]:
+        """
+        Timbra la factura del trabajo y registra el resultado
+
+        Args:
+            trabajo: Trabajo reservado con tomar_siguiente
+
+        Returns:
+            Dict: Resultado de FacturacionService.timbrar_factura
+        """
+        if trabajo.factura is None:
+            resultado = {
+                'exito': False,
+                'error': 'Factura no encontrada',
+                'codigo_error': 'FACTURA_NOT_FOUND'
+            }
+        else:
+            resultado = FacturacionService.timbrar_factura(trabajo.factura)
+
+        cls.registrar_resultado(trabajo, resultado)
+        return resultado
+
+    @staticmethod
+    def registrar_resultado(trabajo: TrabajoTimbrado, resultado: Dict[str, Any]):
+        """Aplica el resultado del timbrado al trabajo en una transacción corta"""
+        with atomic_escritura():
+            trabajo.fecha_fin = timezone.now()
+            if resultado.get('exito'):
+                trabajo.estado = 'COMPLETADO'
+                trabajo.uuid = resultado.get('uuid')
+                trabajo.fecha_timbrado = resultado.get('fecha_timbrado')
+                trabajo.error = None
+                trabajo.codigo_error = None
+                trabajo.detalles_error = None
+            else:
+                trabajo.estado = 'ERROR'
+                trabajo.error = resultado.get('error', 'Error desconocido al timbrar')
+                trabajo.codigo_error = resultado.get('codigo_error', 'UNKNOWN_ERROR')
+                trabajo.detalles_error = '\n'.join(str(d) for d in resultado.get('detalles', []) or [])
+
+                if trabajo.eliminar_factura_si_falla and trabajo.factura_id:
+                    # Si el timbrado falla, eliminar la factura creada para no afectar saldos
+                    try:
+                        with atomic_escritura():
+                            Factura.objects.filter(pk=trabajo.factura_id).delete()
+                        trabajo.factura = None
+                    except Exception as e:
+                        logger.error(f"Error eliminando factura no timbrada {trabajo.factura_folio}: {e}")
+            trabajo.save()
+
+        logger.info(f"Trabajo de timbrado {trabajo.pk} (factura {trabajo.factura_folio}): {trabajo.estado}")
+
+    @staticmethod
+    def liberar_trabajos_interrumpidos(minutos: int = 10) -> int:
+        """
+        Marca como error los trabajos que quedaron en proceso (por ejemplo, el worker se detuvo)
+
+        No se reintentan automáticamente porque el PAC pudo haber timbrado el CFDI.
+
+        Returns:
+            int: Número de trabajos marcados
+        """
+        limite = timezone.now() - timedelta(minutes=minutos)
+        return TrabajoTimbrado.objects.filter(estado='EN_PROCESO', fecha_inicio__lt=limite).update(
+            estado='ERROR',
+            error='El timbrado se interrumpió antes de terminar; verifique el estatus de la factura',
+            codigo_error='INTERRUPTED',
+            fecha_fin=timezone.now()
+        )
+
+    @staticmethod
+    def estado(trabajo: TrabajoTimbrado) -> Dict[str, Any]:
+        """
+        Estado del trabajo para el sondeo desde la interfaz
+
+        Returns:
+            Dict: Respuesta JSON compatible con la del timbrado síncrono
+        """
+        respuesta = {
+            'trabajo_id': trabajo.pk,
+            'estado_trabajo': trabajo.estado,
+            'terminado': trabajo.terminado,
+            'serie_folio': f"A-{trabajo.factura_folio:06d}",
+        }
+        if trabajo.estado == 'COMPLETADO':
+            respuesta.update({
+                'success': True,
+                'message': 'Factura timbrada exitosamente',
+                'uuid': trabajo.uuid or '',
+                'fecha_timbrado': trabajo.fecha_timbrado or '',
+                'estado': 'TIMBRADO'
+            })
+        elif trabajo.estado == 'ERROR':
+            respuesta.update({
+                'success': False,
+                'error': trabajo.error,
+                'codigo_error': trabajo.codigo_error,
+                'detalles': trabajo.detalles_error.split('\n') if trabajo.detalles_error else []
+            })
+        return respuesta
@@ -0,0 +1,335 @@
+"""
+Complemento de pago que liquida varias facturas PPD
+Un solo pago (por ejemplo una transferencia) aplicado a muchas facturas del mismo emisor y
+receptor genera un complemento Pagos 2.0 con un DoctoRelacionado por factura y se timbra una vez
+"""
+
+import logging
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from typing import Dict, Any, List, Tuple
+
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from directiva_agricola.transacciones import atomic_escritura
+from ..models import PagoFactura
+from ..factura_models import FacturaDetalle, Factura
+from .cadena_original import CadenaOriginal
+from .certificado_service import CertificadoService
+from .complemento_pago_xml_builder import ComplementoPagoXMLBuilder
+from .configuracion_entorno import ConfiguracionEntornoService
+from .timbrado_service import TimbradoService
+
+logger = logging.getLogger(__name__)
+
+CENTAVO = Decimal('0.01')
+
+
+class ComplementoPagoService:
+    """Registro y timbrado de un pago aplicado a varias facturas PPD"""
+
+    @staticmethod
+    def facturas_con_saldo(folios: List[int]) -> Dict[int, Factura]:
+        """
+        Facturas a pagar con su saldo, número de pagos timbrados y tipo de IVA, en una consulta
+
+        Args:
+            folios: Folios de las facturas
+
+        Returns:
+            Dict[int, Factura]: Facturas por folio con `saldo`, `pagos_timbrados` y `tipo_impuesto` anotados
+        """
+        pagos_timbrados = (
+            PagoFactura.objects.filter(factura=OuterRef('pk'), uuid__isnull=False)
+            .order_by()
+            .values('factura')
+            .annotate(total=Count('pk'))
+            .values('total')
+        )
+        # El tipo de IVA (IVA_0, IVA_EXENTO...) viene del producto; es el mismo dato que usa el formulario de un pago
+        tipo_impuesto = FacturaDetalle.objects.filter(factura=OuterRef('pk')).order_by('pk').values(
+            'producto_servicio__impuesto'
+        )[:1]
+        return Factura.objects.con_saldo().annotate(
+            pagos_timbrados=Coalesce(Subquery(pagos_timbrados, output_field=IntegerField()), Value(0)),
+            tipo_impuesto=Subquery(tipo_impuesto),
+        ).select_related('emisor', 'receptor', 'receptor__regimen_fiscal').in_bulk(folios)
+
+    @staticmethod
+    def _leer_aplicaciones(documentos: List[Dict[str, Any]]) -> Tuple[List[Tuple[int, Decimal]], List[str]]:
+        """Convierte [{'folio', 'monto'}] en [(folio, monto)] y reporta folios repetidos o montos inválidos"""
+        aplicaciones = []
+        errores = []
+        vistos = set()
+        for documento in documentos:
+            try:
+                folio = int(documento['folio'])
+                monto = Decimal(str(documento['monto'])).quantize(CENTAVO)
+            except (KeyError, TypeError, ValueError, InvalidOperation):
+                errores.append(f'Documento inválido: {documento}')
+                continue
+            if folio in vistos:
+                errores.append(f'La factura {folio} aparece más de una vez')
+            elif monto <= 0:
+                errores.append(f'Factura {folio}: el monto del pago debe ser mayor a cero')
+            vistos.add(folio)
+            aplicaciones.append((folio, monto))
+        return aplicaciones, errores
+
+    @classmethod
+    def validar(cls, documentos: List[Dict[str, Any]]) -> Tuple[List[Tuple[Factura, Decimal]], List[str]]:
+        """
+        Valida la aplicación del pago contra los saldos timbrados de cada factura
+
+        Todas las facturas deben ser PPD, estar timbradas, compartir emisor y receptor, y ningún
+        monto puede exceder el saldo pendiente de su factura.
+
+        Args:
+            documentos: [{'folio': int, 'monto': Decimal}, ...]
+
+        Returns:
+            tuple: ([(factura, monto), ...] en el orden recibido, lista de errores)
+        """
+        aplicaciones, errores = cls._leer_aplicaciones(documentos)
+        if not aplicaciones:
+            return [], errores or ['No se indicaron facturas a pagar']
+
+        facturas = cls.facturas_con_saldo([folio for folio, _ in aplicaciones])
+        validas = []
+        for folio, monto in aplicaciones:
+            factura = facturas.get(folio)
+            if factura is None:
+                errores.append(f'La factura {folio} no existe')
+                continue
+            if factura.metodo_pago != 'PPD':
+                errores.append(f'Factura {folio}: solo se pueden registrar complementos de pago para facturas PPD (crédito)')
+            elif not factura.uuid:
+                errores.append(f'Factura {folio}: la factura no está timbrada')
+            elif monto > factura.saldo:
+                errores.append(f'Factura {folio}: el monto del pago (${monto}) no puede exceder el saldo pendiente (${factura.saldo:.2f})')
+            validas.append((factura, monto))
+
+        if validas:
+            primera = validas[0][0]
+            for factura, _ in validas[1:]:
+                if factura.emisor_id != primera.emisor_id or factura.receptor_id != primera.receptor_id:
+                    errores.append(f'Factura {factura.folio}: todas las facturas deben tener el mismo emisor y receptor')
+        return validas, errores
+
+    @classmethod
+    def cambios_desde_validacion(cls, aplicaciones: List[Tuple[Factura, Decimal]]) -> List[str]:
+        """
+        Facturas cuyo saldo o número de pagos timbrados cambió después de validar
+
+        Se llama dentro de atomic_escritura(), justo antes de registrar los pagos: en PostgreSQL
+        bloquea las facturas (select_for_update) y en SQLite la transacción ya tiene el bloqueo
+        de escritura, así que otro pago a las mismas facturas espera a que esta termine.
+
+        Args:
+            aplicaciones: [(factura, monto), ...] como las devuelve validar()
+
+        Returns:
+            List: Errores por factura; vacía si nada cambió
+        """
+        folios = [factura.folio for factura, _ in aplicaciones]
+        list(Factura.objects.select_for_update().filter(pk__in=folios).values_list('pk', flat=True))
+        actuales = cls.facturas_con_saldo(folios)
+
+        errores = []
+        for factura, _ in aplicaciones:
+            actual = actuales.get(factura.folio)
+            if actual is None or (actual.saldo, actual.pagos_timbrados) != (factura.saldo, factura.pagos_timbrados):
+                errores.append(f'Factura {factura.folio}: se registró otro pago mientras se timbraba este complemento')
+        return errores
+
+    @staticmethod
+    def _documento_relacionado(factura: Factura, monto: Decimal) -> Dict[str, Any]:
+        """Datos del DoctoRelacionado de una factura, con el IVA proporcional al monto pagado"""
+        saldo_anterior = Decimal(factura.saldo).quantize(CENTAVO)
+        documento = {
+            'id_documento': factura.uuid,
+            'serie_dr': factura.serie or '',
+            'folio_dr': str(factura.folio),
+            'moneda_dr': factura.moneda or 'MXN',
+            'equivalencia_dr': 1,
+            'num_parcialidad': factura.pagos_timbrados + 1,
+            'imp_saldo_ant': f'{saldo_anterior:.2f}',
+            'imp_pagado': f'{monto:.2f}',
+            'imp_saldo_insoluto': f'{max(saldo_anterior - monto, Decimal("0.00")):.2f}',
+            'objeto_imp_dr': '02',
+            'impuesto': '002',
+        }
+
+        # Igual que el formulario de un pago: el monto pagado incluye el IVA de la factura
+        if factura.tipo_impuesto == 'IVA_EXENTO':
+            documento.update(tipo_factor='Exento', tasa='', base=f'{monto:.4f}', importe='0.00')
+        elif factura.tipo_impuesto == 'IVA_0' or not factura.impuesto:
+            documento.update(tipo_factor='Tasa0', tasa=0.0, base=f'{monto:.4f}', importe='0.00')
+        else:
+            tasa = round(float(factura.impuesto / factura.subtotal), 6) if factura.subtotal else 0.16
+            base = (monto / (1 + Decimal(str(tasa)))).quantize(Decimal('0.0001'))
+            documento.update(tipo_factor='Tasa', tasa=tasa, base=f'{base:.4f}', importe=f'{monto - base:.2f}')
+        return documento
+
+    @staticmethod
+    def _fecha_pago(valor: str) -> datetime:
+        if not valor:
+            return timezone.now()
+        fecha = parse_datetime(valor)
+        if fecha is None:
+            dia = parse_date(valor)
+            if dia is None:
+                raise ValueError(f'Fecha de pago inválida: {valor}')
+            fecha = datetime(dia.year, dia.month, dia.day)
+        return timezone.make_aware(fecha) if timezone.is_naive(fecha) else fecha
+
+    @staticmethod
+    def _credenciales(emisor) -> Tuple[Dict[str, Any], Dict[str, Any], Any]:
+        """Configuración del PAC, certificado y llave privada del emisor (una vez por pago)"""
+        configuracion = ConfiguracionEntornoService().obtener_configuracion_pac(emisor)
+        if not isinstance(configuracion, dict) or 'url' not in configuracion or 'credenciales' not in configuracion:
+            raise ValueError(f'Configuración PAC incompleta: {configuracion}')
+
+        certificado_data = CertificadoService.extraer_datos_certificado(emisor)
+        if not certificado_data or not certificado_data.get('valido'):
+            raise ValueError(
+                f'No se pudo obtener el certificado del emisor: {(certificado_data or {}).get("error", "Error desconocido")}'
+            )
+        if not certificado_data.get('certificado_base64'):
+            raise ValueError('El certificado del emisor está vacío')
+
+        llave_privada = CertificadoService.cargar_llave_privada(emisor)
+        if not llave_privada:
+            raise ValueError('No se pudo cargar la llave privada del emisor')
+        return configuracion, certificado_data, llave_privada
+
+    @classmethod
+    def registrar_pago(cls, documentos: List[Dict[str, Any]], datos_pago: Dict[str, Any], usuario) -> Dict[str, Any]:
+        """
+        Timbra un complemento de pago con un DoctoRelacionado por factura y registra los pagos
+
+        Los saldos previos salen de una sola consulta; certificado, llave y configuración del PAC
+        se cargan una vez y el complemento se timbra una vez. Si el timbrado falla no se registra
+        ningún pago. Cada factura recibe su PagoFactura, todos con el UUID y XML del complemento.
+
+        Antes de registrar los pagos se bloquean las facturas y se vuelven a leer sus saldos: si
+        otro pago concurrente los cambió (mismo NumParcialidad e ImpSaldoAnt), no se registra
+        nada y se informa el UUID timbrado para cancelarlo.
+
+        Args:
+            documentos: [{'folio': int, 'monto': Decimal}, ...]
+            datos_pago: fecha_pago, forma_pago, moneda, tipo_cambio, referencia_pago, observaciones
+                (y opcionalmente serie, folio y lugar_expedicion del complemento)
+            usuario: Usuario que registra el pago
+
+        Returns:
+            Dict: success; uuid y pagos registrados, o error y errores de validación
+        """
+        aplicaciones, errores = cls.validar(documentos)
+        if errores:
+            return {'success': False, 'error': 'Hay documentos con errores', 'errores': errores}
+
+        try:
+            fecha_pago = cls._fecha_pago(datos_pago.get('fecha_pago'))
+        except ValueError as e:
+            return {'success': False, 'error': str(e)}
+
+        factura_base = aplicaciones[0][0]
+        monto_total = sum((monto for _, monto in aplicaciones), Decimal('0.00'))
+        pago_data = {
+            **{clave: datos_pago[clave] for clave in ('serie', 'folio', 'lugar_expedicion') if datos_pago.get(clave)},
+            'monto': f'{monto_total:.2f}',
+            'fecha_pago': datos_pago.get('fecha_pago'),
+            'forma_pago': datos_pago.get('forma_pago', '03'),
+            'moneda_p': datos_pago.get('moneda', 'MXN'),
+            'tipo_cambio': datos_pago.get('tipo_cambio', 1),
+            'documentos': [cls._documento_relacionado(factura, monto) for factura, monto in aplicaciones],
+        }
+
+        try:
+            configuracion, certificado_data, llave_privada = cls._credenciales(factura_base.emisor)
+
+            arbol = ComplementoPagoXMLBuilder.construir_arbol_complemento_pago(factura_base, pago_data, certificado_data)
+            sello = CertificadoService.generar_sello_digital(CadenaOriginal.generar(arbol), llave_privada)
+            if not sello:
+                return {'success': False, 'error': 'No se pudo generar el sello digital'}
+            arbol.set('Sello', sello)
+            xml_complemento = ComplementoPagoXMLBuilder.serializar_xml(arbol)
+
+            resultado = TimbradoService(configuracion, factura_base.emisor).timbrar_cfdi(xml_complemento)
+        except ValueError as e:
+            return {'success': False, 'error': str(e)}
+
+        if not (resultado.get('timbradoOk') or resultado.get('exito')):
+            error_msg = resultado.get('mensaje', resultado.get('error', 'Error desconocido'))
+            codigo_error = resultado.get('codigo_error', 'UNKNOWN')
+            logger.error(f"Timbrado del complemento de {len(aplicaciones)} facturas falló - Error: {error_msg}, Código: {codigo_error}")
+            return {'success': False, 'error': f'Error en timbrado: {error_msg} (Código: {codigo_error})'}
+
+        # Datos del timbre (aceptar snake_case y camelCase)
+        timbre = {
+            'uuid': resultado.get('uuid', ''),
+            'xml_timbrado': resultado.get('xmlBase64') or resultado.get('xml_base64', ''),
+            'sello': resultado.get('selloCFD') or resultado.get('sello_cfd', ''),
+            'sello_sat': resultado.get('selloSAT') or resultado.get('sello_sat', ''),
+            'no_certificado_sat': resultado.get('noCertificadoSAT') or resultado.get('no_certificado_sat', ''),
+            'fecha_timbrado': resultado.get('FechaTimbrado') or resultado.get('fecha_timbrado', ''),
+            'codigo_qr': resultado.get('qr_base64', ''),
+            'cadena_original_sat': resultado.get('cadena_original_sat', ''),
+        }
+
+        # Los montos ya se validaron contra el saldo timbrado: se insertan todos en un INSERT
+        with atomic_escritura():
+            errores = cls.cambios_desde_validacion(aplicaciones)
+            if errores:
+                pagos = []
+            else:
+                pagos = PagoFactura.objects.bulk_create([
+                    PagoFactura(
+                        factura=factura,
+                        monto_pago=monto,
+                        tipo_pago='COMPLETO' if monto >= factura.saldo else 'PARCIAL',
+                        referencia_pago=datos_pago.get('referencia_pago', ''),
+                        observaciones=datos_pago.get('observaciones', ''),
+                        num_parcialidad=factura.pagos_timbrados + 1,
+                        forma_pago=pago_data['forma_pago'],
+                        fecha_pago=fecha_pago,
+                        usuario_registro=usuario,
+                        **timbre,
+                    )
+                    for factura, monto in aplicaciones
+                ])
+
+        if errores:
+            logger.error(f"Complemento de pago {timbre['uuid']} timbrado pero no registrado: {errores}")
+            return {
+                'success': False,
+                'error': (
+                    f"Otro pago cambió el saldo de las facturas mientras se timbraba; el complemento "
+                    f"{timbre['uuid']} no se registró y debe cancelarse"
+                ),
+                'errores': errores,
+                'uuid': timbre['uuid'],
+            }
+
+        logger.info(f"Complemento de pago {timbre['uuid']} timbrado para {len(pagos)} facturas (${monto_total})")
+        return {
+            'success': True,
+            'uuid': timbre['uuid'],
+            'monto_total': float(monto_total),
+            'pagos': [
+                {
+                    'id': pago.id,
+                    'folio': pago.factura_id,
+                    'monto': float(pago.monto_pago),
+                    'tipo': pago.get_tipo_pago_display(),
+                    'num_parcialidad': pago.num_parcialidad,
+                    'saldo_anterior': float(documento['imp_saldo_ant']),
+                    'saldo_despues': float(documento['imp_saldo_insoluto']),
+                }
+                for pago, documento in zip(pagos, pago_data['documentos'])
+            ],
+        }
@@ -0,0 +1,175 @@
+"""
+Servicio de registro de detalles de compra
+Valida todo el detalle antes de escribir y registra compra_detalles y kardex en bloque;
+al cancelar o eliminar una compra revierte sus entradas de kardex
+"""
+
+import logging
+from datetime import timedelta
+from decimal import Decimal, InvalidOperation
+from typing import Dict, Any, List
+from django.core.exceptions import ValidationError
+from django.utils import timezone
+
+from directiva_agricola.transacciones import atomic_escritura
+
+from ..models import CompraDetalle, ProductoServicio, Almacen, Kardex
+
+logger = logging.getLogger(__name__)
+
+
+class CompraService:
+    """Servicio de registro en bloque de detalles de compra y sus entradas de kardex"""
+
+    @staticmethod
+    def referencia_kardex(compra) -> str:
+        """Referencia con la que se registran en el kardex las entradas de la compra"""
+        return f"Compra {compra.folio:06d}"
+
+    @staticmethod
+    def validar_detalles(detalles_data: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Valida el detalle completo resolviendo productos y almacenes con dos consultas
+
+        Args:
+            detalles_data: Lista enviada por el formulario; producto y almacen pueden venir
+                como {codigo: ...} o como el código directamente
+
+        Returns:
+            List: Renglones válidos con producto, almacen, cantidad y precio
+
+        Raises:
+            ValidationError: Con todos los renglones inválidos; no se escribe nada
+        """
+        renglones = []
+        errores = []
+        for numero, detalle_data in enumerate(detalles_data, start=1):
+            if not detalle_data:
+                continue
+
+            # El JavaScript envía los datos con la estructura: {producto: {codigo: ...}, almacen: {codigo: ...}, ...}
+            producto_obj = detalle_data.get('producto', {})
+            almacen_obj = detalle_data.get('almacen', {})
+            producto_codigo = producto_obj.get('codigo') if isinstance(producto_obj, dict) else producto_obj
+            almacen_codigo = almacen_obj.get('codigo') if isinstance(almacen_obj, dict) else almacen_obj
+            cantidad = detalle_data.get('cantidad')
+            precio = detalle_data.get('precio')
+
+            if not (producto_codigo and almacen_codigo and cantidad and precio):
+                errores.append(f'Renglón {numero}: datos incompletos')
+                continue
+
+            try:
+                cantidad = Decimal(str(cantidad))
+                precio = Decimal(str(precio))
+                producto_codigo = int(producto_codigo)
+                almacen_codigo = int(almacen_codigo)
+            except (InvalidOperation, ValueError, TypeError):
+                errores.append(f'Renglón {numero}: valores numéricos inválidos')
+                continue
+
+            if cantidad <= 0 or precio < 0:
+                errores.append(f'Renglón {numero}: la cantidad debe ser mayor a cero y el precio no negativo')
+                continue
+
+            renglones.append({
+                'numero': numero,
+                'producto': producto_codigo,
+                'almacen': almacen_codigo,
+                'cantidad': cantidad,
+                'precio': precio,
+            })
+
+        productos = ProductoServicio.objects.in_bulk({r['producto'] for r in renglones})
+        almacenes = Almacen.objects.in_bulk({r['almacen'] for r in renglones})
+
+        for renglon in renglones:
+            if renglon['producto'] not in productos:
+                errores.append(f"Renglón {renglon['numero']}: el producto {renglon['producto']} no existe")
+            if renglon['almacen'] not in almacenes:
+                errores.append(f"Renglón {renglon['numero']}: el almacén {renglon['almacen']} no existe")
+            renglon['producto'] = productos.get(renglon['producto'])
+            renglon['almacen'] = almacenes.get(renglon['almacen'])
+
+        if errores:
+            raise ValidationError(errores)
+
+        return renglones
+
+    @classmethod
+    def registrar_detalles(cls, compra, detalles_data: List[Dict[str, Any]]) -> List[CompraDetalle]:
+        """
+        Reemplaza los detalles de la compra y registra sus entradas de kardex
+
+        Las entradas se agrupan por producto/almacén y cada grupo se registra con un solo
+        cálculo de saldos (Kardex.registrar_movimientos).
+
+        Args:
+            compra: Compra a la que pertenecen los detalles
+            detalles_data: Lista enviada por el formulario
+
+        Returns:
+            List[CompraDetalle]: Detalles creados
+        """
+        renglones = cls.validar_detalles(detalles_data)
+        referencia = cls.referencia_kardex(compra)
+
+        with atomic_escritura():
+            # Revertir las entradas de una captura anterior de la misma compra
+            Kardex.anular_movimientos(Kardex.objects.filter(referencia=referencia))
+            CompraDetalle.objects.filter(compra=compra).delete()
+
+            detalles = CompraDetalle.objects.bulk_create([
+                CompraDetalle(
+                    compra=compra,
+                    producto=renglon['producto'],
+                    almacen=renglon['almacen'],
+                    cantidad=renglon['cantidad'],
+                    precio=renglon['precio'],
+                    # bulk_create no ejecuta save(): calcular el subtotal aquí
+                    subtotal=renglon['cantidad'] * renglon['precio']
+                )
+                for renglon in renglones
+            ])
+
+            grupos: Dict[tuple, List[Kardex]] = {}
+            ahora = timezone.now()
+            for indice, detalle in enumerate(detalles):
+                grupos.setdefault((detalle.producto_id, detalle.almacen_id), []).append(
+                    Kardex(
+                        # Fechas distintas para respetar la unicidad por producto/almacén/fecha/tipo
+                        fecha=ahora + timedelta(microseconds=indice),
+                        tipo_movimiento='entrada',
+                        cantidad=detalle.cantidad,
+                        precio_unitario=detalle.precio,
+                        referencia=referencia
+                    )
+                )
+
+            for (producto_id, almacen_id), movimientos in grupos.items():
+                Kardex.registrar_movimientos(producto_id, almacen_id, movimientos)
+
+        logger.info(f"{referencia}: {len(detalles)} detalles y {len(grupos)} grupos de kardex registrados")
+        return detalles
+
+    @classmethod
+    def anular_kardex(cls, compra) -> int:
+        """
+        Revierte las entradas de kardex de la compra y recalcula saldos y existencias
+
+        Args:
+            compra: Compra cancelada o por eliminar
+
+        Returns:
+            int: Movimientos de kardex eliminados
+        """
+        return Kardex.anular_movimientos(Kardex.objects.filter(referencia=cls.referencia_kardex(compra)))
+
+    @classmethod
+    def eliminar(cls, compra):
+        """Elimina la compra revirtiendo antes sus entradas de kardex, en la misma transacción"""
+        referencia = cls.referencia_kardex(compra)
+        with atomic_escritura():
+            anulados = cls.anular_kardex(compra)
+            compra.delete()
+        logger.info(f"{referencia}: eliminada, {anulados} movimientos de kardex revertidos")
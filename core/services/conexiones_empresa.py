@@ -0,0 +1,179 @@
+"""
+Conexiones a las bases de datos de las empresas
+Resuelve la empresa (RFC de la sesión) contra administracion.Empresa y registra su alias en
+`connections.databases` la primera vez que el worker la usa. El número de alias en uso está
+acotado (LRU): al descartar uno se cierran sus conexiones persistentes, para que cientos de
+empresas no agoten descriptores de archivo ni conexiones del servidor de base de datos. La
+configuración del alias se conserva: otros hilos pueden estar atendiendo una petición con él.
+"""
+
+import logging
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+
+from ..utils.cache_utils import CacheLRU
+
+logger = logging.getLogger(__name__)
+
+# Nombres de BD válidos (se usan como alias y como nombre de archivo)
+_NOMBRE_BD = re.compile(r'^[\w-]+$')
+
+
+def _cerrar_conexion_hilo(alias: str):
+    """Cierra la conexión del hilo actual al alias (si la abrió) y la olvida"""
+    conexion = getattr(connections._connections, alias, None)
+    if conexion is not None:
+        try:
+            conexion.close()
+        except DatabaseError as e:
+            logger.warning(f"Error cerrando la conexión {alias}: {e}")
+        delattr(connections._connections, alias)
+
+
+def _al_descartar_alias(alias: str, _config):
+    """El alias salió del LRU: se cierran sus conexiones (la configuración se conserva)"""
+    _cerrar_conexion_hilo(alias)
+    # Los demás hilos cierran la suya al terminar su petición (ConexionesEmpresa.liberar)
+    with ConexionesEmpresa._lock:
+        ConexionesEmpresa._descartados.add(alias)
+    logger.info(f"BD de empresa {alias} descartada del LRU de conexiones")
+
+
+class ConexionesEmpresa:
+    """Administrador de alias y conexiones a las BD de las empresas (por proceso)"""
+
+    _alias = CacheLRU(getattr(settings, 'EMPRESAS_MAX_CONEXIONES', 64), al_descartar=_al_descartar_alias)
+    _empresas = CacheLRU(1024)
+    _descartados = set()
+    _estaticos = None
+    _lock = threading.Lock()
+
+    @staticmethod
+    def configuracion(db_name: str) -> Dict[str, Any]:
+        """
+        Configuración de la BD de una empresa, tomada de la BD 'default' (mismo backend y PRAGMA)
+
+        SQLite usa el archivo `<BASE_DIR>/<db_name>.sqlite3` (como lo crean los comandos
+        crear_empresa_*); otros motores usan db_name como nombre de la base.
+
+        Args:
+            db_name: Empresa.db_name
+
+        Returns:
+            Dict: Entrada para connections.databases con conexión persistente y health checks
+        """
+        base = connections.databases['default']
+        config = dict(base)
+        config['OPTIONS'] = dict(base.get('OPTIONS', {}))
+        config['TEST'] = dict(base.get('TEST', {}))
+        if 'sqlite3' in base['ENGINE']:
+            config['NAME'] = str(Path(settings.BASE_DIR) / f'{db_name}.sqlite3')
+        else:
+            config['NAME'] = db_name
+        config['CONN_MAX_AGE'] = getattr(settings, 'EMPRESAS_CONN_MAX_AGE', 600)
+        config['CONN_HEALTH_CHECKS'] = True
+        # La transacción por petición la abre EmpresaDbMiddleware solo en la BD de la petición
+        config['ATOMIC_REQUESTS'] = False
+        return config
+
+    @classmethod
+    def registrar(cls, db_name: str) -> str:
+        """
+        Alias de la BD de la empresa, registrándolo en connections.databases si hace falta
+
+        Args:
+            db_name: Empresa.db_name
+
+        Returns:
+            str: Alias para el router (set_current_company_db)
+        """
+        if not _NOMBRE_BD.match(db_name or ''):
+            raise ValueError(f'Nombre de base de datos de empresa no válido: {db_name!r}')
+        if cls._estaticos is None:
+            cls._estaticos = frozenset(connections.databases)
+        if db_name in cls._estaticos:
+            return db_name
+
+        def crear():
+            config = cls.configuracion(db_name)
+            connections.databases[db_name] = config
+            with cls._lock:
+                cls._descartados.discard(db_name)
+            logger.info(f"BD de empresa {db_name} registrada ({config['NAME']})")
+            return config
+
+        cls._alias.obtener(db_name, crear)
+        return db_name
+
+    @classmethod
+    def empresa_por_rfc(cls, rfc: str) -> Optional[Dict[str, Any]]:
+        """
+        Empresa registrada con ese RFC (en caché EMPRESAS_CACHE_SEGUNDOS)
+
+        Args:
+            rfc: RFC de la empresa
+
+        Returns:
+            Dict: rfc, nombre, db_name y disponible (activa y no suspendida); None si no existe
+        """
+        rfc = (rfc or '').strip().upper()
+        if not rfc:
+            return None
+
+        def consultar():
+            from administracion.models import Empresa
+
+            try:
+                empresa = Empresa.objects.using('administracion').filter(rfc=rfc).values(
+                    'rfc', 'nombre', 'db_name', 'activo', 'suspendido'
+                ).first()
+            except DatabaseError as e:
+                logger.error(f"No se pudo consultar la empresa {rfc}: {e}")
+                empresa = None
+            if empresa is not None:
+                empresa['disponible'] = empresa.pop('activo') and not empresa.pop('suspendido')
+            return time.monotonic(), empresa
+
+        consultada, empresa = cls._empresas.obtener(rfc, consultar)
+        if time.monotonic() - consultada > getattr(settings, 'EMPRESAS_CACHE_SEGUNDOS', 60):
+            cls._empresas.descartar(lambda clave: clave == rfc)
+            consultada, empresa = cls._empresas.obtener(rfc, consultar)
+        return empresa
+
+    @classmethod
+    def alias_para_rfc(cls, rfc: str) -> Optional[str]:
+        """Alias registrado de la empresa con ese RFC; None si no existe, está inactiva o suspendida"""
+        empresa = cls.empresa_por_rfc(rfc)
+        if empresa is None or not empresa['disponible']:
+            return None
+        return cls.registrar(empresa['db_name'])
+
+    @classmethod
+    def liberar(cls):
+        """Cierra las conexiones del hilo actual a BD que ya salieron del LRU"""
+        if not cls._descartados:
+            return
+        with cls._lock:
+            descartados = [alias for alias in cls._descartados if alias not in cls._alias]
+        for alias in descartados:
+            _cerrar_conexion_hilo(alias)
+
+    @classmethod
+    def olvidar_empresa(cls, rfc: str = None) -> int:
+        """Descarta la empresa de la caché (p. ej. al suspenderla); todas si no se indica RFC"""
+        condicion = None if rfc is None else (lambda clave: clave == rfc.strip().upper())
+        return cls._empresas.descartar(condicion)
+
+    @classmethod
+    def estadisticas(cls) -> Dict[str, Dict[str, int]]:
+        """Aciertos, fallos y descartes de los alias registrados y de la búsqueda de empresas"""
+        return {
+            'conexiones': cls._alias.estadisticas(),
+            'empresas': cls._empresas.estadisticas(),
+        }
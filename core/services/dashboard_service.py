@@ -0,0 +1,273 @@
+"""
+Servicio de estadísticas del dashboard
+Calcula los indicadores de la página principal con un número fijo de consultas agrupadas
+"""
+
+import logging
+from typing import Dict, Any, List
+from django.db.models import Q, Sum, Count
+
+from ..models import Remision, RemisionDetalle, PagoRemision, Presupuesto, PresupuestoDetalle, GastoDetalle, PagoFactura
+from ..factura_models import Factura
+from ..utils.query_utils import suma_subconsulta
+
+logger = logging.getLogger(__name__)
+
+
+class DashboardEstadisticasService:
+    """Servicio de estadísticas del dashboard basado en consultas agregadas"""
+
+    @classmethod
+    def obtener_estadisticas(cls, ciclo_actual: str = '') -> Dict[str, Any]:
+        """
+        Calcula todas las estadísticas del dashboard para el ciclo indicado
+
+        Args:
+            ciclo_actual: Ciclo de la configuración del sistema (vacío = todos)
+
+        Returns:
+            Dict: Variables de contexto que consume la plantilla del dashboard
+        """
+        if ciclo_actual:
+            remisiones_qs = Remision.objects.filter(ciclo=ciclo_actual)
+        else:
+            remisiones_qs = Remision.objects.all()
+
+        remisiones_qs = remisiones_qs.with_diagnostico_liquidacion()
+        remisiones_liquidadas = remisiones_qs.preliquidadas()
+
+        estadisticas = {}
+        estadisticas.update(cls._contar_remisiones(remisiones_qs))
+        estadisticas.update(cls._calcular_presupuestos(ciclo_actual))
+
+        ranking_completo = cls._calcular_ranking_clientes(remisiones_liquidadas)
+        # El saldo pendiente general es la suma de los saldos de todas las remisiones preliquidadas
+        estadisticas['saldo_pendiente_general'] = sum(
+            dato['importe_liquidado'] - dato['total_pagos'] for dato in ranking_completo
+        )
+        estadisticas['saldo_facturas'] = cls._calcular_saldo_facturas()
+        estadisticas.update(cls._calcular_graficas_calidad(remisiones_qs.filter(cancelada=False)))
+
+        ranking_clientes_data = []
+        for dato in ranking_completo:
+            saldo_pendiente = dato['importe_liquidado'] - dato['total_pagos']
+            ranking_clientes_data.append({
+                'cliente_nombre': dato['cliente_nombre'],
+                'importe_preliquidado': round(dato['importe_preliquidado'], 2),
+                'importe_liquidado': round(dato['importe_liquidado'], 2),
+                'total_pagos': round(dato['total_pagos'], 2),
+                'saldo_pendiente': round(saldo_pendiente, 2),
+                'total_remisiones': dato['total_remisiones']
+            })
+
+        # Ordenar por importe liquidado descendente y limitar a top 10 clientes
+        ranking_clientes_data.sort(key=lambda x: x['importe_liquidado'], reverse=True)
+        estadisticas['ranking_clientes_data'] = ranking_clientes_data[:10]
+
+        return estadisticas
+
+    @staticmethod
+    def _contar_remisiones(remisiones_qs) -> Dict[str, Any]:
+        """Cuenta remisiones pendientes/preliquidadas y diagnostica las pendientes"""
+        conteos = remisiones_qs.aggregate(
+            preliquidadas=Count('pk', filter=Q(liquidada=True)),
+            pendientes=Count('pk', filter=Q(liquidada=False)),
+        )
+
+        diagnostico_pendientes = []
+        pendientes_qs = remisiones_qs.pendientes_liquidar().values(
+            'pk', 'ciclo', 'folio', 'cliente__razon_social',
+            'tiene_detalles', 'tiene_valores', 'tiene_auditoria',
+        )
+        for remision in pendientes_qs:
+            # Diagnóstico de por qué no está preliquidada
+            if not remision['tiene_detalles']:
+                razon = 'Sin detalles'
+            elif not remision['tiene_valores']:
+                razon = 'Sin valores de liquidación en detalles'
+            elif not remision['tiene_auditoria']:
+                razon = 'Falta auditoría (usuario/fecha) en detalles'
+            else:
+                razon = 'Condiciones de liquidación no cumplidas'
+            diagnostico_pendientes.append({
+                'id': remision['pk'],
+                'ciclo': remision['ciclo'],
+                'folio': remision['folio'],
+                'cliente': remision['cliente__razon_social'] or '',
+                'razon': razon,
+            })
+
+        return {
+            'remisiones_pendientes': conteos['pendientes'],
+            'remisiones_preliquidadas': conteos['preliquidadas'],
+            'diagnostico_remisiones_pendientes': diagnostico_pendientes,
+        }
+
+    @staticmethod
+    def _calcular_presupuestos(ciclo_actual: str) -> Dict[str, Any]:
+        """Totales presupuestados y gastados por presupuesto activo del ciclo"""
+        if ciclo_actual:
+            presupuestos_qs = Presupuesto.objects.filter(activo=True, ciclo=ciclo_actual)
+        else:
+            presupuestos_qs = Presupuesto.objects.filter(activo=True)
+
+        presupuestos_qs = presupuestos_qs.select_related('centro_costo').annotate(
+            presupuestado=suma_subconsulta(PresupuestoDetalle.objects.all(), 'presupuesto', 'importe'),
+            gastado=suma_subconsulta(
+                GastoDetalle.objects.filter(activo=True, gasto__activo=True),
+                'gasto__presupuesto',
+                'importe'
+            ),
+        )
+
+        total_presupuestado = 0
+        total_gastos = 0
+        presupuestos_info = []
+        for presupuesto in presupuestos_qs:
+            total_presupuestado += float(presupuesto.presupuestado)
+            total_gastos += float(presupuesto.gastado)
+            presupuestos_info.append({
+                'centro_costo': presupuesto.centro_costo.descripcion,
+                'presupuestado': float(presupuesto.presupuestado),
+                'gastos': float(presupuesto.gastado)
+            })
+
+        return {
+            'presupuestos_info': presupuestos_info,
+            'total_presupuestado': total_presupuestado,
+            'total_gastos': total_gastos,
+        }
+
+    @staticmethod
+    def _calcular_ranking_clientes(remisiones_liquidadas) -> List[Dict[str, Any]]:
+        """Importes, pagos y número de remisiones preliquidadas agrupados por cliente"""
+        clientes_data = {}
+
+        def _cliente(nombre):
+            return clientes_data.setdefault(nombre, {
+                'cliente_nombre': nombre,
+                'importe_preliquidado': 0.0,
+                'importe_liquidado': 0.0,
+                'total_pagos': 0.0,
+                'total_remisiones': 0,
+            })
+
+        remisiones_por_cliente = (
+            remisiones_liquidadas.order_by()
+            .values('cliente__razon_social')
+            .annotate(total=Count('pk'))
+        )
+        for fila in remisiones_por_cliente:
+            _cliente(fila['cliente__razon_social'])['total_remisiones'] = fila['total']
+
+        importes_por_cliente = (
+            RemisionDetalle.objects.filter(remision__in=remisiones_liquidadas.values('pk'))
+            .order_by()
+            .values('remision__cliente__razon_social')
+            .annotate(envio=Sum('importe_envio'), liquidado=Sum('importe_liquidado'))
+        )
+        for fila in importes_por_cliente:
+            dato = _cliente(fila['remision__cliente__razon_social'])
+            dato['importe_preliquidado'] = float(fila['envio'] or 0)
+            dato['importe_liquidado'] = float(fila['liquidado'] or 0)
+
+        pagos_por_cliente = (
+            PagoRemision.objects.filter(activo=True, remision__in=remisiones_liquidadas.values('pk'))
+            .order_by()
+            .values('remision__cliente__razon_social')
+            .annotate(total=Sum('monto'))
+        )
+        for fila in pagos_por_cliente:
+            _cliente(fila['remision__cliente__razon_social'])['total_pagos'] = float(fila['total'] or 0)
+
+        return list(clientes_data.values())
+
+    @staticmethod
+    def _calcular_saldo_facturas() -> float:
+        """Saldo pendiente de facturas PPD no canceladas (total - pagos timbrados)"""
+        facturas_ppd = Factura.objects.filter(cancelada=False, metodo_pago='PPD')
+        total_facturado = facturas_ppd.aggregate(total=Sum('total'))['total'] or 0
+        total_pagado = PagoFactura.objects.filter(
+            factura__in=facturas_ppd.values('pk'), uuid__isnull=False
+        ).aggregate(total=Sum('monto_pago'))['total'] or 0
+        return float(total_facturado) - float(total_pagado)
+
+    @staticmethod
+    def _calcular_graficas_calidad(remisiones_no_canceladas) -> Dict[str, Any]:
+        """Datos de las gráficas por calidad en una sola consulta agrupada"""
+        filas = (
+            RemisionDetalle.objects.filter(remision__in=remisiones_no_canceladas.values('pk'))
+            .order_by()
+            .values('calidad')
+            .annotate(
+                kgs_enviados=Sum('kgs_enviados'),
+                kgs_neto_envio=Sum('kgs_neto_envio'),
+                kgs_liquidados=Sum('kgs_liquidados'),
+                kgs_merma=Sum('kgs_merma'),
+                kgs_merma_liquidados=Sum('kgs_merma_liquidados'),
+                no_arps_liquidados=Sum('no_arps_liquidados'),
+                merma_arps=Sum('merma_arps'),
+                importe_envio=Sum('importe_envio'),
+                importe_liquidado=Sum('importe_liquidado'),
+                count_detalles=Count('pk'),
+            )
+        )
+
+        grafica_calidad_data = []
+        grafica_kgs_enviados_data = []
+        grafica_merma_data = []
+        grafica_importes_data = []
+
+        for fila in filas:
+            calidad = fila['calidad']
+            kgs_enviados = float(fila['kgs_enviados'] or 0)
+            kgs_netos_enviados = float(fila['kgs_neto_envio'] or 0)
+            kgs_liquidados = float(fila['kgs_liquidados'] or 0)
+            kgs_merma_enviada = float(fila['kgs_merma'] or 0)
+            kgs_merma_liquidada = float(fila['kgs_merma_liquidados'] or 0)
+            total_no_arps_liquidados = float(fila['no_arps_liquidados'] or 0)
+            sum_merma_arps = float(fila['merma_arps'] or 0)
+            count_detalles = fila['count_detalles']
+            importe_neto_enviado = float(fila['importe_envio'] or 0)
+            importe_preliquidado = float(fila['importe_liquidado'] or 0)
+
+            grafica_calidad_data.append({
+                'calidad': calidad,
+                'kgs_netos_enviados': round(kgs_netos_enviados, 2),
+                'kgs_liquidados': round(kgs_liquidados, 2),
+                'diferencia': round(kgs_netos_enviados - kgs_liquidados, 2)
+            })
+            grafica_kgs_enviados_data.append({
+                'calidad': calidad,
+                'kgs_enviados': round(kgs_enviados, 2),
+                'kgs_liquidados': round(kgs_liquidados, 2),
+                'diferencia': round(kgs_enviados - kgs_liquidados, 2)
+            })
+            grafica_merma_data.append({
+                'calidad': calidad,
+                'kgs_merma_enviada': round(kgs_merma_enviada, 2),
+                'kgs_merma_liquidada': round(kgs_merma_liquidada, 2),
+                'diferencia_merma': round(kgs_merma_enviada - kgs_merma_liquidada, 2),
+                # Promedio de merma por arp enviado y liquidado
+                'promedio_merma_arp_enviado': round(sum_merma_arps / count_detalles, 2) if count_detalles > 0 else 0,
+                'promedio_merma_arp_liquidado': round(kgs_merma_liquidada / total_no_arps_liquidados, 2) if total_no_arps_liquidados > 0 else 0
+            })
+            grafica_importes_data.append({
+                'calidad': calidad,
+                'importe_neto_enviado': round(importe_neto_enviado, 2),
+                'importe_preliquidado': round(importe_preliquidado, 2),
+                'diferencia_importes': round(importe_neto_enviado - importe_preliquidado, 2)
+            })
+
+        # Ordenar por calidad; en importes "Mixtas" va al final
+        grafica_calidad_data.sort(key=lambda x: x['calidad'])
+        grafica_kgs_enviados_data.sort(key=lambda x: x['calidad'])
+        grafica_merma_data.sort(key=lambda x: x['calidad'])
+        grafica_importes_data.sort(key=lambda x: (1 if x['calidad'] == 'Mixtas' else 0, x['calidad']))
+
+        return {
+            'grafica_calidad_data': grafica_calidad_data,
+            'grafica_kgs_enviados_data': grafica_kgs_enviados_data,
+            'grafica_merma_data': grafica_merma_data,
+            'grafica_importes_data': grafica_importes_data,
+        }
@@ -0,0 +1,95 @@
+"""
+CFDI en memoria sobre un árbol lxml
+El comprobante se construye (o se parsea) una sola vez: la cadena original, el sello y los
+datos del timbre se leen y escriben sobre el mismo árbol, y los bytes se serializan una vez
+"""
+
+import logging
+from typing import Any, Dict, Optional, Union
+
+from lxml import etree
+
+from .cadena_original import CadenaOriginal
+from .xml_builder import XMLCFDIBuilder
+
+logger = logging.getLogger(__name__)
+
+
+class DocumentoCFDI:
+    """Comprobante fiscal como árbol lxml con su serialización en caché"""
+
+    def __init__(self, raiz):
+        self.raiz = raiz
+        self._bytes: Optional[bytes] = None
+
+    @classmethod
+    def construir(cls, factura, detalles, certificado_data: Dict[str, Any]) -> 'DocumentoCFDI':
+        """
+        Construye el comprobante desde los modelos, sin sello
+
+        Args:
+            factura: Instancia del modelo Factura
+            detalles: Lista de instancias de FacturaDetalle
+            certificado_data: Datos del certificado
+
+        Returns:
+            DocumentoCFDI: Documento listo para generar la cadena original y sellarse
+        """
+        return cls(XMLCFDIBuilder.construir_arbol_cfdi(factura, detalles, certificado_data, motor='lxml'))
+
+    @classmethod
+    def desde_xml(cls, xml_cfdi: Union[str, bytes]) -> 'DocumentoCFDI':
+        """
+        Parsea un XML (por ejemplo el timbrado que devuelve el PAC) una sola vez
+
+        Args:
+            xml_cfdi: XML del CFDI
+
+        Returns:
+            DocumentoCFDI: Documento con el árbol parseado
+        """
+        if isinstance(xml_cfdi, str):
+            xml_cfdi = xml_cfdi.encode('utf-8')
+        # Un parser por llamada: las instancias de XMLParser no se comparten entre hilos
+        parser = etree.XMLParser(resolve_entities=False, no_network=True, huge_tree=True)
+        documento = cls(etree.fromstring(xml_cfdi, parser=parser))
+        documento._bytes = xml_cfdi
+        return documento
+
+    @property
+    def sellado(self) -> bool:
+        return bool(self.raiz.get('Sello'))
+
+    def cadena_original(self) -> str:
+        """Cadena original del comprobante, leída del árbol"""
+        return CadenaOriginal.generar(self.raiz)
+
+    def sellar(self, sello: str, no_certificado: str = None, certificado_base64: str = None):
+        """
+        Inyecta el sello (y opcionalmente el certificado) directamente en el árbol
+
+        Args:
+            sello: Sello digital
+            no_certificado: Número de certificado
+            certificado_base64: Certificado en base64
+        """
+        self.raiz.set('Sello', sello)
+        if no_certificado is not None:
+            self.raiz.set('NoCertificado', no_certificado)
+        if certificado_base64 is not None:
+            self.raiz.set('Certificado', certificado_base64)
+        self._bytes = None
+
+    def a_bytes(self) -> bytes:
+        """XML en UTF-8; se serializa una sola vez mientras el árbol no cambie"""
+        if self._bytes is None:
+            self._bytes = etree.tostring(self.raiz, xml_declaration=True, encoding='UTF-8')
+        return self._bytes
+
+    @property
+    def xml(self) -> str:
+        return self.a_bytes().decode('utf-8')
+
+    def timbre(self) -> Dict[str, Any]:
+        """Datos del TimbreFiscalDigital (mismo formato que XMLCFDIBuilder.extraer_timbre_fiscal)"""
+        return XMLCFDIBuilder.extraer_timbre_fiscal(self.raiz)
@@ -0,0 +1,100 @@
+"""
+Servicio de estados de cuenta de clientes (facturas PPD)
+Totales y conteos por estado de pago calculados con una consulta agrupada
+"""
+
+import logging
+from decimal import Decimal
+from typing import Dict, Any, List
+
+from django.db.models import Count, Q, Sum
+
+from ..models import Cliente
+from ..factura_models import Factura
+
+logger = logging.getLogger(__name__)
+
+
+class EstadoCuentaService:
+    """Servicio de estados de cuenta basado en el saldo anotado de cada factura PPD"""
+
+    @staticmethod
+    def facturas_cliente(cliente):
+        """
+        Facturas PPD de un cliente para el detalle del estado de cuenta
+
+        Args:
+            cliente: Instancia de Cliente
+
+        Returns:
+            FacturaQuerySet: Facturas con `total_pagado`, `saldo` y `estado_pago` anotados
+        """
+        return Factura.objects.para_listado().con_saldo().filter(
+            receptor=cliente,
+            metodo_pago='PPD'
+        ).order_by('-fecha_emision')
+
+    @staticmethod
+    def _resumen_por_cliente(facturas):
+        """Agrupa por receptor las facturas PPD con su saldo anotado (una sola consulta)"""
+        return facturas.filter(metodo_pago='PPD').con_saldo().order_by().values('receptor').annotate(
+            total_facturado=Sum('total'),
+            total_pagado_cliente=Sum('total_pagado'),
+            facturas_pendientes=Count('pk', filter=Q(total_pagado__lte=0, saldo__gt=0)),
+            facturas_parciales=Count('pk', filter=Q(total_pagado__gt=0, saldo__gt=0)),
+            facturas_pagadas=Count('pk', filter=Q(saldo__lte=0)),
+            total_facturas=Count('pk'),
+        )
+
+    @staticmethod
+    def _formatear(fila: Dict[str, Any]) -> Dict[str, Any]:
+        total_facturado = fila['total_facturado'] or Decimal('0.00')
+        total_pagado = fila['total_pagado_cliente'] or Decimal('0.00')
+        return {
+            'total_facturado': total_facturado,
+            'total_pagado': total_pagado,
+            'saldo_pendiente': total_facturado - total_pagado,
+            'facturas_pendientes': fila['facturas_pendientes'],
+            'facturas_parciales': fila['facturas_parciales'],
+            'facturas_pagadas': fila['facturas_pagadas'],
+            'total_facturas': fila['total_facturas'],
+        }
+
+    @classmethod
+    def resumen_clientes(cls) -> List[Dict[str, Any]]:
+        """
+        Resumen de todos los clientes con facturas PPD
+
+        Solo cuentan los pagos timbrados. Una factura está pendiente si no tiene pagos,
+        parcial si tiene pagos y saldo, y pagada si su saldo es cero o menor.
+
+        Returns:
+            List[Dict]: Por cliente (ordenados por razón social): cliente, total_facturado,
+                total_pagado, saldo_pendiente y número de facturas pendientes, parciales y pagadas
+        """
+        filas = list(cls._resumen_por_cliente(Factura.objects.all()))
+        clientes = Cliente.objects.in_bulk([fila['receptor'] for fila in filas])
+
+        resumen = [
+            {'cliente': clientes[fila['receptor']], **cls._formatear(fila)}
+            for fila in filas
+        ]
+        resumen.sort(key=lambda datos: datos['cliente'].razon_social or '')
+        return resumen
+
+    @classmethod
+    def resumen_cliente(cls, cliente) -> Dict[str, Any]:
+        """
+        Totales del estado de cuenta de un cliente (mismos campos que resumen_clientes)
+
+        Args:
+            cliente: Instancia de Cliente
+
+        Returns:
+            Dict: total_facturado, total_pagado, saldo_pendiente y conteos por estado
+        """
+        filas = list(cls._resumen_por_cliente(Factura.objects.filter(receptor=cliente)))
+        return cls._formatear(filas[0] if filas else {
+            'total_facturado': None, 'total_pagado_cliente': None, 'facturas_pendientes': 0,
+            'facturas_parciales': 0, 'facturas_pagadas': 0, 'total_facturas': 0,
+        })
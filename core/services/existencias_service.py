@@ -0,0 +1,97 @@
+"""
+Servicio de consulta de existencias actuales
+Lee la tabla materializada de existencias en lugar de recorrer el kardex por producto y almacén
+"""
+
+import logging
+from typing import Dict, Any
+from django.db.models import Q
+
+from ..models import Almacen, ProductoServicio, Existencia
+
+logger = logging.getLogger(__name__)
+
+
+class ExistenciasService:
+    """Servicio de existencias agrupadas por almacén"""
+
+    @staticmethod
+    def existencias_por_almacen(producto_filtro: str = '', almacen_filtro: str = '',
+                                mostrar_vacios: bool = False) -> Dict[str, Any]:
+        """
+        Obtiene las existencias actuales agrupadas por almacén
+
+        Args:
+            producto_filtro: Texto a buscar en descripción o SKU (vacío = productos con movimientos)
+            almacen_filtro: Código de almacén (vacío = todos los activos)
+            mostrar_vacios: Incluir productos y almacenes sin existencia
+
+        Returns:
+            Dict: existencias_por_almacen, total_productos, total_almacenes y valor_total_inventario
+        """
+        almacenes = Almacen.objects.filter(activo=True).order_by('descripcion')
+        if almacen_filtro:
+            almacenes = almacenes.filter(codigo=almacen_filtro)
+        almacenes = list(almacenes)
+
+        existencias = Existencia.objects.filter(almacen__in=almacenes).select_related('producto')
+
+        productos_filtrados = []
+        if producto_filtro:
+            # Con filtro de producto se buscan todos los productos activos que coincidan
+            productos_filtrados = list(
+                ProductoServicio.objects.filter(activo=True).filter(
+                    Q(descripcion__icontains=producto_filtro) | Q(sku__icontains=producto_filtro)
+                )
+            )
+            existencias = existencias.filter(producto__in=productos_filtrados)
+
+        if not mostrar_vacios:
+            existencias = existencias.filter(existencia__gt=0)
+
+        productos_por_almacen = {almacen.pk: [] for almacen in almacenes}
+        for existencia in existencias:
+            productos_por_almacen[existencia.almacen_id].append({
+                'producto': existencia.producto,
+                'existencia_actual': existencia.existencia,
+                'costo_promedio': existencia.costo_promedio,
+                'valor_inventario': existencia.existencia * existencia.costo_promedio,
+                'ultimo_movimiento': existencia.fecha_ultimo_movimiento
+            })
+
+        if producto_filtro and mostrar_vacios:
+            # Los productos filtrados sin movimientos en el almacén se muestran en cero
+            for almacen in almacenes:
+                con_existencia = {p['producto'].pk for p in productos_por_almacen[almacen.pk]}
+                for producto in productos_filtrados:
+                    if producto.pk not in con_existencia:
+                        productos_por_almacen[almacen.pk].append({
+                            'producto': producto,
+                            'existencia_actual': 0,
+                            'costo_promedio': 0,
+                            'valor_inventario': 0,
+                            'ultimo_movimiento': None
+                        })
+
+        existencias_por_almacen = {}
+        productos_unicos = set()
+        for almacen in almacenes:
+            productos_existencias = productos_por_almacen[almacen.pk]
+            productos_existencias.sort(key=lambda x: x['producto'].descripcion)
+
+            # Agregar almacenes según el filtro de mostrar_vacios
+            if productos_existencias or mostrar_vacios:
+                existencias_por_almacen[almacen] = {
+                    'productos': productos_existencias,
+                    'valor_total': sum(p['valor_inventario'] for p in productos_existencias)
+                }
+                productos_unicos.update(p['producto'].codigo for p in productos_existencias)
+
+        return {
+            'existencias_por_almacen': existencias_por_almacen,
+            'total_productos': len(productos_unicos),
+            'total_almacenes': len(existencias_por_almacen),
+            'valor_total_inventario': sum(
+                almacen_data['valor_total'] for almacen_data in existencias_por_almacen.values()
+            ),
+        }
@@ -0,0 +1,250 @@
+"""
+Exportación en ZIP de los XML timbrados y sus PDF
+El ZIP se genera por partes conforme se escribe cada archivo, así que la memoria no depende
+del número de facturas: sirve tanto para un StreamingHttpResponse como para escribir a disco
+"""
+
+import logging
+import os
+import time
+import zipfile
+from datetime import date
+from itertools import islice
+from typing import Iterator, List, Optional
+
+from directiva_agricola.db_router import get_current_company_db, set_current_company_db
+from ..factura_models import Factura
+from .pdf_cache import CachePDF
+from .pdf_service import PDFService, WEASYPRINT_AVAILABLE
+
+logger = logging.getLogger(__name__)
+
+# Columnas del documento que no usa la plantilla del PDF
+CAMPOS_NO_PDF = (
+    'documento__xml_original', 'documento__xml_timbrado', 'documento__certificado', 'documento__acuse_cancelacion',
+)
+
+
+class _SalidaZip:
+    """Destino sin posicionamiento para zipfile: guarda lo escrito hasta que el generador lo entrega"""
+
+    def __init__(self):
+        self._partes: List[bytes] = []
+
+    def write(self, datos) -> int:
+        self._partes.append(bytes(datos))
+        return len(datos)
+
+    def flush(self):
+        pass
+
+    def vaciar(self) -> bytes:
+        datos = b''.join(self._partes)
+        self._partes.clear()
+        return datos
+
+
+class ExportacionCFDIService:
+    """Exporta en un ZIP los CFDI timbrados de un periodo, emisor, receptor o estado"""
+
+    TAMANO_BLOQUE = 64 * 1024
+    FOLIOS_POR_CONSULTA = 200
+
+    @classmethod
+    def filtrar(cls, fecha_desde: Optional[date] = None, fecha_hasta: Optional[date] = None,
+                emisor: str = None, receptor: str = None, estado: str = None):
+        """
+        Facturas con XML timbrado que cumplen los filtros (mismos que el listado de facturas)
+
+        Args:
+            fecha_desde: Fecha de emisión inicial
+            fecha_hasta: Fecha de emisión final
+            emisor: Código del emisor
+            receptor: Código del receptor
+            estado: Estado de timbrado (TIMBRADO, CANCELADO, ...)
+
+        Returns:
+            QuerySet: Facturas ordenadas por folio
+        """
+        facturas = Factura.objects.exclude(documento__xml_timbrado__isnull=True).exclude(documento__xml_timbrado='')
+        if fecha_desde:
+            facturas = facturas.filter(fecha_emision__date__gte=fecha_desde)
+        if fecha_hasta:
+            facturas = facturas.filter(fecha_emision__date__lte=fecha_hasta)
+        if emisor:
+            facturas = facturas.filter(emisor__codigo=emisor)
+        if receptor:
+            facturas = facturas.filter(receptor__codigo=receptor)
+        if estado:
+            facturas = facturas.filter(estado_timbrado=estado)
+        return facturas.order_by('folio')
+
+    @classmethod
+    def generar_zip(cls, facturas, incluir_pdf: bool = True, renderizar_faltantes: bool = True) -> Iterator[bytes]:
+        """
+        Genera el ZIP por partes: xml/ con los XML timbrados y pdf/ con los PDF
+
+        Primero recorre las facturas leyendo solo folio, serie, UUID, estado y XML, y agrega los
+        PDF que ya están en la caché; después renderiza en paralelo (pool de PDF) los que faltan.
+        Los errores se listan en errores.txt al final del ZIP.
+
+        Args:
+            facturas: QuerySet de facturas (por ejemplo el de filtrar())
+            incluir_pdf: Incluir los PDF además de los XML
+            renderizar_faltantes: Renderizar los PDF que no están en la caché; con False (descarga
+                web, que no puede pasar del timeout del worker) solo se listan en errores.txt
+
+        Returns:
+            Iterator[bytes]: Partes del archivo ZIP
+        """
+        # El generador se consume después de que la vista termina: se fija la base de la empresa
+        return cls._generar_zip(facturas, incluir_pdf, renderizar_faltantes, get_current_company_db())
+
+    @classmethod
+    def _generar_zip(cls, facturas, incluir_pdf: bool, renderizar_faltantes: bool,
+                     alias: Optional[str]) -> Iterator[bytes]:
+        set_current_company_db(alias)
+        inicio = time.perf_counter()
+        salida = _SalidaZip()
+        errores = []
+        pendientes = []
+        total_xml = total_pdf = 0
+
+        usar_cache = incluir_pdf and CachePDF.activo()
+        version = CachePDF.version(PDFService.PLANTILLA_FACTURA) if usar_cache else None
+
+        with zipfile.ZipFile(salida, 'w', zipfile.ZIP_DEFLATED) as archivo_zip:
+            filas = facturas.values_list('folio', 'serie', 'uuid', 'estado_timbrado', 'documento__xml_timbrado')
+            for folio, serie, uuid, estado, xml_timbrado in filas.iterator(chunk_size=cls.FOLIOS_POR_CONSULTA):
+                archivo_zip.writestr(f'xml/CFDI_{serie}_{folio:06d}_{uuid}.xml', xml_timbrado.encode('utf-8'))
+                total_xml += 1
+                yield salida.vaciar()
+
+                if not incluir_pdf:
+                    continue
+                ruta = CachePDF.ruta('factura', uuid, version) if usar_cache and uuid and estado == 'TIMBRADO' else None
+                if ruta and os.path.exists(ruta):
+                    yield from cls._copiar_archivo(archivo_zip, salida, ruta, cls._nombre_pdf(serie, folio))
+                    total_pdf += 1
+                else:
+                    pendientes.append(folio)
+
+            if pendientes and not renderizar_faltantes:
+                errores.append(
+                    f'{len(pendientes)} PDF no están en la caché y no se incluyeron; para incluirlos '
+                    f'genere la exportación con el comando exportar_cfdi'
+                )
+                errores.extend(f'{folio}: PDF no incluido' for folio in pendientes)
+                pendientes = []
+            elif pendientes and not WEASYPRINT_AVAILABLE:
+                errores.append(f'{len(pendientes)} PDF sin generar: WeasyPrint no está disponible')
+            elif pendientes:
+                for factura, pdf, error in PDFService.renderizar_facturas(cls.facturas_para_pdf(pendientes)):
+                    if error:
+                        errores.append(f'{factura.folio}: {error}')
+                        continue
+                    archivo_zip.writestr(
+                        cls._zipinfo(cls._nombre_pdf(factura.serie, factura.folio), zipfile.ZIP_STORED), pdf
+                    )
+                    total_pdf += 1
+                    yield salida.vaciar()
+
+            if errores:
+                archivo_zip.writestr('errores.txt', '\n'.join(errores))
+
+        yield salida.vaciar()
+        logger.info(
+            f"Exportación ZIP: {total_xml} XML, {total_pdf} PDF ({len(pendientes)} renderizados), "
+            f"{len(errores)} errores en {time.perf_counter() - inicio:.1f}s"
+        )
+
+    @classmethod
+    def generar_zip_pdf(cls, folios: List[int], limite_segundos: Optional[float] = None) -> Iterator[bytes]:
+        """
+        Genera por partes un ZIP con los PDF de las facturas indicadas (caché o pool de PDF)
+
+        Con limite_segundos deja de renderizar al agotarse el tiempo: las facturas restantes se
+        listan en errores.txt, para que la respuesta termine antes del timeout del worker web.
+
+        Args:
+            folios: Folios de las facturas
+            limite_segundos: Tiempo máximo de renderizado (None = sin límite)
+
+        Returns:
+            Iterator[bytes]: Partes del archivo ZIP
+        """
+        return cls._generar_zip_pdf(list(dict.fromkeys(folios)), limite_segundos, get_current_company_db())
+
+    @classmethod
+    def _generar_zip_pdf(cls, folios: List[int], limite_segundos: Optional[float],
+                         alias: Optional[str]) -> Iterator[bytes]:
+        set_current_company_db(alias)
+        limite = time.monotonic() + limite_segundos if limite_segundos else None
+        salida = _SalidaZip()
+        encontrados = set()
+        errores = []
+
+        # Los PDF ya vienen comprimidos: ZIP_STORED evita recomprimirlos
+        with zipfile.ZipFile(salida, 'w', zipfile.ZIP_STORED) as archivo_zip:
+            renderizados = PDFService.renderizar_facturas(cls.facturas_para_pdf(sorted(folios)))
+            try:
+                for factura, pdf, error in renderizados:
+                    encontrados.add(factura.folio)
+                    if error:
+                        errores.append(f'{factura.folio}: {error}')
+                    else:
+                        archivo_zip.writestr(
+                            cls._zipinfo(f'factura_{factura.serie}_{factura.folio:06d}.pdf', zipfile.ZIP_STORED), pdf
+                        )
+                        yield salida.vaciar()
+                    if limite and time.monotonic() > limite:
+                        break
+            finally:
+                renderizados.close()
+
+            existentes = set(Factura.objects.filter(folio__in=folios).values_list('folio', flat=True))
+            for folio in folios:
+                if folio in encontrados:
+                    continue
+                if folio in existentes:
+                    errores.append(f'{folio}: No se generó a tiempo; vuelva a descargarla')
+                else:
+                    errores.append(f'{folio}: Factura no encontrada')
+            if errores:
+                archivo_zip.writestr('errores.txt', '\n'.join(errores))
+
+        yield salida.vaciar()
+
+    @classmethod
+    def facturas_para_pdf(cls, folios: List[int]):
+        """Facturas a renderizar, consultadas por bloques y sin las columnas que no usa el PDF"""
+        folios = iter(folios)
+        while True:
+            bloque = list(islice(folios, cls.FOLIOS_POR_CONSULTA))
+            if not bloque:
+                return
+            yield from Factura.objects.filter(folio__in=bloque).select_related(
+                'emisor', 'receptor', 'documento'
+            ).prefetch_related('detalles').defer(*CAMPOS_NO_PDF).order_by('folio')
+
+    @classmethod
+    def _copiar_archivo(cls, archivo_zip, salida, ruta: str, nombre: str) -> Iterator[bytes]:
+        """Copia un archivo al ZIP por bloques, sin cargarlo completo en memoria"""
+        with open(ruta, 'rb') as origen, archivo_zip.open(cls._zipinfo(nombre, zipfile.ZIP_STORED), 'w') as destino:
+            while True:
+                bloque = origen.read(cls.TAMANO_BLOQUE)
+                if not bloque:
+                    break
+                destino.write(bloque)
+                yield salida.vaciar()
+
+    @staticmethod
+    def _zipinfo(nombre: str, compresion: int) -> zipfile.ZipInfo:
+        info = zipfile.ZipInfo(nombre, date_time=time.localtime()[:6])
+        # Los PDF ya vienen comprimidos
+        info.compress_type = compresion
+        return info
+
+    @staticmethod
+    def _nombre_pdf(serie: str, folio: int) -> str:
+        return f'pdf/factura_{serie}_{folio:06d}.pdf'
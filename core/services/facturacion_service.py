@@ -10,9 +10,12 @@ from django.db import transaction
 from django.core.files.base import ContentFile
 from django.core.files.storage import default_storage
 
+from directiva_agricola.transacciones import atomic_escritura
 from .configuracion_entorno import ConfiguracionEntornoService
 from .certificado_service import CertificadoService
 from .xml_builder import XMLCFDIBuilder
+from .cadena_original import CadenaOriginal
+from .documento_cfdi import DocumentoCFDI
 from .timbrado_service import TimbradoService
 from ..validators.cfdi_validator import CFDIValidator
 from ..models import Factura, FacturaDetalle
@@ -28,92 +31,29 @@ class FacturacionService:
         """
         Timbra una factura completa
         
+        La llamada al PAC se hace fuera de cualquier transacción; solo la preparación
+        y la aplicación del resultado escriben en la base de datos.
+        
         Args:
-            factura: Objeto Factura a timbrar
+            factura: Objeto Factura (o su folio) a timbrar
             
         Returns:
             Dict: Resultado del timbrado
         """
         try:
-            with transaction.atomic():
-                # Obtener detalles de la factura
-                detalles = FacturaDetalle.objects.filter(factura=factura)
-                
-                # Validar que la factura esté en estado pendiente
-                if factura.estado_timbrado != 'PENDIENTE':
-                    return {
-                        'exito': False,
-                        'error': f'La factura ya está en estado {factura.estado_timbrado}',
-                        'codigo_error': 'INVALID_STATE'
-                    }
-                
-                # Actualizar fecha de emisión con zona horaria correcta
-                from ..utils.timezone_utils import obtener_fecha_actual_mexico
-                factura.fecha_emision = obtener_fecha_actual_mexico(factura.lugar_expedicion)
-                factura.save()
-                
-                # Validar configuración del emisor
-                config_validacion = ConfiguracionEntornoService.validar_configuracion_emisor(factura.emisor)
-                if not config_validacion['valido']:
-                    return {
-                        'exito': False,
-                        'error': 'Configuración del emisor inválida',
-                        'codigo_error': 'INVALID_EMISOR_CONFIG',
-                        'detalles': config_validacion['errores']
-                    }
-                
-                # Validar certificado
-                cert_validacion = CertificadoService.validar_certificado_completo(factura.emisor)
-                if not cert_validacion['valido']:
-                    return {
-                        'exito': False,
-                        'error': 'Certificado inválido',
-                        'codigo_error': 'INVALID_CERTIFICATE',
-                        'detalles': cert_validacion['errores']
-                    }
-                
-                # Validar CFDI
-                cfdi_validacion = CFDIValidator.validar_factura_completa(factura, list(detalles))
-                if not cfdi_validacion['valido']:
-                    # Guardar errores de validación
-                    factura.errores_validacion = '; '.join(cfdi_validacion['errores'])
-                    factura.estado_timbrado = 'ERROR'
-                    factura.save()
-                    
-                    return {
-                        'exito': False,
-                        'error': 'Validación CFDI fallida',
-                        'codigo_error': 'CFDI_VALIDATION_FAILED',
-                        'detalles': cfdi_validacion['errores']
-                    }
-                
-                # Generar XML
-                xml_result = cls._generar_xml_cfdi(factura, list(detalles), cert_validacion['datos_certificado'])
-                if not xml_result['exito']:
-                    return xml_result
-                
-                # Timbrar con PAC
-                pac_result = cls._timbrar_con_pac(factura, xml_result['xml'], config_validacion['configuracion'])
-                if not pac_result['exito']:
-                    # Guardar error
-                    factura.errores_validacion = pac_result['error']
-                    factura.estado_timbrado = 'ERROR'
-                    factura.intentos_timbrado += 1
-                    factura.ultimo_intento = datetime.now(timezone.utc)
-                    factura.save()
-                    
-                    return pac_result
-                
-                # Actualizar factura con datos del timbrado
-                cls._actualizar_factura_timbrada(factura, xml_result['xml'], pac_result)
-                
-                return {
-                    'exito': True,
-                    'uuid': pac_result['uuid'],
-                    'fecha_timbrado': pac_result['fecha_timbrado'],
-                    'xml_timbrado': pac_result['xml_timbrado'],
-                    'mensaje': 'Factura timbrada exitosamente'
-                }
+            if not isinstance(factura, Factura):
+                factura = Factura.objects.select_related('emisor', 'documento').get(folio=factura)
+            
+            preparacion = cls.preparar_timbrado(factura)
+            if not preparacion['exito']:
+                return preparacion
+            
+            # Timbrar con PAC (red, sin transacción abierta)
+            pac_result = cls._timbrar_con_pac(
+                factura, preparacion.get('documento') or preparacion['xml'], preparacion['configuracion']
+            )
+            
+            return cls.aplicar_resultado_timbrado(factura, preparacion['xml'], pac_result)
                 
         except Factura.DoesNotExist:
             return {
@@ -122,19 +62,128 @@ class FacturacionService:
                 'codigo_error': 'FACTURA_NOT_FOUND'
             }
         except Exception as e:
-            logger.error(f"Error inesperado timbrando factura {factura.serie}-{factura.folio}: {e}")
+            logger.error(f"Error inesperado timbrando factura {getattr(factura, 'serie', '')}-{getattr(factura, 'folio', factura)}: {e}")
             return {
                 'exito': False,
                 'error': f'Error inesperado: {str(e)}',
                 'codigo_error': 'UNEXPECTED_ERROR'
             }
     
+    @classmethod
+    def preparar_timbrado(cls, factura) -> Dict[str, Any]:
+        """
+        Valida la factura y genera el XML sellado listo para enviarse al PAC
+        
+        Args:
+            factura: Objeto Factura a timbrar
+            
+        Returns:
+            Dict: exito, xml y configuracion del PAC; o el error de validación
+        """
+        # Obtener detalles de la factura
+        detalles = list(FacturaDetalle.objects.filter(factura=factura))
+        
+        # Validar que la factura esté en estado pendiente
+        if factura.estado_timbrado != 'PENDIENTE':
+            return {
+                'exito': False,
+                'error': f'La factura ya está en estado {factura.estado_timbrado}',
+                'codigo_error': 'INVALID_STATE'
+            }
+        
+        # Actualizar fecha de emisión con zona horaria correcta
+        from ..utils.timezone_utils import obtener_fecha_actual_mexico
+        factura.fecha_emision = obtener_fecha_actual_mexico(factura.lugar_expedicion)
+        factura.save()
+        
+        # Validar configuración del emisor
+        config_validacion = ConfiguracionEntornoService.validar_configuracion_emisor(factura.emisor)
+        if not config_validacion['valido']:
+            return {
+                'exito': False,
+                'error': 'Configuración del emisor inválida',
+                'codigo_error': 'INVALID_EMISOR_CONFIG',
+                'detalles': config_validacion['errores']
+            }
+        
+        # Validar certificado
+        cert_validacion = CertificadoService.validar_certificado_completo(factura.emisor)
+        if not cert_validacion['valido']:
+            return {
+                'exito': False,
+                'error': 'Certificado inválido',
+                'codigo_error': 'INVALID_CERTIFICATE',
+                'detalles': cert_validacion['errores']
+            }
+        
+        # Validar CFDI
+        cfdi_validacion = CFDIValidator.validar_factura_completa(factura, detalles)
+        if not cfdi_validacion['valido']:
+            # Guardar errores de validación
+            factura.errores_validacion = '; '.join(cfdi_validacion['errores'])
+            factura.estado_timbrado = 'ERROR'
+            factura.save()
+            
+            return {
+                'exito': False,
+                'error': 'Validación CFDI fallida',
+                'codigo_error': 'CFDI_VALIDATION_FAILED',
+                'detalles': cfdi_validacion['errores']
+            }
+        
+        # Generar XML
+        xml_result = cls._generar_xml_cfdi(factura, detalles, cert_validacion['datos_certificado'])
+        if not xml_result['exito']:
+            return xml_result
+        
+        xml_result['configuracion'] = config_validacion['configuracion']
+        return xml_result
+    
+    @classmethod
+    def aplicar_resultado_timbrado(cls, factura, xml_original, pac_result) -> Dict[str, Any]:
+        """
+        Guarda en una transacción corta el resultado devuelto por el PAC
+        
+        Args:
+            factura: Objeto Factura timbrada
+            xml_original: XML sellado enviado al PAC
+            pac_result: Resultado de TimbradoService.timbrar_cfdi
+            
+        Returns:
+            Dict: Resultado del timbrado
+        """
+        with atomic_escritura():
+            if not pac_result['exito']:
+                # Guardar error
+                cls._asignar_error_timbrado(factura, pac_result)
+                factura.save()
+                
+                return pac_result
+            
+            # Actualizar factura con datos del timbrado
+            cls._actualizar_factura_timbrada(factura, xml_original, pac_result)
+        
+        return {
+            'exito': True,
+            'uuid': pac_result['uuid'],
+            'fecha_timbrado': pac_result['fecha_timbrado'],
+            'xml_timbrado': pac_result['xml_timbrado'],
+            'mensaje': 'Factura timbrada exitosamente'
+        }
+    
     @classmethod
     def _generar_xml_cfdi(cls, factura, detalles, certificado_data) -> Dict[str, Any]:
         """Genera el XML del CFDI"""
         try:
-            # Generar cadena original
-            cadena_original = XMLCFDIBuilder.generar_cadena_original_desde_modelos(factura, detalles)
+            # Construir el árbol una sola vez: la cadena original y el XML salen del mismo documento.
+            # Con el motor lxml el documento se conserva en memoria hasta la respuesta del PAC.
+            documento = None
+            if XMLCFDIBuilder.motor() == 'lxml':
+                documento = DocumentoCFDI.construir(factura, detalles, certificado_data)
+                arbol = documento.raiz
+            else:
+                arbol = XMLCFDIBuilder.construir_arbol_cfdi(factura, detalles, certificado_data)
+            cadena_original = CadenaOriginal.generar(arbol)
             
             # Cargar llave privada
             llave_privada = CertificadoService.cargar_llave_privada(factura.emisor)
@@ -155,12 +204,18 @@ class FacturacionService:
                     'codigo_error': 'DIGITAL_SIGNATURE_ERROR'
                 }
             
-            # Construir XML
-            xml_cfdi = XMLCFDIBuilder.construir_xml_cfdi(factura, detalles, certificado_data, sello)
+            # Sellar y serializar
+            if documento is not None:
+                documento.sellar(sello)
+                xml_cfdi = documento.xml
+            else:
+                arbol.set('Sello', sello)
+                xml_cfdi = XMLCFDIBuilder.serializar_xml(arbol)
             
             return {
                 'exito': True,
                 'xml': xml_cfdi,
+                'documento': documento,
                 'cadena_original': cadena_original,
                 'sello': sello
             }
@@ -175,7 +230,7 @@ class FacturacionService:
     
     @classmethod
     def _timbrar_con_pac(cls, factura, xml_cfdi, configuracion) -> Dict[str, Any]:
-        """Timbra el CFDI con el PAC"""
+        """Timbra el CFDI (XML o DocumentoCFDI ya sellado) con el PAC"""
         try:
             # Crear servicio de timbrado con la configuración del emisor
             timbrado_service = TimbradoService(configuracion, factura.emisor)
@@ -200,25 +255,48 @@ class FacturacionService:
                 'codigo_error': 'PAC_TIMBRADO_ERROR'
             }
     
+    # Campos que escribe el resultado del timbrado (éxito o error)
+    CAMPOS_TIMBRADO = [
+        'uuid', 'fecha_timbrado', 'no_cert_sat', 'sello_sat', 'sello', 'codigo_qr',
+        'cadena_original_sat', 'estado_timbrado', 'xml_original', 'xml_timbrado',
+        'intentos_timbrado', 'ultimo_intento', 'errores_validacion',
+    ]
+    
+    @classmethod
+    def _asignar_error_timbrado(cls, factura, pac_result):
+        """Asigna a la factura (sin guardar) el error devuelto por el PAC"""
+        factura.errores_validacion = pac_result['error']
+        factura.estado_timbrado = 'ERROR'
+        factura.intentos_timbrado += 1
+        factura.ultimo_intento = datetime.now(timezone.utc)
+    
+    @classmethod
+    def _asignar_datos_timbrado(cls, factura, xml_original, pac_result):
+        """Asigna a la factura (sin guardar) los datos del timbrado"""
+        factura.uuid = pac_result['uuid']
+        factura.fecha_timbrado = datetime.fromisoformat(pac_result['fecha_timbrado'].replace('Z', '+00:00'))
+        # Aceptar tanto snake_case como camelCase según la fuente
+        factura.no_cert_sat = pac_result.get('no_cert_sat') or pac_result.get('no_certificado_sat') or pac_result.get('NoCertificadoSAT')
+        factura.sello_sat = pac_result.get('sello_sat') or pac_result.get('selloSAT')
+        factura.sello = pac_result.get('sello_cfd')  # Guardar sello del emisor
+        factura.codigo_qr = pac_result.get('qr_base64')  # Guardar código QR del PAC
+        # Extraer cadena original (del árbol ya parseado por TimbradoService si está disponible)
+        documento_timbrado = pac_result.get('documento_timbrado')
+        factura.cadena_original_sat = cls._extraer_cadena_original_sat(
+            documento_timbrado.raiz if documento_timbrado is not None else pac_result['xml_timbrado']
+        )
+        factura.estado_timbrado = 'TIMBRADO'
+        factura.xml_original = xml_original
+        factura.xml_timbrado = pac_result['xml_timbrado']
+        factura.intentos_timbrado += 1
+        factura.ultimo_intento = datetime.now(timezone.utc)
+        factura.errores_validacion = None  # Limpiar errores previos
+    
     @classmethod
     def _actualizar_factura_timbrada(cls, factura, xml_original, pac_result):
         """Actualiza la factura con los datos del timbrado"""
         try:
-            # Actualizar campos de timbrado
-            factura.uuid = pac_result['uuid']
-            factura.fecha_timbrado = datetime.fromisoformat(pac_result['fecha_timbrado'].replace('Z', '+00:00'))
-            # Aceptar tanto snake_case como camelCase según la fuente
-            factura.no_cert_sat = pac_result.get('no_cert_sat') or pac_result.get('no_certificado_sat') or pac_result.get('NoCertificadoSAT')
-            factura.sello_sat = pac_result.get('sello_sat') or pac_result.get('selloSAT')
-            factura.sello = pac_result.get('sello_cfd')  # Guardar sello del emisor
-            factura.codigo_qr = pac_result.get('qr_base64')  # Guardar código QR del PAC
-            factura.cadena_original_sat = cls._extraer_cadena_original_sat(pac_result['xml_timbrado'])  # Extraer cadena original
-            factura.estado_timbrado = 'TIMBRADO'
-            factura.xml_original = xml_original
-            factura.xml_timbrado = pac_result['xml_timbrado']
-            factura.intentos_timbrado += 1
-            factura.ultimo_intento = datetime.now(timezone.utc)
-            factura.errores_validacion = None  # Limpiar errores previos
+            cls._asignar_datos_timbrado(factura, xml_original, pac_result)
             
             # Guardar archivos XML
             cls._guardar_archivos_xml(factura)
@@ -231,12 +309,12 @@ class FacturacionService:
     
     @classmethod
     def _extraer_cadena_original_sat(cls, xml_timbrado):
-        """Extrae la cadena original del complemento SAT del XML timbrado"""
+        """Extrae la cadena original del complemento SAT del XML timbrado (o de su árbol)"""
         try:
             import xml.etree.ElementTree as ET
             
             # Parsear XML timbrado
-            root = ET.fromstring(xml_timbrado)
+            root = ET.fromstring(xml_timbrado) if isinstance(xml_timbrado, (str, bytes)) else xml_timbrado
             
             # Buscar complemento
             complemento = root.find('{http://www.sat.gob.mx/cfd/4}Complemento')
@@ -296,7 +374,7 @@ class FacturacionService:
         try:
             with transaction.atomic():
                 # Obtener factura
-                factura = Factura.objects.select_related('emisor').get(folio=factura_id)
+                factura = Factura.objects.select_related('emisor', 'documento').get(folio=factura_id)
                 
                 # Validar que la factura esté timbrada
                 if factura.estado_timbrado != 'TIMBRADO':
@@ -364,7 +442,7 @@ class FacturacionService:
         """
         try:
             # Obtener factura
-            factura = Factura.objects.select_related('emisor').get(folio=factura_id)
+            factura = Factura.objects.select_related('emisor', 'documento').get(folio=factura_id)
             
             if not factura.uuid:
                 return {
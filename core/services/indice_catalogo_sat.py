@@ -0,0 +1,198 @@
+"""
+Índice en memoria para autocompletar claves SAT (ClaveProdServ, ClaveUnidad)
+Se construye una vez por proceso desde el almacén local de catálogos (gunicorn lo precarga en
+post_worker_init) y se reconstruye si se carga otra versión. Busca por prefijo de clave y por
+prefijo de palabras de la descripción, sin acentos ni mayúsculas.
+"""
+
+import heapq
+import logging
+import re
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from functools import lru_cache
+from typing import Any, Dict, FrozenSet, List, Optional
+
+from .catalogo_sat_local import CatalogoSATLocal, normalizar
+
+logger = logging.getLogger(__name__)
+
+# Catálogos que se pueden autocompletar (nombre del servicio -> nombre SAT)
+CATALOGOS_AUTOCOMPLETAR = {
+    'productos-servicios': 'c_ClaveProdServ',
+    'claves-unidad': 'c_ClaveUnidad',
+}
+
+# Columnas del catálogo que también se indexan además de la descripción
+COLUMNAS_BUSQUEDA = ('Nombre', 'Palabras similares', 'Símbolo')
+
+PALABRAS_VACIAS = frozenset({
+    'a', 'al', 'con', 'de', 'del', 'e', 'el', 'en', 'la', 'las', 'lo', 'los', 'o', 'para', 'por', 'sin', 'u', 'un',
+    'una', 'y',
+})
+
+_PALABRA = re.compile(r'[a-z0-9]+')
+
+
+def palabras(texto: str) -> List[str]:
+    """Palabras normalizadas del texto (sin acentos, minúsculas, sin palabras vacías)"""
+    return [palabra for palabra in _PALABRA.findall(normalizar(texto)) if palabra not in PALABRAS_VACIAS]
+
+
+class _Indice:
+    """Índice de un catálogo: claves ordenadas y listas de registros por palabra"""
+
+    def __init__(self, registros: List[Dict[str, Any]]):
+        # Los registros vienen ordenados por código: el id de cada uno es su posición
+        self.codigos = [registro['codigo'] for registro in registros]
+        self.etiquetas = [registro.get('Nombre') or registro['descripcion'] for registro in registros]
+        self.normalizados = [normalizar(etiqueta) for etiqueta in self.etiquetas]
+        self.palabras_registro = []
+
+        por_palabra: Dict[str, array] = {}
+        for indice, registro in enumerate(registros):
+            texto = ' '.join([registro['descripcion']] + [registro.get(columna, '') for columna in COLUMNAS_BUSQUEDA])
+            propias = tuple(dict.fromkeys(palabras(texto)))
+            self.palabras_registro.append(propias)
+            for palabra in propias:
+                por_palabra.setdefault(palabra, array('I')).append(indice)
+
+        self.palabras = sorted(por_palabra)
+        self.listas = [por_palabra[palabra] for palabra in self.palabras]
+        self.con_prefijo = lru_cache(maxsize=2048)(self._con_prefijo)
+
+    def _con_prefijo(self, prefijo: str) -> FrozenSet[int]:
+        """Registros que tienen alguna palabra que empieza con el prefijo"""
+        inicio = bisect_left(self.palabras, prefijo)
+        fin = bisect_left(self.palabras, prefijo[:-1] + chr(ord(prefijo[-1]) + 1))
+        if fin - inicio == 1:
+            return frozenset(self.listas[inicio])
+        resultado = set()
+        for lista in self.listas[inicio:fin]:
+            resultado.update(lista)
+        return frozenset(resultado)
+
+    def por_codigo(self, prefijo: str, limite: int) -> List[int]:
+        inicio = bisect_left(self.codigos, prefijo)
+        fin = inicio
+        while fin < len(self.codigos) and fin - inicio < limite and self.codigos[fin].startswith(prefijo):
+            fin += 1
+        return list(range(inicio, fin))
+
+    def por_palabras(self, consulta: List[str], frase: str, limite: int) -> List[int]:
+        """
+        Registros que tienen, para cada palabra de la consulta, una palabra que empieza con ella
+
+        Se parte de la palabra más larga (la más selectiva) y se filtran sus candidatos con las
+        demás. Primero van los que empiezan con la frase buscada y después los más cortos.
+        """
+        consulta = sorted(set(consulta), key=len, reverse=True)
+        candidatos = self.con_prefijo(consulta[0])
+        for prefijo in consulta[1:]:
+            if len(candidatos) > 256:
+                candidatos = candidatos & self.con_prefijo(prefijo)
+            else:
+                candidatos = [
+                    indice for indice in candidatos
+                    if any(palabra.startswith(prefijo) for palabra in self.palabras_registro[indice])
+                ]
+        return heapq.nsmallest(limite, candidatos, key=lambda indice: (
+            not self.normalizados[indice].startswith(frase), len(self.normalizados[indice]), indice
+        ))
+
+    def resultado(self, indice: int) -> Dict[str, str]:
+        return {
+            'codigo': self.codigos[indice],
+            'descripcion': self.etiquetas[indice],
+            'texto_completo': f'{self.codigos[indice]} - {self.etiquetas[indice]}',
+        }
+
+
+class IndiceCatalogoSAT:
+    """Autocompletado de claves SAT desde un índice en memoria por proceso"""
+
+    LIMITE_DEFAULT = 20
+    _indices: Dict[str, tuple] = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def _obtener(cls, catalogo: str) -> Optional[_Indice]:
+        """Índice del catálogo (nombre SAT) para la versión vigente del almacén local"""
+        firma = CatalogoSATLocal.firma()
+        if firma is None:
+            return None
+        actual = cls._indices.get(catalogo)
+        if actual and actual[0] == firma:
+            return actual[1]
+
+        with cls._lock:
+            actual = cls._indices.get(catalogo)
+            if actual and actual[0] == firma:
+                return actual[1]
+            inicio = time.perf_counter()
+            registros = CatalogoSATLocal.listar(catalogo)
+            if not registros:
+                return None
+            indice = _Indice(registros)
+            cls._indices[catalogo] = (firma, indice)
+            logger.info(
+                f"Índice de {catalogo}: {len(registros)} registros, {len(indice.palabras)} palabras "
+                f"en {time.perf_counter() - inicio:.2f}s"
+            )
+            return indice
+
+    @classmethod
+    def precargar(cls) -> Dict[str, int]:
+        """
+        Construye los índices de los catálogos que se pueden autocompletar
+
+        Returns:
+            Dict: registros indexados por catálogo (los no cargados se omiten)
+        """
+        cargados = {}
+        for catalogo in CATALOGOS_AUTOCOMPLETAR.values():
+            try:
+                indice = cls._obtener(catalogo)
+            except Exception as e:
+                logger.error(f"No se pudo construir el índice de {catalogo}: {e}")
+                continue
+            if indice is not None:
+                cargados[catalogo] = len(indice.codigos)
+        return cargados
+
+    @classmethod
+    def buscar(cls, catalogo: str, texto: str, limite: int = None) -> Optional[List[Dict[str, str]]]:
+        """
+        Claves cuyo código empieza con el texto y después las que coinciden por palabras
+
+        Cada palabra del texto es un prefijo ("tom roj" encuentra "Tomate rojo"); acentos y
+        mayúsculas no importan.
+
+        Args:
+            catalogo: Nombre del servicio ('productos-servicios', 'claves-unidad') o nombre SAT
+            texto: Lo que el usuario ha escrito
+            limite: Máximo de resultados
+
+        Returns:
+            List[Dict]: codigo, descripcion y texto_completo; None si el catálogo no está cargado
+        """
+        indice = cls._obtener(CATALOGOS_AUTOCOMPLETAR.get(catalogo, catalogo))
+        if indice is None:
+            return None
+        limite = limite or cls.LIMITE_DEFAULT
+        texto = (texto or '').strip()
+        if not texto:
+            return []
+
+        encontrados = indice.por_codigo(texto.upper(), limite)
+        consulta = palabras(texto) or _PALABRA.findall(normalizar(texto))
+        if consulta and len(encontrados) < limite:
+            vistos = set(encontrados)
+            for posicion in indice.por_palabras(consulta, normalizar(texto), limite):
+                if posicion not in vistos:
+                    encontrados.append(posicion)
+                    if len(encontrados) >= limite:
+                        break
+        return [indice.resultado(posicion) for posicion in encontrados]
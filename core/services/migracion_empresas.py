@@ -0,0 +1,180 @@
+"""
+Migración de las BD de todas las empresas
+Cada empresa se migra en un proceso de un pool (cada una es una BD independiente, así que
+pueden avanzar en paralelo). El resultado por empresa se guarda en un archivo de estado para
+poder reanudar una corrida interrumpida sin repetir las que ya quedaron al día.
+"""
+
+import io
+import json
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+def _inicializar_worker(modulo_settings: str):
+    """Configura Django una vez por proceso del pool"""
+    import django
+
+    os.environ['DJANGO_SETTINGS_MODULE'] = modulo_settings
+    django.setup()
+
+
+def migrar_empresa(
+    db_name: str,
+    app_label: Optional[str] = None,
+    migration_name: Optional[str] = None,
+    simular: bool = False,
+) -> Dict[str, Any]:
+    """
+    Aplica (o solo lista, con simular) las migraciones pendientes de la BD de una empresa
+
+    Args:
+        db_name: Empresa.db_name
+        app_label, migration_name: Igual que en `migrate` (por defecto, todo hasta la última)
+        simular: No migrar, solo contar las migraciones pendientes
+
+    Returns:
+        Dict: db_name, exito, pendientes (nombres), segundos y error
+    """
+    from django.core.management import call_command
+    from django.db import connections
+    from django.db.migrations.executor import MigrationExecutor
+
+    from .conexiones_empresa import ConexionesEmpresa
+
+    inicio = time.perf_counter()
+    resultado = {'db_name': db_name, 'exito': False, 'pendientes': [], 'segundos': 0.0, 'error': None}
+    try:
+        alias = ConexionesEmpresa.registrar(db_name)
+        nombre = connections.databases[alias]['NAME']
+        if 'sqlite3' in connections.databases[alias]['ENGINE'] and not os.path.exists(nombre):
+            raise FileNotFoundError(f'No existe la base de datos {nombre}')
+
+        executor = MigrationExecutor(connections[alias])
+        if app_label:
+            objetivos = [(app_label, migration_name)] if migration_name else [
+                nodo for nodo in executor.loader.graph.leaf_nodes() if nodo[0] == app_label
+            ]
+        else:
+            objetivos = executor.loader.graph.leaf_nodes()
+        plan = executor.migration_plan(objetivos)
+        resultado['pendientes'] = [
+            f'{migracion.app_label}.{migracion.name}{" (revertir)" if revertir else ""}'
+            for migracion, revertir in plan
+        ]
+
+        if not simular and plan:
+            argumentos = [a for a in (app_label, migration_name) if a]
+            call_command(
+                'migrate', *argumentos, database=alias, interactive=False, verbosity=0, stdout=io.StringIO()
+            )
+        resultado['exito'] = True
+    except Exception as e:
+        logger.error(f"Error migrando {db_name}: {e}")
+        resultado['error'] = f'{type(e).__name__}: {e}'
+    finally:
+        connections.close_all()
+    resultado['segundos'] = time.perf_counter() - inicio
+    return resultado
+
+
+class MigracionEmpresas:
+    """Migración en paralelo de las BD de las empresas con estado para reanudar"""
+
+    @staticmethod
+    def empresas(rfcs: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """
+        Empresas activas (incluye suspendidas: su BD también debe quedar al día)
+
+        Args:
+            rfcs: Limitar a estos RFC
+
+        Returns:
+            List[Dict]: rfc, nombre y db_name ordenados por RFC
+        """
+        from administracion.models import Empresa
+
+        empresas = Empresa.objects.using('administracion').filter(activo=True)
+        if rfcs:
+            empresas = empresas.filter(rfc__in=[rfc.strip().upper() for rfc in rfcs])
+        return list(empresas.order_by('rfc').values('rfc', 'nombre', 'db_name'))
+
+    @staticmethod
+    def ruta_estado() -> Path:
+        return Path(getattr(settings, 'MIGRATE_EMPRESAS_ESTADO', Path(settings.BASE_DIR) / 'migrate_empresas.json'))
+
+    @staticmethod
+    def leer_estado(ruta: Path) -> Dict[str, Dict[str, Any]]:
+        """Resultados anteriores por db_name ({} si no hay archivo)"""
+        try:
+            with open(ruta, encoding='utf-8') as archivo:
+                return json.load(archivo)
+        except FileNotFoundError:
+            return {}
+
+    @staticmethod
+    def guardar_estado(ruta: Path, estado: Dict[str, Dict[str, Any]]):
+        temporal = f'{ruta}.tmp'
+        with open(temporal, 'w', encoding='utf-8') as archivo:
+            json.dump(estado, archivo, indent=2, ensure_ascii=False)
+        os.replace(temporal, ruta)
+
+    @staticmethod
+    def ejecutar(
+        db_names: List[str],
+        procesos: int,
+        simular: bool = False,
+        app_label: Optional[str] = None,
+        migration_name: Optional[str] = None,
+        al_terminar: Optional[Callable[[Dict[str, Any]], None]] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Migra las BD en un pool de procesos
+
+        Args:
+            db_names: BD a migrar
+            procesos: Máximo de BD migrándose a la vez
+            simular: Solo listar las migraciones pendientes
+            app_label, migration_name: Igual que en `migrate`
+            al_terminar: Se llama en este proceso con el resultado de cada BD al terminar
+
+        Returns:
+            List[Dict]: Resultado de migrar_empresa por BD, en orden de término
+        """
+        resultados = []
+        if not db_names:
+            return resultados
+
+        contexto = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(
+            max_workers=max(1, min(procesos, len(db_names))),
+            mp_context=contexto,
+            initializer=_inicializar_worker,
+            initargs=(os.environ.get('DJANGO_SETTINGS_MODULE', 'directiva_agricola.settings'),),
+        ) as pool:
+            futuros = {
+                pool.submit(migrar_empresa, db_name, app_label, migration_name, simular): db_name
+                for db_name in db_names
+            }
+            for futuro in as_completed(futuros):
+                try:
+                    resultado = futuro.result()
+                except Exception as e:
+                    # El proceso del pool murió (p. ej. falta de memoria)
+                    resultado = {
+                        'db_name': futuros[futuro], 'exito': False, 'pendientes': [], 'segundos': 0.0,
+                        'error': f'{type(e).__name__}: {e}',
+                    }
+                resultados.append(resultado)
+                if al_terminar:
+                    al_terminar(resultado)
+        return resultados
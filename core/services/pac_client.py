@@ -8,7 +8,8 @@ import json
 import logging
 from typing import Dict, Any, Optional
 from datetime import datetime
-import time
+
+from .pac_sesiones import PoolSesionesPAC
 
 logger = logging.getLogger(__name__)
 
@@ -30,6 +31,18 @@ class PACProdigiaClient:
         self.max_retries = configuracion.get('max_retries', 3)
         self.retry_delay = configuracion.get('retry_delay', 1)
         self.backoff_factor = configuracion.get('backoff_factor', 2)
+
+    def _post(self, endpoint: str, **kwargs):
+        """POST con la sesión compartida del PAC y la política de reintentos de la configuración"""
+        return PoolSesionesPAC.post(
+            endpoint, max_retries=self.max_retries, backoff_factor=self.retry_delay, **kwargs
+        )
+
+    def _get(self, endpoint: str, **kwargs):
+        """GET con la sesión compartida del PAC y la política de reintentos de la configuración"""
+        return PoolSesionesPAC.get(
+            endpoint, max_retries=self.max_retries, backoff_factor=self.retry_delay, **kwargs
+        )
     
     def timbrar_cfdi(self, xml_cfdi: str) -> Dict[str, Any]:
         """
@@ -57,70 +70,42 @@ class PACProdigiaClient:
                 'contrato': self.credenciales['contrato']
             }
             
-            # Realizar petición con reintentos
-            for intento in range(self.max_retries):
-                try:
-                    logger.info(f"Intentando timbrar CFDI (intento {intento + 1}/{self.max_retries})")
-                    
-                    response = requests.post(
-                        endpoint,
-                        data=xml_cfdi,
-                        headers=headers,
-                        params=params,
-                        timeout=self.timeout
-                    )
-                    
-                    if response.status_code == 200:
-                        return self._procesar_respuesta_timbrado(response.text)
-                    else:
-                        error_msg = f"Error HTTP {response.status_code}: {response.text}"
-                        logger.warning(f"Intento {intento + 1} falló: {error_msg}")
-                        
-                        if intento < self.max_retries - 1:
-                            delay = self.retry_delay * (self.backoff_factor ** intento)
-                            logger.info(f"Esperando {delay} segundos antes del siguiente intento")
-                            time.sleep(delay)
-                        else:
-                            return {
-                                'exito': False,
-                                'error': error_msg,
-                                'codigo_error': response.status_code
-                            }
-                
-                except requests.exceptions.Timeout:
-                    error_msg = f"Timeout en intento {intento + 1}"
-                    logger.warning(error_msg)
-                    
-                    if intento < self.max_retries - 1:
-                        delay = self.retry_delay * (self.backoff_factor ** intento)
-                        time.sleep(delay)
-                    else:
-                        return {
-                            'exito': False,
-                            'error': 'Timeout después de todos los intentos',
-                            'codigo_error': 'TIMEOUT'
-                        }
-                
-                except requests.exceptions.RequestException as e:
-                    error_msg = f"Error de conexión en intento {intento + 1}: {str(e)}"
-                    logger.warning(error_msg)
-                    
-                    if intento < self.max_retries - 1:
-                        delay = self.retry_delay * (self.backoff_factor ** intento)
-                        time.sleep(delay)
-                    else:
-                        return {
-                            'exito': False,
-                            'error': f'Error de conexión: {str(e)}',
-                            'codigo_error': 'CONNECTION_ERROR'
-                        }
-            
+            # Los reintentos con backoff los aplica el adaptador de la sesión compartida
+            logger.info("Enviando CFDI a timbrar")
+            try:
+                response = self._post(
+                    endpoint,
+                    data=xml_cfdi,
+                    headers=headers,
+                    params=params,
+                    timeout=self.timeout
+                )
+            except requests.exceptions.Timeout:
+                logger.warning("Timeout timbrando CFDI")
+                return {
+                    'exito': False,
+                    'error': 'Timeout después de todos los intentos',
+                    'codigo_error': 'TIMEOUT'
+                }
+            except requests.exceptions.RequestException as e:
+                logger.warning(f"Error de conexión timbrando CFDI: {e}")
+                return {
+                    'exito': False,
+                    'error': f'Error de conexión: {str(e)}',
+                    'codigo_error': 'CONNECTION_ERROR'
+                }
+
+            if response.status_code == 200:
+                return self._procesar_respuesta_timbrado(response.text)
+
+            error_msg = f"Error HTTP {response.status_code}: {response.text}"
+            logger.warning(f"Timbrado falló: {error_msg}")
             return {
                 'exito': False,
-                'error': 'Se agotaron todos los intentos',
-                'codigo_error': 'MAX_RETRIES_EXCEEDED'
+                'error': error_msg,
+                'codigo_error': response.status_code
             }
-            
+
         except Exception as e:
             logger.error(f"Error inesperado en timbrado: {e}")
             return {
@@ -232,7 +217,7 @@ class PACProdigiaClient:
                 'Accept': 'application/json'
             }
             
-            response = requests.post(
+            response = self._post(
                 endpoint,
                 json=datos_cancelacion,
                 headers=headers,
@@ -309,7 +294,7 @@ class PACProdigiaClient:
                 'contrato': self.credenciales['contrato']
             }
             
-            response = requests.get(
+            response = self._get(
                 endpoint,
                 params=params,
                 timeout=self.timeout
@@ -395,7 +380,7 @@ class PACProdigiaClient:
                 'SOAPAction': 'http://tempuri.org/ITimbrado4_0/TimbradoCfdi'
             }
             
-            response = requests.post(
+            response = self._post(
                 endpoint,
                 data=xml_prueba,
                 headers=headers,
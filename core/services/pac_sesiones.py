@@ -0,0 +1,192 @@
+"""
+Pool de sesiones HTTP hacia el PAC
+Una requests.Session por origen (esquema + host) compartida por todo el proceso: conexiones
+keep-alive, reintentos con backoff en el adaptador y métricas de latencia/errores por endpoint
+"""
+
+import logging
+import threading
+import time
+from typing import Dict, Any
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class PoolSesionesPAC:
+    """Sesiones HTTP reutilizables y métricas por endpoint del PAC"""
+
+    # Valores por defecto; se pueden sobrescribir con settings.PAC_HTTP_POOL
+    CONFIG_DEFAULT = {
+        'pool_connections': 4,
+        'pool_maxsize': 10,
+        'max_retries': 3,
+        'backoff_factor': 1,
+        'status_forcelist': (429, 502, 503, 504),
+    }
+
+    _sesiones: Dict[tuple, requests.Session] = {}
+    _metricas: Dict[str, Dict[str, Any]] = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def configuracion(cls) -> Dict[str, Any]:
+        """Configuración efectiva del pool"""
+        config = cls.CONFIG_DEFAULT.copy()
+        config.update(getattr(settings, 'PAC_HTTP_POOL', {}))
+        return config
+
+    @staticmethod
+    def _origen(url: str) -> str:
+        partes = urlsplit(url)
+        return f"{partes.scheme}://{partes.netloc}"
+
+    @staticmethod
+    def _endpoint(url: str) -> str:
+        partes = urlsplit(url)
+        return f"{partes.scheme}://{partes.netloc}{partes.path}"
+
+    @classmethod
+    def _crear_sesion(cls, max_retries: int, backoff_factor: float) -> requests.Session:
+        config = cls.configuracion()
+        # Un POST (timbrado, cancelación) solo se reintenta si falló la conexión, antes de
+        # enviarse: un 502/503/504 o un timeout de lectura pueden llegar después de que el PAC
+        # timbró, y repetirlo duplicaría el CFDI. Las respuestas 429/5xx se reintentan solo en
+        # métodos idempotentes (GET de consultas de estado)
+        reintentos = Retry(
+            total=max_retries,
+            connect=max_retries,
+            read=0,
+            other=0,
+            status=max_retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=config['status_forcelist'],
+            allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,
+            raise_on_status=False,
+            respect_retry_after_header=True,
+        )
+        adaptador = HTTPAdapter(
+            pool_connections=config['pool_connections'],
+            pool_maxsize=config['pool_maxsize'],
+            max_retries=reintentos,
+        )
+        sesion = requests.Session()
+        sesion.mount('http://', adaptador)
+        sesion.mount('https://', adaptador)
+        return sesion
+
+    @classmethod
+    def obtener_sesion(cls, url: str, max_retries: int = None, backoff_factor: float = None) -> requests.Session:
+        """
+        Sesión compartida para el origen de la URL (se crea la primera vez)
+
+        Args:
+            url: URL de cualquier endpoint del PAC
+            max_retries: Reintentos ante fallas de conexión, o 429/5xx en métodos idempotentes
+                (por defecto los de settings)
+            backoff_factor: Factor de espera exponencial entre reintentos (por defecto el de settings)
+
+        Returns:
+            requests.Session con keep-alive y reintentos configurados
+        """
+        config = cls.configuracion()
+        if max_retries is None:
+            max_retries = config['max_retries']
+        if backoff_factor is None:
+            backoff_factor = config['backoff_factor']
+
+        clave = (cls._origen(url), max_retries, backoff_factor)
+        sesion = cls._sesiones.get(clave)
+        if sesion is None:
+            with cls._lock:
+                sesion = cls._sesiones.get(clave)
+                if sesion is None:
+                    sesion = cls._crear_sesion(max_retries, backoff_factor)
+                    cls._sesiones[clave] = sesion
+                    logger.info(f"Sesión HTTP creada para {clave[0]}")
+        return sesion
+
+    @classmethod
+    def solicitar(cls, metodo: str, url: str, max_retries: int = None, backoff_factor: float = None,
+                  **kwargs) -> requests.Response:
+        """
+        Realiza la petición con la sesión del origen y registra latencia y errores
+
+        Args:
+            metodo: 'GET', 'POST', etc.
+            url: URL del endpoint
+            max_retries: Reintentos del adaptador (ver obtener_sesion)
+            backoff_factor: Factor de espera entre reintentos (ver obtener_sesion)
+            **kwargs: Argumentos de requests (data, json, headers, params, timeout...)
+
+        Returns:
+            requests.Response
+
+        Raises:
+            requests.exceptions.RequestException: Si la petición falla tras los reintentos
+        """
+        endpoint = cls._endpoint(url)
+        inicio = time.perf_counter()
+        try:
+            respuesta = cls.obtener_sesion(url, max_retries, backoff_factor).request(metodo, url, **kwargs)
+        except requests.exceptions.RequestException:
+            cls._registrar(endpoint, time.perf_counter() - inicio, error=True)
+            raise
+        cls._registrar(endpoint, time.perf_counter() - inicio, error=respuesta.status_code >= 500)
+        return respuesta
+
+    @classmethod
+    def post(cls, url: str, **kwargs) -> requests.Response:
+        return cls.solicitar('POST', url, **kwargs)
+
+    @classmethod
+    def get(cls, url: str, **kwargs) -> requests.Response:
+        return cls.solicitar('GET', url, **kwargs)
+
+    @classmethod
+    def _registrar(cls, endpoint: str, latencia: float, error: bool):
+        with cls._lock:
+            metricas = cls._metricas.setdefault(endpoint, {
+                'solicitudes': 0,
+                'errores': 0,
+                'latencia_total': 0.0,
+                'latencia_maxima': 0.0,
+                'latencia_ultima': 0.0,
+            })
+            metricas['solicitudes'] += 1
+            metricas['errores'] += int(error)
+            metricas['latencia_total'] += latencia
+            metricas['latencia_maxima'] = max(metricas['latencia_maxima'], latencia)
+            metricas['latencia_ultima'] = latencia
+
+    @classmethod
+    def metricas(cls) -> Dict[str, Dict[str, Any]]:
+        """
+        Copia de las métricas por endpoint
+
+        Returns:
+            Dict: {endpoint: {solicitudes, errores, latencia_promedio, latencia_maxima, latencia_ultima}}
+        """
+        with cls._lock:
+            resultado = {}
+            for endpoint, metricas in cls._metricas.items():
+                datos = dict(metricas)
+                datos['latencia_promedio'] = (
+                    datos['latencia_total'] / datos['solicitudes'] if datos['solicitudes'] else 0.0
+                )
+                resultado[endpoint] = datos
+            return resultado
+
+    @classmethod
+    def reiniciar(cls):
+        """Cierra las sesiones y limpia las métricas (por ejemplo, al cambiar la configuración)"""
+        with cls._lock:
+            for sesion in cls._sesiones.values():
+                sesion.close()
+            cls._sesiones.clear()
+            cls._metricas.clear()
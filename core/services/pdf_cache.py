@@ -0,0 +1,143 @@
+"""
+Caché en disco de los PDF de comprobantes timbrados
+Un CFDI timbrado no cambia, así que su PDF se renderiza una vez y se guarda bajo MEDIA_ROOT.
+La clave es el UUID más un hash de versión (plantilla + datos de marca de ConfiguracionSistema):
+si cambia cualquiera de los dos, el archivo anterior deja de usarse
+"""
+
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+from functools import lru_cache
+from typing import Callable, Optional, Tuple
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.http import FileResponse
+from django.template.loader import get_template
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from directiva_agricola.db_router import get_current_company_db
+
+logger = logging.getLogger(__name__)
+
+# Campos de ConfiguracionSistema que aparecen en los PDF
+CAMPOS_MARCA = ('razon_social', 'rfc', 'direccion', 'telefono', 'logo_empresa')
+
+
+@lru_cache(maxsize=None)
+def _hash_plantilla(plantilla: str) -> str:
+    # La plantilla solo cambia con un despliegue, que reinicia el proceso
+    return hashlib.sha256(get_template(plantilla).template.source.encode('utf-8')).hexdigest()
+
+
+class CachePDF:
+    """PDF renderizados por UUID, por base de datos de empresa"""
+
+    @classmethod
+    def activo(cls) -> bool:
+        return getattr(settings, 'PDF_CACHE_ACTIVO', True)
+
+    @classmethod
+    def directorio(cls, alias: str = None) -> str:
+        """Directorio de la caché de una empresa (la marca es por empresa)"""
+        return os.path.join(
+            settings.MEDIA_ROOT,
+            getattr(settings, 'PDF_CACHE_DIR', 'pdf_cache'),
+            alias or get_current_company_db() or DEFAULT_DB_ALIAS,
+        )
+
+    @classmethod
+    def version(cls, plantilla: str) -> str:
+        """
+        Hash de todo lo que, además del comprobante, determina el PDF
+
+        Args:
+            plantilla: Nombre de la plantilla con que se renderiza
+
+        Returns:
+            str: Hash corto de plantilla + marca de la empresa
+        """
+        from ..models import ConfiguracionSistema
+
+        marca = ConfiguracionSistema.objects.values_list(*CAMPOS_MARCA).first() or ()
+        contenido = '|'.join([_hash_plantilla(plantilla)] + [str(valor or '') for valor in marca])
+        return hashlib.sha256(contenido.encode('utf-8')).hexdigest()[:16]
+
+    @classmethod
+    def ruta(cls, tipo: str, uuid: str, version: str) -> str:
+        return os.path.join(cls.directorio(), tipo, uuid[:2].lower(), f'{uuid.lower()}-{version}.pdf')
+
+    @classmethod
+    def obtener(cls, tipo: str, uuid: str, plantilla: str, renderizar: Callable[[], bytes],
+                version: str = None) -> Tuple[str, str]:
+        """
+        Ruta del PDF en caché; si no existe lo renderiza y lo guarda
+
+        Args:
+            tipo: 'factura' o 'complemento_pago'
+            uuid: UUID del comprobante timbrado
+            plantilla: Plantilla con que se renderiza
+            renderizar: Función que devuelve los bytes del PDF
+            version: Versión ya calculada (para recorrer muchos comprobantes con una sola consulta)
+
+        Returns:
+            tuple: (ruta del archivo, ETag)
+        """
+        version = version or cls.version(plantilla)
+        ruta = cls.ruta(tipo, uuid, version)
+        if not os.path.exists(ruta):
+            pdf = renderizar()
+            os.makedirs(os.path.dirname(ruta), exist_ok=True)
+            # Escritura atómica: otro proceso nunca ve un PDF a medias
+            descriptor, temporal = tempfile.mkstemp(dir=os.path.dirname(ruta), suffix='.tmp')
+            try:
+                with os.fdopen(descriptor, 'wb') as archivo:
+                    archivo.write(pdf)
+                os.replace(temporal, ruta)
+            except Exception:
+                if os.path.exists(temporal):
+                    os.remove(temporal)
+                raise
+            logger.info(f"PDF de {tipo} {uuid} guardado en caché ({len(pdf)} bytes)")
+        return ruta, f'"{uuid.lower()}-{version}"'
+
+    @classmethod
+    def respuesta(cls, request, tipo: str, uuid: str, plantilla: str, renderizar: Callable[[], bytes],
+                  nombre_archivo: str, adjunto: bool = True):
+        """
+        Respuesta HTTP con el PDF en caché, con ETag y Last-Modified
+
+        Si el navegador ya tiene esa versión (If-None-Match / If-Modified-Since) responde 304
+        sin leer el archivo.
+        """
+        ruta, etag = cls.obtener(tipo, uuid, plantilla, renderizar)
+        modificado = int(os.path.getmtime(ruta))
+
+        if request is not None:
+            no_modificado = get_conditional_response(request, etag=etag, last_modified=modificado)
+            if no_modificado is not None:
+                return no_modificado
+
+        response = FileResponse(
+            open(ruta, 'rb'), content_type='application/pdf', as_attachment=adjunto, filename=nombre_archivo
+        )
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(modificado)
+        response['Cache-Control'] = 'private, max-age=0, must-revalidate'
+        return response
+
+    @classmethod
+    def existe(cls, tipo: str, uuid: str, plantilla: str, version: str = None) -> bool:
+        return os.path.exists(cls.ruta(tipo, uuid, version or cls.version(plantilla)))
+
+    @classmethod
+    def invalidar(cls, alias: Optional[str] = None):
+        """Borra los PDF en caché de una empresa (por ejemplo al cambiar su logo o datos)"""
+        directorio = cls.directorio(alias)
+        if os.path.isdir(directorio):
+            shutil.rmtree(directorio, ignore_errors=True)
+            logger.info(f"Caché de PDF invalidada: {directorio}")
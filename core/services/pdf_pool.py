@@ -0,0 +1,213 @@
+"""
+Pool de procesos para renderizar PDF con WeasyPrint
+El HTML se arma en el proceso web (plantillas y base de datos) y el trabajo pesado de
+maquetación corre en procesos dedicados que conservan su configuración de fuentes entre
+documentos. La cola es acotada: si está llena se rechaza el trabajo en lugar de acumularlo.
+
+Cada worker de gunicorn tiene su propio pool, así que el total de procesos es
+workers x procesos: en la web se usa un proceso por worker y los comandos (exportar_cfdi)
+pueden pedir más con PoolPDF.usar_procesos().
+
+El plazo de cada trabajo corre desde que se envía: si vence mientras sigue en la cola se
+cancela y libera su lugar, en lugar de renderizar un PDF que ya nadie espera.
+"""
+
+import atexit
+import logging
+import math
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+CONFIGURACION_DEFAULT = {
+    'activo': True,
+    'procesos': 1,
+    'max_en_cola': 2,
+    'espera_cola': 3,
+    'timeout': 8,
+    'contexto': 'spawn',
+}
+
+# Estado de cada proceso del pool
+_font_config = None
+
+
+def _limite_excedido(signum, frame):
+    raise TimeoutError('El renderizado del PDF excedió el tiempo límite')
+
+
+def _inicializar_worker(css_calentamiento: str):
+    """Carga WeasyPrint, fontconfig y Pango una vez por proceso"""
+    global _font_config
+    from weasyprint import CSS, HTML
+    from weasyprint.text.fonts import FontConfiguration
+
+    _font_config = FontConfiguration()
+    signal.signal(signal.SIGALRM, _limite_excedido)
+
+    # Calentamiento con la hoja de estilos de la factura: la lista de fuentes del sistema y
+    # las fuentes que usa la plantilla quedan cargadas antes del primer documento real
+    hoja = CSS(string=css_calentamiento, font_config=_font_config)
+    HTML(string='<div class="header"><p class="company-logo">CFDI</p></div>').write_pdf(
+        stylesheets=[hoja], font_config=_font_config
+    )
+
+
+def _renderizar(html_string: str, base_url: str, limite: float) -> bytes:
+    """Convierte HTML en PDF dentro del proceso del pool, con límite de tiempo"""
+    from weasyprint import HTML
+
+    # Las tareas corren en el hilo principal del proceso, así que SIGALRM las interrumpe
+    signal.setitimer(signal.ITIMER_REAL, limite)
+    try:
+        return HTML(string=html_string, base_url=base_url, encoding='utf-8').write_pdf(
+            font_config=_font_config,
+            optimize_images=True,
+            jpeg_quality=95
+        )
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+class PoolPDF:
+    """Pool de procesos de WeasyPrint compartido por los hilos de un proceso web"""
+
+    _executor = None
+    _pid = None
+    _cupos = None
+    _procesos = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def configuracion(cls, clave: str):
+        return {**CONFIGURACION_DEFAULT, **getattr(settings, 'PDF_POOL', {})}[clave]
+
+    @classmethod
+    def activo(cls) -> bool:
+        return cls.configuracion('activo')
+
+    @classmethod
+    def procesos(cls) -> int:
+        return cls._procesos or cls.configuracion('procesos') or 1
+
+    @classmethod
+    def plazo(cls) -> float:
+        """Segundos desde enviar() hasta el PDF: su turno más los trabajos que puede tener delante"""
+        turnos = 1 + math.ceil(cls.configuracion('max_en_cola') / cls.procesos())
+        return cls.configuracion('timeout') * turnos
+
+    @classmethod
+    def usar_procesos(cls, procesos: int):
+        """Procesos del pool en este proceso (comandos fuera de gunicorn); reinicia el pool si ya existía"""
+        cls.cerrar()
+        cls._procesos = max(1, procesos)
+
+    @classmethod
+    def _obtener_executor(cls):
+        with cls._lock:
+            # Un proceso hijo (por ejemplo un worker de gunicorn con --preload) crea su propio pool
+            if cls._executor is None or cls._pid != os.getpid():
+                from .pdf_service import PDFService
+
+                procesos = cls.procesos()
+                cls._executor = ProcessPoolExecutor(
+                    max_workers=procesos,
+                    mp_context=multiprocessing.get_context(cls.configuracion('contexto')),
+                    initializer=_inicializar_worker,
+                    initargs=(PDFService._obtener_css_factura(),),
+                )
+                cls._cupos = threading.BoundedSemaphore(procesos + cls.configuracion('max_en_cola'))
+                cls._pid = os.getpid()
+                logger.info(f"Pool de PDF iniciado con {procesos} procesos")
+            return cls._executor, cls._cupos
+
+    @classmethod
+    def _descartar(cls, executor):
+        """Descarta un pool roto (un proceso murió) para que el siguiente trabajo cree otro"""
+        with cls._lock:
+            if cls._executor is executor:
+                cls._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+        logger.error("Pool de PDF descartado: un proceso terminó de forma inesperada")
+
+    @classmethod
+    def enviar(cls, html_string: str, bloquear: bool = False) -> Future:
+        """
+        Encola el renderizado de un HTML
+
+        Args:
+            html_string: HTML ya renderizado
+            bloquear: Esperar sin límite a que haya lugar en la cola (trabajos en lote)
+
+        Returns:
+            Future: Resuelve a los bytes del PDF; `limite` es el instante (time.monotonic) en
+                que vence su plazo
+
+        Raises:
+            queue.Full: Si la cola sigue llena después de settings.PDF_POOL['espera_cola'] segundos
+        """
+        for intento in range(2):
+            executor, cupos = cls._obtener_executor()
+            if not cupos.acquire(timeout=None if bloquear else cls.configuracion('espera_cola')):
+                raise queue.Full('La cola de renderizado de PDF está llena')
+            try:
+                futuro = executor.submit(
+                    _renderizar, html_string, str(settings.BASE_DIR), cls.configuracion('timeout')
+                )
+                break
+            except BrokenProcessPool:
+                # Un proceso murió (por ejemplo por memoria): se reintenta una vez con un pool nuevo
+                cupos.release()
+                cls._descartar(executor)
+                if intento:
+                    raise
+
+        def liberar(terminado):
+            cupos.release()
+            if not terminado.cancelled() and isinstance(terminado.exception(), BrokenProcessPool):
+                cls._descartar(executor)
+
+        futuro.limite = time.monotonic() + cls.plazo()
+        futuro.add_done_callback(liberar)
+        return futuro
+
+    @classmethod
+    def resultado(cls, futuro: Future) -> bytes:
+        """
+        Espera un trabajo enviado con enviar() hasta que vence su plazo
+
+        Raises:
+            TimeoutError: Si el PDF no estuvo listo dentro del plazo; si el trabajo seguía en la
+                cola se cancela (uno que ya corre lo corta el límite de su proceso)
+        """
+        limite = getattr(futuro, 'limite', None)
+        try:
+            return futuro.result(timeout=None if limite is None else max(0, limite - time.monotonic()))
+        except TimeoutError:
+            futuro.cancel()
+            raise
+
+    @classmethod
+    def renderizar(cls, html_string: str) -> bytes:
+        """Renderiza un HTML en el pool y espera el PDF"""
+        return cls.resultado(cls.enviar(html_string))
+
+    @classmethod
+    def cerrar(cls):
+        with cls._lock:
+            executor, cls._executor = cls._executor, None
+        if executor is not None and cls._pid == os.getpid():
+            executor.shutdown(wait=False, cancel_futures=True)
+            cls._pid = None
+
+
+atexit.register(PoolPDF.cerrar)
@@ -4,20 +4,29 @@ Servicio para generación de PDFs de facturas
 
 import os
 import logging
+import queue
 import qrcode
 import base64
+from collections import deque
+from concurrent.futures import Future
 from io import BytesIO
 from datetime import datetime
+from typing import Any, Iterable, Iterator, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 from django.template.loader import render_to_string
 from django.http import HttpResponse
 from django.conf import settings
+
+from .pdf_cache import CachePDF
+from .pdf_pool import PoolPDF
+
 try:
     from weasyprint import HTML, CSS
     from weasyprint.text.fonts import FontConfiguration
     WEASYPRINT_AVAILABLE = True
-except ImportError:
+except (ImportError, OSError):
+    # OSError: WeasyPrint instalado pero sin las bibliotecas del sistema (Pango)
     WEASYPRINT_AVAILABLE = False
     HTML = None
     CSS = None
@@ -29,78 +38,274 @@ logger = logging.getLogger(__name__)
 class PDFService:
     """Servicio para generar PDFs de facturas"""
     
+    PLANTILLA_FACTURA = 'core/factura_pdf.html'
+    PLANTILLA_COMPLEMENTO_PAGO = 'core/complemento_pago_pdf.html'
+    
     @classmethod
-    def generar_pdf_factura(cls, factura) -> HttpResponse:
+    def generar_pdf_factura(cls, factura, request=None) -> HttpResponse:
         """
         Genera el PDF de una factura
         
+        Las facturas timbradas se sirven desde la caché de PDF (CachePDF).
+        
         Args:
             factura: Instancia del modelo Factura
+            request: Petición, para responder 304 si el navegador ya tiene el PDF
             
         Returns:
             HttpResponse: PDF generado
         """
         try:
-            # Obtener detalles de la factura
-            detalles = factura.detalles.all()
-            
-            # Obtener configuración del sistema
-            from ..models import ConfiguracionSistema
-            configuracion = ConfiguracionSistema.objects.first()
-            
-            # Preparar contexto para el template
-            context = {
-                'factura': factura,
-                'detalles': detalles,
-                'fecha_actual': datetime.now().strftime('%d/%m/%Y %H:%M'),
-                'logo_empresa': cls._obtener_logo_empresa(),
-                'configuracion': configuracion,
-                'codigo_qr': cls._generar_codigo_qr(factura),
-            }
-            
-            # Renderizar template HTML
-            html_string = render_to_string('core/factura_pdf.html', context)
+            nombre_archivo = f"factura_{factura.serie}_{factura.folio:06d}.pdf"
+            if factura.uuid and factura.estado_timbrado == 'TIMBRADO' and CachePDF.activo():
+                return CachePDF.respuesta(
+                    request, 'factura', factura.uuid, cls.PLANTILLA_FACTURA,
+                    lambda: cls.renderizar_pdf_factura(factura), nombre_archivo
+                )
             
-            # Generar PDF
-            if not WEASYPRINT_AVAILABLE:
-                logger.warning("WeasyPrint no está disponible, generando respuesta temporal")
-                return HttpResponse("PDF generation requires WeasyPrint to be installed", status=500)
-            
-            # Configurar WeasyPrint
-            font_config = FontConfiguration()
-            
-            # Crear documento HTML con configuración mejorada
-            html_doc = HTML(
-                string=html_string,
-                base_url=settings.BASE_DIR,
-                encoding='utf-8'
-            )
-            
-            # Generar PDF con configuración optimizada
-            pdf_file = html_doc.write_pdf(
-                font_config=font_config,
-                optimize_images=True,
-                jpeg_quality=95
-            )
-            
-            # Verificar que el PDF se generó correctamente
-            if not pdf_file or len(pdf_file) < 1000:  # PDF mínimo de 1KB
-                logger.error(f"PDF generado es muy pequeño o vacío para factura {factura.folio}")
-                return HttpResponse("Error: PDF generado está vacío o dañado", status=500)
+            pdf_file = cls.renderizar_pdf_factura(factura)
             
             # Crear respuesta HTTP
             response = HttpResponse(pdf_file, content_type='application/pdf')
-            response['Content-Disposition'] = f'attachment; filename="factura_{factura.serie}_{factura.folio:06d}.pdf"'
+            response['Content-Disposition'] = f'attachment; filename="{nombre_archivo}"'
             response['Content-Length'] = len(pdf_file)
             
             return response
             
+        except (queue.Full, TimeoutError) as e:
+            return cls._respuesta_pool_no_disponible(e)
         except Exception as e:
             logger.error(f"Error generando PDF de factura {factura.folio}: {e}")
             import traceback
             logger.error(traceback.format_exc())
             return HttpResponse(f"Error generando PDF: {str(e)}", status=500)
     
+    @classmethod
+    def renderizar_pdf_factura(cls, factura) -> bytes:
+        """
+        Renderiza el PDF de una factura con WeasyPrint
+        
+        Args:
+            factura: Instancia del modelo Factura
+            
+        Returns:
+            bytes: Contenido del PDF
+            
+        Raises:
+            RuntimeError: Si WeasyPrint no está disponible o el PDF sale vacío
+        """
+        return cls._verificar_pdf_factura(factura, cls._html_a_pdf(cls._html_factura(factura)))
+    
+    @classmethod
+    def _html_factura(cls, factura) -> str:
+        """HTML del PDF de una factura (plantilla PLANTILLA_FACTURA)"""
+        # Obtener detalles de la factura
+        detalles = factura.detalles.all()
+        
+        # Obtener configuración del sistema
+        from ..models import ConfiguracionSistema
+        configuracion = ConfiguracionSistema.objects.first()
+        
+        # Preparar contexto para el template
+        context = {
+            'factura': factura,
+            'detalles': detalles,
+            'fecha_actual': datetime.now().strftime('%d/%m/%Y %H:%M'),
+            'logo_empresa': cls._obtener_logo_empresa(),
+            'configuracion': configuracion,
+            'codigo_qr': cls._generar_codigo_qr(factura),
+        }
+        
+        # Renderizar template HTML
+        return render_to_string(cls.PLANTILLA_FACTURA, context)
+    
+    @classmethod
+    def _verificar_pdf_factura(cls, factura, pdf_file: bytes) -> bytes:
+        # Verificar que el PDF se generó correctamente
+        if not pdf_file or len(pdf_file) < 1000:  # PDF mínimo de 1KB
+            logger.error(f"PDF generado es muy pequeño o vacío para factura {factura.folio}")
+            raise RuntimeError("PDF generado está vacío o dañado")
+        
+        return pdf_file
+    
+    @classmethod
+    def generar_pdf_complemento_pago(cls, pago, request=None) -> HttpResponse:
+        """
+        Genera el PDF de un complemento de pago timbrado (desde la caché de PDF)
+        
+        Args:
+            pago: Instancia del modelo PagoFactura timbrada
+            request: Petición, para responder 304 si el navegador ya tiene el PDF
+            
+        Returns:
+            HttpResponse: PDF para mostrarse en el navegador
+        """
+        try:
+            nombre_archivo = f"complemento_pago_{pago.uuid}.pdf"
+            if not CachePDF.activo():
+                pdf_file = cls.renderizar_pdf_complemento_pago(pago)
+                response = HttpResponse(pdf_file, content_type='application/pdf')
+                response['Content-Disposition'] = f'inline; filename="{nombre_archivo}"'
+                return response
+            
+            return CachePDF.respuesta(
+                request, 'complemento_pago', pago.uuid, cls.PLANTILLA_COMPLEMENTO_PAGO,
+                lambda: cls.renderizar_pdf_complemento_pago(pago), nombre_archivo, adjunto=False
+            )
+            
+        except (queue.Full, TimeoutError) as e:
+            return cls._respuesta_pool_no_disponible(e)
+        except Exception as e:
+            logger.error(f"Error generando PDF de complemento de pago {pago.id}: {e}")
+            return HttpResponse(f"Error generando PDF: {str(e)}", status=500)
+    
+    @staticmethod
+    def _documentos_complemento(pago):
+        """Pagos que comparten el complemento timbrado (uno por factura relacionada)"""
+        if not pago.uuid:
+            return [pago]
+        return list(type(pago).objects.filter(uuid=pago.uuid).select_related('factura').order_by('factura_id'))
+    
+    @classmethod
+    def renderizar_pdf_complemento_pago(cls, pago) -> bytes:
+        """
+        Renderiza el PDF de un complemento de pago con WeasyPrint
+        
+        Args:
+            pago: Instancia del modelo PagoFactura timbrada
+            
+        Returns:
+            bytes: Contenido del PDF
+        """
+        import base64
+        xml_timbrado = base64.b64decode(pago.xml_timbrado).decode('utf-8')
+        
+        context = {
+            'pago': pago,
+            'factura': pago.factura,
+            'documentos': cls._documentos_complemento(pago),
+            'xml_timbrado': xml_timbrado,
+            'fecha_actual': datetime.now().strftime('%d/%m/%Y %H:%M'),
+        }
+        html_string = render_to_string(cls.PLANTILLA_COMPLEMENTO_PAGO, context)
+        
+        pdf_file = cls._html_a_pdf(html_string)
+        if not pdf_file:
+            raise RuntimeError("PDF generado está vacío o dañado")
+        return pdf_file
+    
+    @classmethod
+    def renderizar_facturas(cls, facturas: Iterable) -> Iterator[Tuple[Any, Optional[bytes], Optional[str]]]:
+        """
+        Renderiza varias facturas en paralelo en el pool de PDF
+        
+        El HTML de cada factura se arma aquí (consulta la base de datos) y se envía al pool sin
+        esperar el PDF; como máximo hay dos trabajos por proceso en vuelo, así que la memoria no
+        crece con el número de facturas. Las timbradas se leen de la caché de PDF o se guardan en ella.
+        
+        Args:
+            facturas: Facturas a renderizar (puede ser un .iterator())
+            
+        Returns:
+            Iterator: (factura, bytes del PDF o None, mensaje de error o None) en el orden recibido
+        """
+        usar_cache = CachePDF.activo()
+        version = CachePDF.version(cls.PLANTILLA_FACTURA) if usar_cache else None
+        ventana = PoolPDF.procesos() * 2 if PoolPDF.activo() else 1
+        pendientes = deque()
+        
+        def terminar(factura, futuro, guardar):
+            try:
+                pdf = cls._verificar_pdf_factura(factura, PoolPDF.resultado(futuro))
+                if guardar:
+                    CachePDF.obtener('factura', factura.uuid, cls.PLANTILLA_FACTURA, lambda: pdf, version)
+                return factura, pdf, None
+            except Exception as e:
+                logger.error(f"Error generando PDF de factura {factura.folio}: {e}")
+                return factura, None, str(e) or e.__class__.__name__
+        
+        for factura in facturas:
+            en_cache = usar_cache and factura.uuid and factura.estado_timbrado == 'TIMBRADO'
+            guardar = False
+            if en_cache and CachePDF.existe('factura', factura.uuid, cls.PLANTILLA_FACTURA, version):
+                futuro = Future()
+                with open(CachePDF.ruta('factura', factura.uuid, version), 'rb') as archivo:
+                    futuro.set_result(archivo.read())
+            else:
+                guardar = en_cache
+                try:
+                    futuro = cls._enviar_html(cls._html_factura(factura))
+                except Exception as e:
+                    futuro = Future()
+                    futuro.set_exception(e)
+            
+            pendientes.append((factura, futuro, guardar))
+            while len(pendientes) >= ventana:
+                yield terminar(*pendientes.popleft())
+        
+        while pendientes:
+            yield terminar(*pendientes.popleft())
+    
+    @classmethod
+    def _enviar_html(cls, html_string: str) -> Future:
+        """Envía un HTML al pool esperando lugar en la cola; sin pool lo renderiza aquí mismo"""
+        if not WEASYPRINT_AVAILABLE:
+            raise RuntimeError("PDF generation requires WeasyPrint to be installed")
+        if PoolPDF.activo():
+            return PoolPDF.enviar(html_string, bloquear=True)
+        futuro = Future()
+        try:
+            futuro.set_result(cls._html_a_pdf_local(html_string))
+        except Exception as e:
+            futuro.set_exception(e)
+        return futuro
+    
+    @classmethod
+    def _respuesta_pool_no_disponible(cls, error) -> HttpResponse:
+        """503 si la cola de PDF está llena, 504 si el renderizado excedió el tiempo límite"""
+        if isinstance(error, queue.Full):
+            logger.warning("Cola de renderizado de PDF llena")
+            response = HttpResponse("Hay muchos PDF en proceso, intente de nuevo en unos segundos", status=503)
+            response['Retry-After'] = '5'
+            return response
+        logger.error(f"Renderizado de PDF excedió el tiempo límite: {error}")
+        return HttpResponse("El PDF tardó demasiado en generarse", status=504)
+    
+    @classmethod
+    def _html_a_pdf(cls, html_string: str) -> bytes:
+        """Convierte el HTML renderizado en PDF en el pool de procesos (settings.PDF_POOL)"""
+        if not WEASYPRINT_AVAILABLE:
+            logger.warning("WeasyPrint no está disponible")
+            raise RuntimeError("PDF generation requires WeasyPrint to be installed")
+        
+        if PoolPDF.activo():
+            return PoolPDF.renderizar(html_string)
+        return cls._html_a_pdf_local(html_string)
+    
+    @classmethod
+    def _html_a_pdf_local(cls, html_string: str) -> bytes:
+        """Convierte el HTML renderizado en PDF con WeasyPrint en el proceso actual"""
+        if not WEASYPRINT_AVAILABLE:
+            logger.warning("WeasyPrint no está disponible")
+            raise RuntimeError("PDF generation requires WeasyPrint to be installed")
+        
+        # Configurar WeasyPrint
+        font_config = FontConfiguration()
+        
+        # Crear documento HTML con configuración mejorada
+        html_doc = HTML(
+            string=html_string,
+            base_url=settings.BASE_DIR,
+            encoding='utf-8'
+        )
+        
+        # Generar PDF con configuración optimizada
+        return html_doc.write_pdf(
+            font_config=font_config,
+            optimize_images=True,
+            jpeg_quality=95
+        )
+    
     @classmethod
     def _obtener_logo_empresa(cls) -> str:
         """Obtiene la ruta absoluta del logo de la empresa para WeasyPrint"""
@@ -573,6 +778,7 @@ class PDFService:
             context = {
                 'pago': pago,
                 'factura': pago.factura,
+                'documentos': cls._documentos_complemento(pago),
                 'xml_timbrado': xml_timbrado,
                 'fecha_actual': datetime.now().strftime('%d/%m/%Y %H:%M'),
                 'es_vista_previa': True,
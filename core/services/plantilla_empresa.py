@@ -0,0 +1,356 @@
+"""
+Alta de empresas a partir de una BD plantilla
+La plantilla tiene el esquema de los modelos actuales (con las migraciones en disco registradas
+como aplicadas) y los catálogos sembrados, y se guarda una por versión de esquema: un archivo
+SQLite en EMPRESAS_PLANTILLAS_DIR o una base PostgreSQL marcada como TEMPLATE. Una empresa nueva
+se crea clonándola (tiempo constante, sin copiar datos de otra empresa) y aplicando solo su
+configuración.
+"""
+
+import hashlib
+import logging
+import os
+import shutil
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from django.apps import apps
+from django.conf import settings
+from django.core.management.sql import emit_post_migrate_signal
+from django.db import connections, router
+from django.db.migrations.loader import MigrationLoader
+from django.db.migrations.recorder import MigrationRecorder
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# Cambiar al modificar lo que se siembra en la plantilla (obliga a reconstruirla)
+VERSION_DATOS = 1
+
+PASSWORD_SUPERVISOR_DEFAULT = 'Directivasbmj1*'
+
+IMPUESTOS_BASICOS = [
+    ('002', 'IVA Tasa 16%', '0.1600'),
+    ('002', 'IVA Tasa 0%', '0.0000'),
+]
+
+REGIMENES_FISCALES = [
+    ('601', 'General de Ley Personas Morales'),
+    ('603', 'Personas Morales con Fines no Lucrativos'),
+    ('605', 'Sueldos y Salarios e Ingresos Asimilados a Salarios'),
+    ('606', 'Arrendamiento'),
+    ('608', 'Demás ingresos'),
+    ('610', 'Residentes en el Extranjero sin Establecimiento Permanente en México'),
+    ('611', 'Ingresos por Dividendos (socios y accionistas)'),
+    ('612', 'Personas Físicas con Actividades Empresariales y Profesionales'),
+    ('615', 'Régimen de los ingresos por obtención de premios'),
+    ('616', 'Sin obligaciones fiscales'),
+    ('620', 'Sociedades Cooperativas de Producción que optan por diferir sus ingresos'),
+    ('621', 'Incorporación Fiscal'),
+    ('622', 'Actividades Agrícolas, Ganaderas, Silvícolas y Pesqueras'),
+    ('623', 'Opcional para Grupos de Sociedades'),
+    ('624', 'Coordinados'),
+    ('625', 'Régimen de las Actividades Empresariales con ingresos a través de Plataformas Tecnológicas'),
+    ('626', 'Régimen Simplificado de Confianza'),
+]
+
+
+class PlantillaEmpresa:
+    """Construcción de la BD plantilla y alta de empresas clonándola"""
+
+    PREFIJO = 'plantilla_empresa_'
+
+    @staticmethod
+    def _es_postgresql() -> bool:
+        return 'postgresql' in connections.databases['default']['ENGINE']
+
+    @staticmethod
+    def _migraciones_en_disco() -> List[tuple]:
+        loader = MigrationLoader(None, load=False)
+        loader.load_disk()
+        return sorted(loader.disk_migrations)
+
+    @classmethod
+    def version_esquema(cls) -> str:
+        """
+        Versión del esquema: huella de las migraciones en disco y de los datos sembrados
+
+        Returns:
+            str: 12 caracteres hexadecimales; cambia al agregar una migración
+        """
+        huella = hashlib.sha1(f'datos:{VERSION_DATOS}'.encode())
+        for app_label, nombre in cls._migraciones_en_disco():
+            huella.update(f'\n{app_label}.{nombre}'.encode())
+        return huella.hexdigest()[:12]
+
+    @classmethod
+    def directorio(cls) -> Path:
+        return Path(getattr(settings, 'EMPRESAS_PLANTILLAS_DIR', Path(settings.BASE_DIR) / 'plantillas_empresa'))
+
+    @classmethod
+    def nombre(cls, version: str = None) -> str:
+        """Nombre de la plantilla: archivo SQLite o base PostgreSQL"""
+        version = version or cls.version_esquema()
+        if cls._es_postgresql():
+            return f'{cls.PREFIJO}{version}'
+        return str(cls.directorio() / f'{cls.PREFIJO}{version}.sqlite3')
+
+    @classmethod
+    def existe(cls, version: str = None) -> bool:
+        nombre = cls.nombre(version)
+        if cls._es_postgresql():
+            return cls._existe_bd_postgresql(nombre)
+        return os.path.exists(nombre)
+
+    @staticmethod
+    def _existe_bd_postgresql(nombre: str) -> bool:
+        with connections['default'].cursor() as cursor:
+            cursor.execute('SELECT 1 FROM pg_database WHERE datname = %s', [nombre])
+            return cursor.fetchone() is not None
+
+    @staticmethod
+    def _registrar_alias(alias: str, nombre: str):
+        """Registra un alias temporal hacia la BD `nombre` con la configuración de 'default'"""
+        base = connections.databases['default']
+        config = dict(base, NAME=nombre, CONN_MAX_AGE=0, ATOMIC_REQUESTS=False)
+        config['OPTIONS'] = dict(base.get('OPTIONS', {}))
+        config['TEST'] = dict(base.get('TEST', {}))
+        if 'sqlite3' in base['ENGINE']:
+            # Sin WAL: la plantilla y la empresa en alta se copian/renombran como un solo archivo
+            config['OPTIONS']['pragmas'] = dict(config['OPTIONS'].get('pragmas', {}), journal_mode='DELETE')
+        connections.databases[alias] = config
+
+    @staticmethod
+    def _quitar_alias(alias: str):
+        if alias in connections.databases:
+            connections[alias].close()
+            del connections[alias]
+            del connections.databases[alias]
+
+    @classmethod
+    def construir(cls, forzar: bool = False) -> Dict[str, Any]:
+        """
+        Construye la plantilla de la versión de esquema actual (esquema y catálogos)
+
+        Se arma bajo un nombre temporal y solo al terminar toma el nombre definitivo, así una
+        plantilla a medias nunca se usa para crear empresas.
+
+        Args:
+            forzar: Reconstruir aunque ya exista
+
+        Returns:
+            Dict: version, nombre, construida (False si ya existía) y segundos
+        """
+        version = cls.version_esquema()
+        nombre = cls.nombre(version)
+        if not forzar and cls.existe(version):
+            return {'version': version, 'nombre': nombre, 'construida': False, 'segundos': 0.0}
+
+        inicio = time.perf_counter()
+        temporal = f'{nombre}.tmp{os.getpid()}' if not cls._es_postgresql() else f'{nombre}_tmp{os.getpid()}'
+        alias = f'_plantilla_{os.getpid()}'
+        if cls._es_postgresql():
+            cls._crear_bd_postgresql(temporal)
+        else:
+            cls.directorio().mkdir(parents=True, exist_ok=True)
+            if os.path.exists(temporal):
+                os.remove(temporal)
+
+        cls._registrar_alias(alias, temporal)
+        try:
+            cls._crear_esquema(alias)
+            cls._sembrar(alias)
+            if not cls._es_postgresql():
+                with connections[alias].cursor() as cursor:
+                    cursor.execute('VACUUM')
+        except Exception:
+            cls._quitar_alias(alias)
+            cls._eliminar(temporal)
+            raise
+        cls._quitar_alias(alias)
+
+        if cls._es_postgresql():
+            if forzar and cls.existe(version):
+                cls._eliminar(nombre)
+            with connections['default'].cursor() as cursor:
+                cursor.execute(f'ALTER DATABASE "{temporal}" RENAME TO "{nombre}"')
+                cursor.execute(f'ALTER DATABASE "{nombre}" WITH IS_TEMPLATE true')
+        else:
+            os.replace(temporal, nombre)
+
+        segundos = time.perf_counter() - inicio
+        logger.info(f"Plantilla de empresa {version} construida en {segundos:.1f}s ({nombre})")
+        return {'version': version, 'nombre': nombre, 'construida': True, 'segundos': segundos}
+
+    @classmethod
+    def _crear_esquema(cls, alias: str):
+        """
+        Crea las tablas desde los modelos y registra como aplicadas las migraciones en disco
+
+        Reproducir el historial de core desde cero no es posible (0001_initial ya crea el esquema
+        completo y las siguientes vuelven a crear sus tablas); así se crea el esquema como
+        `migrate --run-syncdb` y las migraciones futuras se aplican encima con migrate_empresas.
+        """
+        conexion = connections[alias]
+        with conexion.schema_editor() as editor:
+            for app_config in apps.get_app_configs():
+                for modelo in router.get_migratable_models(app_config, alias, include_auto_created=False):
+                    editor.create_model(modelo)
+
+        recorder = MigrationRecorder(conexion)
+        recorder.ensure_schema()
+        recorder.migration_qs.bulk_create([
+            recorder.Migration(app=app_label, name=nombre)
+            for app_label, nombre in cls._migraciones_en_disco()
+        ])
+        # Tipos de contenido y permisos, como al terminar migrate
+        emit_post_migrate_signal(0, False, alias)
+
+    @classmethod
+    def _sembrar(cls, alias: str):
+        """Catálogos y usuario supervisor comunes a todas las empresas"""
+        from core.models import Impuesto, RegimenFiscal, Usuario
+
+        Impuesto.objects.using(alias).bulk_create([
+            Impuesto(codigo=codigo, nombre=nombre, tasa=tasa, activo=True)
+            for codigo, nombre, tasa in IMPUESTOS_BASICOS
+        ])
+        RegimenFiscal.objects.using(alias).bulk_create([
+            RegimenFiscal(codigo=codigo, descripcion=descripcion, activo=True)
+            for codigo, descripcion in REGIMENES_FISCALES
+        ])
+        # El hash de la contraseña por defecto se calcula una sola vez, aquí
+        Usuario.objects.db_manager(alias).create_superuser(
+            username='supervisor',
+            email='supervisor@directiva.com',
+            password=PASSWORD_SUPERVISOR_DEFAULT,
+            first_name='SUPERVISOR',
+            last_name='SISTEMA',
+            nombre='SUPERVISOR SISTEMA',
+            puesto='Administrador',
+            is_admin=True,
+        )
+
+    @classmethod
+    def crear_empresa(
+        cls,
+        db_name: str,
+        razon_social: str,
+        rfc: str,
+        direccion: str = '',
+        telefono: str = '',
+        ciclo_actual: str = '',
+        password_supervisor: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """
+        Crea la BD de una empresa clonando la plantilla (la construye si falta)
+
+        Args:
+            db_name: Nombre de la BD (Empresa.db_name)
+            razon_social, rfc, direccion, telefono, ciclo_actual: Datos de ConfiguracionSistema
+            password_supervisor: Contraseña del usuario supervisor (por defecto la de siempre)
+
+        Returns:
+            Dict: db_name, nombre (archivo o base creada), version de la plantilla y segundos
+
+        Raises:
+            FileExistsError: Si la BD de la empresa ya existe
+        """
+        from .conexiones_empresa import ConexionesEmpresa
+
+        inicio = time.perf_counter()
+        plantilla = cls.construir()
+        config = ConexionesEmpresa.configuracion(db_name)
+        destino = config['NAME']
+        alias = f'_alta_{db_name}'
+
+        if cls._es_postgresql():
+            if cls._existe_bd_postgresql(destino):
+                raise FileExistsError(f'La base de datos {destino} ya existe')
+            with connections['default'].cursor() as cursor:
+                cursor.execute(f'CREATE DATABASE "{destino}" TEMPLATE "{plantilla["nombre"]}"')
+            temporal = destino
+        else:
+            if os.path.exists(destino):
+                raise FileExistsError(f'La base de datos {destino} ya existe')
+            temporal = f'{destino}.tmp{os.getpid()}'
+            shutil.copyfile(plantilla['nombre'], temporal)
+
+        cls._registrar_alias(alias, temporal)
+        try:
+            cls._configurar(alias, razon_social, rfc, direccion, telefono, ciclo_actual, password_supervisor)
+        except Exception:
+            cls._quitar_alias(alias)
+            cls._eliminar(temporal)
+            raise
+        cls._quitar_alias(alias)
+        if temporal != destino:
+            os.replace(temporal, destino)
+
+        segundos = time.perf_counter() - inicio
+        logger.info(f"Empresa {rfc} creada desde la plantilla {plantilla['version']} en {segundos:.2f}s")
+        return {'db_name': db_name, 'nombre': destino, 'version': plantilla['version'], 'segundos': segundos}
+
+    @staticmethod
+    def _configurar(alias, razon_social, rfc, direccion, telefono, ciclo_actual, password_supervisor):
+        """Datos propios de la empresa sobre la copia de la plantilla"""
+        from core.models import ConfiguracionSistema, Usuario
+
+        ConfiguracionSistema.objects.using(alias).create(
+            razon_social=razon_social,
+            rfc=rfc,
+            direccion=direccion or '',
+            telefono=telefono or '',
+            ciclo_actual=ciclo_actual or '',
+        )
+        supervisor = Usuario.objects.using(alias).get(username='supervisor')
+        supervisor.date_joined = timezone.now()
+        if password_supervisor:
+            supervisor.set_password(password_supervisor)
+        supervisor.save(using=alias, update_fields=['date_joined', 'password'])
+
+    @classmethod
+    def eliminar_empresa(cls, db_name: str):
+        """Elimina la BD de una empresa (por ejemplo si su alta no se pudo completar)"""
+        from .conexiones_empresa import ConexionesEmpresa
+
+        cls._eliminar(ConexionesEmpresa.configuracion(db_name)['NAME'])
+
+    @classmethod
+    def _eliminar(cls, nombre: str):
+        if cls._es_postgresql():
+            with connections['default'].cursor() as cursor:
+                cursor.execute(f'ALTER DATABASE "{nombre}" WITH IS_TEMPLATE false')
+                cursor.execute(f'DROP DATABASE IF EXISTS "{nombre}"')
+        elif os.path.exists(nombre):
+            os.remove(nombre)
+
+    @staticmethod
+    def _crear_bd_postgresql(nombre: str):
+        with connections['default'].cursor() as cursor:
+            cursor.execute(f'DROP DATABASE IF EXISTS "{nombre}"')
+            cursor.execute(f'CREATE DATABASE "{nombre}"')
+
+    @classmethod
+    def plantillas(cls) -> List[str]:
+        """Plantillas existentes (de cualquier versión)"""
+        if cls._es_postgresql():
+            with connections['default'].cursor() as cursor:
+                cursor.execute(
+                    "SELECT datname FROM pg_database WHERE datname LIKE %s ORDER BY datname",
+                    [f'{cls.PREFIJO}%'],
+                )
+                return [fila[0] for fila in cursor.fetchall()]
+        if not cls.directorio().exists():
+            return []
+        return sorted(str(ruta) for ruta in cls.directorio().glob(f'{cls.PREFIJO}*.sqlite3'))
+
+    @classmethod
+    def limpiar(cls) -> List[str]:
+        """Elimina las plantillas de versiones de esquema anteriores; devuelve cuáles"""
+        actual = cls.nombre()
+        eliminadas = [nombre for nombre in cls.plantillas() if nombre != actual]
+        for nombre in eliminadas:
+            cls._eliminar(nombre)
+        return eliminadas
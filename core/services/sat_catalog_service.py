@@ -6,12 +6,15 @@ from django.conf import settings
 from django.core.cache import cache
 from django.utils import timezone
 
+from .catalogo_sat_local import CatalogoSATLocal
+
 logger = logging.getLogger(__name__)
 
 class SATCatalogService:
     """
     Servicio para la gestión de catálogos SAT.
     Incluye descarga, actualización y validación de catálogos.
+    Las consultas usan primero el almacén local (CatalogoSATLocal, comando cargar_catalogos_sat).
     """
     
     # URLs base de los catálogos SAT
@@ -56,8 +59,15 @@ class SATCatalogService:
         'tipos-percepciones-otras': 'c_TipoPercepcionOtra',
         'tipos-deducciones-otras-nomina': 'c_TipoDeduccionOtraNomina',
         'tipos-percepciones-otras-nomina': 'c_TipoPercepcionOtraNomina',
+        'productos-servicios': 'c_ClaveProdServ',
+        'claves-unidad': 'c_ClaveUnidad',
     }
     
+    @classmethod
+    def nombre_sat(cls, nombre_catalogo: str) -> str:
+        """Nombre SAT del catálogo ('usos-cfdi' -> 'c_UsoCFDI'); acepta también el nombre SAT"""
+        return cls.CATALOG_FILES.get(nombre_catalogo, nombre_catalogo)
+    
     @staticmethod
     def obtener_catalogo(nombre_catalogo: str, usar_cache: bool = True) -> dict:
         """
@@ -156,8 +166,13 @@ class SATCatalogService:
     def validar_codigo_en_catalogo(nombre_catalogo: str, codigo: str) -> bool:
         """
         Valida si un código existe en un catálogo específico.
+        Con el catálogo en el almacén local la validación es una búsqueda en un conjunto, sin red.
         """
         try:
+            existe = CatalogoSATLocal.existe(SATCatalogService.nombre_sat(nombre_catalogo), codigo)
+            if existe is not None:
+                return existe
+            
             catalogo = SATCatalogService.obtener_catalogo(nombre_catalogo)
             
             for registro in catalogo['registros']:
@@ -176,6 +191,11 @@ class SATCatalogService:
         Obtiene la descripción de un código en un catálogo específico.
         """
         try:
+            nombre_sat = SATCatalogService.nombre_sat(nombre_catalogo)
+            if CatalogoSATLocal.disponible(nombre_sat):
+                registro = CatalogoSATLocal.obtener(nombre_sat, codigo)
+                return registro['descripcion'] if registro else ""
+            
             catalogo = SATCatalogService.obtener_catalogo(nombre_catalogo)
             
             for registro in catalogo['registros']:
@@ -205,6 +225,7 @@ class SATCatalogService:
             'catalogos_en_cache': 0,
             'catalogos_actualizados': 0,
             'catalogos_desactualizados': 0,
+            'almacen_local': CatalogoSATLocal.metadatos(),
             'detalle': {}
         }
         
@@ -259,36 +280,34 @@ class SATCatalogService:
         """
         Obtiene el catálogo de usos CFDI con formato para templates.
         
+        Se lee del almacén local de catálogos (sin red); si c_UsoCFDI no se ha cargado se usa
+        el catálogo incluido en el código.
+        
         Returns:
             dict: Lista de usos CFDI con código y descripción
         """
         try:
-            # Intentar obtener desde el SAT primero
-            catalogo = cls.obtener_catalogo('usos-cfdi', usar_cache)
-            
-            if catalogo['exito']:
-                usos_cfdi = []
-                for item in catalogo['items']:
-                    usos_cfdi.append({
-                        'codigo': item['codigo'],
-                        'descripcion': item['descripcion'],
-                        'texto_completo': f"{item['codigo']} - {item['descripcion']}"
-                    })
-                
-                return {
-                    'exito': True,
-                    'usos_cfdi': usos_cfdi,
-                    'total': len(usos_cfdi)
-                }
-            else:
-                # Si falla la descarga del SAT, usar catálogo hardcodeado
-                logger.warning("No se pudo obtener catálogo del SAT, usando catálogo local")
-                return cls._obtener_usos_cfdi_local()
-            
+            registros = CatalogoSATLocal.listar(cls.nombre_sat('usos-cfdi'))
         except Exception as e:
-            logger.error(f"Error obteniendo usos CFDI: {e}")
-            # Fallback a catálogo local
+            logger.error(f"Error leyendo usos CFDI del almacén local: {e}")
+            registros = []
+        
+        if not registros:
             return cls._obtener_usos_cfdi_local()
+        
+        usos_cfdi = [
+            {
+                'codigo': registro['codigo'],
+                'descripcion': registro['descripcion'],
+                'texto_completo': f"{registro['codigo']} - {registro['descripcion']}"
+            }
+            for registro in registros
+        ]
+        return {
+            'exito': True,
+            'usos_cfdi': usos_cfdi,
+            'total': len(usos_cfdi)
+        }
     
     @classmethod
     def _obtener_usos_cfdi_local(cls) -> dict:
@@ -0,0 +1,169 @@
+"""
+Timbrado de facturas en lote
+Valida y genera todos los XML primero, los envía al PAC con concurrencia limitada y
+guarda el resultado de cada factura en cuanto el PAC responde
+"""
+
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Any, List, Callable, Optional
+from django.conf import settings
+from django.db import connections
+
+from directiva_agricola.db_router import get_current_company_db, set_current_company_db
+from directiva_agricola.transacciones import atomic_escritura
+from ..factura_models import CAMPOS_DOCUMENTO, Factura, FacturaDocumento
+from .facturacion_service import FacturacionService
+
+logger = logging.getLogger(__name__)
+
+
+class TimbradoLoteService:
+    """Servicio de timbrado de varias facturas con un límite de peticiones simultáneas al PAC"""
+
+    PARALELISMO_DEFAULT = 4
+
+    @classmethod
+    def timbrar_lote(cls, folios: List[int], paralelismo: int = None,
+                     progreso: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+        """
+        Timbra las facturas indicadas
+
+        1. Preparación (secuencial): valida cada factura y genera su XML sellado.
+        2. PAC (concurrente): hasta `paralelismo` peticiones simultáneas, sin transacción abierta.
+        3. Escritura: el resultado de cada factura se guarda (transacción corta) en cuanto llega,
+           para que un proceso interrumpido no deje CFDI timbrados sin registrar.
+
+        Args:
+            folios: Folios de las facturas a timbrar
+            paralelismo: Peticiones simultáneas al PAC (por defecto settings.TIMBRADO_LOTE_PARALELISMO)
+            progreso: Función que recibe el resultado de cada factura conforme termina
+
+        Returns:
+            Dict: resultados por factura (en el orden de los folios), totales y facturas por segundo
+        """
+        inicio = time.perf_counter()
+        paralelismo = max(1, paralelismo or getattr(settings, 'TIMBRADO_LOTE_PARALELISMO', cls.PARALELISMO_DEFAULT))
+        folios = list(dict.fromkeys(folios))
+
+        resultados: Dict[int, Dict[str, Any]] = {}
+
+        def registrar(folio, resultado, etapa):
+            resultados[folio] = cls._resultado_factura(folio, resultado, etapa)
+            if progreso:
+                progreso(resultados[folio])
+
+        # 1. Validar y generar todos los XML antes de llamar al PAC
+        facturas = Factura.objects.select_related('emisor', 'documento').in_bulk(folios)
+        preparados = []
+        for folio in folios:
+            factura = facturas.get(folio)
+            if factura is None:
+                registrar(folio, {
+                    'exito': False,
+                    'error': 'Factura no encontrada',
+                    'codigo_error': 'FACTURA_NOT_FOUND'
+                }, 'preparacion')
+                continue
+            try:
+                preparacion = FacturacionService.preparar_timbrado(factura)
+            except Exception as e:
+                logger.error(f"Error preparando factura {folio} para timbrado: {e}")
+                preparacion = {'exito': False, 'error': f'Error inesperado: {str(e)}', 'codigo_error': 'UNEXPECTED_ERROR'}
+            if preparacion['exito']:
+                preparados.append((factura, preparacion))
+            else:
+                registrar(folio, preparacion, 'preparacion')
+
+        # 2. Timbrar con el PAC en paralelo; 3. guardar cada resultado al recibirlo
+        if preparados:
+            alias = get_current_company_db()
+            with ThreadPoolExecutor(max_workers=min(paralelismo, len(preparados))) as ejecutor:
+                futuros = {
+                    ejecutor.submit(cls._timbrar_en_hilo, alias, factura, preparacion): (factura, preparacion)
+                    for factura, preparacion in preparados
+                }
+                for futuro in as_completed(futuros):
+                    factura, preparacion = futuros[futuro]
+                    pac_result = futuro.result()
+                    cls._aplicar_resultado(factura, preparacion['xml'], pac_result)
+                    registrar(factura.folio, pac_result, 'pac')
+
+        duracion = time.perf_counter() - inicio
+        exitosos = sum(1 for r in resultados.values() if r['exito'])
+        logger.info(f"Lote de timbrado: {exitosos}/{len(folios)} facturas timbradas en {duracion:.1f}s")
+
+        return {
+            'resultados': [resultados[folio] for folio in folios],
+            'total': len(folios),
+            'exitosos': exitosos,
+            'fallidos': len(folios) - exitosos,
+            'duracion': duracion,
+            'facturas_por_segundo': len(folios) / duracion if duracion else 0.0,
+            'paralelismo': paralelismo,
+        }
+
+    @staticmethod
+    def _timbrar_en_hilo(alias, factura, preparacion) -> Dict[str, Any]:
+        """Llamada al PAC desde un hilo del pool (la base de la empresa es local al hilo)"""
+        set_current_company_db(alias)
+        try:
+            return FacturacionService._timbrar_con_pac(
+                factura, preparacion.get('documento') or preparacion['xml'], preparacion['configuracion']
+            )
+        finally:
+            connections.close_all()
+
+    @classmethod
+    def _aplicar_resultado(cls, factura, xml_original, pac_result):
+        """Asigna el resultado del PAC a la factura y lo guarda en una transacción corta"""
+        if pac_result['exito']:
+            try:
+                FacturacionService._asignar_datos_timbrado(factura, xml_original, pac_result)
+                FacturacionService._guardar_archivos_xml(factura)
+                cls._guardar_timbrado(factura)
+                return
+            except Exception as e:
+                logger.error(f"Error aplicando timbrado de factura {factura.folio}: {e}")
+                pac_result.update({
+                    'exito': False,
+                    'error': f'Timbrada por el PAC pero no se pudo guardar: {str(e)}',
+                    'codigo_error': 'APPLY_RESULT_ERROR'
+                })
+                # Conservar el XML timbrado para poder recuperarlo manualmente
+                factura.xml_timbrado = pac_result.get('xml_timbrado')
+        FacturacionService._asignar_error_timbrado(factura, pac_result)
+        try:
+            cls._guardar_timbrado(factura)
+        except Exception as e:
+            # No interrumpir el lote: las demás facturas se siguen guardando
+            logger.error(f"Error guardando resultado de timbrado de factura {factura.folio}: {e}")
+
+    @staticmethod
+    def _guardar_timbrado(factura):
+        """Guarda los campos del timbrado de la factura y de su documento"""
+        campos = FacturacionService.CAMPOS_TIMBRADO
+        with atomic_escritura():
+            Factura.objects.bulk_update([factura], [campo for campo in campos if campo not in CAMPOS_DOCUMENTO])
+            FacturaDocumento.guardar_de_facturas([factura], [campo for campo in campos if campo in CAMPOS_DOCUMENTO])
+
+    @staticmethod
+    def _resultado_factura(folio: int, resultado: Dict[str, Any], etapa: str) -> Dict[str, Any]:
+        """Resultado resumido de una factura para el reporte del lote"""
+        if resultado.get('exito'):
+            return {
+                'folio': folio,
+                'exito': True,
+                'uuid': resultado.get('uuid', ''),
+                'fecha_timbrado': resultado.get('fecha_timbrado', ''),
+                'etapa': etapa,
+            }
+        return {
+            'folio': folio,
+            'exito': False,
+            'error': resultado.get('error', 'Error desconocido al timbrar'),
+            'codigo_error': resultado.get('codigo_error', 'UNKNOWN_ERROR'),
+            'detalles': resultado.get('detalles', []) or [],
+            'etapa': etapa,
+        }
@@ -1,10 +1,11 @@
 import logging
-import requests
 import xml.etree.ElementTree as ET
-from typing import Dict, Any
+from typing import Dict, Any, Union
 from cryptography.hazmat.primitives import serialization
 from .configuracion_entorno import ConfiguracionEntornoService
 from .certificado_service import CertificadoService
+from .documento_cfdi import DocumentoCFDI
+from .pac_sesiones import PoolSesionesPAC
 
 logger = logging.getLogger(__name__)
 
@@ -31,24 +32,32 @@ class TimbradoService:
         logger.info(f"Usuario PAC: {self.credenciales.get('usuario', 'N/A')}")
         logger.info(f"Contrato PAC: {self.credenciales.get('contrato', 'N/A')}")
     
-    def timbrar_cfdi(self, xml_cfdi: str) -> Dict[str, Any]:
+    def timbrar_cfdi(self, xml_cfdi: Union[str, DocumentoCFDI]) -> Dict[str, Any]:
         """
         Timbra un CFDI usando el servicio SOAP de Prodigia
         
         Args:
-            xml_cfdi: XML del CFDI a timbrar
+            xml_cfdi: XML del CFDI a timbrar, o el DocumentoCFDI construido con el motor lxml
             
         Returns:
             Dict: Resultado del timbrado
         """
+        documento = xml_cfdi if isinstance(xml_cfdi, DocumentoCFDI) else None
+        if documento is not None:
+            xml_cfdi = documento.xml
+        
         try:
             # Verificar si estamos en modo simulación
             if 'localhost' in self.url_base or 'simulacion' in self.url_base:
                 logger.info("Modo simulación activado - generando timbrado simulado")
                 return self._simular_timbrado(xml_cfdi)
             
-            # Generar sello digital si tenemos emisor con certificados
-            xml_con_sello = self._firmar_xml_cfdi(xml_cfdi)
+            # Generar sello digital si tenemos emisor con certificados. Un DocumentoCFDI ya
+            # sellado se selló desde su propio árbol: no hace falta volver a parsearlo.
+            if documento is not None and documento.sellado:
+                xml_con_sello = xml_cfdi
+            else:
+                xml_con_sello = self._firmar_xml_cfdi(xml_cfdi)
             
             # Construir SOAP envelope
             soap_envelope = self._construir_soap_envelope(xml_con_sello)
@@ -66,7 +75,7 @@ class TimbradoService:
             logger.debug(f"SOAP Envelope: {soap_envelope}")
             
             # Realizar petición SOAP
-            response = requests.post(
+            response = PoolSesionesPAC.post(
                 endpoint,
                 data=soap_envelope,
                 headers=headers,
@@ -262,20 +271,21 @@ class TimbradoService:
                 if xml_base64_elem is not None and xml_base64_elem.text:
                     # Decodificar el XML desde Base64
                     import base64
-                    xml_timbrado = base64.b64decode(xml_base64_elem.text).decode('utf-8')
+                    xml_bytes = base64.b64decode(xml_base64_elem.text)
+                    xml_timbrado = xml_bytes.decode('utf-8')
                     
-                    # Extraer datos del timbre
-                    from .xml_builder import XMLCFDIBuilder
-                    timbre_data = XMLCFDIBuilder.extraer_timbre_fiscal(xml_timbrado)
+                    # Parsear una sola vez: timbre, QR y cadena original salen del mismo árbol
+                    documento_timbrado = DocumentoCFDI.desde_xml(xml_bytes)
+                    timbre_data = documento_timbrado.timbre()
                     
                     if timbre_data['valido']:
                         logger.info(f"Timbrado exitoso - UUID: {timbre_data['uuid']}")
                         
                         # Generar código QR
-                        qr_base64 = self._generar_codigo_qr_complemento_pago(xml_timbrado)
+                        qr_base64 = self._generar_codigo_qr_complemento_pago(documento_timbrado.raiz)
                         
                         # Extraer cadena original del SAT
-                        cadena_original_sat = self._extraer_cadena_original_sat(xml_timbrado)
+                        cadena_original_sat = self._extraer_cadena_original_sat(documento_timbrado.raiz)
                         
                         return {
                             'exito': True,
@@ -290,6 +300,7 @@ class TimbradoService:
                             'version': timbre_data.get('version', '1.1'),
                             'qr_base64': qr_base64,
                             'cadena_original_sat': cadena_original_sat,
+                            'documento_timbrado': documento_timbrado,
                             'xml_respuesta': xml_respuesta
                         }
                     else:
@@ -495,7 +506,7 @@ class TimbradoService:
             for ep in endpoints_posibles:
                 try:
                     logger.info(f"Probando endpoint: {ep}")
-                    test_response = requests.get(ep, timeout=10)
+                    test_response = PoolSesionesPAC.get(ep, timeout=10)
                     logger.info(f"Endpoint {ep}: Status {test_response.status_code}")
                     if test_response.status_code == 200:
                         endpoints_disponibles.append(ep)
@@ -612,12 +623,12 @@ class TimbradoService:
                 'codigo_error': 'SIMULATION_ERROR'
             }
     
-    def _generar_codigo_qr_complemento_pago(self, xml_timbrado: str) -> str:
+    def _generar_codigo_qr_complemento_pago(self, xml_timbrado) -> str:
         """
         Genera el código QR para el complemento de pago
         
         Args:
-            xml_timbrado: XML timbrado del complemento de pago
+            xml_timbrado: XML timbrado del complemento de pago, o su árbol ya parseado
             
         Returns:
             str: Código QR en Base64
@@ -629,7 +640,7 @@ class TimbradoService:
             from io import BytesIO
             
             # Parsear el XML para extraer datos
-            root = ET.fromstring(xml_timbrado)
+            root = ET.fromstring(xml_timbrado) if isinstance(xml_timbrado, (str, bytes)) else xml_timbrado
             
             # Extraer datos necesarios para el QR
             uuid = root.get('UUID', '')
@@ -666,12 +677,12 @@ class TimbradoService:
             logger.error(f"Error generando código QR para complemento de pago: {e}")
             return ""
     
-    def _extraer_cadena_original_sat(self, xml_timbrado: str) -> str:
+    def _extraer_cadena_original_sat(self, xml_timbrado) -> str:
         """
         Extrae la cadena original del complemento SAT del XML timbrado
         
         Args:
-            xml_timbrado: XML timbrado del complemento de pago
+            xml_timbrado: XML timbrado del complemento de pago, o su árbol ya parseado
             
         Returns:
             str: Cadena original del SAT
@@ -679,7 +690,7 @@ class TimbradoService:
         try:
             import xml.etree.ElementTree as ET
             
-            root = ET.fromstring(xml_timbrado)
+            root = ET.fromstring(xml_timbrado) if isinstance(xml_timbrado, (str, bytes)) else xml_timbrado
             
             # Buscar el complemento de timbre fiscal
             complemento = root.find('.//{http://www.sat.gob.mx/cfd/4}Complemento')
@@ -9,6 +9,11 @@ from decimal import Decimal
 from typing import Dict, List, Any, Optional
 import logging
 
+from django.conf import settings
+from lxml import etree
+
+from .cadena_original import CadenaOriginal
+
 logger = logging.getLogger(__name__)
 
 
@@ -48,18 +53,48 @@ class XMLCFDIBuilder:
         Returns:
             str: XML del CFDI como string
         """
-        try:
-            # Crear elemento raíz
-            root = ET.Element('cfdi:Comprobante')
-            root.set('xmlns:cfdi', cls.NAMESPACES['cfdi'])
-            root.set('xmlns:tfd', cls.NAMESPACES['tfd'])
-            root.set('xmlns:xsi', cls.NAMESPACES['xsi'])
+        return cls.serializar_xml(cls.construir_arbol_cfdi(factura, detalles, certificado_data, sello))
+    
+    @classmethod
+    def motor(cls) -> str:
+        """Motor configurado para construir el XML: 'lxml' o 'etree'"""
+        return getattr(settings, 'CFDI_XML_MOTOR', 'etree')
+    
+    @classmethod
+    def construir_arbol_cfdi(cls, factura, detalles, certificado_data: Dict[str, Any], sello: str = '',
+                             motor: Optional[str] = None):
+        """
+        Construye el árbol del CFDI 4.0 sin serializarlo
+        
+        La cadena original se obtiene de este mismo árbol (CadenaOriginal.generar), de modo
+        que el sello siempre corresponde exactamente al XML que se envía.
+        
+        Args:
+            factura: Instancia del modelo Factura
+            detalles: Lista de instancias de FacturaDetalle
+            certificado_data: Datos del certificado
+            sello: Sello digital (vacío si aún no se genera)
+            motor: 'lxml' o 'etree' (por defecto settings.CFDI_XML_MOTOR)
             
+        Returns:
+            Elemento cfdi:Comprobante (lxml o ElementTree según el motor)
+        """
+        try:
             # Schema locations
             schema_locations = []
             for ns, location in cls.SCHEMA_LOCATIONS.items():
                 schema_locations.append(f"{ns} {location}")
-            root.set('xsi:schemaLocation', ' '.join(schema_locations))
+            
+            # Crear elemento raíz
+            if (motor or cls.motor()) == 'lxml':
+                root = etree.Element(f"{{{cls.NAMESPACES['cfdi']}}}Comprobante", nsmap=cls.NAMESPACES)
+                root.set(f"{{{cls.NAMESPACES['xsi']}}}schemaLocation", ' '.join(schema_locations))
+            else:
+                root = ET.Element('cfdi:Comprobante')
+                root.set('xmlns:cfdi', cls.NAMESPACES['cfdi'])
+                root.set('xmlns:tfd', cls.NAMESPACES['tfd'])
+                root.set('xmlns:xsi', cls.NAMESPACES['xsi'])
+                root.set('xsi:schemaLocation', ' '.join(schema_locations))
             
             # Atributos del comprobante
             cls._agregar_atributos_comprobante(root, factura, certificado_data, sello)
@@ -87,18 +122,32 @@ class XMLCFDIBuilder:
             # Complementos (si aplican)
             cls._agregar_complementos(root, factura)
             
-            # Convertir a string
-            xml_string = ET.tostring(root, encoding='unicode', xml_declaration=True)
-            
-            # Formatear XML
-            xml_formateado = cls._formatear_xml(xml_string)
-            
-            return xml_formateado
+            return root
             
         except Exception as e:
             logger.error(f"Error construyendo XML CFDI: {e}")
             raise
     
+    @classmethod
+    def serializar_xml(cls, root) -> str:
+        """
+        Convierte el árbol del comprobante en XML
+        
+        Los árboles lxml se serializan una sola vez, sin indentar; los de ElementTree
+        se formatean con minidom como hasta ahora.
+        """
+        if not isinstance(root, ET.Element):
+            return etree.tostring(root, xml_declaration=True, encoding='UTF-8').decode('utf-8')
+        xml_string = ET.tostring(root, encoding='unicode', xml_declaration=True)
+        return cls._formatear_xml(xml_string)
+    
+    @classmethod
+    def _subelemento(cls, padre, nombre: str):
+        """Agrega el hijo cfdi:<nombre> con el mismo motor (ElementTree o lxml) que el padre"""
+        if isinstance(padre, ET.Element):
+            return ET.SubElement(padre, f'cfdi:{nombre}')
+        return etree.SubElement(padre, f"{{{cls.NAMESPACES['cfdi']}}}{nombre}")
+    
     @classmethod
     def _agregar_atributos_comprobante(cls, root, factura, certificado_data: Dict[str, Any], sello: str):
         """
@@ -166,7 +215,7 @@ class XMLCFDIBuilder:
     @classmethod
     def _agregar_emisor(cls, root, emisor):
         """Agrega el elemento Emisor"""
-        emisor_elem = ET.SubElement(root, 'cfdi:Emisor')
+        emisor_elem = cls._subelemento(root, 'Emisor')
         emisor_elem.set('Rfc', emisor.rfc)
         emisor_elem.set('Nombre', emisor.razon_social)
         emisor_elem.set('RegimenFiscal', emisor.regimen_fiscal)
@@ -174,7 +223,7 @@ class XMLCFDIBuilder:
     @classmethod
     def _agregar_receptor(cls, root, receptor, uso_cfdi: str):
         """Agrega el elemento Receptor"""
-        receptor_elem = ET.SubElement(root, 'cfdi:Receptor')
+        receptor_elem = cls._subelemento(root, 'Receptor')
         receptor_elem.set('Rfc', receptor.rfc)
         receptor_elem.set('Nombre', receptor.razon_social)
         receptor_elem.set('DomicilioFiscalReceptor', receptor.codigo_postal)
@@ -187,10 +236,10 @@ class XMLCFDIBuilder:
         Agrega el elemento Conceptos según Anexo 20 RMF 2022.
         Usa nombres exactos de atributos del estándar oficial.
         """
-        conceptos_elem = ET.SubElement(root, 'cfdi:Conceptos')
+        conceptos_elem = cls._subelemento(root, 'Conceptos')
         
         for detalle in detalles:
-            concepto_elem = ET.SubElement(conceptos_elem, 'cfdi:Concepto')
+            concepto_elem = cls._subelemento(conceptos_elem, 'Concepto')
             
             # Atributos requeridos según Anexo 20
             concepto_elem.set('ClaveProdServ', detalle.clave_prod_serv)
@@ -220,16 +269,16 @@ class XMLCFDIBuilder:
         Agrega impuestos al concepto según Anexo 20 RMF 2022.
         Siempre incluye el nodo de impuestos para objetos del impuesto.
         """
-        impuestos_elem = ET.SubElement(concepto_elem, 'cfdi:Impuestos')
+        impuestos_elem = cls._subelemento(concepto_elem, 'Impuestos')
         
         # Traslados del concepto
-        traslados_elem = ET.SubElement(impuestos_elem, 'cfdi:Traslados')
+        traslados_elem = cls._subelemento(impuestos_elem, 'Traslados')
         
         # Obtener la tasa correcta del producto
         from core.utils.tax_utils import obtener_tasa_impuesto_xml
         tasa_impuesto = obtener_tasa_impuesto_xml(detalle.producto_servicio.impuesto)
         
-        traslado_elem = ET.SubElement(traslados_elem, 'cfdi:Traslado')
+        traslado_elem = cls._subelemento(traslados_elem, 'Traslado')
         traslado_elem.set('Base', f"{detalle.importe:.2f}")
         traslado_elem.set('Impuesto', '002')  # IVA
         traslado_elem.set('TipoFactor', 'Tasa')
@@ -248,7 +297,7 @@ class XMLCFDIBuilder:
         if not conceptos_con_impuesto:
             return
         
-        impuestos_elem = ET.SubElement(root, 'cfdi:Impuestos')
+        impuestos_elem = cls._subelemento(root, 'Impuestos')
         
         # Calcular totales de impuestos
         total_traslados = sum(detalle.impuesto_concepto for detalle in conceptos_con_impuesto)
@@ -262,7 +311,7 @@ class XMLCFDIBuilder:
             impuestos_elem.set('TotalImpuestosRetenidos', f"{total_retenciones:.2f}")
         
         # Traslados - siempre incluir cuando hay conceptos con objeto de impuesto
-        traslados_elem = ET.SubElement(impuestos_elem, 'cfdi:Traslados')
+        traslados_elem = cls._subelemento(impuestos_elem, 'Traslados')
         
         # Agrupar por tasa de impuesto para crear traslados separados
         from collections import defaultdict
@@ -277,7 +326,7 @@ class XMLCFDIBuilder:
         
         # Crear traslados para cada tasa
         for tasa, datos in impuestos_por_tasa.items():
-            traslado_elem = ET.SubElement(traslados_elem, 'cfdi:Traslado')
+            traslado_elem = cls._subelemento(traslados_elem, 'Traslado')
             traslado_elem.set('Base', f"{datos['base']:.2f}")
             traslado_elem.set('Impuesto', '002')  # IVA
             traslado_elem.set('TipoFactor', 'Tasa')
@@ -286,7 +335,7 @@ class XMLCFDIBuilder:
         
         # Retenciones (si aplican)
         if total_retenciones > 0:
-            retenciones_elem = ET.SubElement(impuestos_elem, 'cfdi:Retenciones')
+            retenciones_elem = cls._subelemento(impuestos_elem, 'Retenciones')
             # Aquí se agregarían las retenciones si las hubiera
     
     @classmethod
@@ -304,7 +353,7 @@ class XMLCFDIBuilder:
         """
         try:
             # Crear elemento Información Global directamente en el Comprobante
-            info_global = ET.SubElement(root, 'cfdi:InformacionGlobal')
+            info_global = cls._subelemento(root, 'InformacionGlobal')
             
             # Atributos requeridos según Anexo 20
             # Usar valores de la factura si están disponibles, sino valores por defecto
@@ -334,40 +383,21 @@ class XMLCFDIBuilder:
             return xml_string
     
     @classmethod
-    def generar_cadena_original_desde_modelos(cls, factura, detalles) -> str:
+    def generar_cadena_original_desde_modelos(cls, factura, detalles, certificado_data: Dict[str, Any] = None) -> str:
         """
         Genera la cadena original del CFDI para el sellado desde los modelos
         
         Args:
             factura: Instancia del modelo Factura
             detalles: Lista de instancias de FacturaDetalle
+            certificado_data: Datos del certificado (NoCertificado forma parte de la cadena)
             
         Returns:
             str: Cadena original
         """
         try:
-            # Crear estructura para la cadena original
-            cadena_parts = []
-            
-            # Datos del comprobante
-            cadena_parts.append(f"||4.0|{factura.serie}|{factura.folio}|{factura.fecha_emision.strftime('%Y-%m-%dT%H:%M:%S')}|{factura.exportacion}|{factura.moneda}|{factura.tipo_cambio:.4f}|{factura.total:.2f}|I|{factura.metodo_pago}|{factura.lugar_expedicion}|")
-            
-            # Datos del emisor
-            cadena_parts.append(f"|{factura.emisor.rfc}|{factura.emisor.razon_social}|{factura.emisor.regimen_fiscal}|")
-            
-            # Datos del receptor
-            cadena_parts.append(f"|{factura.receptor.rfc}|{factura.receptor.razon_social}|{factura.receptor.codigo_postal}|{factura.receptor.regimen_fiscal.codigo}|{factura.uso_cfdi}|")
-            
-            # Conceptos
-            for detalle in detalles:
-                cadena_parts.append(f"|{detalle.clave_prod_serv}|{detalle.no_identificacion}|{detalle.cantidad:.2f}|{detalle.unidad}|{detalle.concepto}|{detalle.precio:.2f}|{detalle.importe:.2f}|{detalle.objeto_impuesto}|")
-            
-            # Impuestos
-            if factura.impuesto > 0:
-                iva_base = sum(detalle.importe for detalle in detalles if detalle.objeto_impuesto == '02')
-                cadena_parts.append(f"|{iva_base:.2f}|002|Tasa|0.160000|{factura.impuesto:.2f}|")
-            
-            return ''.join(cadena_parts)
+            certificado_data = certificado_data or {'no_certificado': '', 'certificado_base64': ''}
+            return CadenaOriginal.generar(cls.construir_arbol_cfdi(factura, detalles, certificado_data))
             
         except Exception as e:
             logger.error(f"Error generando cadena original: {e}")
@@ -385,64 +415,7 @@ class XMLCFDIBuilder:
             str: Cadena original
         """
         try:
-            root = ET.fromstring(xml_cfdi)
-            
-            # Extraer datos del comprobante
-            comprobante = root
-            version = comprobante.get('Version', '4.0')
-            serie = comprobante.get('Serie', '')
-            folio = comprobante.get('Folio', '')
-            fecha = comprobante.get('Fecha', '')
-            exportacion = comprobante.get('Exportacion', '01')
-            moneda = comprobante.get('Moneda', 'MXN')
-            tipo_cambio = comprobante.get('TipoCambio', '1.0000')
-            total = comprobante.get('Total', '0.00')
-            tipo_comprobante = comprobante.get('TipoDeComprobante', 'I')
-            metodo_pago = comprobante.get('MetodoPago', 'PUE')
-            lugar_expedicion = comprobante.get('LugarExpedicion', '')
-            
-            # Extraer datos del emisor
-            emisor = comprobante.find('cfdi:Emisor', cls.NAMESPACES)
-            rfc_emisor = emisor.get('Rfc', '') if emisor is not None else ''
-            nombre_emisor = emisor.get('Nombre', '') if emisor is not None else ''
-            regimen_emisor = emisor.get('RegimenFiscal', '') if emisor is not None else ''
-            
-            # Extraer datos del receptor
-            receptor = comprobante.find('cfdi:Receptor', cls.NAMESPACES)
-            rfc_receptor = receptor.get('Rfc', '') if receptor is not None else ''
-            nombre_receptor = receptor.get('Nombre', '') if receptor is not None else ''
-            domicilio_receptor = receptor.get('DomicilioFiscalReceptor', '') if receptor is not None else ''
-            regimen_receptor = receptor.get('RegimenFiscalReceptor', '') if receptor is not None else ''
-            uso_cfdi = receptor.get('UsoCFDI', '') if receptor is not None else ''
-            
-            # Construir cadena original
-            cadena_parts = []
-            
-            # Datos del comprobante
-            cadena_parts.append(f"||{version}|{serie}|{folio}|{fecha}|{exportacion}|{moneda}|{tipo_cambio}|{total}|{tipo_comprobante}|{metodo_pago}|{lugar_expedicion}|")
-            
-            # Datos del emisor
-            cadena_parts.append(f"|{rfc_emisor}|{nombre_emisor}|{regimen_emisor}|")
-            
-            # Datos del receptor
-            cadena_parts.append(f"|{rfc_receptor}|{nombre_receptor}|{domicilio_receptor}|{regimen_receptor}|{uso_cfdi}|")
-            
-            # Conceptos
-            conceptos = comprobante.find('cfdi:Conceptos', cls.NAMESPACES)
-            if conceptos is not None:
-                for concepto in conceptos.findall('cfdi:Concepto', cls.NAMESPACES):
-                    clave_prod_serv = concepto.get('ClaveProdServ', '')
-                    no_identificacion = concepto.get('NoIdentificacion', '')
-                    cantidad = concepto.get('Cantidad', '0.000000')
-                    unidad = concepto.get('Unidad', '')
-                    descripcion = concepto.get('Descripcion', '')
-                    valor_unitario = concepto.get('ValorUnitario', '0.000000')
-                    importe = concepto.get('Importe', '0.00')
-                    objeto_imp = concepto.get('ObjetoImp', '02')
-                    
-                    cadena_parts.append(f"|{clave_prod_serv}|{no_identificacion}|{cantidad}|{unidad}|{descripcion}|{valor_unitario}|{importe}|{objeto_imp}|")
-            
-            return ''.join(cadena_parts)
+            return CadenaOriginal.desde_xml(xml_cfdi)
             
         except Exception as e:
             logger.error(f"Error generando cadena original: {e}")
@@ -501,18 +474,18 @@ class XMLCFDIBuilder:
             return xml_cfdi
     
     @classmethod
-    def extraer_timbre_fiscal(cls, xml_timbrado: str) -> Dict[str, Any]:
+    def extraer_timbre_fiscal(cls, xml_timbrado) -> Dict[str, Any]:
         """
         Extrae los datos del TimbreFiscalDigital del XML timbrado
         
         Args:
-            xml_timbrado: XML timbrado por el PAC
+            xml_timbrado: XML timbrado por el PAC, o su árbol ya parseado
             
         Returns:
             Dict: Datos del timbre fiscal
         """
         try:
-            root = ET.fromstring(xml_timbrado)
+            root = ET.fromstring(xml_timbrado) if isinstance(xml_timbrado, (str, bytes)) else xml_timbrado
             
             # Buscar el timbre fiscal
             timbre_elem = root.find('.//{http://www.sat.gob.mx/TimbreFiscalDigital}TimbreFiscalDigital')
@@ -1,5 +1,6 @@
 from django.contrib.auth.signals import user_logged_in
 from django.contrib.sessions.models import Session
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from django.utils import timezone
 
@@ -28,3 +29,12 @@ def logout_other_sessions(sender, user, request, **kwargs):
         pass
 
 
+@receiver([post_save, post_delete], sender='core.ConfiguracionSistema')
+def invalidar_cache_pdf(sender, instance, using, **kwargs):
+    """Los PDF en caché llevan el logo y los datos de la empresa: al cambiar la marca se descartan."""
+    try:
+        from .services.pdf_cache import CachePDF
+        CachePDF.invalidar(using)
+    except Exception:
+        # La versión de la caché ya incluye la marca; borrar los archivos es solo limpieza
+        pass
@@ -1,3 +1,916 @@
-from django.test import TestCase
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from datetime import date, datetime
+from decimal import Decimal
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import authenticate, login
+from django.core.handlers.base import BaseHandler
+from django.db import DatabaseError, connection, connections, transaction
+from django.http import HttpResponse, JsonResponse
+from django.db.migrations.executor import MigrationExecutor
+from django.test import RequestFactory, SimpleTestCase, TransactionTestCase, override_settings
+from django.urls import path
+from django.utils import timezone
+
+from directiva_agricola.db_router import get_current_company_db, set_current_company_db
+from directiva_agricola.transacciones import atomic_escritura
+
+from .decorators import no_atomica, solo_lectura
+from .middleware import SoloLecturaMiddleware
+
+
+# Rutas de core.urls que corren sin transacción por petición (ATOMIC_REQUESTS)
+VISTAS_NO_ATOMICAS = {
+    # Solo lectura
+    'dashboard', 'cliente_list', 'cliente_detail', 'proveedor_list', 'proveedor_detail',
+    'transportista_list', 'transportista_detail', 'almacenes_list', 'lote_origen_list',
+    'lote_origen_detail', 'clasificacion_gasto_list', 'clasificacion_gasto_detail',
+    'centro_costo_list', 'centro_costo_detail', 'producto_servicio_list', 'producto_servicio_detail',
+    'regimen_fiscal_list', 'cultivo_list', 'cultivo_detail', 'remision_list', 'remision_detail',
+    'remision_imprimir', 'cobranza_list', 'cobranza_imprimir', 'get_cultivos_ajax',
+    'listar_cuentas_bancarias_ajax', 'reporte_pagos', 'presupuesto_gasto_list', 'presupuesto_gasto_ajax',
+    'presupuesto_list', 'presupuesto_detail', 'gasto_list', 'gasto_detail', 'presupuesto_gastos_reporte',
+    'clasificaciones_gastos_ajax', 'proveedores_ajax', 'clasificaciones_gastos_presupuesto_ajax',
+    'listar_emisores_ajax', 'obtener_emisor_ajax', 'listado_facturas', 'factura_detail',
+    'generar_pdf_factura', 'vista_previa_pdf_factura', 'descargar_xml_factura', 'exportar_cfdi_zip',
+    'obtener_cliente_ajax', 'obtener_producto_ajax', 'pdf_lote_ajax', 'estado_timbrado_ajax',
+    'obtener_usos_cfdi_ajax', 'buscar_claves_sat_ajax', 'obtener_autorizo_gastos_ajax',
+    'estado_sistema_ajax', 'estado_cuenta', 'imprimir_estado_cuenta', 'listado_estados_cuenta',
+    'historial_pagos_ajax', 'info_factura_ajax', 'vista_previa_complemento_pago',
+    'imprimir_complemento_pago', 'descargar_xml_complemento_pago', 'compras_list', 'compra_detail',
+    'kardex_list', 'existencias_list', 'kardex_producto', 'salida_inventario_list',
+    'salida_inventario_detail', 'salida_inventario_imprimir', 'obtener_existencia_producto',
+    'otros_movimientos_list', 'otro_movimiento_detail', 'obtener_existencia_producto_otro_movimiento',
+    # Escriben fuera de la transacción de la petición (llamadas al PAC, lotes)
+    'timbrar_lote_ajax', 'guardar_complemento_pago_multiple_ajax',
+}
+
+
+def _crear_impuesto(request):
+    from .models import Impuesto
+
+    Impuesto.objects.create(codigo='999', nombre='Prueba', tasa=0, activo=True)
+    return HttpResponse()
+
+
+def _es_transaccional(vista, alias='default'):
+    """Si Django envuelve la vista en transaction.atomic(using=alias) por ATOMIC_REQUESTS"""
+    no_atomicas = getattr(vista, '_non_atomic_requests', set())
+    return connections.databases[alias]['ATOMIC_REQUESTS'] and alias not in no_atomicas
+
+
+class PoliticaTransaccionesTests(SimpleTestCase):
+
+    def test_vistas_transaccionales_de_core_urls(self):
+        from . import urls
+
+        no_atomicas = {
+            patron.name for patron in urls.urlpatterns if not _es_transaccional(patron.callback)
+        }
+        self.assertEqual(no_atomicas, VISTAS_NO_ATOMICAS)
+
+    def test_solo_lectura_solo_en_vistas_no_atomicas(self):
+        from . import urls
+
+        for patron in urls.urlpatterns:
+            if getattr(patron.callback, 'solo_lectura', False):
+                self.assertIn(patron.name, VISTAS_NO_ATOMICAS)
+        escrituras = ('_create', '_update', '_delete', '_edit', 'guardar_', 'timbrar_', 'cancelar_', 'registrar_')
+        for patron in urls.urlpatterns:
+            if any(parte in patron.name for parte in escrituras):
+                self.assertFalse(getattr(patron.callback, 'solo_lectura', False), patron.name)
+
+    def test_no_atomica_incluye_bd_de_empresas(self):
+        vista = no_atomica(lambda request: HttpResponse())
+        connections.databases['empresa_prueba'] = dict(connections.databases['default'])
+        try:
+            self.assertFalse(_es_transaccional(vista, 'empresa_prueba'))
+            self.assertIs(BaseHandler().make_view_atomic(vista), vista)
+        finally:
+            del connections.databases['empresa_prueba']
+
+
+class SoloLecturaMiddlewareTests(TransactionTestCase):
+
+    def _ejecutar(self, metodo, vista):
+        request = getattr(RequestFactory(), metodo)('/')
+        middleware = SoloLecturaMiddleware(lambda request: vista(request))
+        middleware.process_view(request, vista, (), {})
+        return middleware(request)
+
+    def test_get_no_puede_escribir_y_restaura_la_conexion(self):
+        with self.assertRaises(DatabaseError):
+            self._ejecutar('get', solo_lectura(lambda request: _crear_impuesto(request)))
+        _crear_impuesto(None)
+
+    def test_post_no_se_restringe(self):
+        self.assertEqual(self._ejecutar('post', solo_lectura(lambda request: _crear_impuesto(request))).status_code, 200)
+
+
+class AtomicEscrituraTests(TransactionTestCase):
+
+    def _begins(self, bloque):
+        sentencias = []
+
+        def espia(execute, sql, params, many, context):
+            if sql.startswith('BEGIN'):
+                sentencias.append(sql)
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(espia):
+            bloque()
+        return sentencias
+
+    def test_solo_el_bloque_de_escritura_empieza_con_immediate(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('BEGIN IMMEDIATE solo aplica a SQLite')
+
+        def bloque():
+            with transaction.atomic():
+                _crear_impuesto(None)
+            with atomic_escritura():
+                with atomic_escritura():
+                    pass
+            with transaction.atomic():
+                pass
+
+        self.assertEqual(self._begins(bloque), ['BEGIN', 'BEGIN IMMEDIATE', 'BEGIN'])
+
+
+RFC_PRUEBA = 'XAXX010101000'
+
+
+class _AliasDePrueba(frozenset):
+    """BD permitidas en la prueba: las de la clase y cualquier alias registrado después"""
+
+    def __new__(cls, permitidas, existentes):
+        instancia = super().__new__(cls, permitidas)
+        instancia.existentes = frozenset(existentes)
+        return instancia
+
+    def __contains__(self, alias):
+        return super().__contains__(alias) or alias not in self.existentes
+
+
+class _EmpresasTestCase(TransactionTestCase):
+    """Pruebas que crean BD de empresas en un directorio temporal"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # La plantilla y la empresa usan alias que se registran (y se quitan) durante la prueba
+        cls.databases = _AliasDePrueba(cls.databases, connections)
+
+    def setUp(self):
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        self.directorio = Path(directorio.name)
+        configuracion = override_settings(
+            BASE_DIR=self.directorio, EMPRESAS_PLANTILLAS_DIR=self.directorio / 'plantillas'
+        )
+        configuracion.enable()
+        self.addCleanup(configuracion.disable)
+
+    def _crear_empresa(self, db_name=None):
+        """Crea la BD de una empresa desde la plantilla y registra su alias durante la prueba"""
+        from .services.conexiones_empresa import ConexionesEmpresa
+        from .services.plantilla_empresa import PlantillaEmpresa
+
+        db_name = db_name or f'Directiva_{RFC_PRUEBA}'
+        PlantillaEmpresa.crear_empresa(db_name, 'Empresa de prueba', RFC_PRUEBA)
+        connections.databases[db_name] = ConexionesEmpresa.configuracion(db_name)
+        self.addCleanup(connections.databases.pop, db_name)
+        self.addCleanup(connections.__delitem__, db_name)
+        self.addCleanup(lambda: connections[db_name].close())
+        return db_name
+
+
+class PlantillaEmpresaTests(_EmpresasTestCase):
+
+    def test_construir_plantilla_y_crear_empresa(self):
+        from .models import ConfiguracionSistema, Impuesto, Usuario
+        from .services.conexiones_empresa import ConexionesEmpresa
+        from .services.plantilla_empresa import PASSWORD_SUPERVISOR_DEFAULT, PlantillaEmpresa
+
+        plantilla = PlantillaEmpresa.construir()
+        self.assertTrue(plantilla['construida'])
+        self.assertFalse(PlantillaEmpresa.construir()['construida'])
+
+        empresa = PlantillaEmpresa.crear_empresa('Directiva_XAXX010101000', 'Empresa de prueba', 'XAXX010101000')
+        self.assertTrue(Path(empresa['nombre']).exists())
+        with self.assertRaises(FileExistsError):
+            PlantillaEmpresa.crear_empresa('Directiva_XAXX010101000', 'Empresa de prueba', 'XAXX010101000')
+
+        alias = 'Directiva_XAXX010101000'
+        connections.databases[alias] = ConexionesEmpresa.configuracion(alias)
+        self.addCleanup(connections.databases.pop, alias)
+        self.addCleanup(connections.__delitem__, alias)
+        self.addCleanup(lambda: connections[alias].close())
+        self.assertEqual(ConfiguracionSistema.objects.using(alias).get().rfc, 'XAXX010101000')
+        self.assertEqual(Impuesto.objects.using(alias).count(), 2)
+        self.assertTrue(Usuario.objects.using(alias).get(username='supervisor').check_password(PASSWORD_SUPERVISOR_DEFAULT))
+
+        # Las migraciones en disco quedan registradas: migrate_empresas no tiene nada que aplicar
+        ejecutor = MigrationExecutor(connections[alias])
+        self.assertEqual(ejecutor.migration_plan(ejecutor.loader.graph.leaf_nodes()), [])
+
+
+
+def _iniciar_sesion(request):
+    """Los pasos de core.views.login_view: autenticar en la BD de la empresa y guardar la sesión"""
+    from .services.conexiones_empresa import ConexionesEmpresa
+
+    empresa = ConexionesEmpresa.empresa_por_rfc(request.POST['rfc'])
+    set_current_company_db(ConexionesEmpresa.registrar(empresa['db_name']))
+    user = authenticate(request, username=request.POST['username'], password=request.POST['password'])
+    login(request, user)
+    request.session['empresa_rfc'] = empresa['rfc']
+    return HttpResponse()
+
+
+def _estado_peticion(request):
+    alias = get_current_company_db()
+    return JsonResponse({
+        'usuario': request.user.username,
+        'alias': alias,
+        'transaccion': connections[alias].in_atomic_block,
+    })
+
+
+def _crear_impuesto_y_fallar(request):
+    _crear_impuesto(request)
+    raise ValueError('Error en la vista')
+
+
+urlpatterns = [
+    path('login/', _iniciar_sesion),
+    path('estado/', _estado_peticion),
+    path('estado-no-atomica/', no_atomica(lambda request: _estado_peticion(request))),
+    path('error/', _crear_impuesto_y_fallar),
+]
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class EmpresaDbMiddlewareTests(_EmpresasTestCase):
+    databases = {'default', 'administracion'}
+
+    def setUp(self):
+        super().setUp()
+        from administracion.models import Empresa
+        from .services.conexiones_empresa import ConexionesEmpresa
+        from .services.plantilla_empresa import PlantillaEmpresa
+
+        self.alias = f'Directiva_{RFC_PRUEBA}'
+        PlantillaEmpresa.crear_empresa(self.alias, 'Empresa de prueba', RFC_PRUEBA)
+        Empresa.objects.using('administracion').create(nombre='Empresa de prueba', rfc=RFC_PRUEBA, db_name=self.alias)
+        self.addCleanup(self._olvidar_empresa)
+
+    def _olvidar_empresa(self):
+        from .services.conexiones_empresa import ConexionesEmpresa
+
+        ConexionesEmpresa.olvidar_empresa()
+        ConexionesEmpresa._alias.descartar()
+        if self.alias in connections.databases:
+            connections[self.alias].close()
+            del connections[self.alias]
+            del connections.databases[self.alias]
+
+    def _iniciar_sesion(self):
+        from .services.plantilla_empresa import PASSWORD_SUPERVISOR_DEFAULT
+
+        respuesta = self.client.post('/login/', {
+            'rfc': RFC_PRUEBA, 'username': 'supervisor', 'password': PASSWORD_SUPERVISOR_DEFAULT,
+        })
+        self.assertEqual(respuesta.status_code, 200)
+
+    def test_login_guarda_la_sesion_en_default(self):
+        from django.contrib.sessions.models import Session
+
+        self._iniciar_sesion()
+        sesion = Session.objects.using('default').get(session_key=self.client.session.session_key)
+        self.assertEqual(sesion.get_decoded()['empresa_rfc'], RFC_PRUEBA)
+
+        estado = self.client.get('/estado/').json()
+        self.assertEqual(estado['usuario'], 'supervisor')
+        self.assertEqual(estado['alias'], self.alias)
+
+    def test_transaccion_solo_en_la_bd_de_la_empresa(self):
+        self._iniciar_sesion()
+        self.assertFalse(connections.databases[self.alias]['ATOMIC_REQUESTS'])
+        self.assertTrue(self.client.get('/estado/').json()['transaccion'])
+        self.assertFalse(self.client.get('/estado-no-atomica/').json()['transaccion'])
+        self.assertFalse(connections[self.alias].in_atomic_block)
+
+    def test_post_empieza_con_immediate(self):
+        self._iniciar_sesion()
+        if connections[self.alias].vendor != 'sqlite':
+            self.skipTest('BEGIN IMMEDIATE solo aplica a SQLite')
+        sentencias = []
+
+        def espia(execute, sql, params, many, context):
+            if sql.startswith('BEGIN'):
+                sentencias.append(sql)
+            return execute(sql, params, many, context)
+
+        with connections[self.alias].execute_wrapper(espia):
+            self.client.get('/estado/')
+            self.client.post('/estado/')
+        self.assertEqual(sentencias, ['BEGIN', 'BEGIN IMMEDIATE'])
+
+    def test_error_en_la_vista_revierte_la_transaccion(self):
+        from .models import Impuesto
+
+        self._iniciar_sesion()
+        antes = Impuesto.objects.using(self.alias).count()
+        with self.assertRaises(ValueError):
+            self.client.get('/error/')
+        self.assertFalse(connections[self.alias].in_atomic_block)
+        self.assertEqual(Impuesto.objects.using(self.alias).count(), antes)
+
+
+class CompraServiceTests(_EmpresasTestCase):
+
+    def setUp(self):
+        super().setUp()
+        from .models import Almacen, ProductoServicio, Proveedor, Usuario
+
+        self.alias = self._crear_empresa()
+        set_current_company_db(self.alias)
+        self.addCleanup(set_current_company_db, None)
+
+        usuario = Usuario.objects.get(username='supervisor')
+        self.proveedor = Proveedor.objects.create(
+            nombre='Proveedor', rfc='AAA010101AAA', domicilio='Conocido', usuario_creacion=usuario
+        )
+        self.producto = ProductoServicio.objects.create(
+            sku='SKU1', descripcion='Producto', unidad_medida='PZA', clave_sat='01010101',
+            impuesto='IVA_16', usuario_creacion=usuario,
+        )
+        self.almacen = Almacen.objects.create(descripcion='Almacén')
+
+    def _renglon(self, cantidad='5', precio='10', producto=None):
+        return {
+            'producto': {'codigo': producto or self.producto.pk},
+            'almacen': {'codigo': self.almacen.pk},
+            'cantidad': cantidad,
+            'precio': precio,
+        }
+
+    def _compra(self):
+        from .models import Compra
+
+        return Compra.objects.create(fecha=date.today(), proveedor=self.proveedor)
+
+    def test_detalle_invalido_no_deja_la_compra(self):
+        from django.core.exceptions import ValidationError
+        from .models import Compra, CompraDetalle, Kardex
+        from .services.compra_service import CompraService
+
+        # Como compra_create: el error se muestra como mensaje y la transacción de la petición
+        # (EmpresaDbMiddleware, BD de la empresa) se confirma
+        with transaction.atomic(using=self.alias):
+            with self.assertRaises(ValidationError):
+                with atomic_escritura():
+                    compra = self._compra()
+                    CompraService.registrar_detalles(compra, [self._renglon(), self._renglon(producto=999)])
+
+        self.assertFalse(Compra.objects.exists())
+        self.assertFalse(CompraDetalle.objects.exists())
+        self.assertFalse(Kardex.objects.exists())
+
+    def test_registrar_y_eliminar_compra_revierte_kardex(self):
+        from .models import Compra, CompraDetalle, Existencia, Kardex
+        from .services.compra_service import CompraService
+
+        compra = self._compra()
+        CompraService.registrar_detalles(compra, [self._renglon('5', '10'), self._renglon('3', '20')])
+        self.assertEqual(CompraDetalle.objects.filter(compra=compra).count(), 2)
+        self.assertEqual(Existencia.obtener_existencia(self.producto.pk, self.almacen.pk), Decimal('8'))
+        ultimo = Kardex.objects.order_by('fecha', 'id').last()
+        self.assertEqual(ultimo.costo_promedio_actual, Decimal('13.75'))
+
+        # Volver a capturar el detalle reemplaza las entradas anteriores
+        CompraService.registrar_detalles(compra, [self._renglon('2', '10')])
+        self.assertEqual(Kardex.objects.count(), 1)
+        self.assertEqual(Existencia.obtener_existencia(self.producto.pk, self.almacen.pk), Decimal('2'))
+
+        CompraService.eliminar(compra)
+        self.assertFalse(Compra.objects.exists())
+        self.assertFalse(Kardex.objects.exists())
+        self.assertEqual(Existencia.obtener_existencia(self.producto.pk, self.almacen.pk), Decimal('0'))
+
+    def test_cancelar_compra_anula_sus_entradas(self):
+        from .models import Existencia, Kardex
+        from .services.compra_service import CompraService
+
+        otra = self._compra()
+        CompraService.registrar_detalles(otra, [self._renglon('4', '10')])
+        compra = self._compra()
+        CompraService.registrar_detalles(compra, [self._renglon('6', '10')])
+
+        self.assertEqual(CompraService.anular_kardex(compra), 1)
+        self.assertEqual(Kardex.objects.count(), 1)
+        self.assertEqual(Existencia.obtener_existencia(self.producto.pk, self.almacen.pk), Decimal('4'))
+
+
+class ConexionesEmpresaTests(_EmpresasTestCase):
+
+    def setUp(self):
+        super().setUp()
+        from .services import conexiones_empresa
+        from .services.plantilla_empresa import PlantillaEmpresa
+        from .utils.cache_utils import CacheLRU
+
+        # Un solo alias en uso: registrar otra empresa descarta la anterior
+        ConexionesEmpresa = conexiones_empresa.ConexionesEmpresa
+        self.addCleanup(setattr, ConexionesEmpresa, '_alias', ConexionesEmpresa._alias)
+        ConexionesEmpresa._alias = CacheLRU(1, al_descartar=conexiones_empresa._al_descartar_alias)
+
+        self.empresas = ['Directiva_AAA010101AAA', 'Directiva_BBB010101BBB']
+        for db_name in self.empresas:
+            PlantillaEmpresa.crear_empresa(db_name, 'Empresa de prueba', db_name.split('_')[1])
+            self.addCleanup(self._quitar_alias, db_name)
+
+    @staticmethod
+    def _quitar_alias(alias):
+        if hasattr(connections._connections, alias):
+            connections[alias].close()
+            del connections[alias]
+        connections.databases.pop(alias, None)
+
+    def test_descartar_alias_no_corta_la_peticion_de_otro_hilo(self):
+        from .models import ConfiguracionSistema
+        from .services.conexiones_empresa import ConexionesEmpresa
+
+        primera, segunda = self.empresas
+        registrada, descartada = threading.Event(), threading.Event()
+        resultado = {}
+
+        def peticion():
+            # Como EmpresaDbMiddleware: el alias se registra antes de que la vista consulte
+            alias = ConexionesEmpresa.registrar(primera)
+            registrada.set()
+            descartada.wait(5)
+            try:
+                resultado['rfc'] = ConfiguracionSistema.objects.using(alias).get().rfc
+            except Exception as e:
+                resultado['error'] = e
+            finally:
+                ConexionesEmpresa.liberar()
+                resultado['conexion_abierta'] = hasattr(connections._connections, alias)
+
+        hilo = threading.Thread(target=peticion)
+        hilo.start()
+        registrada.wait(5)
+        ConexionesEmpresa.registrar(segunda)
+        descartada.set()
+        hilo.join(5)
+
+        self.assertNotIn('error', resultado)
+        self.assertEqual(resultado['rfc'], 'AAA010101AAA')
+        # Al terminar la petición el hilo cierra su conexión a la BD descartada
+        self.assertFalse(resultado['conexion_abierta'])
+        self.assertNotIn(primera, ConexionesEmpresa._alias)
+        self.assertIn(segunda, ConexionesEmpresa._alias)
+
+
+class PoolPDFTests(SimpleTestCase):
+
+    @override_settings(PDF_POOL={'procesos': 1, 'max_en_cola': 0, 'timeout': 0.05})
+    def test_plazo_corre_desde_enviar_y_cancela_el_trabajo_en_cola(self):
+        from .services.pdf_pool import PoolPDF
+
+        cupos = threading.BoundedSemaphore(1)
+        ejecutor = mock.Mock()
+        ejecutor.submit.return_value = Future()
+        with mock.patch.object(PoolPDF, '_obtener_executor', return_value=(ejecutor, cupos)):
+            futuro = PoolPDF.enviar('<p>Factura</p>')
+        self.assertFalse(cupos.acquire(blocking=False))
+
+        # El plazo ya venció mientras el trabajo esperaba: no se vuelve a esperar completo
+        time.sleep(0.1)
+        inicio = time.monotonic()
+        with self.assertRaises(TimeoutError):
+            PoolPDF.resultado(futuro)
+        self.assertLess(time.monotonic() - inicio, 0.05)
+        self.assertTrue(futuro.cancelled())
+        self.assertTrue(cupos.acquire(blocking=False))
+
+
+def _facturas(n, **campos):
+    """Facturas de prueba (bulk_create: sin las validaciones de save) de un mismo emisor y receptor"""
+    from .factura_models import Factura
+    from .models import Cliente, Emisor, RegimenFiscal, Usuario
+
+    usuario = Usuario.objects.create(username='facturacion', nombre='Facturación', puesto='Contador', email='f@prueba.mx')
+    regimen, _ = RegimenFiscal.objects.get_or_create(codigo='601', defaults={'descripcion': 'General de Ley Personas Morales'})
+    emisor = Emisor.objects.bulk_create([Emisor(
+        razon_social='Emisor SA', rfc='EKU9003173C9', codigo_postal='80000', regimen_fiscal='601', serie='A',
+        archivo_certificado='', archivo_llave='', password_llave='x', usuario_creacion=usuario,
+    )])[0]
+    receptor = Cliente.objects.bulk_create([Cliente(
+        razon_social='Receptor', regimen_fiscal=regimen, codigo_postal='80000', rfc='XAXX010101000',
+        domicilio='Conocido', telefono='1', email_principal='r@prueba.mx', usuario_creacion=usuario,
+    )])[0]
+    campos = {
+        'serie': 'A', 'lugar_expedicion': '80000', 'uso_cfdi': 'G03', 'subtotal': Decimal('100'),
+        'impuesto': Decimal('16'), 'total': Decimal('116'), **campos,
+    }
+    Factura.objects.bulk_create([
+        Factura(fecha_emision=timezone.now(), emisor=emisor, receptor=receptor, usuario_creacion=usuario, **campos)
+        for _ in range(n)
+    ])
+    return usuario, list(Factura.objects.order_by('folio'))
+
+
+class ComplementoPagoServiceTests(TransactionTestCase):
+
+    def setUp(self):
+        from .factura_models import Factura
+
+        self.usuario, facturas = _facturas(3, metodo_pago='PPD')
+        for factura in facturas:
+            Factura.objects.filter(pk=factura.pk).update(uuid=f'UUID-{factura.folio}')
+        self.folios = [factura.folio for factura in facturas]
+
+    def _registrar(self, documentos, timbrar):
+        from .services import complemento_pago_service as modulo
+        from .services.complemento_pago_service import ComplementoPagoService
+
+        certificado = {'certificado_base64': 'CERT', 'no_certificado': '1', 'valido': True}
+        with mock.patch.object(ComplementoPagoService, '_credenciales', return_value=({}, certificado, object())), \
+                mock.patch.object(modulo.CertificadoService, 'generar_sello_digital', return_value='SELLO'), \
+                mock.patch.object(modulo.TimbradoService, '__init__', return_value=None), \
+                mock.patch.object(modulo.TimbradoService, 'timbrar_cfdi', timbrar):
+            return ComplementoPagoService.registrar_pago(documentos, {'fecha_pago': '2025-10-17'}, self.usuario)
+
+    def test_registra_un_pago_por_factura_con_el_mismo_timbre(self):
+        from .models import PagoFactura
+
+        def timbrar(servicio, xml):
+            return {'exito': True, 'uuid': 'COMPLEMENTO-1', 'xml_base64': 'eA=='}
+
+        resultado = self._registrar([
+            {'folio': self.folios[0], 'monto': '116'}, {'folio': self.folios[1], 'monto': '58'},
+        ], timbrar)
+        self.assertTrue(resultado['success'], resultado)
+        pagos = PagoFactura.objects.filter(uuid='COMPLEMENTO-1').order_by('factura_id')
+        self.assertEqual([(p.factura_id, p.monto_pago, p.tipo_pago, p.num_parcialidad) for p in pagos], [
+            (self.folios[0], Decimal('116.00'), 'COMPLETO', 1),
+            (self.folios[1], Decimal('58.00'), 'PARCIAL', 1),
+        ])
+
+    def test_pago_concurrente_durante_el_timbrado_no_se_registra(self):
+        from .models import PagoFactura
+
+        def timbrar(servicio, xml):
+            # Otro pago a la misma factura se registra mientras el PAC timbra este complemento
+            PagoFactura.objects.create(
+                factura_id=self.folios[0], monto_pago=Decimal('100'), num_parcialidad=1,
+                usuario_registro=self.usuario, uuid='OTRO-PAGO',
+            )
+            return {'exito': True, 'uuid': 'COMPLEMENTO-2', 'xml_base64': 'eA=='}
+
+        resultado = self._registrar([
+            {'folio': self.folios[0], 'monto': '100'}, {'folio': self.folios[2], 'monto': '116'},
+        ], timbrar)
+        self.assertFalse(resultado['success'])
+        self.assertEqual(resultado['uuid'], 'COMPLEMENTO-2')
+        self.assertEqual(len(resultado['errores']), 1)
+        self.assertFalse(PagoFactura.objects.filter(uuid='COMPLEMENTO-2').exists())
+
+
+class ComplementoPagoXMLTests(SimpleTestCase):
+
+    FACTURA = SimpleNamespace(
+        folio=1, lugar_expedicion='80000',
+        emisor=SimpleNamespace(rfc='EKU9003173C9', razon_social='Emisor SA', regimen_fiscal='601'),
+        receptor=SimpleNamespace(
+            rfc='XAXX010101000', razon_social='Receptor', codigo_postal='80000',
+            regimen_fiscal=SimpleNamespace(codigo='616'),
+        ),
+    )
+    DOCUMENTO = {
+        'id_documento': 'UUID-1', 'serie_dr': 'A', 'folio_dr': '1', 'num_parcialidad': 1,
+        'imp_saldo_ant': '116.00', 'imp_pagado': '116.00', 'imp_saldo_insoluto': '0.00',
+        'objeto_imp_dr': '02', 'impuesto': '002', 'base': '100.0000', 'importe': '16.00',
+        'tipo_factor': 'Tasa', 'tasa': 0.16,
+    }
+
+    def _xml(self, pago_data):
+        from .services import complemento_pago_xml_builder as modulo
+
+        with mock.patch.object(modulo, 'obtener_fecha_actual_mexico', return_value=datetime(2025, 10, 18, 10, 0)):
+            arbol = modulo.ComplementoPagoXMLBuilder.construir_arbol_complemento_pago(
+                self.FACTURA, pago_data, {'certificado_base64': 'CERT', 'no_certificado': '1'}
+            )
+        return arbol
+
+    @staticmethod
+    def _nodos(arbol, nombre):
+        return [dict(nodo.attrib) for nodo in arbol.iter(f'{{http://www.sat.gob.mx/Pagos20}}{nombre}')]
+
+    def test_un_documento_igual_que_el_pago_de_una_factura(self):
+        # Atributos que generaba el constructor antes de admitir varios documentos por pago
+        arbol = self._xml({'monto': '116.00', 'fecha_pago': '2025-10-17', **self.DOCUMENTO})
+        self.assertEqual(self._nodos(arbol, 'Totales'), [{
+            'MontoTotalPagos': '116.00', 'TotalTrasladosBaseIVA16': '100.0', 'TotalTrasladosImpuestoIVA16': '16.0',
+        }])
+        self.assertEqual(self._nodos(arbol, 'Pago'), [{
+            'FechaPago': '2025-10-17T00:00:00', 'FormaDePagoP': '03', 'MonedaP': 'MXN', 'TipoCambioP': '1', 'Monto': '116.00',
+        }])
+        self.assertEqual(self._nodos(arbol, 'DoctoRelacionado'), [{
+            'IdDocumento': 'UUID-1', 'Serie': 'A', 'Folio': '1', 'MonedaDR': 'MXN', 'EquivalenciaDR': '1',
+            'NumParcialidad': '1', 'ImpSaldoAnt': '116.00', 'ImpPagado': '116.00', 'ImpSaldoInsoluto': '0.00',
+            'ObjetoImpDR': '02',
+        }])
+        traslado = {'ImpuestoP': '002', 'TipoFactorP': 'Tasa', 'TasaOCuotaP': '0.160000'}
+        self.assertEqual(self._nodos(arbol, 'TrasladoP'), [{'BaseP': '100.0', **traslado, 'ImporteP': '16.0'}])
+
+    def test_varios_documentos_suman_totales_e_impuestos_por_tasa(self):
+        documentos = [
+            self.DOCUMENTO,
+            {**self.DOCUMENTO, 'id_documento': 'UUID-2', 'folio_dr': '2', 'imp_pagado': '58.00',
+             'imp_saldo_insoluto': '58.00', 'base': '50.0000', 'importe': '8.00'},
+            {**self.DOCUMENTO, 'id_documento': 'UUID-3', 'folio_dr': '3', 'imp_saldo_ant': '108.00',
+             'imp_pagado': '108.00', 'base': '100.0000', 'importe': '8.00', 'tasa': 0.08},
+            {**self.DOCUMENTO, 'id_documento': 'UUID-4', 'folio_dr': '4', 'imp_saldo_ant': '50.00',
+             'imp_pagado': '50.00', 'base': '50.0000', 'importe': '0.00', 'tipo_factor': 'Tasa0', 'tasa': 0.0},
+        ]
+        arbol = self._xml({'monto': '332.00', 'fecha_pago': '2025-10-17', 'documentos': documentos})
+
+        self.assertEqual(self._nodos(arbol, 'Totales'), [{
+            'MontoTotalPagos': '332.00',
+            'TotalTrasladosBaseIVA16': '150.0', 'TotalTrasladosImpuestoIVA16': '24.0',
+            'TotalTrasladosBaseIVA8': '100.0', 'TotalTrasladosImpuestoIVA8': '8.0',
+            'TotalTrasladosBaseIVA0': '50.0', 'TotalTrasladosImpuestoIVA0': '0.0',
+        }])
+        self.assertEqual(self._nodos(arbol, 'Pago')[0]['Monto'], '332.00')
+        self.assertEqual([d['IdDocumento'] for d in self._nodos(arbol, 'DoctoRelacionado')], ['UUID-1', 'UUID-2', 'UUID-3', 'UUID-4'])
+        self.assertEqual(
+            [(t['TasaOCuotaP'], t['BaseP'], t['ImporteP']) for t in self._nodos(arbol, 'TrasladoP')],
+            [('0.160000', '150.0', '24.0'), ('0.080000', '100.0', '8.0'), ('0.000000', '50.0', '0.0')],
+        )
+
+
+class KardexRecalculoTests(TransactionTestCase):
+
+    def setUp(self):
+        from .models import Almacen, ProductoServicio, Usuario
+
+        usuario = Usuario.objects.create(username='almacen', nombre='Almacén', puesto='Almacenista', email='a@prueba.mx')
+        self.producto = ProductoServicio.objects.create(
+            sku='SKU1', descripcion='Producto', unidad_medida='PZA', clave_sat='01010101',
+            impuesto='IVA_16', usuario_creacion=usuario,
+        )
+        self.almacenes = [Almacen.objects.create(descripcion=f'Almacén {i}') for i in range(2)]
+        self.inicio = timezone.now() - timezone.timedelta(days=30)
+        # Lotes pequeños para que el recálculo recorra varias páginas
+        patcher = mock.patch('core.models.Kardex.LOTE_RECALCULO', 2)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _movimiento(self, horas, tipo, cantidad, precio, almacen=None):
+        from .models import Kardex
+
+        return Kardex.objects.create(
+            producto=self.producto, almacen=almacen or self.almacenes[0],
+            fecha=self.inicio + timezone.timedelta(hours=horas), tipo_movimiento=tipo,
+            cantidad=Decimal(cantidad), precio_unitario=Decimal(precio),
+            costo_total=0, existencia_actual=0, costo_promedio_actual=0,
+        )
+
+    def _saldos(self, almacen=None):
+        """(existencia_anterior, existencia_actual, costo_promedio_actual) en orden cronológico"""
+        from .models import Kardex
+
+        return [
+            (m.existencia_anterior, m.existencia_actual, m.costo_promedio_actual)
+            for m in Kardex.objects.filter(
+                producto=self.producto, almacen=almacen or self.almacenes[0]
+            ).order_by('fecha', 'id')
+        ]
+
+    def _existencia(self, almacen=None):
+        from .models import Existencia
+
+        return Existencia.objects.filter(
+            producto=self.producto, almacen=almacen or self.almacenes[0]
+        ).values_list('existencia', 'costo_promedio').first()
+
+    def _kardex_inicial(self):
+        self._movimiento(0, 'entrada', '10', '10')
+        self._movimiento(2, 'salida', '4', '10')
+        self._movimiento(3, 'entrada', '6', '16')
+        self._movimiento(4, 'salida', '2', '16')
+        self.assertEqual(self._saldos(), [
+            (0, 10, Decimal('10.00')), (10, 6, Decimal('10.00')),
+            (6, 12, Decimal('13.00')), (12, 10, Decimal('13.00')),
+        ])
+
+    def test_movimiento_con_fecha_anterior_recalcula_los_posteriores(self):
+        self._kardex_inicial()
+        self._movimiento(1, 'entrada', '10', '20')
+
+        self.assertEqual(self._saldos(), [
+            (0, 10, Decimal('10.00')), (10, 20, Decimal('15.00')), (20, 16, Decimal('15.00')),
+            (16, 22, Decimal('15.27')), (22, 20, Decimal('15.27')),
+        ])
+        self.assertEqual(self._existencia(), (Decimal('20.00'), Decimal('15.27')))
+
+    def test_editar_y_eliminar_recalculan_desde_la_posicion_original(self):
+        from .models import Kardex
+
+        self._kardex_inicial()
+        movimiento = self._movimiento(1, 'entrada', '10', '20')
+
+        # Mover el movimiento al final y a otro almacén: el kardex original vuelve a sus saldos
+        movimiento.fecha = self.inicio + timezone.timedelta(hours=5)
+        movimiento.almacen = self.almacenes[1]
+        movimiento.save()
+        self.assertEqual(self._saldos()[-1], (12, 10, Decimal('13.00')))
+        self.assertEqual(self._existencia(), (Decimal('10.00'), Decimal('13.00')))
+        self.assertEqual(self._saldos(self.almacenes[1]), [(0, 10, Decimal('20.00'))])
+
+        # Eliminar la primera entrada deja la salida siguiente en negativo
+        Kardex.objects.filter(almacen=self.almacenes[0]).order_by('fecha', 'id').first().delete()
+        self.assertEqual(self._saldos(), [
+            (0, -4, Decimal('0.00')), (-4, 2, Decimal('16.00')), (2, 0, Decimal('16.00')),
+        ])
+        self.assertEqual(self._existencia(), (Decimal('0.00'), Decimal('16.00')))
+
+
+class FacturaDocumentoTests(_EmpresasTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.alias = self._crear_empresa()
+        set_current_company_db(self.alias)
+        self.addCleanup(set_current_company_db, None)
+        _, self.facturas = _facturas(2)
+
+    def _documento(self, factura):
+        from .factura_models import FacturaDocumento
+
+        return FacturaDocumento.objects.using(self.alias).filter(pk=factura.pk).values(
+            'xml_timbrado', 'sello', 'acuse_cancelacion'
+        ).first()
+
+    def test_campos_del_documento_se_guardan_en_su_tabla(self):
+        from .factura_models import CAMPOS_DOCUMENTO, Factura, FacturaDocumento
+
+        columnas = {
+            columna.name for columna in
+            connections[self.alias].introspection.get_table_description(connections[self.alias].cursor(), 'facturas')
+        }
+        self.assertFalse(columnas & set(CAMPOS_DOCUMENTO))
+
+        factura = Factura.objects.get(pk=self.facturas[0].pk)
+        factura.save()
+        self.assertIsNone(self._documento(factura))
+
+        factura.xml_timbrado = '<cfdi/>'
+        factura.sello = 'SELLO'
+        factura.save()
+        self.assertEqual(self._documento(factura), {'xml_timbrado': '<cfdi/>', 'sello': 'SELLO', 'acuse_cancelacion': None})
+        self.assertFalse(FacturaDocumento.objects.using('default').exists())
+        self.assertEqual(Factura.objects.con_documento().get(pk=factura.pk).xml_timbrado, '<cfdi/>')
+
+    def test_update_fields_separa_factura_y_documento(self):
+        from .factura_models import Factura
+
+        factura = Factura.objects.get(pk=self.facturas[1].pk)
+        factura.estado_timbrado = 'CANCELADO'
+        factura.acuse_cancelacion = 'ACUSE'
+        factura.save(update_fields=['estado_timbrado', 'acuse_cancelacion'])
+
+        self.assertEqual(Factura.objects.get(pk=factura.pk).estado_timbrado, 'CANCELADO')
+        self.assertEqual(self._documento(factura)['acuse_cancelacion'], 'ACUSE')
+
+    def test_guardar_de_facturas_inserta_y_actualiza(self):
+        from .factura_models import Factura, FacturaDocumento
+
+        primera = Factura.objects.get(pk=self.facturas[0].pk)
+        primera.sello = 'ANTERIOR'
+        primera.save()
+
+        facturas = list(Factura.objects.con_documento().order_by('folio'))
+        for factura in facturas:
+            factura.xml_timbrado = f'<cfdi folio="{factura.folio}"/>'
+        FacturaDocumento.guardar_de_facturas(facturas, ['xml_timbrado'])
+
+        self.assertEqual([self._documento(factura) for factura in facturas], [
+            {'xml_timbrado': f'<cfdi folio="{facturas[0].folio}"/>', 'sello': 'ANTERIOR', 'acuse_cancelacion': None},
+            {'xml_timbrado': f'<cfdi folio="{facturas[1].folio}"/>', 'sello': None, 'acuse_cancelacion': None},
+        ])
+        self.assertFalse(any(factura._documento_modificado for factura in facturas))
+
+
+class FacturaConSaldoTests(TransactionTestCase):
+
+    def setUp(self):
+        from .factura_models import Factura
+        from .models import PagoFactura
+
+        usuario, facturas = _facturas(6, metodo_pago='PPD')
+        Factura.objects.filter(pk=facturas[5].pk).update(metodo_pago='PUE')
+        pagos = [
+            (facturas[1], '50', 'P1'),     # pago parcial
+            (facturas[2], '116', 'P2'),    # pagada
+            (facturas[3], '116', None),    # pago sin timbrar: no cuenta
+            (facturas[4], '60', 'P3'),     # pagada en dos parcialidades
+            (facturas[4], '56', 'P4'),
+            (facturas[5], '116', 'P5'),    # PUE: no aplica
+        ]
+        for factura, monto, uuid in pagos:
+            PagoFactura.objects.create(factura=factura, monto_pago=Decimal(monto), usuario_registro=usuario, uuid=uuid)
+
+    def test_anotaciones_iguales_a_los_metodos(self):
+        from .factura_models import Factura
+
+        with self.assertNumQueries(1):
+            anotadas = list(Factura.objects.con_saldo().order_by('folio'))
+        self.assertEqual(
+            [(f.total_pagado, f.saldo, f.estado_pago) for f in anotadas],
+            [(f.obtener_total_pagado(), f.obtener_saldo_pendiente(), f.obtener_estado_pago()) for f in anotadas],
+        )
+        self.assertEqual([(f.total_pagado, f.saldo, f.estado_pago) for f in anotadas], [
+            (Decimal('0'), Decimal('116'), 'Pendiente'),
+            (Decimal('50'), Decimal('66'), 'Pago parcial'),
+            (Decimal('116'), Decimal('0'), 'Pagada'),
+            (Decimal('0'), Decimal('116'), 'Pendiente'),
+            (Decimal('116'), Decimal('0'), 'Pagada'),
+            (Decimal('116'), Decimal('0'), 'No aplica'),
+        ])
+
+    def test_filtrar_por_saldo(self):
+        from .factura_models import Factura
+
+        pendientes = Factura.objects.con_saldo().filter(saldo__gt=0).order_by('folio')
+        self.assertEqual(
+            list(pendientes.values_list('folio', flat=True)),
+            [f.folio for f in Factura.objects.order_by('folio') if f.obtener_saldo_pendiente() > 0],
+        )
+
+
+class CadenaOriginalTests(SimpleTestCase):
+
+    # Cadena de factura_en_memoria(2) en el orden de cadenaoriginal_4_0.xslt. El generador anterior
+    # (escrito a mano) daba para la misma factura
+    #   ||4.0|A|1|2025-10-18T12:00:00|01|MXN|1.0000|233.16|I|PUE|85140||EKU9003173C9|...|02|
+    # sin FormaPago, NoCertificado, SubTotal, ClaveUnidad ni impuestos, con TipoCambio que el
+    # XML no lleva, separadores "||" entre secciones y sin normalizar los espacios
+    CADENA_FACTURA = (
+        '||4.0|A|1|2025-10-18T12:00:00|03|30001000000500003416|201.00|MXN|233.16|I|01|PUE|85140'
+        '|EKU9003173C9|ESCUELA KEMPER URGATE|601|XEXX010101000|CLIENTE DE PRUEBA|85140|601|G03'
+        '|10101500|P00000|1.000000|H87|Pieza|Producto agrícola 0 con espacios|100.000000|100.00|02'
+        '|100.00|002|Tasa|0.160000|16.00'
+        '|10101500|P00001|1.000000|H87|Pieza|Producto agrícola 1 con espacios|101.000000|101.00|02'
+        '|101.00|002|Tasa|0.160000|16.16'
+        '|201.00|002|Tasa|0.160000|32.16|32.16||'
+    )
+
+    def test_cadena_de_factura(self):
+        from .services.cadena_original import CadenaOriginal
+        from .services.xml_builder import XMLCFDIBuilder
+        from .utils.cfdi_prueba import CERTIFICADO_PRUEBA, factura_en_memoria
+
+        factura, detalles = factura_en_memoria(2)
+        self.assertEqual(
+            XMLCFDIBuilder.generar_cadena_original_desde_modelos(factura, detalles, CERTIFICADO_PRUEBA),
+            self.CADENA_FACTURA,
+        )
+        # Leída del XML sellado (sin Sello ni Certificado en la cadena) da lo mismo
+        xml_cfdi = XMLCFDIBuilder.construir_xml_cfdi(factura, detalles, CERTIFICADO_PRUEBA, 'SELLO')
+        self.assertEqual(XMLCFDIBuilder.generar_cadena_original(xml_cfdi), self.CADENA_FACTURA)
+        self.assertEqual(CadenaOriginal.desde_xml(xml_cfdi), self.CADENA_FACTURA)
+
+    def test_cadena_de_complemento_de_pago(self):
+        from .services import complemento_pago_xml_builder as modulo
+        from .services.cadena_original import CadenaOriginal
+        from .utils.cfdi_prueba import CERTIFICADO_PRUEBA
+
+        pago_data = {'monto': '116.00', 'fecha_pago': '2025-10-17', **ComplementoPagoXMLTests.DOCUMENTO}
+        with mock.patch.object(modulo, 'obtener_fecha_actual_mexico', return_value=datetime(2025, 10, 18, 10, 0)):
+            arbol = modulo.ComplementoPagoXMLBuilder.construir_arbol_complemento_pago(
+                ComplementoPagoXMLTests.FACTURA, pago_data, CERTIFICADO_PRUEBA, 'SELLO'
+            )
+        cadena = CadenaOriginal.generar(arbol)
+
+        # El generador anterior incluía Sello y Certificado y no seguía el orden de Pagos 2.0
+        self.assertEqual(cadena, (
+            '||4.0|A|24A|2025-10-18T10:00:00|30001000000500003416|0|XXX|0|P|01|85140'
+            '|EKU9003173C9|Emisor SA|601|XAXX010101000|Receptor|80000|616|CP01'
+            '|84111506|1|ACT|Pago|0|0|01'
+            '|2.0|100.0|16.0|116.00'
+            '|2025-10-17T00:00:00|03|MXN|1|116.00'
+            '|UUID-1|A|1|MXN|1|1|116.00|116.00|0.00|02|100.0|002|Tasa|0.160000|16.0'
+            '|100.0|002|Tasa|0.160000|16.0||'
+        ))
+        xml_cfdi = modulo.ComplementoPagoXMLBuilder.serializar_xml(arbol)
+        self.assertEqual(modulo.ComplementoPagoXMLBuilder.generar_cadena_original(xml_cfdi), cadena)
@@ -58,13 +58,15 @@ from .factura_views import (
     FacturacionView, ListadoFacturasView, FacturaDetailView,
     validar_emisor_ajax, validar_cfdi_ajax, timbrar_factura_ajax, cancelar_factura_ajax,
     consultar_estatus_factura_ajax, probar_conexion_pac_ajax,
-    generar_pdf_factura, vista_previa_pdf_factura, descargar_xml_factura
+    generar_pdf_factura, vista_previa_pdf_factura, descargar_xml_factura, exportar_cfdi_zip
 )
 from .factura_ajax_views import (
     obtener_emisor_ajax, obtener_cliente_ajax, obtener_producto_ajax, guardar_factura_ajax, timbrar_factura_ajax,
-    probar_conexion_pac_ajax
+    probar_conexion_pac_ajax, estado_timbrado_ajax, timbrar_lote_ajax, pdf_lote_ajax
+)
+from .catalogos_ajax_views import (
+    obtener_usos_cfdi_ajax, buscar_claves_sat_ajax, obtener_autorizo_gastos_ajax, crear_autorizo_gasto_ajax
 )
-from .catalogos_ajax_views import obtener_usos_cfdi_ajax, obtener_autorizo_gastos_ajax, crear_autorizo_gasto_ajax
 from .views.main_views import cancelar_gasto_ajax, almacenes_list, almacen_create, almacen_edit, almacen_delete, compras_list, compra_create, compra_edit, compra_delete, compra_detail, kardex_list, existencias_list, kardex_producto
 from .otros_movimientos_views import otros_movimientos_list, otro_movimiento_create, otro_movimiento_detail, otro_movimiento_update, otro_movimiento_delete, obtener_existencia_producto_otro_movimiento
 # Importar vistas de herramientas de mantenimiento
@@ -75,9 +77,10 @@ from .views.herramientas_mantenimiento import HerramientasMantenimientoView
 from .pago_views import (
     ComplementoPagoView, EstadoCuentaView, listado_estados_cuenta,
     registrar_pago, obtener_historial_pagos, obtener_info_factura_ajax,
-    guardar_complemento_pago_ajax, imprimir_estado_cuenta, descargar_debug_xml,
+    guardar_complemento_pago_ajax, guardar_complemento_pago_multiple_ajax, imprimir_estado_cuenta, descargar_debug_xml,
     imprimir_complemento_pago, descargar_xml_complemento_pago, vista_previa_complemento_pago
 )
+from .decorators import solo_lectura
 
 app_name = 'core'
 
@@ -95,84 +98,84 @@ urlpatterns = [
     path('configuracion/usuario/<int:pk>/eliminar/', UsuarioDeleteView.as_view(), name='usuario_delete'),
     
     # URLs de clientes
-    path('clientes/', ClienteListView.as_view(), name='cliente_list'),
+    path('clientes/', solo_lectura(ClienteListView.as_view()), name='cliente_list'),
     path('clientes/nuevo/', ClienteCreateView.as_view(), name='cliente_create'),
-    path('clientes/<int:pk>/', ClienteDetailView.as_view(), name='cliente_detail'),
+    path('clientes/<int:pk>/', solo_lectura(ClienteDetailView.as_view()), name='cliente_detail'),
     path('clientes/<int:pk>/editar/', ClienteUpdateView.as_view(), name='cliente_update'),
     path('clientes/<int:pk>/eliminar/', ClienteDeleteView.as_view(), name='cliente_delete'),
     
     # URLs de proveedores
-    path('proveedores/', ProveedorListView.as_view(), name='proveedor_list'),
+    path('proveedores/', solo_lectura(ProveedorListView.as_view()), name='proveedor_list'),
     path('proveedores/nuevo/', ProveedorCreateView.as_view(), name='proveedor_create'),
-    path('proveedores/<int:pk>/', ProveedorDetailView.as_view(), name='proveedor_detail'),
+    path('proveedores/<int:pk>/', solo_lectura(ProveedorDetailView.as_view()), name='proveedor_detail'),
     path('proveedores/<int:pk>/editar/', ProveedorUpdateView.as_view(), name='proveedor_update'),
     path('proveedores/<int:pk>/eliminar/', ProveedorDeleteView.as_view(), name='proveedor_delete'),
     
     # URLs de transportistas
-    path('transportistas/', TransportistaListView.as_view(), name='transportista_list'),
+    path('transportistas/', solo_lectura(TransportistaListView.as_view()), name='transportista_list'),
     path('transportistas/nuevo/', TransportistaCreateView.as_view(), name='transportista_create'),
-    path('transportistas/<int:pk>/', TransportistaDetailView.as_view(), name='transportista_detail'),
+    path('transportistas/<int:pk>/', solo_lectura(TransportistaDetailView.as_view()), name='transportista_detail'),
     path('transportistas/<int:pk>/editar/', TransportistaUpdateView.as_view(), name='transportista_update'),
     path('transportistas/<int:pk>/eliminar/', TransportistaDeleteView.as_view(), name='transportista_delete'),
     
     # URLs de almacenes
-    path('almacenes/', almacenes_list, name='almacenes_list'),
+    path('almacenes/', solo_lectura(almacenes_list), name='almacenes_list'),
     path('almacenes/nuevo/', almacen_create, name='almacen_create'),
     path('almacenes/<int:codigo>/editar/', almacen_edit, name='almacen_edit'),
     path('almacenes/<int:codigo>/eliminar/', almacen_delete, name='almacen_delete'),
     
     # URLs de lotes - origen
-    path('lotes-origen/', LoteOrigenListView.as_view(), name='lote_origen_list'),
+    path('lotes-origen/', solo_lectura(LoteOrigenListView.as_view()), name='lote_origen_list'),
     path('lotes-origen/nuevo/', LoteOrigenCreateView.as_view(), name='lote_origen_create'),
-    path('lotes-origen/<int:pk>/', LoteOrigenDetailView.as_view(), name='lote_origen_detail'),
+    path('lotes-origen/<int:pk>/', solo_lectura(LoteOrigenDetailView.as_view()), name='lote_origen_detail'),
     path('lotes-origen/<int:pk>/editar/', LoteOrigenUpdateView.as_view(), name='lote_origen_update'),
     path('lotes-origen/<int:pk>/eliminar/', LoteOrigenDeleteView.as_view(), name='lote_origen_delete'),
     
     # URLs de clasificación de gastos
-    path('clasificacion-gastos/', ClasificacionGastoListView.as_view(), name='clasificacion_gasto_list'),
+    path('clasificacion-gastos/', solo_lectura(ClasificacionGastoListView.as_view()), name='clasificacion_gasto_list'),
     path('clasificacion-gastos/nuevo/', ClasificacionGastoCreateView.as_view(), name='clasificacion_gasto_create'),
-    path('clasificacion-gastos/<int:pk>/', ClasificacionGastoDetailView.as_view(), name='clasificacion_gasto_detail'),
+    path('clasificacion-gastos/<int:pk>/', solo_lectura(ClasificacionGastoDetailView.as_view()), name='clasificacion_gasto_detail'),
     path('clasificacion-gastos/<int:pk>/editar/', ClasificacionGastoUpdateView.as_view(), name='clasificacion_gasto_update'),
     path('clasificacion-gastos/<int:pk>/eliminar/', ClasificacionGastoDeleteView.as_view(), name='clasificacion_gasto_delete'),
     
     # URLs de centro de costos
-    path('centro-costos/', CentroCostoListView.as_view(), name='centro_costo_list'),
+    path('centro-costos/', solo_lectura(CentroCostoListView.as_view()), name='centro_costo_list'),
     path('centro-costos/nuevo/', CentroCostoCreateView.as_view(), name='centro_costo_create'),
-    path('centro-costos/<int:pk>/', CentroCostoDetailView.as_view(), name='centro_costo_detail'),
+    path('centro-costos/<int:pk>/', solo_lectura(CentroCostoDetailView.as_view()), name='centro_costo_detail'),
     path('centro-costos/<int:pk>/editar/', CentroCostoUpdateView.as_view(), name='centro_costo_update'),
     path('centro-costos/<int:pk>/eliminar/', CentroCostoDeleteView.as_view(), name='centro_costo_delete'),
     
     # URLs de productos y servicios
-    path('productos-servicios/', ProductoServicioListView.as_view(), name='producto_servicio_list'),
+    path('productos-servicios/', solo_lectura(ProductoServicioListView.as_view()), name='producto_servicio_list'),
     path('productos-servicios/nuevo/', ProductoServicioCreateView.as_view(), name='producto_servicio_create'),
-    path('productos-servicios/<int:pk>/', ProductoServicioDetailView.as_view(), name='producto_servicio_detail'),
+    path('productos-servicios/<int:pk>/', solo_lectura(ProductoServicioDetailView.as_view()), name='producto_servicio_detail'),
     path('productos-servicios/<int:pk>/editar/', ProductoServicioUpdateView.as_view(), name='producto_servicio_update'),
     path('productos-servicios/<int:pk>/eliminar/', ProductoServicioDeleteView.as_view(), name='producto_servicio_delete'),
     
     # URLs de régimen fiscal
-    path('regimen-fiscal/', RegimenFiscalListView.as_view(), name='regimen_fiscal_list'),
+    path('regimen-fiscal/', solo_lectura(RegimenFiscalListView.as_view()), name='regimen_fiscal_list'),
     path('regimen-fiscal/nuevo/', RegimenFiscalCreateView.as_view(), name='regimen_fiscal_create'),
     path('regimen-fiscal/<int:pk>/editar/', RegimenFiscalUpdateView.as_view(), name='regimen_fiscal_update'),
     path('regimen-fiscal/<int:pk>/eliminar/', RegimenFiscalDeleteView.as_view(), name='regimen_fiscal_delete'),
     
     # URLs de cultivos
-    path('cultivos/', CultivoListView.as_view(), name='cultivo_list'),
+    path('cultivos/', solo_lectura(CultivoListView.as_view()), name='cultivo_list'),
     path('cultivos/nuevo/', CultivoCreateView.as_view(), name='cultivo_create'),
-    path('cultivos/<int:pk>/', CultivoDetailView.as_view(), name='cultivo_detail'),
+    path('cultivos/<int:pk>/', solo_lectura(CultivoDetailView.as_view()), name='cultivo_detail'),
     path('cultivos/<int:pk>/editar/', CultivoUpdateView.as_view(), name='cultivo_update'),
     path('cultivos/<int:pk>/eliminar/', CultivoDeleteView.as_view(), name='cultivo_delete'),
     
     # URLs de remisiones
-    path('remisiones/', RemisionListView.as_view(), name='remision_list'),
+    path('remisiones/', solo_lectura(RemisionListView.as_view()), name='remision_list'),
     path('remisiones/nuevo/', RemisionCreateView.as_view(), name='remision_create'),
-    path('remisiones/<int:pk>/', RemisionDetailView.as_view(), name='remision_detail'),
+    path('remisiones/<int:pk>/', solo_lectura(RemisionDetailView.as_view()), name='remision_detail'),
     path('remisiones/<int:pk>/imprimir/', RemisionImprimirView.as_view(), name='remision_imprimir'),
     path('remisiones/<int:pk>/editar/', RemisionUpdateView.as_view(), name='remision_update'),
     path('remisiones/<int:pk>/eliminar/', RemisionDeleteView.as_view(), name='remision_delete'),
     path('remisiones/<int:pk>/liquidar/', RemisionLiquidacionView.as_view(), name='remision_liquidar'),
     
     # URLs de cobranza
-    path('cobranza/', CobranzaListView.as_view(), name='cobranza_list'),
+    path('cobranza/', solo_lectura(CobranzaListView.as_view()), name='cobranza_list'),
     path('cobranza/imprimir/', CobranzaImprimirView.as_view(), name='cobranza_imprimir'),
     
     # URLs de detalles de remisiones
@@ -181,34 +184,34 @@ urlpatterns = [
     path('remisiones/detalle/<int:pk>/eliminar/', RemisionDetalleDeleteView.as_view(), name='remision_detalle_delete'),
     
     # URLs AJAX
-    path('ajax/cultivos/', get_cultivos_ajax, name='get_cultivos_ajax'),
+    path('ajax/cultivos/', solo_lectura(get_cultivos_ajax), name='get_cultivos_ajax'),
     path('ajax/remisiones/<int:pk>/cancelar/', cancelar_remision_ajax, name='cancelar_remision_ajax'),
     path('ajax/remisiones/<int:pk>/cobranza/', actualizar_estado_cobranza_ajax, name='actualizar_estado_cobranza_ajax'),
     path('ajax/cuentas-bancarias/agregar/', agregar_cuenta_bancaria_ajax, name='agregar_cuenta_bancarias_ajax'),
-    path('ajax/cuentas-bancarias/listar/', listar_cuentas_bancarias_ajax, name='listar_cuentas_bancarias_ajax'),
+    path('ajax/cuentas-bancarias/listar/', solo_lectura(listar_cuentas_bancarias_ajax), name='listar_cuentas_bancarias_ajax'),
     path('ajax/cuentas-bancarias/eliminar/<int:codigo>/', eliminar_cuenta_bancaria_ajax, name='eliminar_cuenta_bancaria_ajax'),
     path('ajax/remisiones/<int:remision_id>/capturar-pago/', capturar_pago_ajax, name='capturar_pago_ajax'),
-    path('cobranza/reporte-pagos/', reporte_pagos_view, name='reporte_pagos'),
+    path('cobranza/reporte-pagos/', solo_lectura(reporte_pagos_view), name='reporte_pagos'),
     
     # URLs de Presupuestos (estructura anterior)
-    path('presupuestos-gasto/', PresupuestoGastoListView.as_view(), name='presupuesto_gasto_list'),
+    path('presupuestos-gasto/', solo_lectura(PresupuestoGastoListView.as_view()), name='presupuesto_gasto_list'),
     path('presupuestos-gasto/crear/', PresupuestoGastoCreateView.as_view(), name='presupuesto_gasto_create'),
     path('presupuestos-gasto/<int:pk>/editar/', PresupuestoGastoUpdateView.as_view(), name='presupuesto_gasto_update'),
     path('presupuestos-gasto/<int:pk>/eliminar/', PresupuestoGastoDeleteView.as_view(), name='presupuesto_gasto_delete'),
-    path('ajax/presupuestos-gasto/<int:pk>/', presupuesto_gasto_ajax, name='presupuesto_gasto_ajax'),
+    path('ajax/presupuestos-gasto/<int:pk>/', solo_lectura(presupuesto_gasto_ajax), name='presupuesto_gasto_ajax'),
     
     # URLs de Presupuestos (nueva estructura)
-    path('presupuestos/', PresupuestoListView.as_view(), name='presupuesto_list'),
+    path('presupuestos/', solo_lectura(PresupuestoListView.as_view()), name='presupuesto_list'),
     path('presupuestos/crear/', PresupuestoCreateView.as_view(), name='presupuesto_create'),
-    path('presupuestos/<int:pk>/', PresupuestoDetailView.as_view(), name='presupuesto_detail'),
+    path('presupuestos/<int:pk>/', solo_lectura(PresupuestoDetailView.as_view()), name='presupuesto_detail'),
     path('presupuestos/<int:pk>/editar/', PresupuestoUpdateView.as_view(), name='presupuesto_update'),
     path('presupuestos/<int:pk>/eliminar/', PresupuestoDeleteView.as_view(), name='presupuesto_delete'),
     path('ajax/presupuestos/<int:pk>/detalle/', presupuesto_detalle_ajax, name='presupuesto_detalle_ajax'),
     
     # URLs de Gastos
-    path('gastos/', GastoListView.as_view(), name='gasto_list'),
+    path('gastos/', solo_lectura(GastoListView.as_view()), name='gasto_list'),
     path('gastos/crear/', GastoCreateView.as_view(), name='gasto_create'),
-    path('gastos/<int:pk>/', GastoDetailView.as_view(), name='gasto_detail'),
+    path('gastos/<int:pk>/', solo_lectura(GastoDetailView.as_view()), name='gasto_detail'),
     path('gastos/<int:pk>/editar/', GastoUpdateView.as_view(), name='gasto_update'),
     path('gastos/<int:pk>/eliminar/', GastoDeleteView.as_view(), name='gasto_delete'),
     
@@ -218,14 +221,14 @@ urlpatterns = [
     path('presupuestos/<str:pk>/gastos-reporte/', PresupuestoGastosReporteView.as_view(), name='presupuesto_gastos_reporte'),
     
     # URLs AJAX
-    path('ajax/clasificaciones-gastos/', clasificaciones_gastos_ajax, name='clasificaciones_gastos_ajax'),
-    path('ajax/proveedores/', proveedores_ajax, name='proveedores_ajax'),
-    path('ajax/presupuestos/<int:presupuesto_id>/clasificaciones/', clasificaciones_gastos_presupuesto_ajax, name='clasificaciones_gastos_presupuesto_ajax'),
+    path('ajax/clasificaciones-gastos/', solo_lectura(clasificaciones_gastos_ajax), name='clasificaciones_gastos_ajax'),
+    path('ajax/proveedores/', solo_lectura(proveedores_ajax), name='proveedores_ajax'),
+    path('ajax/presupuestos/<int:presupuesto_id>/clasificaciones/', solo_lectura(clasificaciones_gastos_presupuesto_ajax), name='clasificaciones_gastos_presupuesto_ajax'),
     
     # URLs AJAX para Emisores
-    path('ajax/emisores/listar/', listar_emisores_ajax, name='listar_emisores_ajax'),
+    path('ajax/emisores/listar/', solo_lectura(listar_emisores_ajax), name='listar_emisores_ajax'),
     path('ajax/emisores/agregar/', agregar_emisor_ajax, name='agregar_emisor_ajax'),
-    path('ajax/emisores/<int:codigo>/', obtener_emisor_ajax, name='obtener_emisor_ajax'),
+    path('ajax/emisores/<int:codigo>/', solo_lectura(obtener_emisor_ajax), name='obtener_emisor_ajax'),
     # Nota: para evitar colisión con la validación usada en facturación, se renombra la ruta int
     path('ajax/emisores/<int:codigo>/validar-certificado/', validar_emisor_ajax, name='validar_emisor_certificado_ajax'),
     path('ajax/emisores/eliminar/<int:codigo>/', eliminar_emisor_ajax, name='eliminar_emisor_ajax'),
@@ -233,14 +236,15 @@ urlpatterns = [
     
     # URLs para Facturación
     path('facturacion/', FacturacionView.as_view(), name='facturacion'),
-    path('listado-facturas/', ListadoFacturasView.as_view(), name='listado_facturas'),
-    path('factura/<int:folio>/', FacturaDetailView.as_view(), name='factura_detail'),
-    path('factura/<int:folio>/pdf/', generar_pdf_factura, name='generar_pdf_factura'),
-    path('factura/<int:folio>/vista-previa/', vista_previa_pdf_factura, name='vista_previa_pdf_factura'),
-    path('factura/<int:folio>/xml/', descargar_xml_factura, name='descargar_xml_factura'),
-    path('ajax/emisores/<str:codigo>/', obtener_emisor_ajax, name='obtener_emisor_ajax'),
-    path('ajax/clientes/<str:codigo>/', obtener_cliente_ajax, name='obtener_cliente_ajax'),
-    path('ajax/productos/<str:codigo>/', obtener_producto_ajax, name='obtener_producto_ajax'),
+    path('listado-facturas/', solo_lectura(ListadoFacturasView.as_view()), name='listado_facturas'),
+    path('factura/<int:folio>/', solo_lectura(FacturaDetailView.as_view()), name='factura_detail'),
+    path('factura/<int:folio>/pdf/', solo_lectura(generar_pdf_factura), name='generar_pdf_factura'),
+    path('factura/<int:folio>/vista-previa/', solo_lectura(vista_previa_pdf_factura), name='vista_previa_pdf_factura'),
+    path('factura/<int:folio>/xml/', solo_lectura(descargar_xml_factura), name='descargar_xml_factura'),
+    path('facturas/exportar-zip/', exportar_cfdi_zip, name='exportar_cfdi_zip'),
+    path('ajax/emisores/<str:codigo>/', solo_lectura(obtener_emisor_ajax), name='obtener_emisor_ajax'),
+    path('ajax/clientes/<str:codigo>/', solo_lectura(obtener_cliente_ajax), name='obtener_cliente_ajax'),
+    path('ajax/productos/<str:codigo>/', solo_lectura(obtener_producto_ajax), name='obtener_producto_ajax'),
     path('ajax/facturas/guardar/', guardar_factura_ajax, name='guardar_factura_ajax'),
     path('ajax/facturas/<int:folio>/cancelar/', cancelar_factura_ajax, name='cancelar_factura_ajax'),
     
@@ -249,74 +253,79 @@ urlpatterns = [
     path('ajax/emisores/<str:codigo>/validar/', validar_emisor_ajax, name='validar_emisor_ajax'),
     path('ajax/facturas/validar/', validar_cfdi_ajax, name='validar_cfdi_ajax'),
     path('ajax/facturas/timbrar/<int:folio>/', timbrar_factura_ajax, name='timbrar_factura_ajax'),
+    path('ajax/facturas/timbrar-lote/', timbrar_lote_ajax, name='timbrar_lote_ajax'),
+    path('ajax/facturas/pdf-lote/', pdf_lote_ajax, name='pdf_lote_ajax'),
+    path('ajax/facturas/timbrado/<int:trabajo_id>/estado/', solo_lectura(estado_timbrado_ajax), name='estado_timbrado_ajax'),
     path('ajax/facturas/<int:factura_id>/cancelar/', cancelar_factura_ajax, name='cancelar_factura_ajax'),
     path('ajax/facturas/<int:factura_id>/estatus/', consultar_estatus_factura_ajax, name='consultar_estatus_factura_ajax'),
     path('ajax/emisores/<int:emisor_id>/probar-conexion/', probar_conexion_pac_ajax, name='probar_conexion_pac_ajax'),
     
     # URLs AJAX para catálogos
-    path('ajax/catalogos/usos-cfdi/', obtener_usos_cfdi_ajax, name='obtener_usos_cfdi_ajax'),
-    path('ajax/catalogos/autorizo-gastos/', obtener_autorizo_gastos_ajax, name='obtener_autorizo_gastos_ajax'),
+    path('ajax/catalogos/usos-cfdi/', solo_lectura(obtener_usos_cfdi_ajax), name='obtener_usos_cfdi_ajax'),
+    path('ajax/catalogos/claves-sat/', solo_lectura(buscar_claves_sat_ajax), name='buscar_claves_sat_ajax'),
+    path('ajax/catalogos/autorizo-gastos/', solo_lectura(obtener_autorizo_gastos_ajax), name='obtener_autorizo_gastos_ajax'),
     path('ajax/catalogos/autorizo-gastos/crear/', crear_autorizo_gasto_ajax, name='crear_autorizo_gasto_ajax'),
     path('ajax/gastos/<int:gasto_id>/cancelar/', cancelar_gasto_ajax, name='cancelar_gasto_ajax'),
     
     # URLs para herramientas de mantenimiento
     path('herramientas/', HerramientasMantenimientoView.as_view(), name='herramientas_mantenimiento'),
-    path('ajax/herramientas/estado-sistema/', estado_sistema, name='estado_sistema_ajax'),
+    path('ajax/herramientas/estado-sistema/', solo_lectura(estado_sistema), name='estado_sistema_ajax'),
     path('ajax/herramientas/verificar-certificados/', verificar_certificados, name='verificar_certificados_ajax'),
     path('ajax/herramientas/actualizar-catalogos/', actualizar_catalogos, name='actualizar_catalogos_ajax'),
     path('ajax/herramientas/probar-conexion-pac/', probar_conexion_pac, name='probar_conexion_pac_ajax'),
     
     # URLs para complemento de pago
     path('complemento-pago/', ComplementoPagoView.as_view(), name='complemento_pago'),
-    path('estado-cuenta/<int:cliente_id>/', EstadoCuentaView.as_view(), name='estado_cuenta'),
-    path('estado-cuenta/<int:cliente_id>/imprimir/', imprimir_estado_cuenta, name='imprimir_estado_cuenta'),
-    path('estados-cuenta/', listado_estados_cuenta, name='listado_estados_cuenta'),
+    path('estado-cuenta/<int:cliente_id>/', solo_lectura(EstadoCuentaView.as_view()), name='estado_cuenta'),
+    path('estado-cuenta/<int:cliente_id>/imprimir/', solo_lectura(imprimir_estado_cuenta), name='imprimir_estado_cuenta'),
+    path('estados-cuenta/', solo_lectura(listado_estados_cuenta), name='listado_estados_cuenta'),
     
     # URLs AJAX para pagos
     path('ajax/factura/<int:factura_id>/registrar-pago/', registrar_pago, name='registrar_pago_ajax'),
-    path('ajax/factura/<int:factura_id>/historial-pagos/', obtener_historial_pagos, name='historial_pagos_ajax'),
-    path('ajax/factura/<int:factura_id>/info/', obtener_info_factura_ajax, name='info_factura_ajax'),
+    path('ajax/factura/<int:factura_id>/historial-pagos/', solo_lectura(obtener_historial_pagos), name='historial_pagos_ajax'),
+    path('ajax/factura/<int:factura_id>/info/', solo_lectura(obtener_info_factura_ajax), name='info_factura_ajax'),
     path('ajax/factura/<int:factura_id>/complemento-pago/', guardar_complemento_pago_ajax, name='guardar_complemento_pago_ajax'),
+    path('ajax/complemento-pago/multiple/', guardar_complemento_pago_multiple_ajax, name='guardar_complemento_pago_multiple_ajax'),
     
     # URLs para debugging
     path('debug/xml/<str:tipo>/<str:factura_folio>/<str:timestamp>/', descargar_debug_xml, name='descargar_debug_xml'),
     
     # URLs para complemento de pago
-    path('complemento-pago/<int:pago_id>/vista-previa/', vista_previa_complemento_pago, name='vista_previa_complemento_pago'),
-    path('complemento-pago/<int:pago_id>/imprimir/', imprimir_complemento_pago, name='imprimir_complemento_pago'),
-    path('complemento-pago/<int:pago_id>/xml/', descargar_xml_complemento_pago, name='descargar_xml_complemento_pago'),
+    path('complemento-pago/<int:pago_id>/vista-previa/', solo_lectura(vista_previa_complemento_pago), name='vista_previa_complemento_pago'),
+    path('complemento-pago/<int:pago_id>/imprimir/', solo_lectura(imprimir_complemento_pago), name='imprimir_complemento_pago'),
+    path('complemento-pago/<int:pago_id>/xml/', solo_lectura(descargar_xml_complemento_pago), name='descargar_xml_complemento_pago'),
     
     # URLs para compras
-    path('compras/', compras_list, name='compras_list'),
+    path('compras/', solo_lectura(compras_list), name='compras_list'),
     path('compras/nuevo/', compra_create, name='compra_create'),
     path('compras/<int:folio>/editar/', compra_edit, name='compra_edit'),
     path('compras/<int:folio>/eliminar/', compra_delete, name='compra_delete'),
-    path('compras/<int:folio>/', compra_detail, name='compra_detail'),
+    path('compras/<int:folio>/', solo_lectura(compra_detail), name='compra_detail'),
     
     # URLs para kardex y existencias
-    path('kardex/', kardex_list, name='kardex_list'),
-    path('existencias/', existencias_list, name='existencias_list'),
-    path('kardex/producto/<int:producto_codigo>/almacen/<int:almacen_codigo>/', kardex_producto, name='kardex_producto'),
+    path('kardex/', solo_lectura(kardex_list), name='kardex_list'),
+    path('existencias/', solo_lectura(existencias_list), name='existencias_list'),
+    path('kardex/producto/<int:producto_codigo>/almacen/<int:almacen_codigo>/', solo_lectura(kardex_producto), name='kardex_producto'),
     
     # URLs para salidas de inventario
-    path('salidas-inventario/', salida_inventario_list, name='salida_inventario_list'),
+    path('salidas-inventario/', solo_lectura(salida_inventario_list), name='salida_inventario_list'),
     path('salidas-inventario/nuevo/', salida_inventario_create, name='salida_inventario_create'),
-    path('salidas-inventario/<int:pk>/', salida_inventario_detail, name='salida_inventario_detail'),
+    path('salidas-inventario/<int:pk>/', solo_lectura(salida_inventario_detail), name='salida_inventario_detail'),
     path('salidas-inventario/<int:pk>/editar/', salida_inventario_update, name='salida_inventario_update'),
     path('salidas-inventario/<int:pk>/eliminar/', salida_inventario_delete, name='salida_inventario_delete'),
-    path('salidas-inventario/<int:pk>/imprimir/', salida_inventario_imprimir, name='salida_inventario_imprimir'),
+    path('salidas-inventario/<int:pk>/imprimir/', solo_lectura(salida_inventario_imprimir), name='salida_inventario_imprimir'),
     
     # URLs AJAX para salidas de inventario
     path('ajax/crear-tipo-salida/', crear_tipo_salida, name='crear_tipo_salida'),
-    path('ajax/existencia-producto/', obtener_existencia_producto, name='obtener_existencia_producto'),
+    path('ajax/existencia-producto/', solo_lectura(obtener_existencia_producto), name='obtener_existencia_producto'),
     
     # URLs para otros movimientos
-    path('otros-movimientos/', otros_movimientos_list, name='otros_movimientos_list'),
+    path('otros-movimientos/', solo_lectura(otros_movimientos_list), name='otros_movimientos_list'),
     path('otros-movimientos/nuevo/', otro_movimiento_create, name='otro_movimiento_create'),
-    path('otros-movimientos/<int:folio>/', otro_movimiento_detail, name='otro_movimiento_detail'),
+    path('otros-movimientos/<int:folio>/', solo_lectura(otro_movimiento_detail), name='otro_movimiento_detail'),
     path('otros-movimientos/<int:folio>/editar/', otro_movimiento_update, name='otro_movimiento_update'),
     path('otros-movimientos/<int:folio>/eliminar/', otro_movimiento_delete, name='otro_movimiento_delete'),
     
     # URLs AJAX para otros movimientos
-    path('ajax/existencia-producto-otro-movimiento/', obtener_existencia_producto_otro_movimiento, name='obtener_existencia_producto_otro_movimiento'),
+    path('ajax/existencia-producto-otro-movimiento/', solo_lectura(obtener_existencia_producto_otro_movimiento), name='obtener_existencia_producto_otro_movimiento'),
 ]
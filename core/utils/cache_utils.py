@@ -0,0 +1,81 @@
+"""
+Caché en memoria del proceso con tamaño acotado (LRU)
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable
+
+
+class CacheLRU:
+    """
+    Diccionario acotado que descarta la entrada usada hace más tiempo
+
+    Seguro para usarse desde varios hilos. Lleva contadores de aciertos, fallos y descartes.
+    `al_descartar(clave, valor)` se llama (fuera del candado) por cada entrada que sale por tamaño.
+    """
+
+    def __init__(self, max_entradas: int = 128, al_descartar: Callable[[Hashable, Any], None] = None):
+        self.max_entradas = max_entradas
+        self.al_descartar = al_descartar
+        self._datos: 'OrderedDict[Hashable, Any]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+        self.descartes = 0
+
+    def obtener(self, clave: Hashable, crear: Callable[[], Any]) -> Any:
+        """
+        Valor de la clave; si no existe lo crea con `crear()` y lo guarda
+
+        `crear` se ejecuta fuera del candado: si dos hilos piden la misma clave a la vez,
+        ambos la crean y se conserva la última.
+        """
+        with self._lock:
+            if clave in self._datos:
+                self._datos.move_to_end(clave)
+                self.aciertos += 1
+                return self._datos[clave]
+            self.fallos += 1
+
+        valor = crear()
+        self.guardar(clave, valor)
+        return valor
+
+    def guardar(self, clave: Hashable, valor: Any):
+        descartados = []
+        with self._lock:
+            self._datos[clave] = valor
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.max_entradas:
+                descartados.append(self._datos.popitem(last=False))
+                self.descartes += 1
+        if self.al_descartar:
+            for descartado in descartados:
+                self.al_descartar(*descartado)
+
+    def descartar(self, condicion: Callable[[Hashable], bool] = None) -> int:
+        """Elimina las claves que cumplen la condición (todas si no se indica); devuelve cuántas"""
+        with self._lock:
+            claves = [c for c in self._datos if condicion is None or condicion(c)]
+            for clave in claves:
+                del self._datos[clave]
+            return len(claves)
+
+    def __contains__(self, clave: Hashable) -> bool:
+        """Si la clave está guardada (no cuenta como acierto ni la marca como usada)"""
+        with self._lock:
+            return clave in self._datos
+
+    def estadisticas(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'entradas': len(self._datos),
+                'max_entradas': self.max_entradas,
+                'aciertos': self.aciertos,
+                'fallos': self.fallos,
+                'descartes': self.descartes,
+            }
+
+    def __len__(self):
+        return len(self._datos)
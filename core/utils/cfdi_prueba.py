@@ -0,0 +1,75 @@
+"""
+Comprobantes en memoria para mediciones locales
+Facturas con sus detalles sin guardar: los builders de XML y la cadena original no consultan
+la base de datos con ellas
+"""
+
+from datetime import datetime
+from decimal import Decimal
+
+CERTIFICADO_PRUEBA = {'no_certificado': '30001000000500003416', 'certificado_base64': 'MIIF' * 200}
+
+
+def factura_en_memoria(num_conceptos: int) -> tuple:
+    """
+    Factura de ingreso con `num_conceptos` conceptos gravados al 16%
+
+    Returns:
+        tuple: (factura, detalles)
+    """
+    from core.models import Cliente, Emisor, Factura, FacturaDetalle, ProductoServicio, RegimenFiscal
+
+    emisor = Emisor(rfc='EKU9003173C9', razon_social='ESCUELA KEMPER URGATE', regimen_fiscal='601')
+    receptor = Cliente(
+        rfc='XEXX010101000',
+        razon_social='CLIENTE DE PRUEBA',
+        codigo_postal='85140',
+        regimen_fiscal=RegimenFiscal(codigo='601'),
+    )
+    producto = ProductoServicio(impuesto='IVA_16')
+
+    detalles = []
+    for i in range(num_conceptos):
+        importe = Decimal('100.00') + i
+        detalles.append(FacturaDetalle(
+            producto_servicio=producto,
+            no_identificacion=f'P{i:05d}',
+            concepto=f'Producto agrícola {i}  con  espacios',
+            cantidad=Decimal('1'),
+            precio=importe,
+            clave_prod_serv='10101500',
+            clave_unidad='H87',
+            unidad='Pieza',
+            objeto_impuesto='02',
+            importe=importe,
+            impuesto_concepto=(importe * Decimal('0.16')).quantize(Decimal('0.01')),
+        ))
+
+    subtotal = sum(d.importe for d in detalles)
+    factura = Factura(
+        serie='A',
+        folio=1,
+        fecha_emision=datetime(2025, 10, 18, 12, 0, 0),
+        emisor=emisor,
+        receptor=receptor,
+        uso_cfdi='G03',
+        forma_pago='03',
+        metodo_pago='PUE',
+        moneda='MXN',
+        exportacion='01',
+        lugar_expedicion='85140',
+        subtotal=subtotal,
+        total=subtotal + sum(d.impuesto_concepto for d in detalles),
+    )
+    return factura, detalles
+
+
+def medir(funcion, repeticiones: int) -> float:
+    """Segundos promedio por llamada (con una llamada previa de calentamiento)"""
+    import time
+
+    funcion()
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        funcion()
+    return (time.perf_counter() - inicio) / repeticiones
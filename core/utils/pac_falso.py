@@ -0,0 +1,188 @@
+"""
+Servidor PAC falso para pruebas y mediciones locales
+Responde los endpoints de timbrado, cancelación y estatus con el mismo formato que Prodigia,
+con latencia y fallas configurables, sin salir de la máquina
+"""
+
+import base64
+import html
+import json
+import re
+import threading
+import time
+import uuid
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+# Timbre que se agrega al CFDI recibido
+TIMBRE_FISCAL = (
+    '<tfd:TimbreFiscalDigital xmlns:tfd="http://www.sat.gob.mx/TimbreFiscalDigital" '
+    'Version="1.1" UUID="{uuid}" FechaTimbrado="{fecha}" RfcProvCertif="PPD101129EA3" '
+    'SelloCFD="PACFALSO" NoCertificadoSAT="00001000000505142236" SelloSAT="PACFALSO"/>'
+)
+
+RESPUESTA_SOAP = (
+    '<?xml version="1.0" encoding="UTF-8"?>'
+    '<soap:Envelope xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/">'
+    '<soap:Body><ns2:timbradoCfdiResponse xmlns:ns2="timbrado.ws.pade.mx">'
+    '<return>{contenido}</return>'
+    '</ns2:timbradoCfdiResponse></soap:Body></soap:Envelope>'
+)
+
+
+def timbrar_xml(xml_cfdi: str) -> tuple:
+    """
+    Agrega un TimbreFiscalDigital al CFDI
+
+    Returns:
+        tuple: (xml_timbrado, uuid)
+    """
+    uuid_timbre = str(uuid.uuid4()).upper()
+    timbre = TIMBRE_FISCAL.format(uuid=uuid_timbre, fecha=datetime.now().strftime('%Y-%m-%dT%H:%M:%S'))
+    if '</cfdi:Complemento>' in xml_cfdi:
+        xml_timbrado = xml_cfdi.replace('</cfdi:Complemento>', f'{timbre}</cfdi:Complemento>', 1)
+    else:
+        xml_timbrado = xml_cfdi.replace(
+            '</cfdi:Comprobante>', f'<cfdi:Complemento>{timbre}</cfdi:Complemento></cfdi:Comprobante>', 1
+        )
+    return xml_timbrado, uuid_timbre
+
+
+class _ManejadorPACFalso(BaseHTTPRequestHandler):
+    # HTTP/1.1 para que el cliente pueda mantener la conexión abierta (keep-alive)
+    protocol_version = 'HTTP/1.1'
+    # Sin Nagle: encabezados y cuerpo van en escrituras separadas y, con keep-alive, el ACK
+    # retardado del cliente agregaría ~40 ms por respuesta
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def setup(self):
+        super().setup()
+        self.server.pac.registrar_conexion()
+
+    def _responder(self, status: int, cuerpo: str, content_type: str):
+        datos = cuerpo.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(datos)))
+        self.end_headers()
+        self.wfile.write(datos)
+
+    def _atender(self, metodo: str):
+        cuerpo = ''
+        longitud = int(self.headers.get('Content-Length') or 0)
+        if longitud:
+            cuerpo = self.rfile.read(longitud).decode('utf-8')
+
+        pac = self.server.pac
+        if not pac.registrar_solicitud():
+            self._responder(503, 'Servicio no disponible', 'text/plain')
+            return
+        if pac.latencia:
+            time.sleep(pac.latencia)
+
+        ruta = urlsplit(self.path).path
+        if metodo == 'POST' and ruta.endswith('/servicio/Timbrado4.0'):
+            coincidencia = re.search(r'<cfdiXml><!\[CDATA\[(.*)\]\]></cfdiXml>', cuerpo, re.S)
+            if coincidencia is None:
+                contenido = '<servicioTimbrado><timbradoOk>false</timbradoOk><codigo>301</codigo>' \
+                            '<mensaje>XML mal formado</mensaje></servicioTimbrado>'
+            else:
+                xml_timbrado, _ = timbrar_xml(coincidencia.group(1))
+                xml_base64 = base64.b64encode(xml_timbrado.encode('utf-8')).decode('ascii')
+                contenido = f'<servicioTimbrado><timbradoOk>true</timbradoOk>' \
+                            f'<xmlBase64>{xml_base64}</xmlBase64></servicioTimbrado>'
+            self._responder(200, RESPUESTA_SOAP.format(contenido=html.escape(contenido)), 'text/xml; charset=utf-8')
+        elif metodo == 'POST' and ruta.endswith('/wsTimbradoCFDI'):
+            xml_cfdi = re.sub(r'^<\?xml[^>]*\?>', '', cuerpo.strip())
+            xml_timbrado, _ = timbrar_xml(xml_cfdi)
+            self._responder(200, f'<Respuesta><CFDI>{xml_timbrado}</CFDI></Respuesta>', 'application/xml')
+        elif metodo == 'POST' and ruta.endswith('/api/cancelacion'):
+            datos = json.loads(cuerpo or '{}')
+            self._responder(200, json.dumps({
+                'exito': True,
+                'acuse': f"ACUSE-{datos.get('uuid', '')}",
+                'fecha_cancelacion': datetime.now().isoformat(),
+                'estado': 'Cancelado',
+            }), 'application/json')
+        elif metodo == 'GET' and ruta.endswith('/api/estatus'):
+            self._responder(200, json.dumps({
+                'estado': 'Vigente',
+                'fecha_consulta': datetime.now().isoformat(),
+                'mensaje': 'S - Comprobante obtenido satisfactoriamente.',
+                'vigente': True,
+            }), 'application/json')
+        else:
+            self._responder(200, 'PAC falso', 'text/plain')
+
+    def do_GET(self):
+        self._atender('GET')
+
+    def do_POST(self):
+        self._atender('POST')
+
+
+class ServidorPACFalso:
+    """
+    Servidor HTTP local que imita al PAC
+
+    Escucha en 127.0.0.1 (no en 'localhost', que TimbradoService trata como modo simulación),
+    de modo que las peticiones recorren la pila HTTP real.
+
+    Uso:
+        with ServidorPACFalso(latencia=0.05) as pac:
+            configuracion = {'url': pac.url, 'credenciales': {...}}
+    """
+
+    def __init__(self, latencia: float = 0.0, fallas: int = 0, puerto: int = 0):
+        """
+        Args:
+            latencia: Segundos de espera antes de responder cada petición
+            fallas: Número de peticiones iniciales que responden 503 (para probar reintentos)
+            puerto: Puerto en el que escuchar (0 = uno libre)
+        """
+        self.latencia = latencia
+        self.fallas = fallas
+        self.solicitudes = 0
+        self.conexiones = 0
+        self._lock = threading.Lock()
+        self._servidor = ThreadingHTTPServer(('127.0.0.1', puerto), _ManejadorPACFalso)
+        self._servidor.daemon_threads = True
+        self._servidor.pac = self
+        self._hilo = None
+
+    @property
+    def url(self) -> str:
+        host, puerto = self._servidor.server_address[:2]
+        return f'http://{host}:{puerto}'
+
+    def registrar_conexion(self):
+        with self._lock:
+            self.conexiones += 1
+
+    def registrar_solicitud(self) -> bool:
+        """Cuenta la petición; devuelve False si debe responderse con falla"""
+        with self._lock:
+            self.solicitudes += 1
+            if self.fallas > 0:
+                self.fallas -= 1
+                return False
+            return True
+
+    def iniciar(self) -> 'ServidorPACFalso':
+        self._hilo = threading.Thread(target=self._servidor.serve_forever, daemon=True)
+        self._hilo.start()
+        return self
+
+    def detener(self):
+        self._servidor.shutdown()
+        self._servidor.server_close()
+
+    def __enter__(self):
+        return self.iniciar()
+
+    def __exit__(self, *args):
+        self.detener()
@@ -0,0 +1,31 @@
+"""
+Utilidades para construir consultas agregadas con el ORM
+"""
+
+from django.db.models import Sum, OuterRef, Subquery, Value, DecimalField
+from django.db.models.functions import Coalesce
+
+
+def suma_subconsulta(queryset, campo_relacion, campo_suma, max_digits=18, decimal_places=2):
+    """
+    Subconsulta correlacionada que suma `campo_suma` de `queryset` para el registro externo
+
+    Args:
+        queryset: QuerySet de los registros a sumar (ya filtrado)
+        campo_relacion: Ruta hacia la llave primaria del modelo externo (ej. 'remision')
+        campo_suma: Campo decimal a sumar
+        max_digits: Dígitos del DecimalField resultante
+        decimal_places: Decimales del DecimalField resultante
+
+    Returns:
+        Expresión que vale la suma o 0 si no hay registros relacionados
+    """
+    output_field = DecimalField(max_digits=max_digits, decimal_places=decimal_places)
+    subconsulta = (
+        queryset.filter(**{campo_relacion: OuterRef('pk')})
+        .order_by()
+        .values(campo_relacion)
+        .annotate(total=Sum(campo_suma))
+        .values('total')
+    )
+    return Coalesce(Subquery(subconsulta, output_field=output_field), Value(0), output_field=output_field)
@@ -10,6 +10,8 @@ from decimal import Decimal, ROUND_HALF_UP
 from typing import Dict, List, Any, Optional
 from django.core.exceptions import ValidationError
 
+from ..services.catalogo_sat_local import CatalogoSATLocal
+
 logger = logging.getLogger(__name__)
 
 
@@ -46,6 +48,19 @@ class CFDIValidator:
     # Valores válidos según Anexo 20
     TIPO_COMPROBANTE_VALORES = {'I', 'E', 'T', 'N', 'P'}
     
+    @classmethod
+    def _en_catalogo(cls, catalogo: str, valor, respaldo: set = None) -> bool:
+        """
+        Valida un valor contra el catálogo SAT del almacén local (sin red)
+        
+        Si el catálogo no está cargado se usa el conjunto de respaldo de esta clase;
+        sin respaldo, el valor se acepta.
+        """
+        existe = CatalogoSATLocal.existe(catalogo, valor)
+        if existe is None:
+            return valor in respaldo if respaldo is not None else True
+        return existe
+    
     # Validaciones específicas del Anexo 20
     @classmethod
     def validar_anexo_20_estructura(cls, factura, detalles) -> List[str]:
@@ -67,27 +82,27 @@ class CFDIValidator:
         
         # Validar tipo de comprobante
         if hasattr(factura, 'tipo_comprobante'):
-            if factura.tipo_comprobante not in cls.TIPO_COMPROBANTE_VALORES:
+            if not cls._en_catalogo('c_TipoDeComprobante', factura.tipo_comprobante, cls.TIPO_COMPROBANTE_VALORES):
                 errores.append(f"Tipo de comprobante inválido: {factura.tipo_comprobante}")
         
         # Validar exportación
-        if factura.exportacion not in cls.EXPORTACION_VALORES:
+        if not cls._en_catalogo('c_Exportacion', factura.exportacion, cls.EXPORTACION_VALORES):
             errores.append(f"Valor de exportación inválido: {factura.exportacion}")
         
         # Validar método de pago
-        if factura.metodo_pago not in cls.METODOS_PAGO:
+        if not cls._en_catalogo('c_MetodoPago', factura.metodo_pago, cls.METODOS_PAGO):
             errores.append(f"Método de pago inválido: {factura.metodo_pago}")
         
         # Validar forma de pago (condicional)
-        if factura.forma_pago and factura.forma_pago not in cls.FORMAS_PAGO:
+        if factura.forma_pago and not cls._en_catalogo('c_FormaPago', factura.forma_pago, cls.FORMAS_PAGO):
             errores.append(f"Forma de pago inválida: {factura.forma_pago}")
         
         # Validar uso CFDI
-        if factura.uso_cfdi not in cls.USOS_CFDI:
+        if not cls._en_catalogo('c_UsoCFDI', factura.uso_cfdi, cls.USOS_CFDI):
             errores.append(f"Uso CFDI inválido: {factura.uso_cfdi}")
         
         # Validar moneda
-        if factura.moneda not in cls.MONEDAS:
+        if not cls._en_catalogo('c_Moneda', factura.moneda, cls.MONEDAS):
             errores.append(f"Moneda inválida: {factura.moneda}")
         
         # Validar tipo de cambio (condicional)
@@ -204,7 +219,7 @@ class CFDIValidator:
         
         if not emisor.regimen_fiscal:
             errores.append("El régimen fiscal del emisor es obligatorio")
-        elif emisor.regimen_fiscal not in cls.REGIMENES_FISCALES:
+        elif not cls._en_catalogo('c_RegimenFiscal', emisor.regimen_fiscal, cls.REGIMENES_FISCALES):
             errores.append(f"El régimen fiscal '{emisor.regimen_fiscal}' no es válido")
         
         return errores
@@ -231,7 +246,7 @@ class CFDIValidator:
         
         if not receptor.regimen_fiscal:
             errores.append("El régimen fiscal del receptor es obligatorio")
-        elif receptor.regimen_fiscal.codigo not in cls.REGIMENES_FISCALES:
+        elif not cls._en_catalogo('c_RegimenFiscal', receptor.regimen_fiscal.codigo, cls.REGIMENES_FISCALES):
             errores.append(f"El régimen fiscal del receptor '{receptor.regimen_fiscal.codigo}' no es válido")
         
         return errores
@@ -257,13 +272,19 @@ class CFDIValidator:
             # Validar clave de producto/servicio
             if not detalle.clave_prod_serv:
                 errores.append(f"Concepto {i}: La clave de producto/servicio es obligatoria")
+            elif not cls._en_catalogo('c_ClaveProdServ', detalle.clave_prod_serv):
+                errores.append(f"Concepto {i}: La clave de producto/servicio '{detalle.clave_prod_serv}' no existe en el catálogo SAT")
+            
+            # Validar clave de unidad (solo si el catálogo está cargado)
+            if detalle.clave_unidad and not cls._en_catalogo('c_ClaveUnidad', detalle.clave_unidad):
+                errores.append(f"Concepto {i}: La clave de unidad '{detalle.clave_unidad}' no existe en el catálogo SAT")
             
             # Validar unidad
             if not detalle.unidad:
                 errores.append(f"Concepto {i}: La unidad es obligatoria")
             
             # Validar objeto de impuesto
-            if detalle.objeto_impuesto not in cls.OBJETO_IMPUESTO_VALORES:
+            if not cls._en_catalogo('c_ObjetoImp', detalle.objeto_impuesto, cls.OBJETO_IMPUESTO_VALORES):
                 errores.append(f"Concepto {i}: El objeto de impuesto '{detalle.objeto_impuesto}' no es válido")
             
             # Validar descripción
@@ -323,13 +344,13 @@ class CFDIValidator:
         # Validar forma de pago
         if not factura.forma_pago:
             errores.append("La forma de pago es obligatoria")
-        elif factura.forma_pago not in cls.FORMAS_PAGO:
+        elif not cls._en_catalogo('c_FormaPago', factura.forma_pago, cls.FORMAS_PAGO):
             errores.append(f"La forma de pago '{factura.forma_pago}' no es válida")
         
         # Validar método de pago
         if not factura.metodo_pago:
             errores.append("El método de pago es obligatorio")
-        elif factura.metodo_pago not in cls.METODOS_PAGO:
+        elif not cls._en_catalogo('c_MetodoPago', factura.metodo_pago, cls.METODOS_PAGO):
             errores.append(f"El método de pago '{factura.metodo_pago}' no es válido")
         
         # Validar congruencia entre forma y método de pago
@@ -346,7 +367,7 @@ class CFDIValidator:
         # Validar moneda
         if not factura.moneda:
             errores.append("La moneda es obligatoria")
-        elif factura.moneda not in cls.MONEDAS:
+        elif not cls._en_catalogo('c_Moneda', factura.moneda, cls.MONEDAS):
             errores.append(f"La moneda '{factura.moneda}' no es válida")
         
         # Validar tipo de cambio
@@ -368,7 +389,7 @@ class CFDIValidator:
         
         if not factura.exportacion:
             errores.append("El campo exportación es obligatorio")
-        elif factura.exportacion not in cls.EXPORTACION_VALORES:
+        elif not cls._en_catalogo('c_Exportacion', factura.exportacion, cls.EXPORTACION_VALORES):
             errores.append(f"El valor de exportación '{factura.exportacion}' no es válido")
         
         return errores
@@ -434,7 +455,7 @@ class CFDIValidator:
                 errores.append(f"Descripción no puede exceder 1000 caracteres en concepto: {detalle.concepto}")
             
             # Validar objeto de impuesto
-            if detalle.objeto_impuesto not in cls.OBJETO_IMPUESTO_VALORES:
+            if not cls._en_catalogo('c_ObjetoImp', detalle.objeto_impuesto, cls.OBJETO_IMPUESTO_VALORES):
                 errores.append(f"Objeto de impuesto inválido en concepto: {detalle.concepto}")
             
             # Validar número de identificación (hasta 50 caracteres según Anexo 20)
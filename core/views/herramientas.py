@@ -10,6 +10,7 @@ from datetime import datetime, timedelta
 from ..models import Emisor, ConfiguracionSistema
 from ..services.configuracion_entorno import ConfiguracionEntornoService
 from ..services.certificado_service import CertificadoService
+from ..services.conexiones_empresa import ConexionesEmpresa
 from ..services.pac_client import PACProdigiaClient
 from ..services.sat_catalog_service import SATCatalogService
 import logging
@@ -70,6 +71,7 @@ def estado_sistema(request):
                 'actualizados': catalogos_actualizados,
                 'desactualizados': catalogos_desactualizados
             },
+            'conexiones_empresa': ConexionesEmpresa.estadisticas(),
             'fecha_verificacion': timezone.now().isoformat()
         })
         
@@ -20,10 +20,12 @@ from datetime import datetime
 from decimal import Decimal
 from ..models import Usuario, Cliente, RegimenFiscal, Proveedor, Transportista, LoteOrigen, ClasificacionGasto, CentroCosto, ProductoServicio, ConfiguracionSistema, Cultivo, Remision, RemisionDetalle, CuentaBancaria, PagoRemision, PresupuestoGasto, Presupuesto, PresupuestoDetalle, Gasto, GastoDetalle, Emisor, Factura, FacturaDetalle, AutorizoGasto, Almacen, Compra, CompraDetalle, Kardex, PagoCompra
 from ..forms import LoginForm, UsuarioForm, ClienteForm, ClienteSearchForm, RegimenFiscalForm, ProveedorForm, ProveedorSearchForm, TransportistaForm, TransportistaSearchForm, LoteOrigenForm, LoteOrigenSearchForm, ClasificacionGastoForm, ClasificacionGastoSearchForm, CentroCostoForm, CentroCostoSearchForm, ProductoServicioForm, ProductoServicioSearchForm, ConfiguracionSistemaForm, CultivoForm, CultivoSearchForm, RemisionForm, RemisionDetalleForm, RemisionSearchForm, RemisionLiquidacionForm, RemisionCancelacionForm, CobranzaSearchForm, PresupuestoGastoForm, PresupuestoGastoSearchForm, PresupuestoForm, PresupuestoDetalleForm, PresupuestoSearchForm, GastoForm, GastoDetalleForm, AlmacenForm, AlmacenSearchForm, CompraForm, CompraDetalleForm, CompraSearchForm, KardexSearchForm
+from ..decorators import solo_lectura
+from ..mixins import SoloLecturaMixin
 
 # Create your views here.
 
-class DashboardView(LoginRequiredMixin, TemplateView):
+class DashboardView(SoloLecturaMixin, LoginRequiredMixin, TemplateView):
     template_name = 'core/dashboard.html'
     
     def get_context_data(self, **kwargs):
@@ -36,18 +38,10 @@ class DashboardView(LoginRequiredMixin, TemplateView):
         context['usuarios_activos'] = Usuario.objects.filter(is_active=True).count()
         
         # Obtener lista de clientes para el filtro del primer gráfico
-        clientes = Cliente.objects.filter(activo=True).order_by('razon_social')
-        print(f"DEBUG: Clientes encontrados: {clientes.count()}")
-        for cliente in clientes:
-            print(f"DEBUG: Cliente Código: {cliente.codigo}, Razón Social: {cliente.razon_social}")
-        context['clientes'] = clientes
+        context['clientes'] = Cliente.objects.filter(activo=True).order_by('razon_social')
         
         # Obtener lista de lotes de origen para el filtro del primer gráfico
-        lotes_origen = LoteOrigen.objects.filter(activo=True).order_by('nombre')
-        print(f"DEBUG: Lotes de origen encontrados: {lotes_origen.count()}")
-        for lote in lotes_origen:
-            print(f"DEBUG: Lote Código: {lote.codigo}, Nombre: {lote.nombre}")
-        context['lotes_origen'] = lotes_origen
+        context['lotes_origen'] = LoteOrigen.objects.filter(activo=True).order_by('nombre')
         
         # Estadísticas de remisiones del ciclo actual
         # Obtener el ciclo actual de la configuración
@@ -57,294 +51,14 @@ class DashboardView(LoginRequiredMixin, TemplateView):
         except:
             ciclo_actual = ''
         
-        # Filtrar solo remisiones del ciclo actual (igual que en RemisionListView)
-        if ciclo_actual:
-            remisiones_qs = Remision.objects.filter(ciclo=ciclo_actual)
-        else:
-            remisiones_qs = Remision.objects.all()
-        
-        # Contar pendientes y preliquidadas del ciclo actual
-        pendientes = 0
-        preliquidadas = 0
-        diagnostico_pendientes = []
-        
-        for remision in remisiones_qs:
-            if remision.esta_liquidada():
-                preliquidadas += 1
-            else:
-                pendientes += 1
-                # Diagnóstico de por qué no está preliquidada
-                detalles = remision.detalles.all()
-                if not detalles.exists():
-                    razon = 'Sin detalles'
-                else:
-                    tiene_valores = False
-                    tiene_auditoria = False
-                    for d in detalles:
-                        if (getattr(d, 'kgs_liquidados', 0) > 0 or
-                            getattr(d, 'kgs_merma', 0) > 0 or
-                            getattr(d, 'precio', 0) > 0 or
-                            getattr(d, 'importe_liquidado', 0) > 0):
-                            tiene_valores = True
-                        if getattr(d, 'usuario_liquidacion', None) is not None and getattr(d, 'fecha_liquidacion', None) is not None:
-                            tiene_auditoria = True
-                    if not tiene_valores:
-                        razon = 'Sin valores de liquidación en detalles'
-                    elif not tiene_auditoria:
-                        razon = 'Falta auditoría (usuario/fecha) en detalles'
-                    else:
-                        razon = 'Condiciones de liquidación no cumplidas'
-                diagnostico_pendientes.append({
-                    'id': remision.pk,
-                    'ciclo': remision.ciclo,
-                    'folio': remision.folio,
-                    'cliente': getattr(remision.cliente, 'razon_social', ''),
-                    'razon': razon,
-                })
-        
-        context['remisiones_pendientes'] = pendientes
-        context['remisiones_preliquidadas'] = preliquidadas
-        context['diagnostico_remisiones_pendientes'] = diagnostico_pendientes
         context['ciclo_actual'] = ciclo_actual
         
-        # Estadísticas de presupuestos del ciclo actual
-        if ciclo_actual:
-            presupuestos_qs = Presupuesto.objects.filter(activo=True, ciclo=ciclo_actual)
-        else:
-            presupuestos_qs = Presupuesto.objects.filter(activo=True)
-        
-        # Calcular totales de presupuestos
-        total_presupuestado = 0
-        total_gastos = 0
-        presupuestos_info = []
+        # Remisiones, presupuestos, saldos, facturas y gráficas por calidad con consultas agregadas
+        from core.services.dashboard_service import DashboardEstadisticasService
+        context.update(DashboardEstadisticasService.obtener_estadisticas(ciclo_actual))
         
-        for presupuesto in presupuestos_qs:
-            # Obtener todos los gastos del presupuesto
-            gastos = Gasto.objects.filter(presupuesto=presupuesto, activo=True)
-            presupuesto_gastos = 0
-            
-            for gasto in gastos:
-                # Sumar todos los detalles de gasto activos
-                from django.db.models import Sum
-                total_detalle = gasto.detalles.filter(activo=True).aggregate(
-                    total=Sum('importe')
-                )['total'] or 0
-                presupuesto_gastos += float(total_detalle)
-            
-            total_presupuestado += float(presupuesto.total_presupuestado)
-            total_gastos += presupuesto_gastos
-            
-            presupuestos_info.append({
-                'centro_costo': presupuesto.centro_costo.descripcion,
-                'presupuestado': float(presupuesto.total_presupuestado),
-                'gastos': presupuesto_gastos
-            })
-        
-        context['presupuestos_info'] = presupuestos_info
-        context['total_presupuestado'] = total_presupuestado
-        context['total_gastos'] = total_gastos
-        
-        # Calcular saldo pendiente general de remisiones preliquidadas
-        saldo_pendiente_general = 0
-        if ciclo_actual:
-            remisiones_preliquidadas_qs = Remision.objects.filter(ciclo=ciclo_actual)
-        else:
-            remisiones_preliquidadas_qs = Remision.objects.all()
-        
-        for remision in remisiones_preliquidadas_qs:
-            if remision.esta_liquidada():
-                # Calcular el saldo pendiente de esta remisión
-                saldo_remision = remision.saldo_pendiente
-                saldo_pendiente_general += float(saldo_remision)
-        
-        context['saldo_pendiente_general'] = saldo_pendiente_general
-        
-        # Calcular saldo pendiente en facturas
-        from core.factura_models import Factura
-        saldo_facturas = 0
-        facturas_activas = Factura.objects.filter(cancelada=False)
-        
-        for factura in facturas_activas:
-            saldo_factura = factura.obtener_saldo_pendiente()
-            saldo_facturas += float(saldo_factura)
-        
-        context['saldo_facturas'] = saldo_facturas
-        
-        # Datos para gráfica de calidad de productos (remisiones no canceladas del ciclo actual)
-        from django.db.models import Sum
         from collections import defaultdict
         
-        # Filtrar solo las remisiones no canceladas del ciclo actual (incluye preliquidadas y no preliquidadas)
-        remisiones_no_canceladas = [r for r in remisiones_qs if not r.cancelada]
-        remisiones_no_canceladas_ids = [r.pk for r in remisiones_no_canceladas]
-        
-        # Obtener detalles de remisiones no canceladas del ciclo actual
-        detalles_qs = RemisionDetalle.objects.filter(remision__in=remisiones_no_canceladas_ids)
-        
-        # Agrupar por calidad y calcular totales
-        calidad_data = defaultdict(lambda: {'kgs_netos_enviados': 0, 'kgs_liquidados': 0})
-        
-        for detalle in detalles_qs:
-            calidad = detalle.calidad
-            calidad_data[calidad]['kgs_netos_enviados'] += float(detalle.kgs_neto_envio or 0)
-            calidad_data[calidad]['kgs_liquidados'] += float(detalle.kgs_liquidados or 0)
-        
-        # Convertir a lista para el template
-        grafica_calidad_data = []
-        for calidad, datos in calidad_data.items():
-            diferencia = round(datos['kgs_netos_enviados'] - datos['kgs_liquidados'], 2)
-            grafica_calidad_data.append({
-                'calidad': calidad,
-                'kgs_netos_enviados': round(datos['kgs_netos_enviados'], 2),
-                'kgs_liquidados': round(datos['kgs_liquidados'], 2),
-                'diferencia': diferencia
-            })
-        
-        # Ordenar por calidad
-        grafica_calidad_data.sort(key=lambda x: x['calidad'])
-        
-        context['grafica_calidad_data'] = grafica_calidad_data
-        
-        # Datos para gráfica de kgs enviados vs liquidados (remisiones no canceladas del ciclo actual)
-        # Usar los mismos detalles_qs ya filtrados
-        kgs_enviados_data = defaultdict(lambda: {'kgs_enviados': 0, 'kgs_liquidados': 0})
-        
-        for detalle in detalles_qs:
-            calidad = detalle.calidad
-            kgs_enviados_data[calidad]['kgs_enviados'] += float(detalle.kgs_enviados or 0)
-            kgs_enviados_data[calidad]['kgs_liquidados'] += float(detalle.kgs_liquidados or 0)
-        
-        # Convertir a lista para el template
-        grafica_kgs_enviados_data = []
-        for calidad, datos in kgs_enviados_data.items():
-            diferencia = round(datos['kgs_enviados'] - datos['kgs_liquidados'], 2)
-            grafica_kgs_enviados_data.append({
-                'calidad': calidad,
-                'kgs_enviados': round(datos['kgs_enviados'], 2),
-                'kgs_liquidados': round(datos['kgs_liquidados'], 2),
-                'diferencia': diferencia
-            })
-        
-        # Ordenar por calidad
-        grafica_kgs_enviados_data.sort(key=lambda x: x['calidad'])
-        
-        context['grafica_kgs_enviados_data'] = grafica_kgs_enviados_data
-        
-        # Datos para gráfica de merma (remisiones no canceladas del ciclo actual)
-        merma_data = defaultdict(lambda: {
-            'kgs_merma_enviada': 0, 
-            'kgs_merma_liquidada': 0,
-            'total_no_arps': 0,
-            'total_no_arps_liquidados': 0,
-            'sum_merma_arps': 0,
-            'count_detalles': 0
-        })
-        
-        for detalle in detalles_qs:
-            calidad = detalle.calidad
-            merma_data[calidad]['kgs_merma_enviada'] += float(detalle.kgs_merma or 0)
-            merma_data[calidad]['kgs_merma_liquidada'] += float(detalle.kgs_merma_liquidados or 0)
-            merma_data[calidad]['total_no_arps'] += float(detalle.no_arps or 0)
-            merma_data[calidad]['total_no_arps_liquidados'] += float(detalle.no_arps_liquidados or 0)
-            merma_data[calidad]['sum_merma_arps'] += float(detalle.merma_arps or 0)
-            merma_data[calidad]['count_detalles'] += 1
-        
-        # Convertir a lista para el template
-        grafica_merma_data = []
-        for calidad, datos in merma_data.items():
-            diferencia_merma = round(datos['kgs_merma_enviada'] - datos['kgs_merma_liquidada'], 2)
-            # Calcular promedio de merma por arp enviado
-            promedio_merma_arp_enviado = round(datos['sum_merma_arps'] / datos['count_detalles'], 2) if datos['count_detalles'] > 0 else 0
-            # Calcular promedio de merma por arp liquidado
-            promedio_merma_arp_liquidado = round(datos['kgs_merma_liquidada'] / datos['total_no_arps_liquidados'], 2) if datos['total_no_arps_liquidados'] > 0 else 0
-            
-            grafica_merma_data.append({
-                'calidad': calidad,
-                'kgs_merma_enviada': round(datos['kgs_merma_enviada'], 2),
-                'kgs_merma_liquidada': round(datos['kgs_merma_liquidada'], 2),
-                'diferencia_merma': diferencia_merma,
-                'promedio_merma_arp_enviado': promedio_merma_arp_enviado,
-                'promedio_merma_arp_liquidado': promedio_merma_arp_liquidado
-            })
-        
-        # Ordenar por calidad
-        grafica_merma_data.sort(key=lambda x: x['calidad'])
-        
-        context['grafica_merma_data'] = grafica_merma_data
-        
-        # Datos para gráfica de importes neto enviado vs preliquidado (remisiones no canceladas del ciclo actual)
-        importes_data = defaultdict(lambda: {'importe_neto_enviado': 0, 'importe_preliquidado': 0})
-        
-        for detalle in detalles_qs:
-            calidad = detalle.calidad
-            importes_data[calidad]['importe_neto_enviado'] += float(detalle.importe_envio or 0)
-            importes_data[calidad]['importe_preliquidado'] += float(detalle.importe_liquidado or 0)
-        
-        # Convertir a lista para el template
-        grafica_importes_data = []
-        for calidad, datos in importes_data.items():
-            diferencia_importes = round(datos['importe_neto_enviado'] - datos['importe_preliquidado'], 2)
-            grafica_importes_data.append({
-                'calidad': calidad,
-                'importe_neto_enviado': round(datos['importe_neto_enviado'], 2),
-                'importe_preliquidado': round(datos['importe_preliquidado'], 2),
-                'diferencia_importes': diferencia_importes
-            })
-        
-        # Ordenar por calidad con "Mixtas" al final
-        def sort_key(item):
-            calidad = item['calidad']
-            if calidad == 'Mixtas':
-                return (1, calidad)  # 1 para que vaya al final
-            else:
-                return (0, calidad)  # 0 para que vaya al principio
-        
-        grafica_importes_data.sort(key=sort_key)
-        
-        context['grafica_importes_data'] = grafica_importes_data
-        
-        # Datos para ranking de clientes (solo remisiones preliquidadas del ciclo actual)
-        from django.db.models import Sum, Count
-        
-        # Agrupar remisiones preliquidadas por cliente y calcular totales
-        clientes_data = defaultdict(lambda: {'importe_preliquidado': 0, 'importe_liquidado': 0, 'total_pagos': 0, 'total_remisiones': 0})
-        
-        for remision in remisiones_qs:
-            if remision.esta_liquidada():  # Solo remisiones preliquidadas
-                cliente_nombre = remision.cliente.razon_social
-                # Sumar importes preliquidados y liquidados de todos los detalles de la remisión
-                importe_preliquidado_remision = sum(float(detalle.importe_envio or 0) for detalle in remision.detalles.all())
-                importe_liquidado_remision = sum(float(detalle.importe_liquidado or 0) for detalle in remision.detalles.all())
-                # Sumar pagos realizados de la remisión
-                total_pagos_remision = sum(float(pago.monto or 0) for pago in remision.pagos.filter(activo=True))
-                
-                clientes_data[cliente_nombre]['importe_preliquidado'] += importe_preliquidado_remision
-                clientes_data[cliente_nombre]['importe_liquidado'] += importe_liquidado_remision
-                clientes_data[cliente_nombre]['total_pagos'] += total_pagos_remision
-                clientes_data[cliente_nombre]['total_remisiones'] += 1
-        
-        # Convertir a lista y ordenar por importe liquidado (descendente)
-        ranking_clientes_data = []
-        for cliente_nombre, datos in clientes_data.items():
-            # Saldo pendiente = Importe liquidado - Pagos realizados
-            saldo_pendiente = datos['importe_liquidado'] - datos['total_pagos']
-            ranking_clientes_data.append({
-                'cliente_nombre': cliente_nombre,
-                'importe_preliquidado': round(datos['importe_preliquidado'], 2),
-                'importe_liquidado': round(datos['importe_liquidado'], 2),
-                'total_pagos': round(datos['total_pagos'], 2),
-                'saldo_pendiente': round(saldo_pendiente, 2),
-                'total_remisiones': datos['total_remisiones']
-            })
-        
-        # Ordenar por importe liquidado descendente (ranking)
-        ranking_clientes_data.sort(key=lambda x: x['importe_liquidado'], reverse=True)
-        
-        # Limitar a top 10 clientes
-        ranking_clientes_data = ranking_clientes_data[:10]
-        
-        context['ranking_clientes_data'] = ranking_clientes_data
-        
         # Datos para gráfica de gastos autorizados (Compras de productos del inventario)
         from core.models import Compra, AutorizoGasto
         
@@ -563,11 +277,27 @@ def login_view(request):
         return redirect('core:dashboard')
     
     if request.method == 'POST':
+        from django.conf import settings
+        from directiva_agricola.db_router import set_current_company_db
+        from ..services.conexiones_empresa import ConexionesEmpresa
+
         form = LoginForm(data=request.POST)
-        if form.is_valid():
-            user = form.get_user()
-            login(request, user)
-            return redirect('core:dashboard')
+        rfc = request.POST.get('rfc', '').strip().upper()
+        empresa = ConexionesEmpresa.empresa_por_rfc(rfc) if rfc else None
+        if empresa is not None and not empresa['disponible']:
+            form.add_error(None, 'La empresa está suspendida o dada de baja.')
+        elif empresa is None and getattr(settings, 'EMPRESAS_RFC_OBLIGATORIO', False):
+            form.add_error(None, 'El RFC no corresponde a ninguna empresa registrada.')
+        else:
+            # El usuario se autentica contra la BD de su empresa (EmpresaDbMiddleware restablece el alias)
+            if empresa is not None:
+                set_current_company_db(ConexionesEmpresa.registrar(empresa['db_name']))
+            if form.is_valid():
+                user = form.get_user()
+                login(request, user)
+                if empresa is not None:
+                    request.session['empresa_rfc'] = empresa['rfc']
+                return redirect('core:dashboard')
     else:
         form = LoginForm()
     
@@ -10031,7 +9761,8 @@ class RemisionListView(LoginRequiredMixin, ListView):
                         Q(total_kgs_liq__gt=0) | Q(total_imp_liq__gt=0)
                     )
         
-        return queryset.order_by('-fecha_creacion')
+        # Anotar el estado de liquidación para que la plantilla no consulte por cada renglón
+        return queryset.with_liquidacion_state().order_by('-fecha_creacion')
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -10702,21 +10433,7 @@ class RemisionLiquidacionView(LoginRequiredMixin, TemplateView):
         """Determinar si una remisión está preliquidada basándose en los campos de liquidación
         Y si tiene información de auditoría (usuario_liquidacion y fecha_liquidacion)
         """
-        detalles = remision.detalles.all()
-        if not detalles.exists():
-            return False
-        
-        # Una remisión está preliquidada si al menos un detalle tiene valores de liquidación
-        # Y tiene información de auditoría (usuario_liquidacion y fecha_liquidacion)
-        for detalle in detalles:
-            if ((detalle.kgs_liquidados > 0 or 
-                 detalle.kgs_merma > 0 or 
-                 detalle.precio > 0 or 
-                 detalle.importe_liquidado > 0) and
-                detalle.usuario_liquidacion is not None and
-                detalle.fecha_liquidacion is not None):
-                return True
-        return False
+        return Remision.objects.filter(pk=remision.pk).preliquidadas().exists()
     
     def form_invalid(self, form):
         messages.error(self.request, 'Error en el formulario de liquidación.')
@@ -11180,7 +10897,7 @@ def eliminar_emisor_ajax(request, codigo):
         }, status=500)
 
 
-class RemisionImprimirView(LoginRequiredMixin, TemplateView):
+class RemisionImprimirView(SoloLecturaMixin, LoginRequiredMixin, TemplateView):
     """Vista para imprimir formato de remisión"""
     template_name = 'core/remision_imprimir.html'
     
@@ -12587,120 +12304,31 @@ class CobranzaListView(LoginRequiredMixin, ListView):
     paginate_by = 20
     
     def get_queryset(self):
-        """Obtener remisiones preliquidadas agrupadas por cliente con filtros"""
-        # Obtener parámetros de búsqueda
-        busqueda = self.request.GET.get('busqueda', '')
-        cliente_id = self.request.GET.get('cliente', '')
-        estado_facturacion = self.request.GET.get('estado_facturacion', '')
-        estado_pago = self.request.GET.get('estado_pago', '')
-        fecha_desde = self.request.GET.get('fecha_desde', '')
-        fecha_hasta = self.request.GET.get('fecha_hasta', '')
-        
-        # Filtrar solo remisiones preliquidadas y no canceladas
-        remisiones = Remision.objects.filter(
-            cancelada=False
-        ).select_related('cliente').prefetch_related('detalles')
-        
-        # Aplicar filtros
-        if busqueda:
-            remisiones = remisiones.filter(
-                Q(ciclo__icontains=busqueda) |
-                Q(folio__icontains=busqueda) |
-                Q(cliente__razon_social__icontains=busqueda)
-            )
-        
-        if cliente_id:
-            remisiones = remisiones.filter(cliente_id=cliente_id)
-        
-        if estado_facturacion == 'pendiente':
-            remisiones = remisiones.filter(facturado=False)
-        elif estado_facturacion == 'facturado':
-            remisiones = remisiones.filter(facturado=True)
-        
-        
-        if fecha_desde:
-            remisiones = remisiones.filter(fecha__gte=fecha_desde)
-        
-        if fecha_hasta:
-            remisiones = remisiones.filter(fecha__lte=fecha_hasta)
-        
-        # Filtrar solo las que están preliquidadas
-        remisiones_preliquidadas = []
-        for remision in remisiones:
-            if remision.esta_liquidada():
-                # Aplicar filtro de estado de pago basado en saldo pendiente
-                saldo_pendiente = remision.saldo_pendiente
-                
-                if estado_pago == 'pendiente':
-                    # Mostrar solo remisiones con saldo pendiente (no pagadas completamente)
-                    if saldo_pendiente > 0:
-                        remisiones_preliquidadas.append(remision)
-                elif estado_pago == 'pagado':
-                    # Mostrar solo remisiones con saldo cero (completamente pagadas)
-                    if saldo_pendiente == 0:
-                        remisiones_preliquidadas.append(remision)
-                else:
-                    # Sin filtro de estado de pago, mostrar solo las no pagadas (comportamiento por defecto)
-                    if saldo_pendiente > 0:
-                        remisiones_preliquidadas.append(remision)
-        
-        # Agrupar por cliente
-        clientes_dict = {}
-        for remision in remisiones_preliquidadas:
-            cliente = remision.cliente
-            if cliente not in clientes_dict:
-                clientes_dict[cliente] = []
-            clientes_dict[cliente].append(remision)
-        
-        # Convertir a lista de tuplas (cliente, lista_remisiones)
-        clientes_agrupados = []
-        for cliente, remisiones_cliente in clientes_dict.items():
-            # Ordenar remisiones por fecha descendente
-            remisiones_cliente.sort(key=lambda x: x.fecha, reverse=True)
-            clientes_agrupados.append((cliente, remisiones_cliente))
+        """Obtener los clientes con remisiones preliquidadas que cumplen los filtros
         
-        # Ordenar por razón social del cliente
-        clientes_agrupados.sort(key=lambda x: x[0].razon_social)
+        La paginación se hace por cliente en la base de datos; las remisiones se
+        consultan después solo para los clientes de la página actual.
+        """
+        from core.services.cobranza_service import CobranzaService
         
-        return clientes_agrupados
+        self.remisiones_filtradas = CobranzaService.filtrar_remisiones(self.request.GET)
+        return CobranzaService.clientes_con_remisiones(self.remisiones_filtradas)
     
     def get_context_data(self, **kwargs):
+        from core.services.cobranza_service import CobranzaService
+        
         context = super().get_context_data(**kwargs)
         context['title'] = 'Cobranza - Remisiones Preliquidadas'
         
         # Agregar formulario de búsqueda
         context['search_form'] = CobranzaSearchForm(self.request.GET)
         
-        # Calcular totales por cliente y agregar a cada tupla
-        remisiones_agrupadas_con_totales = []
-        total_general = 0
-        saldo_general = 0
-        
-        for cliente, remisiones in context['remisiones_agrupadas']:
-            total_importe = 0
-            saldo_cliente = 0
-            remisiones_con_importe = []
-            
-            for remision in remisiones:
-                # Calcular el importe total de esta remisión
-                importe_remision = 0
-                for detalle in remision.detalles.all():
-                    importe_remision += detalle.importe_liquidado
-                
-                # Calcular el saldo pendiente de la remisión
-                saldo_remision = remision.saldo_pendiente
-                
-                # Agregar el importe de la remisión al total del cliente
-                total_importe += importe_remision
-                saldo_cliente += saldo_remision
-                
-                # Crear una tupla con la remisión y su importe
-                remisiones_con_importe.append((remision, importe_remision))
-            
-            # Agregar el total y saldo a la tupla
-            remisiones_agrupadas_con_totales.append((cliente, remisiones_con_importe, total_importe, saldo_cliente))
-            total_general += total_importe
-            saldo_general += saldo_cliente
+        # Agrupar las remisiones de los clientes de la página y calcular totales por cliente
+        remisiones_agrupadas_con_totales = CobranzaService.agrupar_por_cliente(
+            context['remisiones_agrupadas'], self.remisiones_filtradas
+        )
+        total_general = sum(total_importe for _, _, total_importe, _ in remisiones_agrupadas_con_totales)
+        saldo_general = sum(saldo_cliente for _, _, _, saldo_cliente in remisiones_agrupadas_con_totales)
         
         context['remisiones_agrupadas'] = remisiones_agrupadas_con_totales
         context['total_general'] = total_general
@@ -13107,87 +12735,18 @@ def eliminar_emisor_ajax(request, codigo):
         }, status=500)
 
 
-class CobranzaImprimirView(LoginRequiredMixin, TemplateView):
+class CobranzaImprimirView(SoloLecturaMixin, LoginRequiredMixin, TemplateView):
     """Vista para imprimir el estado de cuenta de cobranza"""
     template_name = 'core/cobranza_imprimir.html'
     
     def get_queryset(self):
-        """Obtener remisiones preliquidadas con los mismos filtros que la vista principal"""
-        # Obtener parámetros de búsqueda (mismo código que CobranzaListView)
-        busqueda = self.request.GET.get('busqueda', '')
-        cliente_id = self.request.GET.get('cliente', '')
-        estado_facturacion = self.request.GET.get('estado_facturacion', '')
-        estado_pago = self.request.GET.get('estado_pago', '')
-        fecha_desde = self.request.GET.get('fecha_desde', '')
-        fecha_hasta = self.request.GET.get('fecha_hasta', '')
-        
-        # Filtrar solo remisiones preliquidadas y no canceladas
-        remisiones = Remision.objects.filter(
-            cancelada=False
-        ).select_related('cliente').prefetch_related('detalles')
-        
-        # Aplicar filtros (mismo código que CobranzaListView)
-        if busqueda:
-            remisiones = remisiones.filter(
-                Q(ciclo__icontains=busqueda) |
-                Q(folio__icontains=busqueda) |
-                Q(cliente__razon_social__icontains=busqueda)
-            )
-        
-        if cliente_id:
-            remisiones = remisiones.filter(cliente_id=cliente_id)
-        
-        if estado_facturacion == 'pendiente':
-            remisiones = remisiones.filter(facturado=False)
-        elif estado_facturacion == 'facturado':
-            remisiones = remisiones.filter(facturado=True)
-        
-        
-        if fecha_desde:
-            remisiones = remisiones.filter(fecha__gte=fecha_desde)
-        
-        if fecha_hasta:
-            remisiones = remisiones.filter(fecha__lte=fecha_hasta)
-        
-        # Filtrar solo las que están preliquidadas
-        remisiones_preliquidadas = []
-        for remision in remisiones:
-            if remision.esta_liquidada():
-                # Aplicar filtro de estado de pago basado en saldo pendiente
-                saldo_pendiente = remision.saldo_pendiente
-                
-                if estado_pago == 'pendiente':
-                    # Mostrar solo remisiones con saldo pendiente (no pagadas completamente)
-                    if saldo_pendiente > 0:
-                        remisiones_preliquidadas.append(remision)
-                elif estado_pago == 'pagado':
-                    # Mostrar solo remisiones con saldo cero (completamente pagadas)
-                    if saldo_pendiente == 0:
-                        remisiones_preliquidadas.append(remision)
-                else:
-                    # Sin filtro de estado de pago, mostrar solo las no pagadas (comportamiento por defecto)
-                    if saldo_pendiente > 0:
-                        remisiones_preliquidadas.append(remision)
+        """Obtener remisiones preliquidadas agrupadas por cliente con los mismos filtros que la vista principal"""
+        from core.services.cobranza_service import CobranzaService
         
-        # Agrupar por cliente
-        clientes_dict = {}
-        for remision in remisiones_preliquidadas:
-            cliente = remision.cliente
-            if cliente not in clientes_dict:
-                clientes_dict[cliente] = []
-            clientes_dict[cliente].append(remision)
-        
-        # Convertir a lista de tuplas (cliente, lista_remisiones)
-        clientes_agrupados = []
-        for cliente, remisiones_cliente in clientes_dict.items():
-            # Ordenar remisiones por fecha descendente
-            remisiones_cliente.sort(key=lambda x: x.fecha, reverse=True)
-            clientes_agrupados.append((cliente, remisiones_cliente))
-        
-        # Ordenar por razón social del cliente
-        clientes_agrupados.sort(key=lambda x: x[0].razon_social)
-        
-        return clientes_agrupados
+        remisiones = CobranzaService.filtrar_remisiones(self.request.GET)
+        return CobranzaService.agrupar_por_cliente(
+            CobranzaService.clientes_con_remisiones(remisiones), remisiones
+        )
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -13200,41 +12759,18 @@ class CobranzaImprimirView(LoginRequiredMixin, TemplateView):
         # Obtener datos con filtros aplicados
         remisiones_agrupadas = self.get_queryset()
         
-        # Calcular totales por cliente y agregar a cada tupla
-        remisiones_agrupadas_con_totales = []
+        # Calcular totales generales a partir de los totales por cliente
         total_general = 0
         saldo_general = 0
         total_remisiones = 0
         
-        for cliente, remisiones in remisiones_agrupadas:
+        for cliente, remisiones_con_importe, total_importe, saldo_cliente in remisiones_agrupadas:
             # Contar las remisiones de este cliente
-            total_remisiones += len(remisiones)
-            total_importe = 0
-            saldo_cliente = 0
-            remisiones_con_importe = []
-            
-            for remision in remisiones:
-                # Calcular el importe total de esta remisión
-                importe_remision = 0
-                for detalle in remision.detalles.all():
-                    importe_remision += detalle.importe_liquidado
-                
-                # Calcular el saldo pendiente de la remisión
-                saldo_remision = remision.saldo_pendiente
-                
-                # Agregar el importe de la remisión al total del cliente
-                total_importe += importe_remision
-                saldo_cliente += saldo_remision
-                
-                # Crear una tupla con la remisión y su importe
-                remisiones_con_importe.append((remision, importe_remision))
-            
-            # Agregar el total y saldo a la tupla
-            remisiones_agrupadas_con_totales.append((cliente, remisiones_con_importe, total_importe, saldo_cliente))
+            total_remisiones += len(remisiones_con_importe)
             total_general += total_importe
             saldo_general += saldo_cliente
         
-        context['remisiones_agrupadas'] = remisiones_agrupadas_con_totales
+        context['remisiones_agrupadas'] = remisiones_agrupadas
         context['total_general'] = total_general
         context['saldo_general'] = saldo_general
         context['total_remisiones'] = total_remisiones
@@ -17350,7 +16886,7 @@ def eliminar_emisor_ajax(request, codigo):
         return JsonResponse({
             'error': f'Error interno del servidor: {str(e)}'
         }, status=500)
-class PresupuestoGastosReporteView(LoginRequiredMixin, TemplateView):
+class PresupuestoGastosReporteView(SoloLecturaMixin, LoginRequiredMixin, TemplateView):
     """Vista para mostrar el reporte de gastos de un presupuesto específico"""
     template_name = 'core/presupuesto_gastos_reporte.html'
     
@@ -17883,38 +17419,31 @@ def compra_create(request):
     """Vista para crear compra"""
 
     if request.method == 'POST':
-        print(f"=== REQUEST POST RECIBIDO ===")
-        print(f"POST data recibido: {request.POST}")
-        print(f"detalles_data: {request.POST.get('detalles_data', 'NO ENCONTRADO')}")
-        print(f"CSRF token: {request.POST.get('csrfmiddlewaretoken', 'NO ENCONTRADO')}")
-        
+        from django.core.exceptions import ValidationError
+        from directiva_agricola.transacciones import atomic_escritura
+
         form = CompraForm(request.POST)
-        print(f"Formulario válido: {form.is_valid()}")
-        if not form.is_valid():
-            print(f"Errores del formulario: {form.errors}")
         
         if form.is_valid():
             try:
-                compra = form.save()
-                print(f"Compra creada con folio: {compra.folio}")
-                
-                # Procesar detalles si se enviaron
-                if 'detalles_data' in request.POST:
-                    print("Procesando detalles...")
-                    procesar_detalles_compra(request, compra)
-                    print("Detalles procesados")
+                # Encabezado, detalles y kardex se registran juntos o no se registra nada
+                # (en la BD de la empresa, no en 'default')
+                with atomic_escritura():
+                    compra = form.save()
+                    if compra.estado != 'cancelada':
+                        procesar_detalles_compra(request, compra)
                 
                 messages.success(request, f'Compra {compra.folio:06d} creada correctamente.')
-                print(f"Redirigiendo a: /compras/")
                 return redirect('core:compras_list')
                 
+            except ValidationError as e:
+                for error in e.messages:
+                    messages.error(request, f'Compra no registrada: {error}')
             except Exception as e:
-                print(f"Error al procesar la compra: {e}")
-                import traceback
-                traceback.print_exc()
+                import logging
+                logging.getLogger(__name__).exception(f'Error al procesar la compra: {e}')
                 messages.error(request, f'Error al crear la compra: {str(e)}')
         else:
-            print(f"Errores del formulario: {form.errors}")
             messages.error(request, 'Por favor corrija los errores en el formulario.')
     else:
         form = CompraForm()
@@ -17950,16 +17479,26 @@ def compra_edit(request, folio):
         return redirect('core:compras_list')
 
     if request.method == 'POST':
+        from django.core.exceptions import ValidationError
+        from directiva_agricola.transacciones import atomic_escritura
+        from core.services.compra_service import CompraService
+
         form = CompraForm(request.POST, instance=compra)
         if form.is_valid():
-            compra = form.save()
-            
-            # Procesar detalles si se enviaron
-            if 'detalles' in request.POST:
-                procesar_detalles_compra(request, compra)
-            
-            messages.success(request, f'Compra {compra.folio:06d} actualizada correctamente.')
-            return redirect('core:compras_list')
+            try:
+                with atomic_escritura():
+                    compra = form.save()
+                    if compra.estado == 'cancelada':
+                        # Una compra cancelada no deja entradas en el kardex
+                        CompraService.anular_kardex(compra)
+                    elif request.POST.get('detalles_data'):
+                        procesar_detalles_compra(request, compra)
+            except ValidationError as e:
+                for error in e.messages:
+                    messages.error(request, f'Compra no actualizada: {error}')
+            else:
+                messages.success(request, f'Compra {compra.folio:06d} actualizada correctamente.')
+                return redirect('core:compras_list')
     else:
         form = CompraForm(instance=compra)
 
@@ -17984,122 +17523,22 @@ def compra_edit(request, folio):
 
 
 def procesar_detalles_compra(request, compra):
-    """Procesar los detalles de la compra"""
-    import json
-    from decimal import Decimal
-    
-    try:
-        detalles_json = request.POST.get('detalles_data', '[]')
-        print(f"Detalles JSON recibido: {detalles_json}")
-        
-        detalles_data = json.loads(detalles_json)
-        print(f"Detalles parseados: {detalles_data}")
-        
-        # Eliminar detalles existentes
-        CompraDetalle.objects.filter(compra=compra).delete()
-        
-        # Crear nuevos detalles
-        for detalle_data in detalles_data:
-            if not detalle_data:
-                continue
-                
-            # El JavaScript envía los datos con la estructura: {producto: {codigo: ...}, almacen: {codigo: ...}, ...}
-            producto_obj = detalle_data.get('producto', {})
-            almacen_obj = detalle_data.get('almacen', {})
-            
-            producto_codigo = producto_obj.get('codigo') if isinstance(producto_obj, dict) else producto_obj
-            almacen_codigo = almacen_obj.get('codigo') if isinstance(almacen_obj, dict) else almacen_obj
-            cantidad = detalle_data.get('cantidad')
-            precio = detalle_data.get('precio')
-            
-            print(f"Procesando detalle: producto_codigo={producto_codigo}, almacen_codigo={almacen_codigo}, cantidad={cantidad}, precio={precio}")
-            
-            if producto_codigo and almacen_codigo and cantidad and precio:
-                try:
-                    producto = ProductoServicio.objects.get(codigo=producto_codigo)
-                    almacen = Almacen.objects.get(codigo=almacen_codigo)
-                    
-                    detalle = CompraDetalle.objects.create(
-                        compra=compra,
-                        producto=producto,
-                        almacen=almacen,
-                        cantidad=Decimal(str(cantidad)),
-                        precio=Decimal(str(precio))
-                    )
-                    
-                    print(f"Detalle creado exitosamente: {detalle}")
-                    
-                    # El movimiento de kardex se crea automáticamente en el método save() del modelo CompraDetalle
-                    
-                except (ProductoServicio.DoesNotExist, Almacen.DoesNotExist, ValueError, TypeError) as e:
-                    print(f"Error procesando detalle: {e}")
-                    print(f"Datos del detalle: {detalle_data}")
-                    continue
-            else:
-                print(f"Datos incompletos en detalle: {detalle_data}")
-                
-    except json.JSONDecodeError as e:
-        print(f"Error decodificando JSON: {e}")
-        print(f"JSON recibido: {detalles_json}")
-    except Exception as e:
-        print(f"Error general procesando detalles: {e}")
-        import traceback
-        traceback.print_exc()
-
+    """
+    Registrar los detalles enviados de la compra y sus entradas de kardex
 
-def crear_movimiento_kardex(compra, detalle):
-    """Crear movimiento en kardex para el detalle de compra"""
-    from django.utils import timezone
-    from decimal import Decimal
+    Raises:
+        ValidationError: Si el detalle no se puede leer o algún renglón es inválido; no se
+            registra ningún detalle (la vista revierte también el encabezado)
+    """
+    from django.core.exceptions import ValidationError
+    from core.services.compra_service import CompraService
     
     try:
-        # Obtener la existencia anterior
-        ultimo_movimiento = Kardex.objects.filter(
-            producto=detalle.producto,
-            almacen=detalle.almacen
-        ).order_by('-fecha', '-id').first()
-        
-        existencia_anterior = ultimo_movimiento.existencia_actual if ultimo_movimiento else Decimal('0')
-        existencia_actual = existencia_anterior + detalle.cantidad
-        
-        # Calcular costo promedio anterior
-        costo_promedio_anterior = ultimo_movimiento.costo_promedio_actual if ultimo_movimiento else Decimal('0')
-        
-        # Calcular costo total
-        costo_total = detalle.cantidad * detalle.precio
-        
-        # Calcular costo promedio actual (método de costo promedio)
-        if existencia_anterior > 0:
-            costo_total_anterior = existencia_anterior * costo_promedio_anterior
-            costo_total_actual = costo_total_anterior + costo_total
-            costo_promedio_actual = costo_total_actual / existencia_actual
-        else:
-            costo_promedio_actual = detalle.precio
-        
-        # Crear el movimiento con todos los campos calculados manualmente
-        kardex = Kardex.objects.create(
-            producto=detalle.producto,
-            almacen=detalle.almacen,
-            fecha=timezone.now(),
-            tipo_movimiento='entrada',
-            cantidad=detalle.cantidad,
-            precio_unitario=detalle.precio,
-            costo_total=costo_total,
-            existencia_anterior=existencia_anterior,
-            existencia_actual=existencia_actual,
-            costo_promedio_anterior=costo_promedio_anterior,
-            costo_promedio_actual=costo_promedio_actual,
-            referencia=f"Compra {compra.folio:06d}"
-        )
-        
-        print(f"Movimiento kardex creado exitosamente: {kardex}")
-        
-    except Exception as e:
-        print(f"Error al crear movimiento kardex: {e}")
-        import traceback
-        traceback.print_exc()
-        # No re-lanzar la excepción para que no interrumpa el proceso de compra
-        # El movimiento de kardex es importante pero no crítico para la compra
+        detalles_data = json.loads(request.POST.get('detalles_data') or '[]')
+    except json.JSONDecodeError:
+        raise ValidationError('No se pudieron leer los detalles de la compra.')
+    
+    CompraService.registrar_detalles(compra, detalles_data)
 
 
 @login_required
@@ -18118,8 +17557,10 @@ def compra_delete(request, folio):
         return redirect('core:compras_list')
 
     if request.method == 'POST':
+        from core.services.compra_service import CompraService
+
         folio_num = compra.folio
-        compra.delete()
+        CompraService.eliminar(compra)
         messages.success(request, f'Compra {folio_num:06d} eliminada correctamente.')
         return redirect('core:compras_list')
 
@@ -18216,111 +17657,16 @@ def existencias_list(request):
     almacen_filtro = request.GET.get('almacen', '')
     mostrar_vacios = request.GET.get('mostrar_vacios', False)
     
-    
-    # Obtener las existencias actuales agrupadas por almacén
-    existencias_por_almacen = {}
-    
-    # Obtener todos los almacenes activos
-    almacenes = Almacen.objects.filter(activo=True).order_by('descripcion')
-    
-    # Aplicar filtro de almacén si se especifica
-    if almacen_filtro:
-        almacenes = almacenes.filter(codigo=almacen_filtro)
-    
-    for almacen in almacenes:
-        # Si hay filtro de producto, buscar en todos los productos, sino solo en los que tienen movimientos
-        if producto_filtro:
-            # Buscar productos que coincidan con el filtro
-            productos_filtrados = ProductoServicio.objects.filter(
-                activo=True
-            ).filter(
-                Q(descripcion__icontains=producto_filtro) | Q(sku__icontains=producto_filtro)
-            )
-            productos_con_movimientos = productos_filtrados.values_list('codigo', flat=True)
-        else:
-            # Obtener todos los productos únicos que tienen movimientos en este almacén
-            productos_con_movimientos = Kardex.objects.filter(
-                almacen=almacen
-            ).values_list('producto', flat=True).distinct()
-        
-        # Obtener información de existencias para cada producto en este almacén
-        productos_existencias = []
-        
-        for producto_id in productos_con_movimientos:
-            try:
-                producto = ProductoServicio.objects.get(codigo=producto_id)
-                
-                # El filtro de producto ya se aplicó a nivel de base de datos
-                
-                # Obtener el último movimiento para este producto/almacén
-                ultimo_movimiento = Kardex.objects.filter(
-                    producto=producto,
-                    almacen=almacen
-                ).order_by('-fecha', '-id').first()
-                
-                # Mostrar productos según el filtro de mostrar_vacios
-                if mostrar_vacios or (ultimo_movimiento and ultimo_movimiento.existencia_actual > 0):
-                    # Verificar si el producto ya está en la lista
-                    producto_ya_existe = any(
-                        p['producto'].codigo == producto.codigo 
-                        for p in productos_existencias
-                    )
-                    
-                    if not producto_ya_existe:
-                        # Manejar productos sin movimientos o con existencia 0
-                        if ultimo_movimiento:
-                            existencia_actual = ultimo_movimiento.existencia_actual
-                            costo_promedio = ultimo_movimiento.costo_promedio_actual
-                            valor_inventario = existencia_actual * costo_promedio
-                            ultimo_movimiento_fecha = ultimo_movimiento.fecha
-                        else:
-                            existencia_actual = 0
-                            costo_promedio = 0
-                            valor_inventario = 0
-                            ultimo_movimiento_fecha = None
-                        
-                        productos_existencias.append({
-                            'producto': producto,
-                            'existencia_actual': existencia_actual,
-                            'costo_promedio': costo_promedio,
-                            'valor_inventario': valor_inventario,
-                            'ultimo_movimiento': ultimo_movimiento_fecha
-                        })
-            except ProductoServicio.DoesNotExist:
-                continue
-        
-        # Ordenar productos por descripción
-        productos_existencias.sort(key=lambda x: x['producto'].descripcion)
-        
-        # Agregar almacenes según el filtro de mostrar_vacios
-        if productos_existencias or mostrar_vacios:
-            # Calcular valor total del almacén
-            valor_total_almacen = sum(p['valor_inventario'] for p in productos_existencias)
-            existencias_por_almacen[almacen] = {
-                'productos': productos_existencias,
-                'valor_total': valor_total_almacen
-            }
-
-    # Calcular estadísticas generales
-    # Contar productos únicos (no duplicados entre almacenes)
-    productos_unicos = set()
-    for almacen_data in existencias_por_almacen.values():
-        for producto_info in almacen_data['productos']:
-            productos_unicos.add(producto_info['producto'].codigo)
-    
-    total_productos = len(productos_unicos)
-    total_almacenes = len(existencias_por_almacen)
-    valor_total_inventario = sum(almacen_data['valor_total'] for almacen_data in existencias_por_almacen.values())
+    # Obtener las existencias actuales agrupadas por almacén desde la tabla materializada
+    from core.services.existencias_service import ExistenciasService
+    existencias = ExistenciasService.existencias_por_almacen(producto_filtro, almacen_filtro, mostrar_vacios)
     
     # Obtener opciones para los filtros
     productos_options = ProductoServicio.objects.filter(activo=True).order_by('descripcion')
     almacenes_options = Almacen.objects.filter(activo=True).order_by('descripcion')
     
     context = {
-        'existencias_por_almacen': existencias_por_almacen,
-        'total_productos': total_productos,
-        'total_almacenes': total_almacenes,
-        'valor_total_inventario': valor_total_inventario,
+        **existencias,
         'productos_options': productos_options,
         'almacenes_options': almacenes_options,
         'producto_filtro': producto_filtro,
@@ -18341,109 +17687,15 @@ def existencias_imprimir(request):
     almacen_filtro = request.GET.get('almacen', '')
     mostrar_vacios = request.GET.get('mostrar_vacios', False)
     
-    # Obtener las existencias actuales agrupadas por almacén
-    existencias_por_almacen = {}
-    
-    # Obtener todos los almacenes activos
-    almacenes = Almacen.objects.filter(activo=True).order_by('descripcion')
-    
-    # Aplicar filtro de almacén si se especifica
-    if almacen_filtro:
-        almacenes = almacenes.filter(codigo=almacen_filtro)
-    
-    for almacen in almacenes:
-        # Si hay filtro de producto, buscar en todos los productos, sino solo en los que tienen movimientos
-        if producto_filtro:
-            # Buscar productos que coincidan con el filtro
-            productos_filtrados = ProductoServicio.objects.filter(
-                activo=True
-            ).filter(
-                Q(descripcion__icontains=producto_filtro) | Q(sku__icontains=producto_filtro)
-            )
-            productos_con_movimientos = productos_filtrados.values_list('codigo', flat=True)
-        else:
-            # Obtener todos los productos únicos que tienen movimientos en este almacén
-            productos_con_movimientos = Kardex.objects.filter(
-                almacen=almacen
-            ).values_list('producto', flat=True).distinct()
-        
-        # Obtener información de existencias para cada producto en este almacén
-        productos_existencias = []
-        
-        for producto_id in productos_con_movimientos:
-            try:
-                producto = ProductoServicio.objects.get(codigo=producto_id)
-                
-                # El filtro de producto ya se aplicó a nivel de base de datos
-                
-                # Obtener el último movimiento para este producto/almacén
-                ultimo_movimiento = Kardex.objects.filter(
-                    producto=producto,
-                    almacen=almacen
-                ).order_by('-fecha', '-id').first()
-                
-                # Mostrar productos según el filtro de mostrar_vacios
-                if mostrar_vacios or (ultimo_movimiento and ultimo_movimiento.existencia_actual > 0):
-                    # Verificar si el producto ya está en la lista
-                    producto_ya_existe = any(
-                        p['producto'].codigo == producto.codigo 
-                        for p in productos_existencias
-                    )
-                    
-                    if not producto_ya_existe:
-                        # Manejar productos sin movimientos o con existencia 0
-                        if ultimo_movimiento:
-                            existencia_actual = ultimo_movimiento.existencia_actual
-                            costo_promedio = ultimo_movimiento.costo_promedio_actual
-                            valor_inventario = existencia_actual * costo_promedio
-                            ultimo_movimiento_fecha = ultimo_movimiento.fecha
-                        else:
-                            existencia_actual = 0
-                            costo_promedio = 0
-                            valor_inventario = 0
-                            ultimo_movimiento_fecha = None
-                        
-                        productos_existencias.append({
-                            'producto': producto,
-                            'existencia_actual': existencia_actual,
-                            'costo_promedio': costo_promedio,
-                            'valor_inventario': valor_inventario,
-                            'ultimo_movimiento': ultimo_movimiento_fecha
-                        })
-            except ProductoServicio.DoesNotExist:
-                continue
-        
-        # Ordenar productos por descripción
-        productos_existencias.sort(key=lambda x: x['producto'].descripcion)
-        
-        # Agregar almacenes según el filtro de mostrar_vacios
-        if productos_existencias or mostrar_vacios:
-            # Calcular valor total del almacén
-            valor_total_almacen = sum(p['valor_inventario'] for p in productos_existencias)
-            existencias_por_almacen[almacen] = {
-                'productos': productos_existencias,
-                'valor_total': valor_total_almacen
-            }
-
-    # Calcular estadísticas generales
-    # Contar productos únicos (no duplicados entre almacenes)
-    productos_unicos = set()
-    for almacen_data in existencias_por_almacen.values():
-        for producto_info in almacen_data['productos']:
-            productos_unicos.add(producto_info['producto'].codigo)
-    
-    total_productos = len(productos_unicos)
-    total_almacenes = len(existencias_por_almacen)
-    valor_total_inventario = sum(almacen_data['valor_total'] for almacen_data in existencias_por_almacen.values())
+    # Obtener las existencias actuales agrupadas por almacén desde la tabla materializada
+    from core.services.existencias_service import ExistenciasService
+    existencias = ExistenciasService.existencias_por_almacen(producto_filtro, almacen_filtro, mostrar_vacios)
     
     # Obtener datos de configuración de la empresa
     configuracion = ConfiguracionSistema.objects.first()
     
     context = {
-        'existencias_por_almacen': existencias_por_almacen,
-        'total_productos': total_productos,
-        'total_almacenes': total_almacenes,
-        'valor_total_inventario': valor_total_inventario,
+        **existencias,
         'producto_filtro': producto_filtro,
         'almacen_filtro': almacen_filtro,
         'mostrar_vacios': mostrar_vacios,
@@ -19343,17 +18595,16 @@ class RankingClientesImprimirView(LoginRequiredMixin, TemplateView):
         if fecha_hasta:
             remisiones_qs = remisiones_qs.filter(fecha__lte=fecha_hasta)
         
-        # Filtrar solo remisiones preliquidadas
-        remisiones_preliquidadas = []
-        for remision in remisiones_qs:
-            if remision.esta_liquidada():
-                # Aplicar filtros de cliente y lote-origen
-                if cliente_filtrado and remision.cliente != cliente_filtrado:
-                    continue
-                if lote_origen_filtrado and remision.lote_origen != lote_origen_filtrado:
-                    continue
-                
-                remisiones_preliquidadas.append(remision)
+        # Filtrar solo remisiones preliquidadas (anotando pagos) en la base de datos
+        remisiones_qs = remisiones_qs.preliquidadas().with_saldo()
+        
+        # Aplicar filtros de cliente y lote-origen
+        if cliente_filtrado:
+            remisiones_qs = remisiones_qs.filter(cliente=cliente_filtrado)
+        if lote_origen_filtrado:
+            remisiones_qs = remisiones_qs.filter(lote_origen=lote_origen_filtrado)
+        
+        remisiones_preliquidadas = list(remisiones_qs)
         
         # Agrupar remisiones preliquidadas por cliente y calcular totales
         clientes_data = defaultdict(lambda: {
@@ -19388,8 +18639,8 @@ class RankingClientesImprimirView(LoginRequiredMixin, TemplateView):
                 importe_preliquidado_remision = sum(float(detalle.importe_envio or 0) for detalle in remision.detalles.all())
                 importe_liquidado_remision = sum(float(detalle.importe_liquidado or 0) for detalle in remision.detalles.all())
             
-            # Sumar pagos realizados de la remisión
-            total_pagos_remision = sum(float(pago.monto or 0) for pago in remision.pagos.filter(activo=True))
+            # Pagos realizados de la remisión (anotados por RemisionQuerySet.with_saldo())
+            total_pagos_remision = float(remision.total_pagado)
             
             clientes_data[cliente_nombre]['importe_preliquidado'] += importe_preliquidado_remision
             clientes_data[cliente_nombre]['importe_liquidado'] += importe_liquidado_remision
@@ -19446,6 +18697,7 @@ class RankingClientesImprimirView(LoginRequiredMixin, TemplateView):
         return context
 
 
+@solo_lectura
 def actualizar_grafico_kgs_ajax(request):
     """Vista AJAX para actualizar el gráfico de kgs enviados vs liquidados con filtro de cliente"""
     from django.http import JsonResponse
@@ -19548,6 +18800,7 @@ def actualizar_grafico_kgs_ajax(request):
     })
 
 # @login_required # Temporarily removed for debugging
+@solo_lectura
 def actualizar_grafico_calidad_ajax(request):
     """Vista AJAX para actualizar el gráfico de calidad de producto con filtros"""
     from django.http import JsonResponse
@@ -19650,6 +18903,7 @@ def actualizar_grafico_calidad_ajax(request):
     })
 
 # @login_required # Temporarily removed for debugging
+@solo_lectura
 def actualizar_grafico_merma_ajax(request):
     """Vista AJAX para actualizar el gráfico de merma por calidad con filtros"""
     from django.http import JsonResponse
@@ -19770,6 +19024,7 @@ def actualizar_grafico_merma_ajax(request):
     })
 
 
+@solo_lectura
 def actualizar_grafico_ranking_ajax(request):
     """Vista AJAX para actualizar el gráfico de ranking de clientes con filtros"""
     from django.http import JsonResponse
@@ -19814,26 +19069,27 @@ def actualizar_grafico_ranking_ajax(request):
             remisiones_qs = remisiones_qs.filter(fecha__lte=fecha_hasta)
             logger.info(f"Filtro fecha hasta aplicado: {fecha_hasta}")
         
-        logger.info(f"Total remisiones encontradas: {remisiones_qs.count()}")
-        
         # Filtrar solo las remisiones no canceladas
-        remisiones_no_canceladas = [r for r in remisiones_qs if not r.cancelada]
-        logger.info(f"Remisiones no canceladas: {len(remisiones_no_canceladas)}")
+        remisiones_qs = remisiones_qs.filter(cancelada=False)
         
         # Si se especifica un cliente, filtrar por ese cliente
         if cliente_id:
-            remisiones_no_canceladas = [r for r in remisiones_no_canceladas if r.cliente.codigo == int(cliente_id)]
-            logger.info(f"Remisiones filtradas por cliente {cliente_id}: {len(remisiones_no_canceladas)}")
+            remisiones_qs = remisiones_qs.filter(cliente_id=int(cliente_id))
         
         # Si se especifica un lote-origen, filtrar por ese lote-origen
         if lote_origen_id:
-            remisiones_no_canceladas = [r for r in remisiones_no_canceladas if r.lote_origen.codigo == int(lote_origen_id)]
-            logger.info(f"Remisiones filtradas por lote-origen {lote_origen_id}: {len(remisiones_no_canceladas)}")
+            remisiones_qs = remisiones_qs.filter(lote_origen_id=int(lote_origen_id))
         
-        remisiones_no_canceladas_ids = [r.pk for r in remisiones_no_canceladas]
+        # Solo remisiones preliquidadas, con pagos anotados y detalles precargados
+        remisiones_preliquidadas = list(
+            remisiones_qs.preliquidadas().with_saldo()
+            .select_related('cliente')
+            .prefetch_related('detalles')
+        )
+        logger.info(f"Remisiones preliquidadas encontradas: {len(remisiones_preliquidadas)}")
         
         # Obtener detalles de remisiones filtradas
-        detalles_qs = RemisionDetalle.objects.filter(remision__in=remisiones_no_canceladas_ids)
+        detalles_qs = RemisionDetalle.objects.filter(remision__in=[r.pk for r in remisiones_preliquidadas])
         
         # Si se especifica una calidad, filtrar por esa calidad
         if calidad:
@@ -19851,31 +19107,30 @@ def actualizar_grafico_ranking_ajax(request):
             detalles_filtrados = {detalle.remision_id: detalle for detalle in detalles_qs}
             logger.info(f"Detalles filtrados por calidad: {len(detalles_filtrados)}")
         
-        for remision in remisiones_no_canceladas:
-            if remision.esta_liquidada():  # Solo remisiones preliquidadas
-                cliente_nombre = remision.cliente.razon_social
-                
-                # Si hay filtro de calidad, usar solo los detalles filtrados
-                if calidad:
-                    if remision.pk in detalles_filtrados:
-                        detalle = detalles_filtrados[remision.pk]
-                        importe_preliquidado_remision = float(detalle.importe_envio or 0)
-                        importe_liquidado_remision = float(detalle.importe_liquidado or 0)
-                    else:
-                        # Si la remisión no tiene detalles con la calidad seleccionada, saltarla
-                        continue
+        for remision in remisiones_preliquidadas:
+            cliente_nombre = remision.cliente.razon_social
+            
+            # Si hay filtro de calidad, usar solo los detalles filtrados
+            if calidad:
+                if remision.pk in detalles_filtrados:
+                    detalle = detalles_filtrados[remision.pk]
+                    importe_preliquidado_remision = float(detalle.importe_envio or 0)
+                    importe_liquidado_remision = float(detalle.importe_liquidado or 0)
                 else:
-                    # Sin filtro de calidad, usar todos los detalles de la remisión
-                    importe_preliquidado_remision = sum(float(detalle.importe_envio or 0) for detalle in remision.detalles.all())
-                    importe_liquidado_remision = sum(float(detalle.importe_liquidado or 0) for detalle in remision.detalles.all())
-                
-                # Sumar pagos realizados de la remisión
-                total_pagos_remision = sum(float(pago.monto or 0) for pago in remision.pagos.filter(activo=True))
-                
-                clientes_data[cliente_nombre]['importe_preliquidado'] += importe_preliquidado_remision
-                clientes_data[cliente_nombre]['importe_liquidado'] += importe_liquidado_remision
-                clientes_data[cliente_nombre]['total_pagos'] += total_pagos_remision
-                clientes_data[cliente_nombre]['total_remisiones'] += 1
+                    # Si la remisión no tiene detalles con la calidad seleccionada, saltarla
+                    continue
+            else:
+                # Sin filtro de calidad, usar todos los detalles de la remisión
+                importe_preliquidado_remision = sum(float(detalle.importe_envio or 0) for detalle in remision.detalles.all())
+                importe_liquidado_remision = sum(float(detalle.importe_liquidado or 0) for detalle in remision.detalles.all())
+            
+            # Pagos realizados de la remisión (anotados por RemisionQuerySet.with_saldo())
+            total_pagos_remision = float(remision.total_pagado)
+            
+            clientes_data[cliente_nombre]['importe_preliquidado'] += importe_preliquidado_remision
+            clientes_data[cliente_nombre]['importe_liquidado'] += importe_liquidado_remision
+            clientes_data[cliente_nombre]['total_pagos'] += total_pagos_remision
+            clientes_data[cliente_nombre]['total_remisiones'] += 1
         
         # Convertir a lista y ordenar por importe liquidado (descendente)
         ranking_clientes_data = []
@@ -19908,6 +19163,7 @@ def actualizar_grafico_ranking_ajax(request):
         }, status=500)
 
 
+@solo_lectura
 def actualizar_grafico_importes_ajax(request):
     """Vista AJAX para actualizar el gráfico de análisis por importe neto enviado vs preliquidado"""
     from django.http import JsonResponse
@@ -20024,6 +19280,7 @@ def actualizar_grafico_importes_ajax(request):
         }, status=500)
 
 
+@solo_lectura
 def actualizar_grafico_gastos_ajax(request):
     """Vista AJAX para actualizar el gráfico de gastos autorizados (compras de productos del inventario)"""
     from django.http import JsonResponse
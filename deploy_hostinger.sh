@@ -130,6 +130,25 @@ Restart=on-failure
 WantedBy=multi-user.target
 EOF
 
+print_status "Configurando worker de la cola de timbrado..."
+cat > /etc/systemd/system/directiva-timbrado.service << EOF
+[Unit]
+Description=Directiva Agrícola worker de timbrado (todas las empresas)
+After=network.target
+
+[Service]
+User=www-data
+Group=www-data
+WorkingDirectory=$PROJECT_DIR
+Environment="PATH=$VENV_DIR/bin"
+ExecStart=$VENV_DIR/bin/python manage.py procesar_cola_timbrado --todas --settings=directiva_agricola.settings_production
+Restart=always
+RestartSec=5
+
+[Install]
+WantedBy=multi-user.target
+EOF
+
 print_status "Configurando Nginx..."
 cat > /etc/nginx/sites-available/$PROJECT_NAME << EOF
 server {
@@ -172,6 +191,8 @@ print_status "Iniciando servicios..."
 systemctl daemon-reload
 systemctl enable directiva-agricola
 systemctl start directiva-agricola
+systemctl enable directiva-timbrado
+systemctl start directiva-timbrado
 systemctl restart nginx
 
 print_status "Configurando SSL con Let's Encrypt..."
@@ -197,6 +218,7 @@ print_status "✅ Despliegue completado exitosamente!"
 print_status "🌐 Tu aplicación está disponible en: https://$DOMAIN"
 print_status "📊 Para monitorear: systemctl status directiva-agricola"
 print_status "📝 Para ver logs: journalctl -u directiva-agricola -f"
+print_status "🧾 Worker de timbrado: journalctl -u directiva-timbrado -f"
 
 echo ""
 print_warning "IMPORTANTE:"
@@ -101,6 +101,26 @@ echo "[Install]"
 echo "WantedBy=multi-user.target"
 echo "EOF"
 echo ""
+echo "# Worker de la cola de timbrado (necesario con TIMBRADO_ASINCRONO = True)"
+echo "cat > /etc/systemd/system/directiva-timbrado.service << 'EOF'"
+echo "[Unit]"
+echo "Description=Directiva Agrícola worker de timbrado (todas las empresas)"
+echo "After=network.target"
+echo ""
+echo "[Service]"
+echo "User=www-data"
+echo "Group=www-data"
+echo "WorkingDirectory=/var/www/directiva_agricola"
+echo "Environment=\"PATH=/var/www/directiva_agricola/venv/bin\""
+echo "ExecStart=/var/www/directiva_agricola/venv/bin/python manage.py procesar_cola_timbrado --todas"
+echo "Restart=always"
+echo "RestartSec=5"
+echo ""
+echo "[Install]"
+echo "WantedBy=multi-user.target"
+echo "EOF"
+echo "systemctl daemon-reload && systemctl enable --now directiva-timbrado"
+echo ""
 
 echo "📋 PASO 14: Configurar Nginx"
 echo "cat > /etc/nginx/sites-available/directiva_agricola << 'EOF'"
@@ -0,0 +1,49 @@
+"""
+Backend SQLite para producción
+Igual al de Django, pero cada conexión nueva se configura con los PRAGMA de PRAGMAS_DEFAULT
+(WAL, synchronous=NORMAL, caché, mmap y busy_timeout), para que varios workers de gunicorn
+lean mientras otro escribe y las escrituras esperen su turno en lugar de fallar con
+"database is locked".
+
+Las transacciones empiezan con BEGIN diferido, así que las peticiones que solo leen no toman
+el bloqueo de escritura. Las que escriben usan directiva_agricola.transacciones.atomic_escritura
+(BEGIN IMMEDIATE): EmpresaDbMiddleware la usa para la transacción de las peticiones POST, PUT,
+PATCH y DELETE, y los servicios para los bloques que escriben fuera de ella.
+
+Los valores se pueden cambiar con settings.SQLITE_PRAGMAS (todas las BD) o con
+OPTIONS['pragmas'] de una BD; OPTIONS['transaction_mode'] cambia el modo de BEGIN.
+"""
+
+from django.conf import settings
+from django.db.backends.sqlite3 import base
+
+PRAGMAS_DEFAULT = {
+    'busy_timeout': 5000,  # ms; primero, para que el cambio a WAL también espere
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -32000,  # negativo = KiB (32 MB por conexión)
+    'mmap_size': 134217728,  # 128 MB
+    'temp_store': 'MEMORY',
+}
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+
+    def get_connection_params(self):
+        kwargs = super().get_connection_params()
+        self.pragmas = {
+            **PRAGMAS_DEFAULT,
+            **getattr(settings, 'SQLITE_PRAGMAS', {}),
+            **kwargs.pop('pragmas', {}),
+        }
+        if self.pragmas.get('busy_timeout') is not None:
+            kwargs.setdefault('timeout', int(self.pragmas['busy_timeout']) / 1000)
+        return kwargs
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        if not self.is_in_memory_db():
+            for nombre, valor in self.pragmas.items():
+                if valor is not None:
+                    conn.execute(f'PRAGMA {nombre} = {valor}')
+        return conn
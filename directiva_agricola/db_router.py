@@ -13,29 +13,38 @@ def get_current_company_db() -> str | None:
 
 
 class EmpresaRouter:
-    """Router de BD: modelos de administracion -> 'administracion';
+    """Router de BD: modelos de administracion -> 'administracion'; sesiones -> 'default';
     modelos de core -> BD de empresa si está definida en el contexto del hilo.
     """
 
     app_label_admin = 'administracion'
+    # La sesión se lee antes de conocer la empresa y login() la guarda (cycle_key) con el
+    # alias de la empresa ya activo: siempre va a 'default'
+    app_labels_default = {'sessions'}
 
     def db_for_read(self, model, **hints):
         if model._meta.app_label == self.app_label_admin:
             return 'administracion'
+        if model._meta.app_label in self.app_labels_default:
+            return 'default'
         db = get_current_company_db()
         return db or 'default'
 
     def db_for_write(self, model, **hints):
         if model._meta.app_label == self.app_label_admin:
             return 'administracion'
+        if model._meta.app_label in self.app_labels_default:
+            return 'default'
         db = get_current_company_db()
         return db or 'default'
 
     def allow_migrate(self, db, app_label, model_name=None, **hints):
         if app_label == self.app_label_admin:
             return db == 'administracion'
-        # El resto de apps migran en la BD por defecto (plantilla);
-        # las BDs de empresas se crean/cargan fuera del ciclo de migración global.
-        return db == 'default'
+        if app_label == 'sessions':
+            return db == 'default'
+        # El resto de apps migran en la BD por defecto y en las de empresas
+        # (plantilla de empresas y `migrate --database <empresa>`).
+        return db != 'administracion'
 
 
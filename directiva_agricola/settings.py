@@ -50,6 +50,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'core.middleware.EmpresaDbMiddleware',  # Rehabilitado
+    'core.middleware.SoloLecturaMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'core.middleware.NoCacheMiddleware',
     'core.middleware.StaticFilesNoCacheMiddleware',
@@ -80,14 +81,14 @@ WSGI_APPLICATION = 'directiva_agricola.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'directiva_agricola.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
         'ATOMIC_REQUESTS': True,
         'TIME_ZONE': 'America/Mexico_City',
         'OPTIONS': {},
-        'CONN_MAX_AGE': 0,
+        'CONN_MAX_AGE': 600,
         'AUTOCOMMIT': True,
-        'CONN_HEALTH_CHECKS': False,
+        'CONN_HEALTH_CHECKS': True,
         'HOST': '',
         'PASSWORD': '',
         'PORT': '',
@@ -95,20 +96,22 @@ DATABASES = {
         'TEST': {
             'CHARSET': None,
             'COLLATION': None,
-            'MIGRATE': True,
+            # La BD de pruebas se crea desde los modelos: el historial de core no se puede
+            # aplicar desde cero (ver PlantillaEmpresa._crear_esquema)
+            'MIGRATE': False,
             'MIRROR': None,
             'NAME': None
         },
     },
     'administracion': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'directiva_agricola.backends.sqlite3',
         'NAME': BASE_DIR / 'DirectivaAdministracion.sqlite3',
         'ATOMIC_REQUESTS': True,
         'TIME_ZONE': 'America/Mexico_City',
         'OPTIONS': {},
-        'CONN_MAX_AGE': 0,
+        'CONN_MAX_AGE': 600,
         'AUTOCOMMIT': True,
-        'CONN_HEALTH_CHECKS': False,
+        'CONN_HEALTH_CHECKS': True,
         'HOST': '',
         'PASSWORD': '',
         'PORT': '',
@@ -220,3 +223,87 @@ CSRF_COOKIE_PATH = '/'
 CSRF_COOKIE_SAMESITE = 'Lax'
 CSRF_COOKIE_SECURE = False  # True en producción con HTTPS
 CSRF_USE_SESSIONS = False  # Usar cookies en lugar de sesiones para CSRF
+
+# Timbrado asíncrono: la petición encola y el worker `procesar_cola_timbrado --todas` llama al PAC.
+# Activar solo donde el worker esté desplegado (servicio directiva-timbrado); sin él los trabajos
+# quedan pendientes. Con False se timbra dentro de la petición.
+TIMBRADO_ASINCRONO = False
+
+# Timbrado en lote (comando timbrar_lote y ajax/facturas/timbrar-lote/): peticiones simultáneas
+# al PAC y máximo de facturas por petición web
+TIMBRADO_LOTE_PARALELISMO = 4
+TIMBRADO_LOTE_MAX_FOLIOS = 500
+
+# Sesiones HTTP compartidas hacia el PAC (core.services.pac_sesiones): conexiones keep-alive
+# por host y reintentos con backoff ante fallas de conexión; las respuestas 429/502/503/504 solo
+# se reintentan en GET (un POST de timbrado nunca se reenvía si ya llegó al PAC).
+PAC_HTTP_POOL = {
+    'pool_connections': 4,
+    'pool_maxsize': 10,
+    'max_retries': 3,
+    'backoff_factor': 1,
+}
+
+# Certificados parseados y llaves privadas en memoria por emisor (CertificadoService)
+CERTIFICADOS_CACHE_MAX = 64
+
+# Construcción del XML CFDI: 'lxml' arma el árbol una vez, lo sella en memoria y lo serializa
+# una sola vez (sin indentar); 'etree' conserva el XML indentado con minidom.
+CFDI_XML_MOTOR = 'lxml'
+
+# Caché en disco de PDF de comprobantes timbrados (core.services.pdf_cache), bajo MEDIA_ROOT/PDF_CACHE_DIR.
+# Se precalienta con el comando precalentar_pdfs.
+PDF_CACHE_ACTIVO = True
+PDF_CACHE_DIR = 'pdf_cache'
+
+# Pool de procesos de WeasyPrint (core.services.pdf_pool). Cada worker de gunicorn tiene su pool:
+# procesos es por worker (total = workers x procesos, no más que los núcleos). Con la cola llena
+# (max_en_cola trabajos esperando más de espera_cola segundos) se responde 503; un PDF se corta
+# a los timeout segundos de renderizado y la petición responde 504 si no está listo en
+# timeout x (1 + max_en_cola / procesos) segundos desde que se encoló (el trabajo se cancela).
+# espera_cola + ese plazo debe quedar por debajo del timeout de gunicorn (30 s): 3 + 8 x 3 = 27.
+# 'activo': False renderiza en el proceso web.
+PDF_POOL = {
+    'activo': True,
+    'procesos': 1,
+    'max_en_cola': 2,
+    'espera_cola': 3,
+    'timeout': 8,
+    'contexto': 'spawn',
+}
+
+# Máximo de facturas por descarga en ajax/facturas/pdf-lote/ y segundos de renderizado por
+# petición: el ZIP se envía por partes y las facturas que no alcanzan a renderizarse se listan en
+# errores.txt (las timbradas quedan en la caché para la siguiente descarga)
+PDF_LOTE_MAX_FOLIOS = 200
+PDF_LOTE_SEGUNDOS = 8
+
+# Máximo de facturas (DoctoRelacionado) por complemento en ajax/complemento-pago/multiple/
+COMPLEMENTO_PAGO_MAX_DOCUMENTOS = 100
+
+# Almacén local de catálogos SAT (core.services.catalogo_sat_local): archivo SQLite común a todas
+# las empresas, generado con el comando cargar_catalogos_sat desde SAT_CATALOGOS_ORIGEN
+SAT_CATALOGOS_DB = BASE_DIR / 'catalogos_sat' / 'catalogos_sat.sqlite3'
+SAT_CATALOGOS_ORIGEN = BASE_DIR / 'catalogos_sat' / 'origen'
+
+# BD de empresas (core.services.conexiones_empresa / EmpresaDbMiddleware): máximo de BD con alias
+# registrado por worker (al exceder se cierra la usada hace más tiempo), vida de cada conexión
+# persistente (se revisa con health checks), segundos en caché de la búsqueda de empresa por RFC,
+# y si el login rechaza un RFC que no está en administracion.Empresa (False: usa la BD por defecto)
+EMPRESAS_MAX_CONEXIONES = 64
+EMPRESAS_CONN_MAX_AGE = 600
+EMPRESAS_CACHE_SEGUNDOS = 60
+EMPRESAS_RFC_OBLIGATORIO = False
+
+# Plantillas de BD de empresas (core.services.plantilla_empresa): una por versión de esquema,
+# se construyen con el comando construir_plantilla_empresa (o al crear la primera empresa)
+EMPRESAS_PLANTILLAS_DIR = BASE_DIR / 'plantillas_empresa'
+
+# Comando migrate_empresas: BD de empresas migrándose a la vez (None = núcleos del servidor) y
+# archivo con el resultado por empresa para reanudar con --reanudar
+MIGRATE_EMPRESAS_PROCESOS = 4
+MIGRATE_EMPRESAS_ESTADO = BASE_DIR / 'migrate_empresas.json'
+
+# PRAGMA de cada conexión del backend directiva_agricola.backends.sqlite3 (default, administracion
+# y empresas); se combinan con los de PRAGMAS_DEFAULT del backend, p. ej. {'cache_size': -64000}
+SQLITE_PRAGMAS = {}
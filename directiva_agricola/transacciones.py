@@ -0,0 +1,44 @@
+"""
+Transacciones de escritura
+Con SQLite las transacciones empiezan con BEGIN diferido: una petición de solo lectura no toma
+el bloqueo de escritura. Un bloque que va a escribir usa atomic_escritura(), que empieza con
+BEGIN IMMEDIATE: toma el bloqueo al entrar (esperando busy_timeout) y no al primer UPDATE, donde
+SQLite ya no puede esperar y responde "database is locked".
+"""
+
+from contextlib import contextmanager
+
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from .db_router import get_current_company_db
+
+
+@contextmanager
+def atomic_escritura(using=None, savepoint=True):
+    """
+    transaction.atomic() que en SQLite empieza con BEGIN IMMEDIATE
+
+    Dentro de otra transacción es un savepoint normal (el bloqueo lo decide la externa).
+
+    Args:
+        using: Alias de la BD (por defecto la de la empresa actual o 'default')
+        savepoint: Igual que en transaction.atomic()
+    """
+    using = using or get_current_company_db() or DEFAULT_DB_ALIAS
+    conexion = connections[using]
+    if conexion.vendor != 'sqlite' or conexion.in_atomic_block:
+        with transaction.atomic(using=using, savepoint=savepoint):
+            yield
+        return
+
+    # La conexión se abre antes: al abrirse se toma transaction_mode de OPTIONS
+    conexion.ensure_connection()
+    modo = conexion.transaction_mode
+    conexion.transaction_mode = 'IMMEDIATE'
+    try:
+        with transaction.atomic(using=using, savepoint=savepoint):
+            # El BEGIN ya se ejecutó: las demás transacciones de la conexión siguen diferidas
+            conexion.transaction_mode = modo
+            yield
+    finally:
+        conexion.transaction_mode = modo
@@ -7,3 +7,16 @@ keepalive = 2
 max_requests = 1000
 max_requests_jitter = 100
 preload_app = True
+
+
+def post_fork(server, worker):
+    # Con preload_app el master pudo abrir conexiones a la BD; cada worker abre las suyas
+    # (persistentes por CONN_MAX_AGE) en lugar de compartir las del master
+    from django.db import connections
+    connections.close_all()
+
+
+def post_worker_init(worker):
+    # Índice en memoria para autocompletar claves SAT (una vez por worker)
+    from core.services.indice_catalogo_sat import IndiceCatalogoSAT
+    IndiceCatalogoSAT.precargar()
@@ -31,6 +31,17 @@ limit_request_line = 4094
 limit_request_fields = 100
 limit_request_field_size = 8190
 
+# Con preload_app el master pudo abrir conexiones a la BD; cada worker abre las suyas
+# (persistentes por CONN_MAX_AGE) en lugar de compartir las del master
+def post_fork(server, worker):
+    from django.db import connections
+    connections.close_all()
+
+# Índice en memoria para autocompletar claves SAT (una vez por worker)
+def post_worker_init(worker):
+    from core.services.indice_catalogo_sat import IndiceCatalogoSAT
+    IndiceCatalogoSAT.precargar()
+
 # Configuración de SSL (si se usa HTTPS directo)
 # keyfile = "/path/to/keyfile"
 # certfile = "/path/to/certfile"